@@ -0,0 +1,436 @@
+"""
+Analyysien taustatyöjono.
+
+Reitit /analyze ja /api/analyze lisäävät analyysin jonoon (analysis_jobs-taulu)
+ja palauttavat työn tunnisteen heti. Taustasäikeet hakevat jonosta odottavia
+töitä ja suorittavat analysis_pipeline-moduulin vaiheet. Koska jono on
+tietokannassa, mikä tahansa gunicorn-prosessi voi suorittaa minkä tahansa työn,
+ja prosessin kaatuessa kesken jääneet työt palautetaan jonoon.
+
+Pääanalyysin tokenit tallennetaan striimattaessa työn partial_analysis-sarakkeeseen
+harvennetusti, ja follow-generaattori välittää ne selaimelle (SSE) ja API-asiakkaille
+(NDJSON) työtä suorittavasta prosessista riippumatta. Striimi varaa pyyntösäikeen, joten
+yksi yhteys kestää enintään stream_timeout sekuntia, minkä jälkeen asiakas jatkaa uudella
+yhteydellä saamastaan kohdasta (offset). Samanaikaisia striimejä on prosessissa enintään
+max_streams; muut asiakkaat seuraavat tilaa kyselemällä.
+"""
+
+import json
+import uuid
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from models import db, AnalysisJob
+import analysis_pipeline
+import api_call
+from quota import quota_service
+
+logger = logging.getLogger(__name__)
+
+# Työn tilat
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class AnalysisJobQueue:
+    """
+    Tietokantapohjainen työjono ja sitä käsittelevät taustasäikeet
+    """
+
+    def __init__(self):
+        self.app = None
+        self.running = False
+        self.worker_threads = []
+        self.num_workers = 2
+        self.poll_interval = 2.0
+        self.stale_after = timedelta(seconds=600)
+        self.max_attempts = 2
+        # Herättää odottavat säikeet heti, kun samaan prosessiin lisätään uusi työ
+        self._wakeup = threading.Event()
+        self._last_stale_check = 0.0
+        # Analyysin striimaus: osittaisen tekstin tallennusväli ja seuraajien kyselyväli sekunteina
+        self.streaming_enabled = True
+        self.stream_flush_interval = 0.5
+        self.stream_poll_interval = 0.3
+        self.stream_timeout = 25
+        self.max_streams = 1
+        self._stream_slots = threading.BoundedSemaphore(self.max_streams)
+
+    def init_app(self, app):
+        """Lukee jonon asetukset sovelluksen konfiguraatiosta"""
+        self.app = app
+        self.num_workers = int(app.config.get('ANALYSIS_JOB_WORKERS', 2))
+        self.poll_interval = float(app.config.get('ANALYSIS_JOB_POLL_INTERVAL', 2.0))
+        self.stale_after = timedelta(seconds=int(app.config.get('ANALYSIS_JOB_STALE_SECONDS', 600)))
+        self.max_attempts = int(app.config.get('ANALYSIS_JOB_MAX_ATTEMPTS', 2))
+        self.streaming_enabled = bool(app.config.get('ANALYSIS_STREAMING_ENABLED', True))
+        self.stream_flush_interval = float(app.config.get('ANALYSIS_STREAM_FLUSH_INTERVAL', 0.5))
+        self.stream_poll_interval = float(app.config.get('ANALYSIS_STREAM_POLL_INTERVAL', 0.3))
+        self.stream_timeout = int(app.config.get('ANALYSIS_STREAM_TIMEOUT', 25))
+        self.max_streams = int(app.config.get('ANALYSIS_STREAM_MAX_CONCURRENT', 1))
+        self._stream_slots = threading.BoundedSemaphore(max(1, self.max_streams))
+
+    def start(self):
+        """Käynnistää taustasäikeet"""
+        if self.running:
+            logger.warning("Analyysijono on jo käynnissä")
+            return
+        if self.app is None:
+            raise RuntimeError("AnalysisJobQueue.init_app on kutsuttava ennen start-metodia")
+        if self.num_workers <= 0:
+            logger.info("Analyysijonon taustasäikeet on poistettu käytöstä (ANALYSIS_JOB_WORKERS=0)")
+            return
+
+        self.running = True
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run_worker, name=f"analysis-worker-{i}")
+            thread.daemon = True
+            thread.start()
+            self.worker_threads.append(thread)
+        logger.info(f"Analyysijono käynnistetty {self.num_workers} taustasäikeellä")
+
+    def stop(self):
+        """Pysäyttää taustasäikeet"""
+        if not self.running:
+            return
+        self.running = False
+        self._wakeup.set()
+        for thread in self.worker_threads:
+            thread.join(timeout=2.0)
+        self.worker_threads = []
+        logger.info("Analyysijono pysäytetty")
+
+    def enqueue(self, user_id, url, options=None):
+        """
+        Lisää analyysin jonoon
+
+        Args:
+            user_id (int): Käyttäjän ID
+            url (str): Asuntoilmoituksen URL
+            options (dict, optional): Työkohtaiset lisäasetukset
+
+        Returns:
+            AnalysisJob: Tallennettu jonotietue
+        """
+        job = AnalysisJob(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            property_url=url,
+            source=analysis_pipeline.detect_source(url),
+            status=STATUS_QUEUED,
+            options=json.dumps(options) if options else None,
+            created_at=datetime.utcnow()
+        )
+        db.session.add(job)
+        db.session.commit()
+        logger.info(f"Analyysi {job.id} lisätty jonoon käyttäjälle {user_id}: {url}")
+        self._wakeup.set()
+        return job
+
+    def get_job(self, job_id, user_id=None):
+        """Hakee työn tunnisteella, valinnaisesti rajattuna käyttäjään"""
+        query = AnalysisJob.query.filter_by(id=job_id)
+        if user_id is not None:
+            query = query.filter_by(user_id=user_id)
+        return query.first()
+
+    def job_result(self, job):
+        """Palauttaa valmiin työn tuloksen sanakirjana tai None"""
+        if job.status != STATUS_DONE or not job.result_data:
+            return None
+        try:
+            return json.loads(job.result_data)
+        except (TypeError, ValueError):
+            return None
+
+    def acquire_stream(self):
+        """
+        Varaa prosessikohtaisen striimipaikan
+
+        Returns:
+            callable: Paikan vapauttava funktio, tai None jos kaikki paikat ovat käytössä
+        """
+        if self.max_streams <= 0 or not self._stream_slots.acquire(blocking=False):
+            return None
+
+        slots = self._stream_slots
+        released = []
+
+        def release():
+            if not released:
+                released.append(True)
+                slots.release()
+
+        return release
+
+    def follow(self, job_id, user_id=None, offset=0):
+        """
+        Seuraa työn etenemistä ja tuottaa tapahtumat sitä mukaa kuin niitä syntyy.
+        Tila luetaan tietokannasta, joten työ voi olla käynnissä missä tahansa prosessissa.
+
+        Tapahtumat ovat sanakirjoja, joiden 'type' on jokin seuraavista:
+            status: työn tila tai vaihe muuttui ('status', 'stage')
+            delta: analyysiin tuli lisää tekstiä ('text')
+            reset: analyysi alkoi alusta, esim. uusintayrityksessä ('text' on koko teksti)
+            done: analyysi on valmis ('analysis_id', 'analysis')
+            failed: analyysi epäonnistui ('error')
+            timeout: yhteys suljetaan stream_timeout-ajan jälkeen; seurantaa jatketaan
+                uudella yhteydellä kohdasta 'offset'
+
+        Args:
+            job_id (str): Työn tunniste
+            user_id (int, optional): Rajaa seurannan käyttäjän omiin töihin
+            offset (int, optional): Asiakkaan jo saaman analyysitekstin pituus
+
+        Yields:
+            dict: Tapahtuma
+        """
+        deadline = time.monotonic() + self.stream_timeout
+        last_state = None
+        sent_text = None
+
+        while True:
+            query = db.session.query(
+                AnalysisJob.status, AnalysisJob.stage, AnalysisJob.partial_analysis, AnalysisJob.error_message
+            ).filter(AnalysisJob.id == job_id)
+            if user_id is not None:
+                query = query.filter(AnalysisJob.user_id == user_id)
+            row = query.first()
+            # Luku päätetään heti, jotta seuraava kierros näkee uusimmat tiedot
+            db.session.rollback()
+
+            if row is None:
+                yield {'type': 'failed', 'error': 'Analyysityötä ei löytynyt'}
+                return
+
+            status, stage, partial_text, error_message = row
+            if (status, stage) != last_state:
+                last_state = (status, stage)
+                yield {'type': 'status', 'status': status, 'stage': stage}
+
+            if sent_text is None and partial_text and len(partial_text) >= offset:
+                # Jatketaan kohdasta, johon asiakas edellisellä yhteydellä pääsi
+                sent_text = partial_text[:offset]
+            if partial_text and partial_text != sent_text:
+                if sent_text is not None and partial_text.startswith(sent_text):
+                    yield {'type': 'delta', 'text': partial_text[len(sent_text):]}
+                else:
+                    yield {'type': 'reset', 'text': partial_text}
+                sent_text = partial_text
+
+            if status == STATUS_DONE:
+                job = self.get_job(job_id)
+                result = self.job_result(job) or {}
+                yield {'type': 'done', 'analysis_id': job.analysis_id, 'analysis': result.get('analysis')}
+                return
+            if status == STATUS_FAILED:
+                yield {'type': 'failed', 'error': error_message}
+                return
+            if time.monotonic() >= deadline:
+                yield {'type': 'timeout', 'offset': len(sent_text) if sent_text is not None else offset}
+                return
+
+            time.sleep(self.stream_poll_interval)
+
+    def _partial_writer(self, job_id):
+        """
+        Palauttaa funktion, joka tallentaa pääanalyysin kertyneen tekstin työlle.
+        Tallennus tehdään enintään stream_flush_interval-välein; ensimmäinen
+        tekstipala tallennetaan heti. Loppu tulee valmiin työn tuloksessa.
+        """
+        last_flush = [None]
+        lock = threading.Lock()
+
+        def write(text):
+            # Kirjoittajia voi olla useampi säie (esim. ennakoiva ja oikea analyysi)
+            with lock:
+                now = time.monotonic()
+                if last_flush[0] is not None and now - last_flush[0] < self.stream_flush_interval:
+                    return
+                last_flush[0] = now
+            try:
+                AnalysisJob.query.filter_by(id=job_id).update(
+                    {'partial_analysis': api_call.sanitize_markdown_response(text), 'updated_at': datetime.utcnow()},
+                    synchronize_session=False
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Osittaisen analyysin tallennus epäonnistui työlle {job_id}: {e}")
+
+        return write
+
+    def _run_worker(self):
+        """Taustasäikeen silmukka: hakee ja suorittaa töitä jonosta"""
+        logger.info(f"{threading.current_thread().name} käynnistetty")
+        while self.running:
+            job_id = None
+            try:
+                with self.app.app_context():
+                    self._requeue_stale_jobs()
+                    job_id = self._claim_next_job()
+                    if job_id:
+                        self._execute(job_id)
+            except Exception as e:
+                logger.exception(f"Virhe analyysijonon käsittelyssä: {e}")
+                time.sleep(self.poll_interval)
+            finally:
+                try:
+                    with self.app.app_context():
+                        db.session.remove()
+                except Exception:
+                    pass
+
+            if not job_id:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim_next_job(self):
+        """
+        Varaa vanhimman odottavan työn tälle säikeelle
+
+        PostgreSQL:ssä rivi lukitaan SKIP LOCKED -valinnalla, jotta säikeet ja
+        prosessit eivät kilpaile samasta rivistä. Varaus tehdään lisäksi ehdollisella
+        päivityksellä, joten se on atominen myös SQLitessä.
+        """
+        candidate = (AnalysisJob.query
+                     .filter_by(status=STATUS_QUEUED)
+                     .order_by(AnalysisJob.created_at)
+                     .with_for_update(skip_locked=True)
+                     .first())
+        if not candidate:
+            db.session.rollback()
+            return None
+
+        job_id = candidate.id
+        now = datetime.utcnow()
+        claimed = (AnalysisJob.query
+                   .filter_by(id=job_id, status=STATUS_QUEUED)
+                   .update({
+                       'status': STATUS_RUNNING,
+                       'started_at': now,
+                       'updated_at': now,
+                       'attempts': AnalysisJob.attempts + 1
+                   }, synchronize_session=False))
+        db.session.commit()
+        return job_id if claimed else None
+
+    def _requeue_stale_jobs(self):
+        """Palauttaa jonoon työt, joiden suorittaja on kadonnut (esim. prosessi kaatunut)"""
+        if time.monotonic() - self._last_stale_check < 60:
+            return
+        self._last_stale_check = time.monotonic()
+
+        cutoff = datetime.utcnow() - self.stale_after
+        stale_jobs = AnalysisJob.query.filter(
+            AnalysisJob.status == STATUS_RUNNING,
+            AnalysisJob.updated_at < cutoff
+        ).all()
+        failed_jobs = []
+        for job in stale_jobs:
+            if job.attempts >= self.max_attempts:
+                job.status = STATUS_FAILED
+                job.error_message = "Analyysi keskeytyi. Ole hyvä, yritä myöhemmin uudelleen."
+                job.finished_at = datetime.utcnow()
+                failed_jobs.append((job.id, job.user_id, job_reservation(job)))
+                logger.warning(f"Analyysi {job.id} merkitty epäonnistuneeksi {job.attempts} yrityksen jälkeen")
+            else:
+                job.status = STATUS_QUEUED
+                logger.warning(f"Analyysi {job.id} palautettu jonoon (vaihe {job.stage})")
+        if stale_jobs:
+            db.session.commit()
+        for job_id, user_id, reservation in failed_jobs:
+            self._refund(job_id, user_id, reservation)
+
+    def _set_stage(self, job_id, stage):
+        """Päivittää työn vaiheen ja heartbeat-aikaleiman"""
+        AnalysisJob.query.filter_by(id=job_id).update(
+            {'stage': stage, 'updated_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+
+    def _refund(self, job_id, user_id, reservation):
+        """Palauttaa epäonnistuneen työn varaaman analyysin käyttäjälle"""
+        try:
+            quota_service.refund(user_id, reservation)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Virhe analyysin {job_id} varauksen palautuksessa käyttäjälle {user_id}: {e}")
+
+    def _finish(self, job_id, **values):
+        """Tallentaa työn lopputilan"""
+        values['finished_at'] = datetime.utcnow()
+        values['updated_at'] = values['finished_at']
+        # Valmis teksti on tuloksessa, joten osittainen teksti voidaan poistaa
+        values['partial_analysis'] = None
+        AnalysisJob.query.filter_by(id=job_id).update(values, synchronize_session=False)
+        db.session.commit()
+
+    def _execute(self, job_id):
+        """Suorittaa yhden työn analyysiputken läpi"""
+        job = AnalysisJob.query.get(job_id)
+        url = job.property_url
+        user_id = job.user_id
+        reservation = job_reservation(job)
+        logger.info(f"Suoritetaan analyysi {job_id} käyttäjälle {user_id}: {url}")
+        start_time = time.time()
+
+        try:
+            result = analysis_pipeline.run_analysis_pipeline(
+                url, user_id,
+                progress=lambda stage: self._set_stage(job_id, stage),
+                on_partial=self._partial_writer(job_id) if self.streaming_enabled else None
+            )
+        except analysis_pipeline.PipelineError as e:
+            db.session.rollback()
+            logger.error(f"Analyysi {job_id} epäonnistui vaiheessa {e.stage}: {e.message}")
+            self._finish(job_id, status=STATUS_FAILED, stage=e.stage, error_message=e.message)
+            self._refund(job_id, user_id, reservation)
+            return
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Odottamaton virhe analyysissä {job_id}: {e}")
+            self._finish(job_id, status=STATUS_FAILED,
+                         error_message=f"Analysoinnissa tapahtui virhe: {str(e)}")
+            self._refund(job_id, user_id, reservation)
+            return
+
+        # Jonoon lisättäessä varattu analyysi jää voimaan; vanhat työt ilman varausta
+        # veloitetaan vasta kun analyysi on valmis
+        if reservation is None:
+            try:
+                analysis_pipeline.charge_analysis(user_id)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Virhe analyysin veloituksessa käyttäjältä {user_id}: {e}")
+
+        self._finish(job_id,
+                     status=STATUS_DONE,
+                     stage=None,
+                     analysis_id=result.get('analysis_id'),
+                     result_data=json.dumps(result, ensure_ascii=False, default=str))
+        logger.info(f"Analyysi {job_id} valmis {time.time() - start_time:.1f} sekunnissa")
+
+
+def job_reservation(job):
+    """
+    Palauttaa työn jonoon lisättäessä tehdyn analyysivarauksen perusteen
+
+    Returns:
+        str: 'admin', 'subscription' tai 'credits', tai None jos työ on lisätty ilman varausta
+    """
+    if not job.options:
+        return None
+    try:
+        return json.loads(job.options).get('quota')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+# Luodaan singleton-instanssi
+analysis_job_queue = AnalysisJobQueue()
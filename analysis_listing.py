@@ -0,0 +1,103 @@
+"""
+Käyttäjän analyysilistojen haut.
+
+Listoissa näytetään vain otsikko, päivämäärä sekä kohteen perustiedot ja riskitaso,
+joten analyysin pitkää sisältöä ei ladata. Kohde haetaan samalla kyselyllä.
+Sivutus tehdään avainjoukolla (created_at, id): seuraava sivu alkaa edellisen sivun
+viimeisen rivin jälkeen, joten sivun hakuaika ei riipu siitä, kuinka kaukana
+listassa ollaan.
+"""
+
+import logging
+from datetime import datetime
+
+from sqlalchemy import or_, tuple_
+from sqlalchemy.orm import joinedload, load_only
+
+from models import Analysis, Kohde
+
+logger = logging.getLogger(__name__)
+
+# Listan oletussivukoko
+DEFAULT_PAGE_SIZE = 50
+
+
+def summary_query(user_id):
+    """
+    Muodostaa käyttäjän analyysien listakyselyn uusimmasta alkaen
+
+    Args:
+        user_id (int): Käyttäjän ID
+
+    Returns:
+        Query: Kysely, joka lataa analyysien yhteenvetotiedot ja kohteet
+    """
+    return (
+        Analysis.query
+        .filter(Analysis.user_id == user_id)
+        .options(
+            load_only(Analysis.id, Analysis.title, Analysis.property_url, Analysis.created_at, Analysis.user_id),
+            joinedload(Analysis.kohde).load_only(
+                Kohde.id, Kohde.osoite, Kohde.tyyppi, Kohde.hinta, Kohde.rakennusvuosi,
+                Kohde.neliot, Kohde.risk_level, Kohde.analysis_id
+            )
+        )
+        .order_by(Analysis.created_at.desc(), Analysis.id.desc())
+    )
+
+
+def encode_cursor(analysis):
+    """Muodostaa sivun viimeisestä analyysistä seuraavan sivun tunnisteen"""
+    return f"{analysis.created_at.isoformat()}_{analysis.id}"
+
+
+def decode_cursor(cursor):
+    """
+    Purkaa sivutunnisteen
+
+    Returns:
+        tuple: (created_at, id) tai None, jos tunniste puuttuu tai on virheellinen
+    """
+    if not cursor:
+        return None
+    try:
+        created_at, analysis_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(analysis_id)
+    except ValueError:
+        logger.warning(f"Virheellinen sivutunniste: {cursor}")
+        return None
+
+
+def list_analyses_page(user_id, before=None, page_size=DEFAULT_PAGE_SIZE, search=None):
+    """
+    Hakee yhden sivun käyttäjän analyysejä
+
+    Args:
+        user_id (int): Käyttäjän ID
+        before (str, optional): Edellisen sivun palauttama tunniste; None hakee ensimmäisen sivun
+        page_size (int, optional): Analyysien määrä sivulla
+        search (str, optional): Hakusana, jota etsitään otsikosta, kohteen osoitteesta ja sisällöstä
+
+    Returns:
+        tuple: (analyysit, seuraavan sivun tunniste tai None)
+    """
+    query = summary_query(user_id)
+
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(or_(
+            Analysis.title.ilike(pattern),
+            Analysis.content.ilike(pattern),
+            Analysis.kohde.has(Kohde.osoite.ilike(pattern))
+        ))
+
+    position = decode_cursor(before)
+    if position:
+        query = query.filter(tuple_(Analysis.created_at, Analysis.id) < tuple_(*position))
+
+    # Yksi ylimääräinen rivi kertoo, onko seuraava sivu olemassa
+    analyses = query.limit(page_size + 1).all()
+    if len(analyses) > page_size:
+        analyses = analyses[:page_size]
+        return analyses, encode_cursor(analyses[-1])
+    return analyses, None
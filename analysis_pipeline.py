@@ -0,0 +1,597 @@
+"""
+Asuntoanalyysin vaiheet: ilmoituksen haku, perustietojen poiminta,
+pääanalyysi ja riskianalyysi.
+
+Moduulia käyttävät sekä taustatyöjono (analysis_jobs) että reitit, jotta
+analyysin logiikka on yhdessä paikassa eikä sidottu HTTP-pyyntöön.
+"""
+
+import re
+import json
+import hashlib
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+
+import api_call
+import info_extract
+import etuovi_downloader
+import oikotie_downloader
+from entitlements import entitlement_cache
+from listing_cache import listing_cache, listing_key
+from llm_cache import llm_cache
+from models import db, User, Analysis, RiskAnalysis, Kohde, Subscription
+from prompt_registry import property_kind
+from riskianalyysi import riskianalyysi, save_risk_analysis
+from single_flight import single_flight
+from text_condense import text_condenser
+
+logger = logging.getLogger(__name__)
+
+# Kuinka vanha analyysi voidaan käyttää uudelleen samalle käyttäjälle
+RECENT_ANALYSIS_MAX_AGE = timedelta(days=7)
+
+# Säiepooli, jossa KAT-poiminta ja pääanalyysi ajetaan rinnakkain. Säikeissä tehdään
+# vain LLM-kutsut, tietokantaan kirjoitetaan aina kutsuvasta säikeestä.
+_llm_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='analysis-llm')
+
+# Ilmoituksessa oleva talotyyppi, esim. "Talotyyppi: Omakotitalo" tai "Rakennuksen tyyppi Kerrostalo"
+PROPERTY_TYPE_PATTERN = re.compile(
+    r'(?:talotyyppi|rakennustyyppi|rakennuksen tyyppi|asuntotyyppi|kohdetyyppi|kohteen tyyppi)\s*:?\s*'
+    r'(omakotitalo|kerrostalo|rivitalo|paritalo|erillistalo)',
+    re.IGNORECASE
+)
+
+
+class PipelineError(Exception):
+    """Analyysin vaiheen virhe, jonka viesti voidaan näyttää käyttäjälle"""
+
+    def __init__(self, message, stage=None):
+        super().__init__(message)
+        self.message = message
+        self.stage = stage
+
+
+def is_supported_url(url):
+    """Tarkistaa, onko URL Oikotien tai Etuoven asuntoilmoitus"""
+    if not url:
+        return False
+    return 'oikotie.fi' in url or 'asunnot.oikotie.fi' in url or 'etuovi.com' in url
+
+
+def detect_source(url):
+    """Palauttaa ilmoituksen lähteen nimen URL:n perusteella"""
+    if 'oikotie.fi' in url or 'asunnot.oikotie.fi' in url:
+        return 'oikotie'
+    if 'etuovi.com' in url:
+        return 'etuovi'
+    return 'unknown'
+
+
+def get_property_data(url):
+    """
+    Hakee asunnon tiedot URL:n perusteella. Saman ilmoituksen tiedot palautetaan
+    välimuistista, jos joku on hakenut ne äskettäin.
+
+    Args:
+        url (str): Asuntoilmoituksen URL
+
+    Returns:
+        tuple: (success, markdown_data, source)
+            - success (bool): True jos haku onnistui, False muuten
+            - markdown_data (str): Asunnon tiedot markdown-muodossa tai None jos haku epäonnistui
+            - source (str): Lähteen nimi ('oikotie' tai 'etuovi')
+    """
+    key = listing_key(url)
+    cached_markdown = listing_cache.get(key)
+    if cached_markdown:
+        logger.info(f"Ilmoituksen {key[0]}/{key[1]} tiedot löytyivät välimuistista")
+        return True, cached_markdown, key[0]
+
+    # Saman ilmoituksen samanaikaiset haut tehdään vain kerran
+    success, markdown_data, source = single_flight.do(
+        f"fetch:{key[0]}:{key[1]}", lambda: fetch_property_data(url), succeeded=lambda result: result[0]
+    ) if key else fetch_property_data(url)
+    if success and markdown_data:
+        listing_cache.set(key, markdown_data)
+    return success, markdown_data, source
+
+
+# Funktio joka päättelee URL-tyypin ja hakee asuntotiedot oikealla tavalla
+def fetch_property_data(url):
+    """
+    Hakee asunnon tiedot URL:n perusteella joko käyttäen oikotie_downloader-moduulia (Oikotie)
+    tai etuovi_downloader-moduulia (Etuovi) ohittaen välimuistin
+
+    Args:
+        url (str): Asuntoilmoituksen URL
+
+    Returns:
+        tuple: (success, markdown_data, source)
+    """
+    # Tarkistetaan URL:n tyyppi
+    if 'oikotie.fi' in url or 'asunnot.oikotie.fi' in url:
+        # Käytetään Oikotie-downloaderia
+        logger.info(f"Oikotie URL havaittu: {url}")
+        try:
+            # Haetaan asunnon tiedot oikotie_downloader-moduulilla
+            logger.info("Haetaan tiedot oikotie_downloader-moduulilla...")
+            text_content = oikotie_downloader.get_property_info(url, verbose=False)
+
+            # Poistetaan toistuvat tunnisteet ja vakiotekstit sekä rajataan tokenibudjettiin
+            text_content = text_condenser.condense(text_content)
+
+            # Määritellään property_id
+            match = re.search(r'/(\d+)/?$', url)
+            property_id = match.group(1) if match else "unknown"
+
+            # Muunnetaan teksti markdown-muotoon
+            logger.info("Muotoillaan teksti markdown-muotoon...")
+            markdown_data = f"""# Oikotie-asuntoilmoitus
+
+## Perustiedot
+URL: {url}
+Lähde: Oikotie.fi
+Ilmoitus-ID: {property_id}
+
+## Ilmoituksen sisältö
+{text_content}
+"""
+            return True, markdown_data, 'oikotie'
+
+        except Exception as e:
+            logger.error(f"Virhe Oikotie-datan noutamisessa: {e}")
+            logger.error(traceback.format_exc())
+            return False, None, 'oikotie'
+
+    elif 'etuovi.com' in url:
+        # Käytetään Etuovi-downloaderia
+        logger.info(f"Etuovi URL havaittu: {url}")
+        try:
+            property_id = url.split('/')[-1]
+
+            # Ladataan PDF ja muunnetaan tekstiksi muistissa ilman välitiedostoja
+            logger.info("Ladataan PDF Etuovesta...")
+            pdf_document = etuovi_downloader.download_pdf_document(url, headless=True)
+
+            # Validoinnissa jäsennetty dokumentti käytetään uudelleen
+            logger.info("Muunnetaan PDF tekstiksi...")
+            text_content = text_condenser.condense(etuovi_downloader.pdf_to_text(pdf_document))
+
+            # Muunnetaan etuovi-teksti markdown-muotoon
+            logger.info("Muotoillaan teksti markdown-muotoon...")
+            markdown_data = f"""# Etuovi-asuntoilmoitus
+
+## Perustiedot
+URL: {url}
+Lähde: Etuovi.com
+Ilmoitus-ID: {property_id}
+
+## Ilmoituksen sisältö
+{text_content}
+"""
+
+            return True, markdown_data, 'etuovi'
+
+        except Exception as e:
+            logger.error(f"Virhe Etuovi-datan noutamisessa: {e}")
+            logger.error(traceback.format_exc())
+            return False, None, 'etuovi'
+    else:
+        # Tuntematon URL-tyyppi
+        logger.warning(f"Tuntematon URL-tyyppi: {url}")
+        return False, None, 'unknown'
+
+
+def find_recent_analysis(url, user_id):
+    """
+    Hakee käyttäjän tuoreen (alle 7 päivää vanhan) analyysin samalle URL:lle
+
+    Args:
+        url (str): Asuntoilmoituksen URL
+        user_id (int): Käyttäjän ID
+
+    Returns:
+        Analysis tai None
+    """
+    try:
+        existing_analysis = Analysis.query.filter_by(
+            property_url=url,
+            user_id=user_id
+        ).first()
+
+        if existing_analysis and existing_analysis.created_at > datetime.utcnow() - RECENT_ANALYSIS_MAX_AGE:
+            logger.info(f"Käyttäjällä {user_id} on tuore analyysi tälle URL:lle: {existing_analysis.id}")
+            return existing_analysis
+    except Exception as e:
+        logger.error(f"Virhe tarkistettaessa olemassa olevia analyysejä: {e}")
+    return None
+
+
+def ensure_risk_analysis(analysis, user_id):
+    """Tekee riskianalyysin olemassa olevalle analyysille, jos sitä ei vielä ole"""
+    try:
+        risk_db = RiskAnalysis.query.filter_by(analysis_id=analysis.id, user_id=user_id).first()
+        if risk_db and risk_db.risk_data:
+            return json.loads(risk_db.risk_data)
+
+        logger.info(f"Olemassa olevalle analyysille {analysis.id} ei löydy riskianalyysiä, tehdään se nyt")
+        riski_data_json = riskianalyysi(analysis.content, analysis.id, user_id)
+        if riski_data_json:
+            return json.loads(riski_data_json)
+    except Exception as e:
+        logger.error(f"Virhe riskianalyysin hakemisessa: {e}")
+    return None
+
+
+def guess_property_type(markdown_data):
+    """
+    Päättelee kohteen tyypin ilmoitustekstistä ilman LLM-kutsua. Käytetään
+    pääanalyysin promptin valintaan ennen kuin KAT-poiminta on valmis.
+
+    Args:
+        markdown_data (str): Asunnon tiedot markdown-muodossa
+
+    Returns:
+        str: Kohteen tyyppi pienillä kirjaimilla tai None, jos tyyppiä ei löytynyt
+    """
+    if not markdown_data:
+        return None
+
+    match = PROPERTY_TYPE_PATTERN.search(markdown_data)
+    if match:
+        return match.group(1).lower()
+
+    # Omakotitalon ilmoituksessa sana esiintyy yleensä jo ilmoituksen alussa
+    if 'omakotitalo' in markdown_data[:3000].lower():
+        return 'omakotitalo'
+    return None
+
+
+def save_extracted_property(property_data_json, user_id):
+    """
+    Tallentaa KAT API:n palauttamat perustiedot kohteet-tauluun
+
+    Args:
+        property_data_json (str): KAT API:n palauttama JSON-merkkijono
+        user_id (int): Käyttäjän ID
+
+    Returns:
+        tuple: (property_data, kohde_id, kohde_tyyppi), arvot None jos tallennus epäonnistui
+    """
+    property_data = None
+    kohde_id = None
+    kohde_tyyppi = None
+    try:
+        if not property_data_json:
+            logger.warning("Kohteen perustietoja ei saatu")
+            return None, None, None
+
+        # Muunnetaan JSON-merkkijono sanakirjaksi
+        try:
+            property_data = json.loads(property_data_json)
+        except json.JSONDecodeError as e:
+            logger.error(f"Virhe JSON-merkkijonon muuntamisessa sanakirjaksi: {e}")
+            property_data = None
+
+        # Tallennetaan kohteet-tauluun ilman analysis_id:tä, liitetään myöhemmin
+        logger.info(f"Tallennetaan kohteen tiedot tietokantaan käyttäjälle {user_id}")
+        kohde_id = info_extract.save_property_data_to_db(property_data, user_id=user_id)
+
+        if kohde_id:
+            logger.info(f"Kohde tallennettu tietokantaan ID:llä {kohde_id}")
+            kohde = Kohde.query.get(kohde_id)
+            if kohde and kohde.tyyppi:
+                kohde_tyyppi = kohde.tyyppi
+                logger.info(f"Kohteen tyyppi: {kohde_tyyppi}")
+        else:
+            logger.warning("Kohteen tallentaminen epäonnistui")
+    except Exception as e:
+        logger.error(f"Virhe kohteen tietojen käsittelyssä: {e}")
+
+    return property_data, kohde_id, kohde_tyyppi
+
+
+def extract_property_info(markdown_data, user_id):
+    """
+    Poimii kohteen perustiedot KAT API:lla ja tallentaa ne kohteet-tauluun
+
+    Args:
+        markdown_data (str): Asunnon tiedot markdown-muodossa
+        user_id (int): Käyttäjän ID
+
+    Returns:
+        tuple: (property_data, kohde_id, kohde_tyyppi), arvot None jos poiminta epäonnistui
+    """
+    logger.info("Haetaan kohteen perustiedot KAT API:lla")
+    property_data_json = extract_kat_data(markdown_data)
+    return save_extracted_property(property_data_json, user_id)
+
+
+def _submit(fn, *args, **kwargs):
+    """
+    Ajaa funktion säiepoolissa saman sovelluskontekstin sisällä, jotta esim.
+    LLM-välimuisti voi käyttää tietokantaa myös säikeessä
+    """
+    if not has_app_context():
+        return _llm_executor.submit(fn, *args, **kwargs)
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            return fn(*args, **kwargs)
+
+    return _llm_executor.submit(run)
+
+
+def content_key(markdown_data):
+    """Ilmoitustekstin tiiviste, jolla saman ilmoituksen vaiheet yhdistetään"""
+    return hashlib.sha256(markdown_data.encode('utf-8')).hexdigest()[:32]
+
+
+def extract_kat_data(markdown_data):
+    """KAT-poiminta; saman ilmoituksen samanaikaiset poiminnat tehdään vain kerran"""
+    return single_flight.do(
+        f"extract:{content_key(markdown_data)}",
+        lambda: info_extract.get_property_data(markdown_data),
+        succeeded=bool
+    )
+
+
+def generate_analysis(markdown_data, kohde_tyyppi, use_cache=False, on_partial=None, combined=False, cancel=None):
+    """
+    Tekee pääanalyysin (ja yhdistetyssä tilassa riskianalyysin). Jos käyttäjän
+    tuotetaso sallii käyttäjien kesken jaetut vastaukset, saman ilmoituksen
+    samanaikaiset analyysit tehdään vain kerran ja muut odottavat sen tulosta.
+
+    Args:
+        markdown_data (str): Asunnon tiedot markdown-muodossa
+        kohde_tyyppi (str): Kiinteistön tyyppi, jonka mukaan prompt valitaan
+        use_cache (bool, optional): Sallitaanko käyttäjien kesken jaetut vastaukset
+        on_partial (callable, optional): Saa analyysin kertyneen tekstin tokenien saapuessa
+        combined (bool, optional): Tehdäänkö riskianalyysi samalla kutsulla
+        cancel (threading.Event, optional): Asetettuna kesken oleva kutsu keskeytetään
+
+    Returns:
+        tuple: (analysis_response, analysis_ok, risk_data), risk_data on None, jos
+            riskianalyysiä ei tehty samalla kutsulla
+    """
+    def run():
+        ran_here.append(True)
+        if combined:
+            return api_call.generate_combined_analysis(markdown_data, kohde_tyyppi, use_cache=use_cache,
+                                                       on_partial=on_partial, cancel=cancel)
+        return api_call.generate_analysis(markdown_data, kohde_tyyppi, use_cache=use_cache,
+                                          on_partial=on_partial, cancel=cancel) + (None,)
+
+    ran_here = []
+    if not use_cache:
+        return tuple(run())
+
+    key = f"analysis:{'combined' if combined else 'single'}:{property_kind(kohde_tyyppi)}:{content_key(markdown_data)}"
+    result = tuple(single_flight.do(key, run, succeeded=lambda result: result[1]))
+    # Toisen suorituksen tekemä analyysi välitetään kerralla striimin seuraajille
+    if not ran_here and on_partial and result[1]:
+        on_partial(result[0])
+    return result
+
+
+class SpeculativePartial:
+    """
+    Ennakoivan analyysin on_partial-kääre. Kun ennakoiva analyysi hylätään, cancel
+    estää sen kirjoitukset ja llm_gateway sulkee sen striimin seuraavan tapahtuman
+    kohdalla, jolloin vain oikean promptin analyysi päivittää osittaista tekstiä.
+    """
+
+    def __init__(self, on_partial):
+        self.on_partial = on_partial
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, text):
+        # Lukko takaa, ettei hylätty analyysi kirjoita enää cancel-kutsun palattua
+        with self._lock:
+            if not self.cancelled.is_set():
+                self.on_partial(text)
+
+    def cancel(self):
+        """Hylkää ennakoivan analyysin"""
+        with self._lock:
+            self.cancelled.set()
+
+
+def extract_and_analyze(markdown_data, user_id, report=None, use_cache=False, on_partial=None, combined=False):
+    """
+    Ajaa KAT-poiminnan ja pääanalyysin rinnakkain.
+
+    Pääanalyysin prompt riippuu kohteen tyypistä, jonka KAT-poiminta palauttaa.
+    Analyysi aloitetaan heti ilmoitustekstistä päätellyllä tyypillä. Jos KAT-poiminnan
+    tyyppi valitsee eri promptin, ennakoiva analyysi hylätään ja analyysi tehdään
+    uudelleen oikealla promptilla.
+
+    Args:
+        markdown_data (str): Asunnon tiedot markdown-muodossa
+        user_id (int): Käyttäjän ID
+        report (callable, optional): Vaiheen raportointifunktio
+        use_cache (bool, optional): Käytetäänkö LLM-välimuistia
+        on_partial (callable, optional): Saa analyysin kertyneen tekstin tokenien saapuessa
+        combined (bool, optional): Tehdäänkö riskianalyysi samalla kutsulla pääanalyysin kanssa
+
+    Returns:
+        tuple: (property_data, kohde_id, kohde_tyyppi, analysis_response, analysis_ok, risk_data),
+            risk_data on None, jos riskianalyysiä ei tehty samalla kutsulla
+    """
+    guessed_type = guess_property_type(markdown_data)
+    logger.info(f"Aloitetaan KAT-poiminta ja analyysi rinnakkain (ennakoitu tyyppi: {guessed_type or 'tuntematon'})")
+
+    speculative = SpeculativePartial(on_partial)
+    kat_future = _submit(extract_kat_data, markdown_data)
+    analysis_future = _submit(generate_analysis, markdown_data, guessed_type, use_cache=use_cache,
+                              on_partial=speculative if on_partial else None, combined=combined,
+                              cancel=speculative.cancelled)
+
+    try:
+        property_data_json = kat_future.result()
+    except Exception as e:
+        logger.error(f"Virhe KAT-poiminnassa: {e}")
+        property_data_json = None
+    property_data, kohde_id, kohde_tyyppi = save_extracted_property(property_data_json, user_id)
+
+    if report:
+        report('analysis')
+
+    if api_call.select_prompt_file(kohde_tyyppi) != api_call.select_prompt_file(guessed_type):
+        # Jonossa oleva tai käynnissä oleva ennakoiva kutsu keskeytetään ja sen paikka vapautetaan
+        analysis_future.cancel()
+        speculative.cancel()
+        logger.info(f"Ennakoitu tyyppi {guessed_type} ei vastannut kohteen tyyppiä {kohde_tyyppi}, tehdään analyysi uudelleen")
+        result = generate_analysis(markdown_data, kohde_tyyppi, use_cache=use_cache,
+                                   on_partial=on_partial, combined=combined)
+    else:
+        result = analysis_future.result()
+
+    return (property_data, kohde_id, kohde_tyyppi) + result
+
+
+def link_kohde_to_analysis(kohde_id, analysis_id, user_id):
+    """Liittää kohteen analyysiin ja varmistaa kohteen käyttäjäsidonnaisuuden"""
+    try:
+        logger.info(f"Päivitetään kohteen {kohde_id} analysis_id = {analysis_id}")
+        kohde = Kohde.query.get(kohde_id)
+        if kohde:
+            kohde.analysis_id = analysis_id
+            if not kohde.user_id:
+                kohde.user_id = user_id
+            db.session.commit()
+            logger.info("Kohteen analysis_id päivitetty onnistuneesti")
+        else:
+            logger.warning(f"Kohdetta ID:llä {kohde_id} ei löytynyt")
+    except Exception as e:
+        logger.error(f"Virhe kohteen analysis_id:n päivittämisessä: {e}")
+        db.session.rollback()
+
+
+def charge_analysis(user_id):
+    """
+    Vähentää käyttäjältä yhden analyysin, jos käyttäjällä ei ole kuukausijäsenyyttä
+    eikä hän ole ylläpitäjä
+    """
+    user = User.query.get(user_id)
+    if not user or user.is_admin:
+        return
+
+    active_subscription = Subscription.query.filter_by(
+        user_id=user_id,
+        status='active',
+        subscription_type='monthly'
+    ).first()
+
+    if not active_subscription:
+        logger.info(f"Vähennetään yksi analyysi käyttäjältä {user_id}. Analyysejä jäljellä ennen vähennystä: {user.analyses_left}")
+        user.decrement_analyses_left()
+        entitlement_cache.invalidate(user_id)
+        logger.info(f"Analyysejä jäljellä vähennyksen jälkeen: {user.analyses_left}")
+
+
+def run_analysis_pipeline(url, user_id, progress=None, on_partial=None):
+    """
+    Suorittaa koko analyysin: ilmoituksen haku, perustiedot, pääanalyysi ja riskianalyysi
+
+    Args:
+        url (str): Asuntoilmoituksen URL
+        user_id (int): Käyttäjän ID
+        progress (callable, optional): Kutsutaan vaiheen nimellä ('fetch', 'extract',
+            'analysis', 'risk') aina kun uusi vaihe alkaa
+        on_partial (callable, optional): Kutsutaan pääanalyysin kertyneellä tekstillä
+            tokenien saapuessa, jotta analyysi voidaan näyttää jo sen valmistuessa
+
+    Returns:
+        dict: Analyysin tulos samassa muodossa kuin /api/analyze on aiemmin palauttanut
+
+    Raises:
+        PipelineError: Jos ilmoituksen haku tai analyysin muodostaminen epäonnistuu
+    """
+    def report(stage):
+        if progress:
+            try:
+                progress(stage)
+            except Exception as e:
+                logger.warning(f"Vaiheen {stage} raportointi epäonnistui: {e}")
+
+    # Haetaan asunnon tiedot URL:n perusteella
+    report('fetch')
+    logger.info(f"Haetaan tietoja URL:sta: {url}")
+    success, markdown_data, source = get_property_data(url)
+
+    if not success or not markdown_data:
+        logger.error("Asuntoilmoituksen noutaminen epäonnistui")
+        raise PipelineError("Ilmoituksen hakemisessa tapahtui virhe. Ole hyvä, yritä myöhemmin uudelleen.", 'fetch')
+
+    # Haetaan kohteen perustiedot KAT API:n avulla ja tehdään pääanalyysi
+    report('extract')
+    logger.info(f"Tehdään OpenAI API -kutsut analyysia varten käyttäjälle {user_id}")
+    use_cache = llm_cache.allowed_for_user(user_id)
+    combined = current_app.config.get('ANALYSIS_COMBINED_MODE', False)
+    if current_app.config.get('ANALYSIS_PIPELINE_MODE', 'concurrent') == 'concurrent':
+        property_data, kohde_id, kohde_tyyppi, analysis_response, analysis_ok, risk_data = extract_and_analyze(
+            markdown_data, user_id, report, use_cache=use_cache, on_partial=on_partial, combined=combined
+        )
+    else:
+        property_data, kohde_id, kohde_tyyppi = extract_property_info(markdown_data, user_id)
+        report('analysis')
+        analysis_response, analysis_ok, risk_data = generate_analysis(
+            markdown_data, kohde_tyyppi, use_cache=use_cache, on_partial=on_partial, combined=combined
+        )
+
+    if not analysis_ok or not analysis_response:
+        logger.error("API-kutsu ei palauttanut analyysiä")
+        raise PipelineError("Analyysin muodostamisessa tapahtui virhe. Ole hyvä, yritä myöhemmin uudelleen.", 'analysis')
+
+    # Tallennetaan analyysi tiedostoon ja tietokantaan
+    saved_file, analysis_id = api_call.save_analysis_to_file(analysis_response, markdown_data, url, user_id)
+
+    # Jos analysis_id ei ole saatavilla, yritetään hakea se tietokannasta
+    if not analysis_id:
+        analysis = Analysis.query.filter_by(property_url=url, user_id=user_id).first()
+        if analysis:
+            analysis_id = analysis.id
+            logger.info(f"Käytetään olemassa olevaa analyysiä ID: {analysis_id}")
+
+    if kohde_id and analysis_id:
+        link_kohde_to_analysis(kohde_id, analysis_id, user_id)
+
+    # Tehdään riskianalyysi API-vastauksesta, jos analyysi on löydetty
+    report('risk')
+    riski_data = None
+    if analysis_id:
+        try:
+            if risk_data:
+                # Riskianalyysi tehtiin jo pääanalyysin kanssa samalla kutsulla
+                riski_data_json = save_risk_analysis(risk_data, analysis_id, user_id)
+            else:
+                logger.info(f"Tehdään riskianalyysi kohteesta, analyysi {analysis_id}, käyttäjä {user_id}")
+                riski_data_json = riskianalyysi(analysis_response, analysis_id, user_id, use_cache=use_cache)
+            riski_data = json.loads(riski_data_json)
+            logger.info(f"Riskianalyysi valmis: {riski_data.get('kokonaisriskitaso', 'N/A')}/10")
+        except Exception as e:
+            logger.error(f"Virhe riskianalyysissä: {e}")
+            logger.error(traceback.format_exc())
+
+    result = {
+        'property_data': markdown_data,
+        'analysis': analysis_response,
+        'source': source
+    }
+    if analysis_id:
+        result['analysis_id'] = analysis_id
+    if property_data:
+        result['basic_property_data'] = property_data
+    if riski_data:
+        result['risk_analysis'] = riski_data
+
+    return result
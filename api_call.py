@@ -1,14 +1,16 @@
-from openai import OpenAI
 import logging
 import os
 import time
 import json
-import requests
 import re
 from typing import Optional, Dict, Any
 from datetime import datetime
 import hashlib
 from models import db, Analysis, RiskAnalysis
+from llm_cache import llm_cache
+from llm_gateway import llm_gateway, LLMGatewayTimeout, LLMCallCancelled
+from prompt_registry import prompt_registry, build_input, build_combined_input, property_kind, ANALYSIS_PROMPT_FILES
+from riskianalyysi import RISK_SCHEMA
 from flask_login import current_user
 
 # Asetetaan lokitus
@@ -27,9 +29,20 @@ logger = logging.getLogger(__name__)
 ANALYSES_DIR = "analyses"
 os.makedirs(ANALYSES_DIR, exist_ok=True)  # Varmistetaan että hakemisto on olemassa
 
-# Haetaan OpenAI API-avain ympäristömuuttujasta tai käytä oletusarvoa
-api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+# Pääanalyysin malli
+ANALYSIS_MODEL = "gpt-4.1"
+
+# Yhdistetyn analyysin vastausmuoto. Analyysi on ensimmäisenä, jotta sen teksti
+# voidaan näyttää käyttäjälle jo striimauksen aikana.
+COMBINED_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analyysi": {"type": "string"},
+        "riskianalyysi": RISK_SCHEMA
+    },
+    "required": ["analyysi", "riskianalyysi"],
+    "additionalProperties": False
+}
 
 # Vakiovastaukset virhetilanteisiin
 ERROR_MESSAGES = {
@@ -84,6 +97,18 @@ def sanitize_markdown_response(text: str) -> str:
     logger.debug("Sanitoitu markdown-vastaus")
     return text.strip()
 
+def select_prompt_file(kohde_tyyppi: str = None) -> str:
+    """
+    Valitsee analyysin prompt-tiedoston kiinteistön tyypin mukaan.
+    
+    Args:
+        kohde_tyyppi (str, optional): Kiinteistön tyyppi (esim. "Omakotitalo", "Kerrostalo", "Rivitalo")
+        
+    Returns:
+        str: Prompt-tiedoston nimi
+    """
+    return ANALYSIS_PROMPT_FILES[property_kind(kohde_tyyppi)]
+
 def get_analysis(markdown_data: str, property_url: str = None, kohde_tyyppi: str = None, user_id=None) -> tuple:
     """
     Lähettää asunnon tiedot markdown-muodossa OpenAI:lle ja pyytää analyysin.
@@ -97,179 +122,314 @@ def get_analysis(markdown_data: str, property_url: str = None, kohde_tyyppi: str
     Returns:
         tuple: (OpenAI:n tuottama analyysi, tallennetun tiedoston polku, analyysin ID tietokannassa)
     """
+    analysis, success = generate_analysis(markdown_data, kohde_tyyppi, use_cache=llm_cache.allowed_for_user(user_id))
+    if not success:
+        return analysis, "", None
+    
+    # Tallennetaan analyysi tiedostoon ja tietokantaan
+    saved_file, analysis_id = save_analysis_to_file(analysis, markdown_data, property_url, user_id)
+    return analysis, saved_file, analysis_id
+
+def _stream_output_text(request_args: dict, on_partial, cancel=None) -> str:
+    """
+    Pyytää vastauksen OpenAI:lta striimattuna ja välittää kertyneen tekstin
+    on_partial-funktiolle jokaisen saapuvan tekstipalan jälkeen.
+    
+    Args:
+        request_args (dict): responses.create-kutsun parametrit
+        on_partial (callable): Kutsutaan tähän mennessä saapuneella raakatekstillä
+        cancel (threading.Event, optional): Asetettuna striimi suljetaan llm_gatewayssa
+        
+    Returns:
+        str: Koko vastausteksti
+    """
+    parts = []
+    first_token_time = None
+    start_time = time.time()
+    
+    events = llm_gateway.stream(cancel=cancel, **request_args)
+    try:
+        for event in events:
+            event_type = getattr(event, 'type', None)
+            if event_type == 'response.output_text.delta':
+                if first_token_time is None:
+                    first_token_time = time.time() - start_time
+                    logger.info(f"Ensimmäinen analyysin token saapui {first_token_time:.2f} sekunnissa")
+                parts.append(event.delta)
+                try:
+                    on_partial(''.join(parts))
+                except Exception as e:
+                    logger.warning(f"Osittaisen analyysin välitys epäonnistui: {e}")
+            elif event_type in ('response.failed', 'error'):
+                raise RuntimeError(f"OpenAI-striimi päättyi virheeseen: {event}")
+    finally:
+        # Striimin sulkeminen vapauttaa yhdyskäytävän paikan heti myös virhetilanteessa
+        if hasattr(events, 'close'):
+            events.close()
+    
+    return ''.join(parts)
+
+def generate_analysis(markdown_data: str, kohde_tyyppi: str = None, use_cache: bool = False, on_partial=None,
+                      cancel=None) -> tuple:
+    """
+    Pyytää OpenAI:lta analyysin tallentamatta sitä. Erillään get_analysis-funktiosta,
+    jotta analyysi voidaan aloittaa ennen kuin kohteen tyyppi on varmistunut.
+    
+    Args:
+        markdown_data (str): Asunnon tiedot markdown-muodossa
+        kohde_tyyppi (str, optional): Kiinteistön tyyppi, jonka mukaan prompt valitaan
+        use_cache (bool, optional): Palautetaanko identtisen syötteen aiempi vastaus LLM-välimuistista
+        on_partial (callable, optional): Jos annettu, vastaus striimataan ja funktiota kutsutaan
+            kertyneellä raakatekstillä tokenien saapuessa
+        cancel (threading.Event, optional): Asetettuna kesken oleva kutsu keskeytetään ja
+            nostetaan LLMCallCancelled
+        
+    Returns:
+        tuple: (sanitoitu analyysi tai virheilmoitus, onnistuiko kutsu)
+    """
     if not markdown_data:
         logger.error("Markdown-data puuttuu")
-        return ERROR_MESSAGES["invalid_request"], "", None
+        return ERROR_MESSAGES["invalid_request"], False
+    
+    # Prompt valitaan kiinteistön tyypin mukaan muistissa olevista prompteista
+    prompt = prompt_registry.analysis_prompt(kohde_tyyppi)
+    system_prompt = prompt.text
+    logger.info(f"Käytetään promptia: {prompt.label}")
     
-    # Valitaan prompt-tiedosto kiinteistön tyypin mukaan
-    prompt_file = "prompt_analyysi_okt.txt" if kohde_tyyppi and "omakotitalo" in kohde_tyyppi.lower() else "prompt_analyysi_kt.txt"
+    if use_cache:
+        cached_analysis = llm_cache.get(ANALYSIS_MODEL, system_prompt, markdown_data)
+        if cached_analysis:
+            if on_partial:
+                on_partial(cached_analysis)
+            return cached_analysis, True
     
     try:
-        # Luetaan prompt tiedostosta
-        with open(prompt_file, "r", encoding="utf-8") as file:
-            system_prompt = file.read()
-        logger.info(f"Käytetään promptia: {prompt_file}")
+        # Uudelleenyritykset ja nopeusrajoitukset hoitaa llm_gateway
+        logger.info("Lähetetään analyysiä OpenAI API:lle")
+        logger.debug(f"Markdown datan pituus: {len(markdown_data)} merkkiä")
+        
+        start_time = time.time()
+        
+        request_args = dict(
+            model=ANALYSIS_MODEL,
+            input=build_input(prompt, markdown_data),
+            text={
+                "format": {
+                    "type": "text"
+                }
+            },
+            reasoning={},
+            tools=[],
+            temperature=1,
+            max_output_tokens=4096,
+            top_p=1,
+            store=True
+        )
+        
+        if on_partial:
+            output_text = _stream_output_text(request_args, on_partial, cancel=cancel)
+        else:
+            response = llm_gateway.create(cancel=cancel, **request_args)
+            output_text = getattr(response, 'output_text', None)
+        
+        elapsed_time = time.time() - start_time
+        logger.info(f"OpenAI API vastasi ajassa {elapsed_time:.2f} sekuntia")
+        
+        if output_text:
+            logger.info("Analyysi haettu onnistuneesti")
+            # Lokitetaan vain osa vastauksesta yksityisyyssyistä
+            content_preview = output_text[:100] + "..." if len(output_text) > 100 else output_text
+            logger.debug(f"Vastauksen alku: {content_preview}")
+            
+            # Sanitoidaan vastaus ennen tallennusta ja palautusta
+            sanitized_response = sanitize_markdown_response(output_text)
+            if use_cache:
+                llm_cache.set(ANALYSIS_MODEL, system_prompt, markdown_data, sanitized_response, prompt_name=prompt.label)
+            return sanitized_response, True
+        else:
+            logger.error("OpenAI API ei palauttanut odotettua vastausta")
+            return ERROR_MESSAGES["general"], False
+            
+    except LLMCallCancelled:
+        raise
     except Exception as e:
-        logger.error(f"Virhe promptin lukemisessa tiedostosta {prompt_file}: {e}")
-        # Käytetään oletuspromptia jos tiedoston lukeminen epäonnistuu
-        system_prompt = """Olet kiinteistö- ja kiinteistövälityksen kokenut ammattilainen.
-Tehtävänäsi on tehdä ostajalle analyysi myynnisssä olevasta kohteesta.
-
-**TÄMÄ ON TÄRKEÄÄ:**
-Perhedy tietoihin huolellisesi. Tee kohteen tiedoista implisiittisiä päätelmiä ostajalle tärkeistä asioista.
-
-Laadi teksi asiantuntijamaiseen tyyliin. Kerro kuitenkin suoraan kohteen puutteet ja negatiiviset asiat.
-Vältä ilmoitustekstin toistoa, ilman että siinä on mielestäsi jotain huomioitavaa. Ota huomioon, että lukija on jo perehtynyt ilmoituksen sisältöön ja odottaa nyt sinulta huomioita, jotka eivät suoraan ilmene tekstistä.
-Koosta analyysin loppuun kolmen kysymyksen kysymyslista. Tee sellaisia kysymyksiä, jotka ovat oikeasti merkittäviä ostajalle.
-Älä kommentoi välitysliikettä tai välittäjää.
-
-Kirjoita teksti hyvällä suomenkielisellä kirjoitustyylillä.
-
-Alla kuvaus vastauksen rakenteesta.
-
-Voit painottaa tekstistä sanoja boldilla.
-
-<rakennekuvaus>
-
-*1. Sijainti ja alueellinen konteksti*
-Anna tässä rehellinen kuvaus alueesta, jossa kiinteistö sijaitsee. Kerro suoraan, jos alue on maineeltaan kyseenalainen.
-
-*2. Rakennus ja taloyhtiö*
-Pyri tekemään omia päätelmiäsi siitä, millainen rakennus ja taloyhtiö on kyseessä, myös sen perusteella, mitä ilmoituksessa ei ole sanottu. On tärkeää, ettei tässä kohdassa ainoastaan toisteta samoja asioita, jotka ilmenevät jo ilmoituksessa.
-
-*3. Asunto ja varustelutaso*
-*4. Markkina- ja ostotilanne*
-*5. Mahdolliset huomiot tai riskitekijät*
-Tämä on tärkeä osio. Pyri kirjoittamaan tämä osio mahdollisimman vakuuttavasti, niin että lukija kokee saaneensa arvokasta tietoa.
-
-*6. Kohteen hinta verrattuna vastaaviin*
-Anna tässä konkreettinen oma hinta-arviosi kohteesta perusteluineen.
+        return _api_error_message(e), False
 
-*7. Kysymyslista välittäjälle*
-Listaa tähän kolme kysymystä, jotka olisi mielestäsi tärkeä kysyä välittäjältä.
-</rakennekuvaus>
+def _api_error_message(error: Exception) -> str:
+    """
+    Kirjaa OpenAI-kutsun virheen lokiin ja palauttaa käyttäjälle näytettävän viestin.
+    Kutsutaan except-lohkosta, jotta odottamattoman virheen jäljitys tulee lokiin.
+    
+    Args:
+        error (Exception): Kutsussa tapahtunut virhe
+        
+    Returns:
+        str: Virheilmoitus ERROR_MESSAGES-taulukosta
+    """
+    import openai
 
-**Tämä on tärkeää:**
-Kirjoita analyysi markdown-muodossa, joka on täysin yhteensopiva verkkosivujen Markdown-renderöijien kanssa. Käytä vain tavallisia ASCII-merkkejä ja vältä erikoisia UNICODE-välilyöntejä kuten narrow no-break space (U+202F).
+    if isinstance(error, openai.AuthenticationError):
+        logger.error("Tunnistautumisvirhe: Virheellinen API-avain")
+        return ERROR_MESSAGES["auth_error"]
+    if isinstance(error, (openai.RateLimitError, LLMGatewayTimeout)):
+        logger.warning(f"Liian monta pyyntöä, uudelleenyritykset eivät auttaneet: {error}")
+        return ERROR_MESSAGES["rate_limit"]
+    if isinstance(error, openai.APITimeoutError):
+        logger.warning("Pyyntö aikakatkaistiin")
+        return ERROR_MESSAGES["timeout"]
+    if isinstance(error, openai.APIConnectionError):
+        logger.error(f"Yhteysvirhe: {error}")
+        return ERROR_MESSAGES["general"]
+    if isinstance(error, openai.BadRequestError):
+        logger.error(f"Virheellinen pyyntö: {error}")
+        return ERROR_MESSAGES["invalid_request"]
+    if isinstance(error, openai.APIStatusError):
+        logger.error(f"HTTP-virhe {error.status_code}: {error}")
+        return ERROR_MESSAGES["api_error"]
+    logger.exception(f"Odottamaton virhe: {str(error)}")
+    return ERROR_MESSAGES["general"]
 
-Käytä ainoastaan seuraavia muotoiluelementtejä:
-Otsikot muodossa ### ja ####
-Lihavoinnit **...**
-Yksinkertaiset listat -...
-Rivinvaihdot käyttäen kaksoisvälilyöntiä + \n (eli \n)
-Älä käytä lainausmerkkejä.
-Käytä ainoastaan tavallisia välilyöntejä.
+class _PartialJsonString:
+    """
+    Purkaa striimattavan JSON-vastauksen ensimmäisen merkkijonokentän arvoa sitä mukaa
+    kuin raakatekstiä saapuu. Jokainen merkki käydään läpi vain kerran.
+    """
+    
+    START_PATTERN = re.compile(r'\s*\{\s*"[^"]*"\s*:\s*"')
+    
+    def __init__(self):
+        self.start = None
+        self.scanned = 0
+        self.done = False
+        self.parts = []
+    
+    def update(self, raw: str) -> str:
+        """
+        Käsittelee kertyneen raakatekstin uudet merkit
+        
+        Args:
+            raw (str): Tähän mennessä saapunut raakateksti
+            
+        Returns:
+            str: Tähän mennessä puretun merkkijonon arvo
+        """
+        if self.start is None:
+            match = self.START_PATTERN.match(raw)
+            if not match:
+                return ''
+            self.start = self.scanned = match.end()
+        
+        position = self.scanned
+        while not self.done and position < len(raw):
+            char = raw[position]
+            if char == '\\':
+                # Keskeneräinen escape-jakso puretaan vasta seuraavalla kerralla
+                length = 6 if raw[position + 1:position + 2] == 'u' else 2
+                if position + length > len(raw):
+                    break
+                position += length
+            elif char == '"':
+                self.done = True
+            else:
+                position += 1
+        
+        if position > self.scanned:
+            try:
+                self.parts.append(json.loads('"' + raw[self.scanned:position] + '"', strict=False))
+                self.scanned = position
+            except ValueError:
+                # Surrogaattipari voi jakautua kahteen osaan, odotetaan loppua
+                pass
+        return ''.join(self.parts)
 
-Älä käytä otsikoinnissa suurempaa kuin h3.
-"""
-        logger.warning(f"Käytetään oletuspromptia prompt-tiedoston sijaan!")
+def generate_combined_analysis(markdown_data: str, kohde_tyyppi: str = None, use_cache: bool = False, on_partial=None,
+                               cancel=None) -> tuple:
+    """
+    Pyytää analyysin ja riskianalyysin yhdellä kutsulla JSON-skeeman mukaisena
+    strukturoituna vastauksena. Skeema takaa, että vastaus on validia JSONia, joten
+    erillistä riskianalyysikutsua ja sen jäsennyksen uudelleenyrityksiä ei tarvita.
+    Jos vastausta ei silti voida käyttää (esim. katkennut vastaus), analyysi tehdään
+    tavalliseen tapaan generate_analysis-funktiolla ja riskianalyysi jää tekemättä.
     
-    retry_count = 0
-    max_retries = 3
-    backoff_time = 2  # sekunteina
+    Args:
+        markdown_data (str): Asunnon tiedot markdown-muodossa
+        kohde_tyyppi (str, optional): Kiinteistön tyyppi, jonka mukaan promptit valitaan
+        use_cache (bool, optional): Palautetaanko identtisen syötteen aiempi vastaus LLM-välimuistista
+        on_partial (callable, optional): Jos annettu, vastaus striimataan ja funktiota kutsutaan
+            analyysin kertyneellä tekstillä tokenien saapuessa
+        cancel (threading.Event, optional): Asetettuna kesken oleva kutsu keskeytetään ja
+            nostetaan LLMCallCancelled
+        
+    Returns:
+        tuple: (sanitoitu analyysi tai virheilmoitus, onnistuiko kutsu, riskianalyysi dict tai None)
+    """
+    if not markdown_data:
+        logger.error("Markdown-data puuttuu")
+        return ERROR_MESSAGES["invalid_request"], False, None
+    
+    analysis_prompt = prompt_registry.analysis_prompt(kohde_tyyppi)
+    risk_prompt = prompt_registry.risk_prompt(kohde_tyyppi)
+    input_items = build_combined_input(analysis_prompt, risk_prompt, markdown_data)
+    prompt_label = f"{analysis_prompt.label}+{risk_prompt.label}"
+    logger.info(f"Käytetään yhdistettyä analyysiä prompteilla: {prompt_label}")
+    
+    # Välimuistin avaimeen tulevat kaikki staattiset system-viestit
+    cache_prompt = "\n".join(item["content"][0]["text"] for item in input_items[:-1])
+    output_text = llm_cache.get(ANALYSIS_MODEL, cache_prompt, markdown_data) if use_cache else None
+    from_cache = output_text is not None
     
-    while retry_count < max_retries:
+    if output_text is None:
+        request_args = dict(
+            model=ANALYSIS_MODEL,
+            input=input_items,
+            text={
+                "format": {
+                    "type": "json_schema",
+                    "name": "asuntoanalyysi",
+                    "schema": COMBINED_SCHEMA,
+                    "strict": True
+                }
+            },
+            reasoning={},
+            tools=[],
+            temperature=1,
+            max_output_tokens=6144,
+            top_p=1,
+            store=True
+        )
+        
         try:
-            logger.info(f"Lähetetään analyysiä OpenAI API:lle (yritys {retry_count + 1}/{max_retries})")
-            logger.debug(f"Markdown datan pituus: {len(markdown_data)} merkkiä")
-            
-            # Poistettu hardcoded prompt tästä, käytetään aiemmin ladattua promptia
-            
             start_time = time.time()
-            
-            response = client.responses.create(
-                model="gpt-4.1",
-                input=[
-                    {
-                        "role": "system",
-                        "content": [
-                            {
-                                "type": "input_text",
-                                "text": system_prompt
-                            },
-                            {
-                                "type": "input_text",
-                                "text": markdown_data
-                            }
-                        ]  
-                    }
-                ],
-                text={
-                    "format": {
-                        "type": "text"
-                    }
-                },
-                reasoning={},
-                tools=[],
-                temperature=1,
-                max_output_tokens=4096,
-                top_p=1,
-                store=True
-            )
-            
-            elapsed_time = time.time() - start_time
-            logger.info(f"OpenAI API vastasi ajassa {elapsed_time:.2f} sekuntia")
-            
-            if hasattr(response, 'output_text') and response.output_text:
-                logger.info("Analyysi haettu onnistuneesti")
-                # Lokitetaan vain osa vastauksesta yksityisyyssyistä
-                content_preview = response.output_text[:100] + "..." if len(response.output_text) > 100 else response.output_text
-                logger.debug(f"Vastauksen alku: {content_preview}")
-                
-                # Sanitoidaan vastaus ennen tallennusta ja palautusta
-                sanitized_response = sanitize_markdown_response(response.output_text)
-                
-                # Tallennetaan analyysi tiedostoon ja tietokantaan
-                saved_file, analysis_id = save_analysis_to_file(sanitized_response, markdown_data, property_url, user_id)
-                
-                return sanitized_response, saved_file, analysis_id
+            if on_partial:
+                decoder = _PartialJsonString()
+                output_text = _stream_output_text(request_args, lambda raw: on_partial(decoder.update(raw)), cancel=cancel)
             else:
-                logger.error("OpenAI API ei palauttanut odotettua vastausta")
-                return ERROR_MESSAGES["general"], "", None
-                
-        except requests.exceptions.Timeout:
-            logger.warning(f"Pyyntö aikakatkaistiin (yritys {retry_count + 1}/{max_retries})")
-            if retry_count == max_retries - 1:
-                return ERROR_MESSAGES["timeout"], "", None
-                
-        except requests.exceptions.ConnectionError:
-            logger.error(f"Yhteysvirhe (yritys {retry_count + 1}/{max_retries})")
-            if retry_count == max_retries - 1:
-                return ERROR_MESSAGES["general"], "", None
-                
-        except requests.exceptions.HTTPError as http_err:
-            status_code = getattr(http_err.response, 'status_code', None)
-            
-            if status_code == 401:
-                logger.error("Tunnistautumisvirhe: Virheellinen API-avain")
-                return ERROR_MESSAGES["auth_error"], "", None
-            elif status_code == 429:
-                logger.warning(f"Liian monta pyyntöä - rajaa rajoitettu (yritys {retry_count + 1}/{max_retries})")
-                # Odota pidempään rate limit -virheissä
-                time.sleep(backoff_time * 2)
-                backoff_time *= 2
-                retry_count += 1
-                continue
-            else:
-                logger.error(f"HTTP-virhe: {http_err}")
-                return ERROR_MESSAGES["api_error"], "", None
-                
-        except json.JSONDecodeError:
-            logger.error("Virheellinen JSON-vastaus OpenAI API:lta")
-            return ERROR_MESSAGES["api_error"], "", None
-            
+                response = llm_gateway.create(cancel=cancel, **request_args)
+                output_text = getattr(response, 'output_text', None)
+            logger.info(f"Yhdistetty analyysi valmistui ajassa {time.time() - start_time:.2f} sekuntia")
+        except LLMCallCancelled:
+            raise
         except Exception as e:
-            logger.exception(f"Odottamaton virhe: {str(e)}")
-            return ERROR_MESSAGES["general"], "", None
-            
-        # Eksponentiaalinen backoff uudelleenyritysten välillä
-        time.sleep(backoff_time)
-        backoff_time *= 2
-        retry_count += 1
-        
-    # Jos kaikki yritykset epäonnistuvat
-    logger.error(f"Kaikki {max_retries} yritystä epäonnistuivat")
-    return ERROR_MESSAGES["general"], "", None
+            return _api_error_message(e), False, None
+    
+    try:
+        data = json.loads(output_text or "")
+        analysis = sanitize_markdown_response(data["analyysi"])
+        risk_data = data["riskianalyysi"]
+        if not analysis or not isinstance(risk_data, dict):
+            raise ValueError("analyysi tai riskianalyysi puuttuu")
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Yhdistetyn analyysin vastausta ei voitu käyttää ({e}), tehdään analyysi erikseen")
+        analysis, success = generate_analysis(markdown_data, kohde_tyyppi, use_cache=use_cache, on_partial=on_partial,
+                                              cancel=cancel)
+        return analysis, success, None
+    
+    if from_cache and on_partial:
+        on_partial(analysis)
+    if use_cache and not from_cache:
+        llm_cache.set(ANALYSIS_MODEL, cache_prompt, markdown_data, output_text, prompt_name=prompt_label)
+    logger.info("Analyysi ja riskianalyysi haettu onnistuneesti yhdellä kutsulla")
+    return analysis, True, risk_data
 
 def save_analysis_to_file(analysis: str, markdown_data: str, property_url: str = None, user_id=None) -> tuple:
     """
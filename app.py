@@ -8,13 +8,13 @@ import time
 import tempfile
 from functools import wraps
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash, send_file, abort, session
+from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, flash, send_file, abort, session, Response, stream_with_context
 from flask_login import LoginManager, current_user, login_required
-import sqlalchemy
-from sqlalchemy import text, exc
+from werkzeug.wsgi import ClosingIterator
+from sqlalchemy import exc
 from flask_migrate import Migrate
 import secrets
-from flask_session import Session
+from session_backend import init_session
 import pytz
 
 import api_call
@@ -27,10 +27,24 @@ from riskianalyysi import riskianalyysi
 import etuovi_downloader  # Import the etuovi_downloader
 import oikotie_downloader  # Import the oikotie_downloader
 import info_extract  # Käytetään info_extract-moduulia kat_api_call-moduulin kautta
+from pdf_document import PdfDocument
+import analysis_pipeline
+from analysis_jobs import analysis_job_queue
+from listing_cache import listing_cache
+from llm_cache import llm_cache
+from llm_gateway import llm_gateway
+from prompt_registry import prompt_registry
+from text_condense import text_condenser
+from single_flight import single_flight
+from analysis_listing import summary_query, list_analyses_page
+from quota import quota_service
+from entitlements import entitlement_cache
+from browser_pool import browser_pool
+from schema import ensure_schema, SCHEMA_STARTUP
+from worker_lifecycle import start_background_services, SERVICES_ON_IMPORT
 
 # Import subscription modules
 from subscription_service import subscription_service
-from subscription_scheduler import subscription_scheduler
 
 # Asetetaan lokitus
 logging.basicConfig(
@@ -62,6 +76,7 @@ app = Flask(__name__)
 app.config.from_object(get_config())
 
 # Lisää istuntoasetukset - TÄRKEÄÄ! OAuth vaatii toimivan istunnon
+# SESSION_TYPE koskee Flask-Sessionia, jota käytetään kun SESSION_BACKEND on 'filesystem'
 app.config['SESSION_TYPE'] = 'filesystem'  # Tallenna istunnot tiedostoihin
 app.config['SESSION_PERMANENT'] = True  # Istunto säilyy vaikka selain suljetaan
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)  # Istunnon kesto
@@ -72,7 +87,8 @@ app.config['SESSION_FILE_THRESHOLD'] = 500  # Max number of sessions in session
 app.config['SESSION_FILE_MODE'] = 0o600  # Unix file mode for session files
 
 # Varmista että istuntohakemisto on olemassa ja siihen on oikeudet
-os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
+if app.config.get('SESSION_BACKEND', 'filesystem') == 'filesystem':
+    os.makedirs(app.config['SESSION_FILE_DIR'], exist_ok=True)
 
 # Varmista että salaisuusavain on asetettu
 if app.config.get('SECRET_KEY') is None or app.config.get('SECRET_KEY') == 'kehitys-avain-vaihda-tuotannossa':
@@ -87,11 +103,11 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'None'  # Välttämätön cross-site red
 # Määritämme istunnon cookies_kwargs asetukset
 app.config['SESSION_COOKIE_NAME'] = 'kotiko_session'  # Selkeä nimi istuntoeville
 
-# Alusta Flask-Session
-Session(app)
+# Alusta istuntojen tallennus (SESSION_BACKEND: filesystem, database tai cookie)
+session_backend = init_session(app)
 
 # Tallennetaan global istuntoasetukset debug-lokitukseen
-logger.info(f"Session config: type={app.config.get('SESSION_TYPE')}, cookie_secure={app.config.get('SESSION_COOKIE_SECURE')}, samesite={app.config.get('SESSION_COOKIE_SAMESITE')}")
+logger.info(f"Session config: backend={session_backend}, cookie_secure={app.config.get('SESSION_COOKIE_SECURE')}, samesite={app.config.get('SESSION_COOKIE_SAMESITE')}")
 
 # Alustetaan tietokanta
 db.init_app(app)
@@ -143,8 +159,8 @@ def retry_on_db_error(max_retries=3, retry_delay=1):
 @login_manager.user_loader
 @retry_on_db_error(max_retries=3)
 def load_user(user_id):
-    """Lataa käyttäjä session tunnisteen perusteella"""
-    return User.query.get(int(user_id))
+    """Lataa käyttäjä session tunnisteen perusteella; kuukausijäsenyys haetaan samalla kyselyllä"""
+    return entitlement_cache.load_user(int(user_id))
 
 # Rekisteröidään blueprint-komponentit
 app.register_blueprint(auth, url_prefix='/auth')
@@ -155,92 +171,12 @@ custom_result = init_google_blueprint(app)  # Alustetaan Google OAuth blueprint
 if custom_result is None:
     logger.info("Käytetään omaa Google OAuth implementaatiota Flask-Dance sijaan")
 
-# Luodaan tietokantafunktio, joka suoritetaan ennen ensimmäistä pyyntöä
-def create_tables():
-    """Luo tietokanta ja taulut jos ne eivät ole olemassa"""
-    with app.app_context():
-        db.create_all()
-        
-        # Varmistetaan että kohteet-taulu on luotu oikein
-        inspector = sqlalchemy.inspect(db.engine)
-        tables = inspector.get_table_names()
-        
-        # Tarkista onko kohteet-taulu jo olemassa
-        if 'kohteet' not in tables:
-            logger.info("Kohteet-taulu puuttuu. Luodaan se...")
-            try:
-                # Luodaan taulu käyttäen create_all-funktiota, joka huomioi kaikki määritellyt mallit
-                db.create_all()
-                logger.info("Kohteet-taulu luotu onnistuneesti.")
-            except Exception as e:
-                logger.error(f"Virhe kohteet-taulun luomisessa SQLAlchemylla: {e}")
-                
-                # Jos SQLAlchemy epäonnistuu, yritetään luoda taulu suoralla SQL-kyselyllä
-                try:
-                    with db.engine.connect() as conn:
-                        with conn.begin():
-                            conn.execute(text("""
-                            CREATE TABLE kohteet (
-                                id SERIAL PRIMARY KEY,
-                                osoite VARCHAR(255) NOT NULL,
-                                tyyppi VARCHAR(50),
-                                hinta NUMERIC,
-                                rakennusvuosi INTEGER,
-                                analysis_id INTEGER,
-                                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
-                                FOREIGN KEY (analysis_id) REFERENCES analyses (id) ON DELETE SET NULL
-                            )
-                            """))
-                    logger.info("Kohteet-taulu luotu onnistuneesti suoralla SQL-kyselyllä!")
-                except Exception as e2:
-                    logger.error(f"Virhe kohteet-taulun luomisessa suoralla SQL-kyselyllä: {e2}")
-        else:
-            # Tarkista onko analysis_id-sarake määritetty ei-null-arvoiseksi
-            columns = inspector.get_columns('kohteet')
-            # Etsi analysis_id-sarake
-            for column in columns:
-                if column['name'] == 'analysis_id':
-                    if not column.get('nullable', True):
-                        logger.info("Päivitetään kohteet-taulun analysis_id-sarake nullable=True")
-                        try:
-                            with db.engine.connect() as conn:
-                                with conn.begin():
-                                    conn.execute(text("ALTER TABLE kohteet ALTER COLUMN analysis_id DROP NOT NULL"))
-                            logger.info("Kohteet-taulun analysis_id-sarake päivitetty onnistuneesti!")
-                        except Exception as e:
-                            logger.error(f"Virhe kohteet-taulun päivityksessä: {e}")
-                    break
-
-# Varmistetaan että taulut on luotu sovelluksen käynnistyessä
-with app.app_context():
-    # Tarkista onko tauluja jo olemassa
-    inspector = sqlalchemy.inspect(db.engine)
-    tables = inspector.get_table_names()
-    if not tables:
-        logger.info("Tietokanta on tyhjä. Luodaan taulut...")
-        db.create_all()
-        logger.info("Taulut luotu.")
-    else:
-        logger.info(f"Tietokanta sisältää jo taulut: {tables}")
-    
-    # Kutsutaan create_tables-funktiota, joka varmistaa myös kohteet-taulun olemassaolon
-    create_tables()
-    
-    # Päivitetään kohteet-taulun rakenne tarvittaessa
-    try:
-        # Tarkistetaan onko risk_level-sarake jo olemassa
-        kohteet_columns = [c['name'] for c in inspector.get_columns('kohteet')] if 'kohteet' in tables else []
-        if 'risk_level' not in kohteet_columns and 'kohteet' in tables:
-            logger.info("Lisätään risk_level-sarake kohteet-tauluun...")
-            with db.engine.connect() as conn:
-                with conn.begin():
-                    conn.execute(text("""
-                    ALTER TABLE kohteet 
-                    ADD COLUMN risk_level NUMERIC(3,1)
-                    """))
-            logger.info("risk_level-sarake lisätty onnistuneesti!")
-    except Exception as e:
-        logger.error(f"Virhe risk_level-sarakkeen lisäämisessä: {e}")
+# Tietokannan rakenne tarkistetaan käynnistyksessä vain, jos sitä ei hoideta erillisenä
+# vaiheena (python schema.py); SCHEMA_MANAGEMENT=manual nopeuttaa workerien käynnistystä
+if app.config.get('SCHEMA_MANAGEMENT', SCHEMA_STARTUP) == SCHEMA_STARTUP:
+    ensure_schema(app)
+else:
+    logger.info("Tietokannan rakenteen tarkistus ohitetaan (SCHEMA_MANAGEMENT=manual)")
 
 # Context processor lisää muuttujia ja funktioita Jinja2-templateihin
 @app.context_processor
@@ -291,7 +227,7 @@ def index():
     """Etusivu, jossa käyttäjä voi syöttää asuntolinkin tai näkee landing-sivun"""
     if current_user.is_authenticated:
         # Haetaan käyttäjän viimeisimmät analyysit
-        analyses = Analysis.query.filter_by(user_id=current_user.id).order_by(Analysis.created_at.desc()).limit(5).all()
+        analyses = summary_query(current_user.id).limit(5).all()
         return render_template('index.html', analyses=analyses)
     else:
         return render_template('landing.html')
@@ -306,116 +242,15 @@ def _sanitize_content(content):
     content = re.sub(r'<script\b[^<]*(?:(?!<\/script>)<[^<]*)*<\/script>', '', content)
     return content
 
-# Funktio joka päättelee URL-tyypin ja hakee asuntotiedot oikealla tavalla
-def get_property_data(url):
-    """
-    Hakee asunnon tiedot URL:n perusteella joko käyttäen oikotie_downloader-moduulia (Oikotie) 
-    tai etuovi_downloader-moduulia (Etuovi)
-    
-    Args:
-        url (str): Asuntoilmoituksen URL
-        
-    Returns:
-        tuple: (success, markdown_data, source)
-            - success (bool): True jos haku onnistui, False muuten
-            - markdown_data (str): Asunnon tiedot markdown-muodossa tai None jos haku epäonnistui
-            - source (str): Lähteen nimi ('oikotie' tai 'etuovi')
-    """
-    # Tarkistetaan URL:n tyyppi
-    if 'oikotie.fi' in url or 'asunnot.oikotie.fi' in url:
-        # Käytetään Oikotie-downloaderia
-        logger.info(f"Oikotie URL havaittu: {url}")
-        try:
-            # Haetaan asunnon tiedot oikotie_downloader-moduulilla
-            logger.info("Haetaan tiedot oikotie_downloader-moduulilla...")
-            text_content = oikotie_downloader.get_property_info(url, verbose=False)
-            
-            # Määritellään property_id
-            match = re.search(r'/(\d+)/?$', url)
-            property_id = match.group(1) if match else "unknown"
-            
-            # Muunnetaan teksti markdown-muotoon
-            logger.info("Muotoillaan teksti markdown-muotoon...")
-            markdown_data = f"""# Oikotie-asuntoilmoitus
-
-## Perustiedot
-URL: {url}
-Lähde: Oikotie.fi
-Ilmoitus-ID: {property_id}
-
-## Ilmoituksen sisältö
-{text_content}
-"""
-            return True, markdown_data, 'oikotie'
-            
-        except Exception as e:
-            logger.error(f"Virhe Oikotie-datan noutamisessa: {e}")
-            logger.error(traceback.format_exc())
-            return False, None, 'oikotie'
-        
-    elif 'etuovi.com' in url:
-        # Käytetään Etuovi-downloaderia
-        logger.info(f"Etuovi URL havaittu: {url}")
-        try:
-            # Määritellään tiedostonimi
-            property_id = url.split('/')[-1]
-            pdf_filename = f"etuovi_{property_id}.pdf"
-            
-            # Ladataan PDF ja muunnetaan tekstiksi
-            logger.info("Ladataan PDF Etuovesta...")
-            pdf_path = etuovi_downloader.download_pdf(url, pdf_filename, headless=True)
-            
-            logger.info("Muunnetaan PDF tekstiksi...")
-            text_path = etuovi_downloader.convert_pdf_to_text(pdf_path)
-            
-            # Luetaan tekstitiedosto
-            with open(text_path, 'r', encoding='utf-8') as f:
-                text_content = f.read()
-            
-            # Muunnetaan etuovi-teksti markdown-muotoon
-            logger.info("Muotoillaan teksti markdown-muotoon...")
-            markdown_data = f"""# Etuovi-asuntoilmoitus
-
-## Perustiedot
-URL: {url}
-Lähde: Etuovi.com
-Ilmoitus-ID: {property_id}
-
-## Ilmoituksen sisältö
-{text_content}
-"""
-            
-            # Poista tilapäiset tiedostot
-            try:
-                os.remove(pdf_path)
-                os.remove(text_path)
-                logger.info("Tilapäiset tiedostot poistettu")
-            except Exception as e:
-                logger.warning(f"Tilapäisten tiedostojen poistaminen epäonnistui: {e}")
-                
-            return True, markdown_data, 'etuovi'
-            
-        except Exception as e:
-            logger.error(f"Virhe Etuovi-datan noutamisessa: {e}")
-            logger.error(traceback.format_exc())
-            return False, None, 'etuovi'
-    else:
-        # Tuntematon URL-tyyppi
-        logger.warning(f"Tuntematon URL-tyyppi: {url}")
-        return False, None, 'unknown'
-
 @app.route('/analyze', methods=['POST'])
 @login_required
 def analyze():
-    """Analysointi-reitti, joka ottaa vastaan URL:n ja palauttaa analyysin"""
+    """Analysointi-reitti, joka ottaa vastaan URL:n ja lisää analyysin taustajonoon"""
     try:
-        # Luodaan sessio ID jokaiselle analyysi-pyynnölle
-        import uuid
-        session_id = str(uuid.uuid4())
-        logger.info(f"Aloitetaan analyysi käyttäjälle {current_user.id}, sessio {session_id}")
+        logger.info(f"Vastaanotettu analyysipyyntö käyttäjältä {current_user.id}")
         
         # Tarkista käyttäjän oikeus tehdä analyysi
-        if not current_user.can_make_api_call():
+        if not quota_service.entitlement(current_user):
             flash('Sinulla ei ole oikeutta tehdä enempää analyysejä. Hanki lisää analyysejä ostamalla paketti.', 'danger')
             return redirect(url_for('products'))
             
@@ -426,197 +261,26 @@ def analyze():
             return redirect(url_for('index'))
         
         # Tarkistetaan, että URL on hyväksytty URL (Oikotie tai Etuovi)
-        if ('oikotie.fi' not in url and 'asunnot.oikotie.fi' not in url and 
-            'etuovi.com' not in url):
+        if not analysis_pipeline.is_supported_url(url):
             flash('Syötä kelvollinen Oikotie- tai Etuovi-asuntolinkin URL', 'danger')
             return redirect(url_for('index'))
         
-        # Haetaan asunnon tiedot URL:n perusteella
-        logger.info(f"Haetaan tietoja URL:sta: {url}")
-        success, markdown_data, source = get_property_data(url)
+        # Tarkistetaan, onko kohde jo analysoitu tällä käyttäjällä (alle 7 päivää sitten)
+        existing_analysis = analysis_pipeline.find_recent_analysis(url, current_user.id)
+        if existing_analysis:
+            logger.info(f"Käytetään olemassa olevaa analyysiä {existing_analysis.id} (alle 7 päivää vanha)")
+            analysis_pipeline.ensure_risk_analysis(existing_analysis, current_user.id)
+            return redirect(url_for('view_analysis', analysis_id=existing_analysis.id))
         
-        if not success or not markdown_data:
-            logger.error("Asuntoilmoituksen noutaminen epäonnistui")
-            flash("Ilmoituksen hakemisessa tapahtui virhe. Ole hyvä, yritä myöhemmin uudelleen.", 'danger')
-            return redirect(url_for('index'))
-        
-        # Haetaan kohteen perustiedot ensin KAT API:n avulla
-        property_data = None
-        kohde_id = None
-        kohde_tyyppi = None
-        try:
-            logger.info("Haetaan kohteen perustiedot KAT API:lla")
-            property_data_json = info_extract.get_property_data(markdown_data)
-            
-            if property_data_json:
-                # Muunnetaan JSON-merkkijono sanakirjaksi
-                try:
-                    property_data = json.loads(property_data_json)
-                    logger.info("JSON-merkkijono muunnettu sanakirjaksi onnistuneesti")
-                except json.JSONDecodeError as e:
-                    logger.error(f"Virhe JSON-merkkijonon muuntamisessa sanakirjaksi: {e}")
-                    property_data = None
-                
-                # Tallennetaan kohteet-tauluun ilman analysis_id:tä, liitetään myöhemmin
-                logger.info("Tallennetaan kohteen tiedot tietokantaan")
-                
-                # Varmistetaan että kohde tallennetaan käyttäjäkohtaisesti
-                logger.info(f"Kohde tallennetaan käyttäjälle {current_user.id}, sessio {session_id}")
-                kohde_id = info_extract.save_property_data_to_db(property_data, user_id=current_user.id)
-                
-                if kohde_id:
-                    logger.info(f"Kohde tallennettu tietokantaan ID:llä {kohde_id}")
-                    # Haetaan kohteen tyyppi
-                    kohde = Kohde.query.get(kohde_id)
-                    if kohde and kohde.tyyppi:
-                        kohde_tyyppi = kohde.tyyppi
-                        logger.info(f"Kohteen tyyppi: {kohde_tyyppi}")
-                    
-                    # Linkitetään kohde käyttäjään manuaalisesti päivittämällä kohteen tiedot
-                    try:
-                        if kohde:
-                            # Varmistetaan että kohde on sidottu käyttäjään päivittämällä analysis myöhemmin
-                            logger.info(f"Kohde {kohde_id} merkitty käyttäjälle {current_user.id}")
-                    except Exception as e:
-                        logger.error(f"Virhe kohteen käyttäjäsidonnaisuuden päivityksessä: {e}")
-                else:
-                    logger.warning("Kohteen tallentaminen epäonnistui")
-            else:
-                logger.warning("Kohteen perustietoja ei saatu")
-        except Exception as e:
-            logger.error(f"Virhe kohteen tietojen käsittelyssä: {e}")
-        
-        # Tarkistetaan, onko kohde jo analysoitu tällä käyttäjällä
-        existing_analysis = None
-        try:
-            existing_analysis = Analysis.query.filter_by(
-                property_url=url, 
-                user_id=current_user.id
-            ).first()
-            
-            if existing_analysis:
-                logger.info(f"Käyttäjällä {current_user.id} on jo analyysi tälle URL:lle: {existing_analysis.id}")
-                
-                # Tarkistetaan onko analyysi tuore (alle 7 päivää vanha)
-                if existing_analysis.created_at > datetime.utcnow() - timedelta(days=7):
-                    logger.info(f"Käytetään olemassa olevaa analyysiä {existing_analysis.id} (alle 7 päivää vanha)")
-                    
-                    analysis_response = existing_analysis.content
-                    saved_file = existing_analysis.filename
-                    analysis_id = existing_analysis.id
-                    
-                    # Haetaan olemassa oleva riskianalyysi
-                    riski_data = None
-                    try:
-                        risk_db = RiskAnalysis.query.filter_by(
-                            analysis_id=analysis_id, 
-                            user_id=current_user.id
-                        ).first()
-                        
-                        if risk_db and risk_db.risk_data:
-                            riski_data = json.loads(risk_db.risk_data)
-                            logger.info(f"Käytetään olemassa olevaa riskianalyysiä analyysille {analysis_id}")
-                        else:
-                            # Jos riskianalyysiä ei löydy, tehdään se nyt
-                            logger.info(f"Olemassa olevalle analyysille ei löydy riskianalyysiä, tehdään se nyt")
-                            riski_data_json = riskianalyysi(analysis_response, analysis_id, current_user.id)
-                            if riski_data_json:
-                                riski_data = json.loads(riski_data_json)
-                    except Exception as e:
-                        logger.error(f"Virhe riskianalyysin hakemisessa: {e}")
-                    
-                    # Ohjataan käyttäjä suoraan analyysin sivulle
-                    return redirect(url_for('view_analysis', analysis_id=analysis_id))
-        except Exception as e:
-            logger.error(f"Virhe tarkistettaessa olemassa olevia analyysejä: {e}")
-        
-        # Käytetään OpenAI API:a analyysin tekemiseen
-        logger.info(f"Tehdään OpenAI API -kutsu analyysia varten käyttäjälle {current_user.id}, sessio {session_id}")
-        analysis_response, saved_file, db_analysis_id = api_call.get_analysis(markdown_data, url, kohde_tyyppi, current_user.id)
-        
-        if not analysis_response:
-            logger.error("API-kutsu palautti tyhjän vastauksen")
-            flash("Analyysin muodostamisessa tapahtui virhe. Ole hyvä, yritä myöhemmin uudelleen.", 'danger')
-            return redirect(url_for('index'))
-            
-        # Varmistetaan että vastaus on puhdistettu (API:ssa puhdistus tehdään jo, tämä on varmuuden vuoksi)
-        analysis_response = api_call.sanitize_markdown_response(analysis_response)
-        
-        # Käytetään suoraan API:n palauttamaa analysis_id:tä jos se on saatavilla
-        analysis_id = db_analysis_id
-        
-        # Jos analysis_id ei ole saatavilla, yritetään hakea se tietokannasta
-        if not analysis_id:
-            # Haetaan analyysi tietokannasta URL:n perusteella
-            analysis = Analysis.query.filter_by(property_url=url, user_id=current_user.id).first()
-            if analysis:
-                analysis_id = analysis.id
-                logger.info(f"Käytetään olemassa olevaa analyysiä ID: {analysis_id}")
-        
-        # Jos meillä on nyt kohde_id ja analysis_id, päivitetään kohteen analysis_id
-        if kohde_id and analysis_id:
-            try:
-                logger.info(f"Päivitetään kohteen {kohde_id} analysis_id = {analysis_id}")
-                kohde = Kohde.query.get(kohde_id)
-                if kohde:
-                    kohde.analysis_id = analysis_id
-                    
-                    # Varmistetaan että kohde on sidottu käyttäjään
-                    if not kohde.user_id:
-                        kohde.user_id = current_user.id
-                        
-                    db.session.commit()
-                    logger.info("Kohteen analysis_id päivitetty onnistuneesti")
-                else:
-                    logger.warning(f"Kohdetta ID:llä {kohde_id} ei löytynyt")
-            except Exception as e:
-                logger.error(f"Virhe kohteen analysis_id:n päivittämisessä: {e}")
-                # Session rollback virheen sattuessa
-                db.session.rollback()
-        
-        # Tehdään riskianalyysi API-vastauksesta, jos analyysi on löydetty
-        riski_data = None
-        if analysis_id:
-            try:
-                logger.info(f"Tehdään riskianalyysi kohteesta, analyysi {analysis_id}, käyttäjä {current_user.id}")
-                riski_data_json = riskianalyysi(analysis_response, analysis_id, current_user.id)
-                logger.info(f"Saatiin riskianalyysin JSON vastaus pituudella: {len(riski_data_json)}")
-                riski_data = json.loads(riski_data_json)
-                logger.info(f"Riskianalyysi valmis: {riski_data.get('kokonaisriskitaso', 'N/A')}/10")
-            except Exception as e:
-                logger.error(f"Virhe riskianalyysissä: {e}")
-                logger.error(traceback.format_exc())
-        
-        # Jos käyttäjällä ei ole kuukausijäsenyyttä, vähennä jäljellä olevia analyysejä
-        active_subscription = Subscription.query.filter_by(
-            user_id=current_user.id, 
-            status='active',
-            subscription_type='monthly'
-        ).first()
-        
-        if not current_user.is_admin and not active_subscription:
-            logger.info(f"Vähennetään yksi analyysi käyttäjältä {current_user.id}. Analyysejä jäljellä ennen vähennystä: {current_user.analyses_left}")
-            current_user.decrement_analyses_left()
-            logger.info(f"Analyysejä jäljellä vähennyksen jälkeen: {current_user.analyses_left}")
-        
-        # Ohjataan käyttäjä analyysin sivulle sen sijaan että renderöidään results.html
-        logger.info(f"Analyysi valmis käyttäjälle {current_user.id}, sessio {session_id}")
+        # Varataan analyysi ennen jonoon lisäämistä; epäonnistunut analyysi palautetaan
+        reservation = quota_service.reserve(current_user)
+        if not reservation:
+            flash('Sinulla ei ole oikeutta tehdä enempää analyysejä. Hanki lisää analyysejä ostamalla paketti.', 'danger')
+            return redirect(url_for('products'))
         
-        if analysis_id:
-            return redirect(url_for('view_analysis', analysis_id=analysis_id))
-        else:
-            # Jos jostain syystä analysis_id ei ole saatavilla, renderöidään results.html
-            # Sanitoidaan sisältö ennen template-renderöintiä
-            sanitized_markdown = _sanitize_content(markdown_data)
-            sanitized_analysis = _sanitize_content(analysis_response)
-            
-            return render_template('results.html', 
-                            property_data=sanitized_markdown, 
-                            analysis=sanitized_analysis,
-                              riski_data=riski_data,
-                              property_url=url,
-                              analysis_id=analysis_id,
-                              source=source)
+        # Lisätään analyysi jonoon ja ohjataan käyttäjä seuraamaan sen etenemistä
+        job = _enqueue_reserved(current_user.id, url, reservation)
+        return redirect(url_for('view_analysis_job', job_id=job.id))
         
     except Exception as e:
         logger.error(f"Virhe asuntoanalyysissa: {e}")
@@ -625,170 +289,211 @@ def analyze():
                               error_title="Virhe analyysissä", 
                               error_message=f"Analysoinnissa tapahtui virhe: {str(e)}"), 500
 
+def _enqueue_reserved(user_id, url, reservation):
+    """Lisää analyysin jonoon varauksen kanssa ja palauttaa varauksen, jos lisäys epäonnistuu"""
+    try:
+        return analysis_job_queue.enqueue(user_id, url, options={'quota': reservation})
+    except Exception:
+        db.session.rollback()
+        quota_service.refund(user_id, reservation)
+        raise
+
+@app.route('/analyze/job/<job_id>')
+@login_required
+def view_analysis_job(job_id):
+    """Näyttää jonossa olevan analyysin etenemisen ja ohjaa valmiiseen analyysiin"""
+    job = analysis_job_queue.get_job(job_id, user_id=current_user.id)
+    if not job:
+        abort(404)
+    
+    if job.status == 'done' and job.analysis_id:
+        return redirect(url_for('view_analysis', analysis_id=job.analysis_id))
+    
+    if job.status == 'done':
+        # Jos jostain syystä analysis_id ei ole saatavilla, renderöidään results.html
+        result = analysis_job_queue.job_result(job) or {}
+        return render_template('results.html',
+                              property_data=_sanitize_content(result.get('property_data')),
+                              analysis=_sanitize_content(result.get('analysis')),
+                              riski_data=result.get('risk_analysis'),
+                              property_url=job.property_url,
+                              analysis_id=None,
+                              source=job.source)
+    
+    return render_template('analysis_job.html', job=job)
+
+# Välityspalvelimet eivät saa puskuroida striimattua vastausta
+STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+def _follow_job_events(job_id, user_id, offset=0):
+    """
+    Seuraa työn tapahtumia ja lisää valmiin analyysin osoitteen done-tapahtumaan.
+    Tapahtumiin lisätään 'offset', eli asiakkaan siihen mennessä saaman tekstin pituus,
+    jolla seurantaa voi jatkaa uudella yhteydellä.
+    """
+    for event in analysis_job_queue.follow(job_id, user_id=user_id, offset=offset):
+        if event['type'] == 'delta':
+            offset += len(event['text'])
+        elif event['type'] == 'reset':
+            offset = len(event['text'])
+        elif event['type'] == 'done' and event.get('analysis_id'):
+            event['analysis_url'] = url_for('view_analysis', analysis_id=event['analysis_id'])
+        event['offset'] = offset
+        yield event
+
+def _stream_offset():
+    """Lukee jatkokohdan SSE:n Last-Event-ID-otsakkeesta tai offset-parametrista"""
+    try:
+        return max(0, int(request.headers.get('Last-Event-ID') or request.args.get('offset') or 0))
+    except ValueError:
+        return 0
+
+def _job_stream_response(events, release, mimetype, status=200):
+    """Striimaa tapahtumat ja vapauttaa striimipaikan, kun vastaus suljetaan"""
+    return Response(stream_with_context(ClosingIterator(events, release)), status=status,
+                    mimetype=mimetype, headers=STREAM_HEADERS)
+
+@app.route('/analyze/job/<job_id>/stream')
+@login_required
+def stream_analysis_job(job_id):
+    """
+    Striimaa jonossa olevan analyysin vaiheet ja tekstin selaimelle Server-Sent Events -muodossa.
+    Yhteys suljetaan ANALYSIS_STREAM_TIMEOUT-ajan jälkeen, ja selain jatkaa uudella yhteydellä
+    Last-Event-ID-otsakkeen kertomasta kohdasta. Jos prosessin striimipaikat ovat käytössä,
+    palautetaan 503 ja selain seuraa tilaa kyselemällä.
+    """
+    job = analysis_job_queue.get_job(job_id, user_id=current_user.id)
+    if not job:
+        abort(404)
+    
+    release = analysis_job_queue.acquire_stream()
+    if release is None:
+        return Response("Striimipaikat ovat käytössä", status=503, headers={'Retry-After': '5'})
+    
+    user_id = current_user.id
+    offset = _stream_offset()
+    
+    def generate():
+        # Yhteyden sulkeuduttua selain jatkaa sekunnin kuluttua
+        yield "retry: 1000\n\n"
+        for event in _follow_job_events(job_id, user_id, offset):
+            if event['type'] == 'timeout':
+                # Palvelin sulkee yhteyden, selain avaa uuden automaattisesti
+                return
+            yield f"id: {event['offset']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return _job_stream_response(generate(), release, 'text/event-stream')
+
 @app.route('/api/analyze', methods=['POST'])
 @login_required
 def api_analyze():
-    """API-pääte, joka ottaa vastaan URL:n ja palauttaa analyysin JSON-muodossa"""
+    """
+    API-pääte, joka ottaa vastaan URL:n, lisää analyysin jonoon ja palauttaa työn tunnisteen.
+    Jos pyynnössä on "stream": true tai Accept: application/x-ndjson, työn vaiheet ja
+    analyysin teksti striimataan samassa vastauksessa NDJSON-riveinä. Striimi päättyy
+    timeout-tapahtumaan, jonka events_url jatkaa seurantaa. Jos striimipaikkoja ei ole
+    vapaana, palautetaan tavallinen vastaus ja tila haetaan status_url-osoitteesta.
+    """
     try:
-        # Tarkistetaan onko käyttäjä oikeutettu tekemään API-kutsun
-        if not current_user.can_make_api_call():
-            return jsonify({
-                'error': 'API-kutsujen rajoitus', 
-                'message': 'Sinulla ei ole oikeutta tehdä enempää analyysejä. Hanki lisää analyysejä ostamalla paketti.'
-            }), 403
-        
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         url = data.get('url')
         
         if not url:
             return jsonify({'error': 'URL-osoite puuttuu'}), 400
         
         # Tarkistetaan, että URL on hyväksytty URL (Oikotie tai Etuovi)
-        if ('oikotie.fi' not in url and 'asunnot.oikotie.fi' not in url and 
-            'etuovi.com' not in url):
+        if not analysis_pipeline.is_supported_url(url):
             return jsonify({'error': 'Syötä kelvollinen Oikotie- tai Etuovi-asuntolinkin URL'}), 400
         
-        # Haetaan asunnon tiedot URL:n perusteella
-        logger.info(f"Haetaan tietoja URL:sta: {url}")
-        success, markdown_data, source = get_property_data(url)
-        
-        if not success or not markdown_data:
-            logger.error("API: Asuntoilmoituksen noutaminen epäonnistui")
+        # Varataan käyttäjältä analyysi; epäonnistunut analyysi palautetaan
+        reservation = quota_service.reserve(current_user)
+        if not reservation:
             return jsonify({
-                'error': 'Ilmoituksen hakemisessa tapahtui virhe', 
-                'message': 'Ilmoituksen hakemisessa tapahtui virhe. Ole hyvä, yritä myöhemmin uudelleen.'
-            }), 500
-        
-        # Haetaan kohteen perustiedot ensin KAT API:n avulla
-        property_data = None
-        kohde_id = None
-        kohde_tyyppi = None
-        try:
-            logger.info("API: Haetaan kohteen perustiedot KAT API:lla")
-            property_data_json = info_extract.get_property_data(markdown_data)
-            
-            if property_data_json:
-                # Muunnetaan JSON-merkkijono sanakirjaksi
-                try:
-                    property_data = json.loads(property_data_json)
-                    logger.info("JSON-merkkijono muunnettu sanakirjaksi onnistuneesti")
-                except json.JSONDecodeError as e:
-                    logger.error(f"Virhe JSON-merkkijonon muuntamisessa sanakirjaksi: {e}")
-                    property_data = None
-                
-                # Tallennetaan kohteet-tauluun ilman analysis_id:tä, liitetään myöhemmin
-                logger.info("API: Tallennetaan kohteen tiedot tietokantaan")
-                kohde_id = info_extract.save_property_data_to_db(property_data, user_id=current_user.id)
-                if kohde_id:
-                    logger.info(f"API: Kohde tallennettu tietokantaan ID:llä {kohde_id}")
-                    # Haetaan kohteen tyyppi
-                    kohde = Kohde.query.get(kohde_id)
-                    if kohde and kohde.tyyppi:
-                        kohde_tyyppi = kohde.tyyppi
-                        logger.info(f"API: Kohteen tyyppi: {kohde_tyyppi}")
-                else:
-                    logger.warning("API: Kohteen tallentaminen epäonnistui")
-            else:
-                logger.warning("API: Kohteen perustietoja ei saatu")
-        except Exception as e:
-            logger.error(f"API: Virhe kohteen tietojen käsittelyssä: {e}")
-        
-        # Käytetään OpenAI API:a analyysin tekemiseen
-        logger.info("Tehdään OpenAI API -kutsu analyysia varten")
-        analysis_response, saved_file, db_analysis_id = api_call.get_analysis(markdown_data, url, kohde_tyyppi, current_user.id)
-        
-        if not analysis_response:
-            logger.error("API-kutsu palautti tyhjän vastauksen")
-            return jsonify({'error': 'API-analyysi epäonnistui'}), 500
-            
-        # Varmistetaan että vastaus on puhdistettu (API:ssa puhdistus tehdään jo)
-        analysis_response = api_call.sanitize_markdown_response(analysis_response)
-        
-        # Jos käyttäjällä ei ole kuukausijäsenyyttä, vähennä jäljellä olevia analyysejä
-        active_subscription = Subscription.query.filter_by(
-            user_id=current_user.id, 
-            status='active',
-            subscription_type='monthly'
-        ).first()
-        
-        if not current_user.is_admin and not active_subscription:
-            logger.info(f"API: Vähennetään yksi analyysi käyttäjältä {current_user.id}. Analyysejä jäljellä ennen vähennystä: {current_user.analyses_left}")
-            current_user.decrement_analyses_left()
-            logger.info(f"API: Analyysejä jäljellä vähennyksen jälkeen: {current_user.analyses_left}")
-        
-        # Käytetään suoraan API:n palauttamaa analysis_id:tä jos se on saatavilla
-        analysis_id = db_analysis_id
-        
-        # Jos analysis_id ei ole saatavilla, yritetään hakea se tietokannasta
-        if not analysis_id:
-            # Haetaan analyysi tietokannasta URL:n perusteella
-            analysis = Analysis.query.filter_by(property_url=url, user_id=current_user.id).first()
-            if analysis:
-                analysis_id = analysis.id
-                logger.info(f"Käytetään olemassa olevaa analyysiä ID: {analysis_id}")
+                'error': 'API-kutsujen rajoitus', 
+                'message': 'Sinulla ei ole oikeutta tehdä enempää analyysejä. Hanki lisää analyysejä ostamalla paketti.'
+            }), 403
         
-        # Jos meillä on nyt kohde_id ja analysis_id, päivitetään kohteen analysis_id
-        if kohde_id and analysis_id:
-            try:
-                logger.info(f"Päivitetään kohteen {kohde_id} analysis_id = {analysis_id}")
-                kohde = Kohde.query.get(kohde_id)
-                if kohde:
-                    kohde.analysis_id = analysis_id
-                    db.session.commit()
-                    logger.info("Kohteen analysis_id päivitetty onnistuneesti")
-                else:
-                    logger.warning(f"Kohdetta ID:llä {kohde_id} ei löytynyt")
-            except Exception as e:
-                logger.error(f"Virhe kohteen analysis_id:n päivittämisessä: {e}")
-                logger.error(traceback.format_exc())
+        job = _enqueue_reserved(current_user.id, url, reservation)
         
-        # Tehdään riskianalyysi API-vastauksesta, jos analyysi on löydetty
-        riski_data = None
-        if analysis_id:
-            try:
-                logger.info("API: Tehdään riskianalyysi kohteesta")
-                riski_data_json = riskianalyysi(analysis_response, analysis_id, current_user.id)
-                logger.info(f"API: Saatiin riskianalyysin JSON vastaus pituudella: {len(riski_data_json)}")
-                riski_data = json.loads(riski_data_json)
-                logger.info(f"API: Riskianalyysi valmis: {riski_data.get('kokonaisriskitaso', 'N/A')}/10")
-            except Exception as e:
-                logger.error(f"API: Virhe riskianalyysissä: {e}")
-                riski_data = None
+        # Palautetaan työn tunniste heti, tila haetaan /api/jobs/<job_id> -päätteestä
+        response_data = job.to_dict()
+        response_data['status_url'] = url_for('api_job_status', job_id=job.id)
+        response_data['events_url'] = url_for('api_job_events', job_id=job.id)
         
-        # Palautetaan analyysi, raakatiedot ja riskianalyysi JSON-muodossa
-        response_data = {
-            'property_data': markdown_data,
-            'analysis': analysis_response,
-            'source': source
-        }
+        # Striimaava asiakas saa tapahtumat NDJSON-riveinä samassa vastauksessa
+        if data.get('stream') or 'application/x-ndjson' in request.headers.get('Accept', ''):
+            release = analysis_job_queue.acquire_stream()
+            if release is not None:
+                header = json.dumps(dict(response_data, type='job'), ensure_ascii=False) + "\n"
+                return _job_stream_response(_ndjson_events(job.id, current_user.id, 0, header), release,
+                                            'application/x-ndjson', status=202)
         
-        # Lisätään analyysin ID vastaukseen, jos se on saatavilla
-        if analysis_id:
-            response_data['analysis_id'] = analysis_id
-        
-        # Lisätään perustiedot vastaukseen, jos ne on saatavilla
-        if property_data:
-            response_data['basic_property_data'] = property_data
-            
-        # Lisätään riskianalyysi vastaukseen, jos se on saatavilla
-        if riski_data:
-            response_data['risk_analysis'] = riski_data
-            
-        return jsonify(response_data)
+        return jsonify(response_data), 202
         
     except Exception as e:
         logger.error(f"Virhe API-analyysin teossa: {e}")
         return jsonify({'error': f'Virhe: {str(e)}'}), 500
 
+def _ndjson_events(job_id, user_id, offset, header=None):
+    """Muotoilee työn tapahtumat NDJSON-riveiksi; timeout-tapahtumaan lisätään jatko-osoite"""
+    if header:
+        yield header
+    for event in _follow_job_events(job_id, user_id, offset):
+        if event['type'] == 'timeout':
+            event['events_url'] = url_for('api_job_events', job_id=job_id, offset=event['offset'])
+        yield json.dumps(event, ensure_ascii=False) + "\n"
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def api_job_events(job_id):
+    """Jatkaa työn tapahtumien NDJSON-striimiä offset-parametrin kertomasta kohdasta"""
+    job = analysis_job_queue.get_job(job_id, user_id=current_user.id)
+    if not job:
+        return jsonify({'error': 'Analyysityötä ei löytynyt'}), 404
+    
+    release = analysis_job_queue.acquire_stream()
+    if release is None:
+        response = jsonify({'error': 'Striimipaikat ovat käytössä',
+                            'status_url': url_for('api_job_status', job_id=job_id)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    return _job_stream_response(_ndjson_events(job_id, current_user.id, _stream_offset()), release,
+                                'application/x-ndjson')
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def api_job_status(job_id):
+    """Palauttaa jonossa olevan analyysin tilan ja valmiin analyysin tuloksen"""
+    job = analysis_job_queue.get_job(job_id, user_id=current_user.id)
+    if not job:
+        return jsonify({'error': 'Analyysityötä ei löytynyt'}), 404
+    
+    response_data = job.to_dict()
+    if job.status == 'done':
+        response_data['result'] = analysis_job_queue.job_result(job)
+        if job.analysis_id:
+            response_data['analysis_url'] = url_for('view_analysis', analysis_id=job.analysis_id)
+    
+    return jsonify(response_data)
+
 @app.route('/analyses')
 @login_required
 def list_analyses():
     """Näyttää kirjautuneen käyttäjän tallennetut analyysit"""
     try:
-        # Haetaan käyttäjän analyysit tietokannasta
-        analyses = Analysis.query.filter_by(user_id=current_user.id).order_by(Analysis.created_at.desc()).all()
+        # Haetaan yksi sivu käyttäjän analyysejä ilman analyysien sisältöä
+        search = request.args.get('q', '').strip() or None
+        before = request.args.get('before')
+        analyses, next_cursor = list_analyses_page(
+            current_user.id,
+            before=before,
+            page_size=app.config.get('ANALYSIS_LIST_PAGE_SIZE', 50),
+            search=search
+        )
         
-        return render_template('analyses.html', analyses=analyses)
+        return render_template('analyses.html', analyses=analyses, next_cursor=next_cursor,
+                               is_first_page=not before, search=search)
         
     except Exception as e:
         logger.exception(f"Virhe analyysien listaamisessa: {e}")
@@ -904,7 +609,7 @@ def upload_pdf():
     """Handle PDF uploads and process them using info_extract to extract data"""
     try:
         # Check if the user is allowed to make API calls
-        if not current_user.can_make_api_call():
+        if not quota_service.entitlement(current_user):
             return render_template('error.html', 
                                 error_title="API-kutsujen rajoitus", 
                                 error_message="Olet käyttänyt kaikki API-kutsusi (2). Päivitä tilisi admin-tasoon jatkaaksesi käyttöä."), 403
@@ -921,12 +626,9 @@ def upload_pdf():
             return jsonify({'error': 'PDF-tiedostoa ei valittu'}), 400
             
         if pdf_file:
-            # Create a temporary file to save the uploaded PDF
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp:
-                pdf_path = temp.name
-                pdf_file.save(pdf_path)
-                
-            logger.info(f"PDF-tiedosto tallennettu väliaikaisesti: {pdf_path}")
+            # Luetaan PDF muistiin ja jäsennetään kerran; sama dokumentti kulkee kaikkien vaiheiden läpi
+            pdf_document = PdfDocument(pdf_file.read(), name=pdf_file.filename)
+            logger.info(f"PDF-tiedosto luettu muistiin: {pdf_file.filename} ({len(pdf_document.data)} tavua)")
             
             try:
                 # Create property ID based on the file name and timestamp
@@ -936,9 +638,10 @@ def upload_pdf():
                 # Suorita PDF-tiedoston tietojen poiminta käyttäen info_extract-moduulia
                 logger.info("Poimitaan tietoja PDF-tiedostosta info_extract-moduulilla...")
                 extracted_data = info_extract.process_single_pdf(
-                    pdf_path=pdf_path, 
+                    pdf_path=pdf_document, 
                     kaupunki_nimi="PDF-lataus",
-                    user_id=current_user.id
+                    user_id=current_user.id,
+                    filename=pdf_file.filename
                 )
                 
                 # Tarkistetaan saatiinko kohde_id suoraan process_single_pdf-funktiosta
@@ -959,7 +662,7 @@ def upload_pdf():
                     
                     # Jos suora poiminta epäonnistui, yritetään vaihtoehtoista tapaa
                     # Extract text from PDF for API analysis
-                    text_content = oikotie_downloader.extract_text_from_pdf(pdf_path)
+                    text_content = oikotie_downloader.extract_text_from_pdf(pdf_document)
                     
                     # Format text into markdown for analysis
                     markdown_data = f"""# PDF-asuntoilmoitus
@@ -1011,7 +714,7 @@ ID: {property_id}
                 # Käytetään samaa markdown_data-muuttujaa OpenAI API:n kutsuun
                 if 'markdown_data' not in locals():
                     # Jos markdown_data ei ole vielä määritelty, määritellään se nyt
-                    text_content = oikotie_downloader.extract_text_from_pdf(pdf_path)
+                    text_content = oikotie_downloader.extract_text_from_pdf(pdf_document)
                     markdown_data = f"""# PDF-asuntoilmoitus
 
 ## Perustiedot
@@ -1086,13 +789,6 @@ ID: {property_id}
                         logger.error(f"Virhe riskianalyysissä: {e}")
                         logger.error(traceback.format_exc())
                 
-                # Remove the temporary file
-                try:
-                    os.remove(pdf_path)
-                    logger.info("Tilapäinen PDF-tiedosto poistettu")
-                except Exception as e:
-                    logger.warning(f"Tilapäisen PDF-tiedoston poistaminen epäonnistui: {e}")
-                
                 # Redirect to the analysis page instead of rendering results
                 if analysis_id:
                     return redirect(url_for('view_analysis', analysis_id=analysis_id))
@@ -1110,13 +806,6 @@ ID: {property_id}
                 logger.error(f"Virhe PDF:n käsittelyssä: {e}")
                 logger.error(traceback.format_exc())
                 
-                # Clean up temporary file if it exists
-                if os.path.exists(pdf_path):
-                    try:
-                        os.remove(pdf_path)
-                    except:
-                        pass
-                
                 return render_template('error.html', 
                                     error_title="Virhe PDF-tiedoston käsittelyssä", 
                                     error_message=f"PDF-tiedoston käsittelyssä tapahtui virhe: {str(e)}"), 500
@@ -1576,6 +1265,7 @@ def debug_session():
         "cookies": cookie_data,
         "config": {
             "session_type": app.config.get('SESSION_TYPE'),
+            "session_backend": session_backend,
             "session_permanent": app.config.get('SESSION_PERMANENT'),
             "session_cookie_secure": app.config.get('SESSION_COOKIE_SECURE'),
             "session_cookie_httponly": app.config.get('SESSION_COOKIE_HTTPONLY'),
@@ -1713,12 +1403,27 @@ def debug_paytrail(product_id):
         logger.exception(f"Error in debug Paytrail: {e}")
         return jsonify({"error": str(e)}), 500
 
-# Start subscription scheduler if in production or if specified
-if os.environ.get('FLASK_ENV') == 'production' or os.environ.get('RUN_SUBSCRIPTION_SCHEDULER') == 'true':
-    logger.info("Starting subscription scheduler...")
-    with app.app_context():
-        subscription_scheduler.start()
-    logger.info("Subscription scheduler started")
+# Alustetaan ilmoitusten, LLM-vastausten ja käyttäjätietojen välimuistit sekä samanaikaisten analyysien yhdistäminen
+listing_cache.init_app(app)
+llm_cache.init_app(app)
+single_flight.init_app(app)
+entitlement_cache.init_app(app)
+
+# Alustetaan OpenAI-kutsujen yhdyskäytävä ja ladataan promptit muistiin
+llm_gateway.init_app(app)
+prompt_registry.init_app(app)
+text_condenser.init_app(app)
+
+# Alustetaan Etuovi-latausten selainpooli
+browser_pool.init_app(app)
+
+# Alustetaan analyysien taustajono
+analysis_job_queue.init_app(app)
+
+# Taustasäikeet ja tilausten ajastin (tuotannossa tai RUN_SUBSCRIPTION_SCHEDULER=true). Gunicornin
+# kanssa (BACKGROUND_SERVICES=worker) ne käynnistetään vasta workerissa, ks. gunicorn.conf.py
+if app.config.get('BACKGROUND_SERVICES', SERVICES_ON_IMPORT) == SERVICES_ON_IMPORT:
+    start_background_services(app)
 
 # Subscription management routes
 @app.route('/my-subscription', methods=['GET'])
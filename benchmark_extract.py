@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Kenttien poiminnan suorituskykytesti.
+
+Vertaa info_extract_etuovi-moduulin yhden läpikäynnin poimintaa kenttäkohtaisiin
+re.search-kutsuihin (aiempi toteutus) ja tulostaa läpäisyn dokumentteina sekunnissa.
+Molempien tulosten tarkistetaan olevan samat.
+
+Käyttö:
+    python benchmark_extract.py                      # synteettinen aineisto
+    python benchmark_extract.py polku/pdf-kansioon   # omat PDF-tiedostot
+    python benchmark_extract.py --documents 200 --rounds 5
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+from pdf_document import PdfDocument
+from info_extract_etuovi import LISTING_FIELDS, extract_listing_fields
+
+# Aiemman toteutuksen osoitelauseke
+LEGACY_ADDRESS_PATTERN = re.compile(
+    r"([A-ZÅÄÖa-zåäö]+\s\d+[A-Za-z]?(?:\s?[a-z])?,\s?[A-ZÅÄÖa-zåäö\- ]+,\s?[A-ZÅÄÖa-zåäö\-]+)"
+)
+
+# Synteettisen ilmoituksen rivit: tunniste ja esimerkkiarvo
+SAMPLE_LINES = [
+    ("Kaupunginosa", "Kallio"), ("Kohdenumero", "12345678"), ("Postitoimipaikka", "Helsinki"),
+    ("Asuinpinta-ala", "54,5 m²"), ("Kokonaispinta-ala", "60 m²"), ("Kerros", "3 / 5"),
+    ("Huoneiston kokoonpano", "2h+k+s"), ("Huoneita", "2"), ("Kunto", "Hyvä"),
+    ("Vapautuminen", "Sopimuksen mukaan"), ("Velaton hinta", "289 000 €"), ("Myyntihinta", "250 000 €"),
+    ("Velkaosuus", "39 000 €"), ("Neliöhinta", "5 302,75 € / m²"), ("Hoitovastike", "245,00 € / kk"),
+    ("Rahoitusvastike", "120,00 € / kk"), ("Vesimaksu", "20 € / hlö / kk"), ("Rakennusvuosi", "1962"),
+    ("Taloyhtiön nimi", "As Oy Esimerkki"), ("Rakennuksen tyyppi", "Kerrostalo"), ("Energialuokka", "D2018"),
+    ("Lämmitysmuoto", "Kaukolämpö"), ("Ilmanvaihto", "Koneellinen poisto"), ("Tontin omistus", "Oma"),
+    ("Keittiön varusteet", "Jääkaappipakastin, liesi, astianpesukone"), ("Sauna", "Oma sauna"),
+    ("Säilytystilat", "Kellarikomero"), ("Liikenneyhteydet", "Raitiovaunu 50 m"),
+]
+FILLER = (
+    "Valoisa ja hyväkuntoinen koti rauhallisella paikalla. Taloyhtiössä on tehty "
+    "useita remontteja ja lähipalvelut ovat kävelymatkan päässä."
+)
+
+
+def make_synthetic_text(rng):
+    """Luo satunnaisen ilmoitustekstin, jossa osa kentistä puuttuu"""
+    lines = ["Mannerheimintie 12 B, Kallio, Helsinki", FILLER]
+    for label, value in SAMPLE_LINES:
+        if rng.random() < 0.85:
+            lines.append(f"{label} {value}")
+        if rng.random() < 0.3:
+            lines.append(FILLER)
+    lines.append("Tehdyt remontit:")
+    lines.extend(f"{year} putkiremontti" for year in range(2000, 2000 + rng.randint(1, 6)))
+    return "\n".join(lines) * rng.randint(1, 3)
+
+
+def extract_per_field(full_text, kaupunki_nimi):
+    """Aiempi toteutus: jokaiselle kentälle oma re.search koko tekstiin"""
+    data = {"osoite": LEGACY_ADDRESS_PATTERN.search(full_text)}
+    for field in LISTING_FIELDS:
+        match = field.regex.search(full_text)
+        if field.name == "rahoitusmuoto" and match is None:
+            continue
+        data[field.name] = match
+        if field.name == "kaupunginosa":
+            data["kaupunki"] = kaupunki_nimi
+    return {k: (v.group(1).strip() if isinstance(v, re.Match) else v) for k, v in data.items()}
+
+
+def load_corpus(folder):
+    """Lukee kansion PDF-tiedostojen tekstit"""
+    texts = []
+    for root, _, files in os.walk(folder):
+        for filename in sorted(files):
+            if filename.lower().endswith(".pdf"):
+                texts.append(PdfDocument(os.path.join(root, filename)).layout_text())
+    return texts
+
+
+def measure(extract, texts, rounds):
+    """Palauttaa parhaan kierroksen läpäisyn dokumentteina sekunnissa"""
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for text in texts:
+            extract(text, "Helsinki")
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(texts) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kenttien poiminnan suorituskykytesti")
+    parser.add_argument("folder", nargs="?", help="Kansio, jonka PDF-tiedostoja käytetään aineistona")
+    parser.add_argument("--documents", type=int, default=500, help="Synteettisten dokumenttien määrä")
+    parser.add_argument("--rounds", type=int, default=3, help="Mittauskierrokset")
+    args = parser.parse_args()
+
+    if args.folder:
+        texts = load_corpus(args.folder)
+        if not texts:
+            print(f"Kansiosta {args.folder} ei löytynyt PDF-tiedostoja")
+            return 1
+        print(f"Aineisto: {len(texts)} PDF-tiedostoa kansiosta {args.folder}")
+    else:
+        rng = random.Random(42)
+        texts = [make_synthetic_text(rng) for _ in range(args.documents)]
+        print(f"Aineisto: {len(texts)} synteettistä ilmoitusta")
+
+    # Varmistetaan, että molemmat toteutukset tuottavat saman tuloksen
+    for text in texts:
+        expected = extract_per_field(text, "Helsinki")
+        actual = extract_listing_fields(text, "Helsinki")
+        if expected != actual:
+            print("VIRHE: toteutusten tulokset eroavat")
+            return 1
+
+    baseline = measure(extract_per_field, texts, args.rounds)
+    single_scan = measure(extract_listing_fields, texts, args.rounds)
+
+    print(f"Kenttäkohtaiset haut:  {baseline:10.1f} dokumenttia/s")
+    print(f"Yksi läpikäynti:       {single_scan:10.1f} dokumenttia/s")
+    print(f"Nopeutus:              {single_scan / baseline:10.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
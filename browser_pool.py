@@ -0,0 +1,221 @@
+"""
+Lämpimien headless Chrome -selainten pooli Etuovi-latauksia varten.
+
+Chromen käynnistys vie useita sekunteja ja satoja megatavuja muistia, joten
+selaimet pidetään käynnissä latausten välillä. Jokainen lainaus saa oman
+lataushakemiston, selaimen kunto tarkistetaan ennen lainausta ja selain
+kierrätetään tietyn käyttökerran jälkeen tai jos se on kaatunut. Samanaikaisten
+selainten määrää rajoitetaan semaforilla.
+"""
+
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPoolTimeout(Exception):
+    """Vapaata selainta ei saatu odotusajan kuluessa"""
+
+
+class PooledDriver:
+    """Poolin selain ja sen käyttötiedot"""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+        self.last_used_at = self.created_at
+
+
+class BrowserPool:
+    """
+    Rajattu pooli uudelleenkäytettäviä WebDriver-instansseja
+    """
+
+    def __init__(self, max_size=2, max_uses=20, max_idle=600, acquire_timeout=90):
+        self.enabled = True
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self.acquire_timeout = acquire_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_size)
+        self.created = 0
+        self.recycled = 0
+
+    def init_app(self, app):
+        """Lukee poolin asetukset sovelluksen konfiguraatiosta"""
+        self.enabled = bool(app.config.get('BROWSER_POOL_ENABLED', True))
+        self.configure(
+            max_size=int(app.config.get('BROWSER_POOL_SIZE', self.max_size)),
+            max_uses=int(app.config.get('BROWSER_POOL_MAX_USES', self.max_uses)),
+            max_idle=int(app.config.get('BROWSER_POOL_MAX_IDLE', self.max_idle)),
+            acquire_timeout=int(app.config.get('BROWSER_POOL_ACQUIRE_TIMEOUT', self.acquire_timeout))
+        )
+
+    def configure(self, max_size=None, max_uses=None, max_idle=None, acquire_timeout=None):
+        """Päivittää poolin asetukset. Kutsutaan ennen kuin selaimia on lainattu."""
+        if max_uses is not None:
+            self.max_uses = max_uses
+        if max_idle is not None:
+            self.max_idle = max_idle
+        if acquire_timeout is not None:
+            self.acquire_timeout = acquire_timeout
+        if max_size is not None and max_size != self.max_size:
+            self.max_size = max(1, max_size)
+            self._semaphore = threading.BoundedSemaphore(self.max_size)
+
+    @contextmanager
+    def checkout(self, download_dir):
+        """
+        Lainaa selaimen poolista
+
+        Args:
+            download_dir (str): Hakemisto, johon tämän lainauksen lataukset tallennetaan
+
+        Yields:
+            WebDriver: Käyttövalmis selain
+        """
+        semaphore = self._semaphore
+        if not semaphore.acquire(timeout=self.acquire_timeout):
+            raise BrowserPoolTimeout(f"Vapaata selainta ei saatu {self.acquire_timeout} sekunnissa")
+
+        pooled = None
+        failed = False
+        try:
+            pooled = self._get_driver()
+            self._set_download_dir(pooled.driver, download_dir)
+            yield pooled.driver
+        except Exception:
+            failed = True
+            raise
+        finally:
+            try:
+                if pooled:
+                    self._release(pooled, failed)
+            finally:
+                semaphore.release()
+
+    def shutdown(self):
+        """Sulkee kaikki vapaana olevat selaimet"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._quit(pooled)
+
+    def reset_after_fork(self):
+        """
+        Unohtaa emoprosessilta periytyneet selaimet sulkematta niitä. Selaimet
+        kuuluvat emoprosessille, eikä lapsiprosessi saa käyttää niitä.
+        """
+        self._idle = []
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(self.max_size)
+
+    def stats(self):
+        """Palauttaa poolin tilastot"""
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'created': self.created,
+                'recycled': self.recycled
+            }
+
+    def _get_driver(self):
+        """Palauttaa terveen vapaan selaimen tai käynnistää uuden"""
+        while True:
+            with self._lock:
+                pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                break
+
+            if time.time() - pooled.last_used_at > self.max_idle:
+                logger.info("Suljetaan pitkään käyttämättä ollut selain")
+                self._quit(pooled)
+                continue
+            if not self._is_healthy(pooled.driver):
+                logger.warning("Poolin selain ei vastaa, käynnistetään uusi")
+                self._quit(pooled)
+                continue
+            return pooled
+
+        # Tuodaan vasta tarvittaessa, koska etuovi_downloader käyttää tätä moduulia
+        from etuovi_downloader import setup_driver
+
+        start_time = time.time()
+        driver = setup_driver(headless=True)
+        with self._lock:
+            self.created += 1
+        logger.info(f"Uusi selain käynnistetty pooliin {time.time() - start_time:.2f} sekunnissa")
+        return PooledDriver(driver)
+
+    def _release(self, pooled, failed):
+        """Palauttaa selaimen pooliin tai kierrättää sen"""
+        pooled.uses += 1
+        pooled.last_used_at = time.time()
+
+        if failed and not self._is_healthy(pooled.driver):
+            logger.warning("Selain kaatui käytön aikana, kierrätetään")
+            self._quit(pooled)
+            return
+        if pooled.uses >= self.max_uses:
+            logger.info(f"Selainta on käytetty {pooled.uses} kertaa, kierrätetään")
+            self._quit(pooled)
+            return
+
+        try:
+            self._reset(pooled.driver)
+        except Exception as e:
+            logger.warning(f"Selaimen tilan nollaus epäonnistui, kierrätetään: {e}")
+            self._quit(pooled)
+            return
+
+        with self._lock:
+            self._idle.append(pooled)
+
+    def _reset(self, driver):
+        """Sulkee ylimääräiset välilehdet ja tyhjentää sivun seuraavaa käyttöä varten"""
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        driver.get('about:blank')
+
+    def _set_download_dir(self, driver, download_dir):
+        """Ohjaa selaimen lataukset lainauskohtaiseen hakemistoon"""
+        params = {'behavior': 'allow', 'downloadPath': download_dir}
+        try:
+            # Koskee koko selainta, myös klikkauksen avaamia uusia välilehtiä
+            driver.execute_cdp_cmd('Browser.setDownloadBehavior', dict(params, eventsEnabled=False))
+        except Exception:
+            driver.execute_cdp_cmd('Page.setDownloadBehavior', params)
+
+    def _is_healthy(self, driver):
+        """Tarkistaa, että selain vastaa komentoihin"""
+        try:
+            return driver.execute_script('return 1') == 1
+        except Exception:
+            return False
+
+    def _quit(self, pooled):
+        """Sulkee selaimen"""
+        with self._lock:
+            self.recycled += 1
+        try:
+            pooled.driver.quit()
+        except Exception as e:
+            logger.warning(f"Selaimen sulkeminen epäonnistui: {e}")
+
+
+# Luodaan singleton-instanssi
+browser_pool = BrowserPool()
+
+# Suljetaan selaimet prosessin päättyessä, jotta Chrome-prosesseja ei jää orvoiksi
+atexit.register(browser_pool.shutdown)
@@ -44,6 +44,10 @@ class Config:
         }
     }
     
+    # SQLite (paikallinen kehitys ja suorituskykytestit) ei tunne PostgreSQL:n yhteysasetuksia
+    if SQLALCHEMY_DATABASE_URI and SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    
     # Google OAuth asetukset
     GOOGLE_OAUTH_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID', '')
     GOOGLE_OAUTH_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET', '')
@@ -80,6 +84,99 @@ class Config:
     SITE_NAME = 'Kotiko'
     CURRENT_YEAR = datetime.datetime.now().year
 
+    # Analyysien taustatyöjono: säikeiden määrä per prosessi (0 = ei taustasäikeitä tässä prosessissa)
+    ANALYSIS_JOB_WORKERS = int(os.environ.get('ANALYSIS_JOB_WORKERS', '2'))
+    ANALYSIS_JOB_POLL_INTERVAL = float(os.environ.get('ANALYSIS_JOB_POLL_INTERVAL', '2.0'))
+    # Kuinka kauan käynnissä oleva työ saa olla päivittymättä ennen kuin se palautetaan jonoon
+    ANALYSIS_JOB_STALE_SECONDS = int(os.environ.get('ANALYSIS_JOB_STALE_SECONDS', '600'))
+    ANALYSIS_JOB_MAX_ATTEMPTS = int(os.environ.get('ANALYSIS_JOB_MAX_ATTEMPTS', '2'))
+    # Pääanalyysin striimaus: osittainen teksti tallennetaan työlle FLUSH_INTERVAL-välein ja
+    # SSE/NDJSON-seuraajat lukevat sitä POLL_INTERVAL-välein. Yksi yhteys kestää enintään TIMEOUT
+    # sekuntia, jonka jälkeen asiakas jatkaa uudella yhteydellä. Striimi varaa pyyntösäikeen, joten
+    # samanaikaisia striimejä on prosessissa enintään MAX_CONCURRENT; muut seuraavat tilaa kyselemällä
+    ANALYSIS_STREAMING_ENABLED = os.environ.get('ANALYSIS_STREAMING_ENABLED', 'true').lower() == 'true'
+    ANALYSIS_STREAM_FLUSH_INTERVAL = float(os.environ.get('ANALYSIS_STREAM_FLUSH_INTERVAL', '0.5'))
+    ANALYSIS_STREAM_POLL_INTERVAL = float(os.environ.get('ANALYSIS_STREAM_POLL_INTERVAL', '0.3'))
+    ANALYSIS_STREAM_TIMEOUT = int(os.environ.get('ANALYSIS_STREAM_TIMEOUT', '25'))
+    ANALYSIS_STREAM_MAX_CONCURRENT = int(os.environ.get('ANALYSIS_STREAM_MAX_CONCURRENT', '1'))
+    # 'concurrent' ajaa KAT-poiminnan ja pääanalyysin rinnakkain, 'sequential' peräkkäin
+    ANALYSIS_PIPELINE_MODE = os.environ.get('ANALYSIS_PIPELINE_MODE', 'concurrent')
+    # Tehdään pääanalyysi ja riskianalyysi yhdellä JSON-skeeman mukaisella kutsulla
+    ANALYSIS_COMBINED_MODE = os.environ.get('ANALYSIS_COMBINED_MODE', 'false').lower() == 'true'
+
+    # Analyysilistan sivukoko
+    ANALYSIS_LIST_PAGE_SIZE = int(os.environ.get('ANALYSIS_LIST_PAGE_SIZE', '50'))
+
+    # Haettujen ilmoitusten välimuisti (listing_content_cache-taulu, yhteinen kaikille workereille):
+    # vanhenemisaika sekunteina ja kokoraja tavuina
+    LISTING_CACHE_TTL = int(os.environ.get('LISTING_CACHE_TTL', '3600'))
+    LISTING_CACHE_MAX_BYTES = int(os.environ.get('LISTING_CACHE_MAX_BYTES', str(50 * 1024 * 1024)))
+
+    # Istuntojen tallennus: 'filesystem' (Flask-Session), 'database' (web_sessions-taulu) tai 'cookie'
+    # (allekirjoitettu eväste). Tietokantaistunnon vanhenemisaikaa jatketaan enintään REFRESH_INTERVAL
+    # sekunnin välein ja vanhentuneet poistetaan CLEANUP_INTERVAL sekunnin välein BATCH_SIZE rivin erissä
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'filesystem').lower()
+    SESSION_REFRESH_INTERVAL = int(os.environ.get('SESSION_REFRESH_INTERVAL', '3600'))
+    SESSION_CLEANUP_INTERVAL = int(os.environ.get('SESSION_CLEANUP_INTERVAL', '300'))
+    SESSION_CLEANUP_BATCH_SIZE = int(os.environ.get('SESSION_CLEANUP_BATCH_SIZE', '1000'))
+
+    # Tietokannan rakenteen hallinta: 'startup' tarkistaa ja päivittää taulut jokaisen workerin
+    # käynnistyessä, 'manual' ohittaa tarkistukset, jolloin rakenne päivitetään komennolla python schema.py
+    SCHEMA_MANAGEMENT = os.environ.get('SCHEMA_MANAGEMENT', 'startup').lower()
+
+    # Taustasäikeiden käynnistys: 'import' käynnistää ne app.py:n latauksessa, 'worker' vasta gunicornin
+    # workerissa (gunicorn.conf.py asettaa tämän, jotta esiladattu emoprosessi pysyy ilman säikeitä)
+    BACKGROUND_SERVICES = os.environ.get('BACKGROUND_SERVICES', 'import').lower()
+
+    # Kirjautuneen käyttäjän ja kuukausijäsenyyden prosessikohtainen välimuisti: vanhenemisaika
+    # sekunteina (0 = ei käytössä, jolloin käyttäjä ja jäsenyys haetaan yhdellä kyselyllä) ja merkintöjen enimmäismäärä
+    ENTITLEMENT_CACHE_TTL = int(os.environ.get('ENTITLEMENT_CACHE_TTL', '0'))
+    ENTITLEMENT_CACHE_MAX_ENTRIES = int(os.environ.get('ENTITLEMENT_CACHE_MAX_ENTRIES', '10000'))
+
+    # Ilmoitustekstin tiivistys ennen LLM-kutsuja: ilmoitustekstin tokenibudjetti (0 = ei rajaa)
+    TEXT_CONDENSE_ENABLED = os.environ.get('TEXT_CONDENSE_ENABLED', 'true').lower() == 'true'
+    TEXT_CONDENSE_MAX_TOKENS = int(os.environ.get('TEXT_CONDENSE_MAX_TOKENS', '6000'))
+
+    # Saman ilmoituksen samanaikaisten analyysien yhdistäminen prosessien välillä: lukon voimassaoloaika,
+    # odottajan enimmäisodotus ja valmiin tuloksen säilytysaika sekunteina
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+    SINGLE_FLIGHT_LEASE_SECONDS = int(os.environ.get('SINGLE_FLIGHT_LEASE_SECONDS', '180'))
+    SINGLE_FLIGHT_WAIT_TIMEOUT = int(os.environ.get('SINGLE_FLIGHT_WAIT_TIMEOUT', '300'))
+    SINGLE_FLIGHT_POLL_INTERVAL = float(os.environ.get('SINGLE_FLIGHT_POLL_INTERVAL', '0.5'))
+    SINGLE_FLIGHT_RESULT_TTL = int(os.environ.get('SINGLE_FLIGHT_RESULT_TTL', '60'))
+
+    # Käyttäjien kesken jaettu LLM-vastausten välimuisti
+    LLM_CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_MAX_AGE = int(os.environ.get('LLM_CACHE_MAX_AGE', str(7 * 24 * 3600)))  # Sekunteina
+    # Pilkuilla eroteltu lista tuotetasoista ('admin', 'subscription', 'one_time'), joille välimuistia ei käytetä
+    LLM_CACHE_OPT_OUT_TIERS = os.environ.get('LLM_CACHE_OPT_OUT_TIERS', '')
+
+    # Promptitiedostot ladataan käynnistyksessä; muutokset huomataan RELOAD_INTERVAL sekunnin viiveellä
+    PROMPT_DIR = os.environ.get('PROMPT_DIR')
+    PROMPT_RELOAD_INTERVAL = float(os.environ.get('PROMPT_RELOAD_INTERVAL', '2.0'))
+
+    # OpenAI-kutsujen yhdyskäytävä. Rajat ovat prosessikohtaisia, joten OpenAI-tason
+    # minuuttirajat jaetaan gunicorn-prosessien määrällä. Mallikohtaiset samanaikaisuusrajat
+    # annetaan muodossa "gpt-4.1=4,gpt-4.1-mini=8".
+    LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+    LLM_MODEL_CONCURRENCY_DEFAULT = int(os.environ.get('LLM_MODEL_CONCURRENCY_DEFAULT', '4'))
+    LLM_MODEL_CONCURRENCY = os.environ.get('LLM_MODEL_CONCURRENCY', '')
+    LLM_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE', '500'))
+    LLM_TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE', '30000'))
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '4'))
+    LLM_REQUEST_TIMEOUT = float(os.environ.get('LLM_REQUEST_TIMEOUT', '120'))
+    # Kuinka kauan (s) kutsu saa odottaa vuoroaan ruuhkassa ennen kuin se epäonnistuu
+    LLM_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', '180'))
+    LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', '20'))
+
+    # Etuovi-latausten selainpooli: selainten enimmäismäärä per prosessi, käyttökerrat ennen
+    # kierrätystä ja kuinka kauan (s) käyttämätön selain pidetään käynnissä
+    BROWSER_POOL_ENABLED = os.environ.get('BROWSER_POOL_ENABLED', 'true').lower() == 'true'
+    BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', '2'))
+    BROWSER_POOL_MAX_USES = int(os.environ.get('BROWSER_POOL_MAX_USES', '20'))
+    BROWSER_POOL_MAX_IDLE = int(os.environ.get('BROWSER_POOL_MAX_IDLE', '600'))
+    BROWSER_POOL_ACQUIRE_TIMEOUT = int(os.environ.get('BROWSER_POOL_ACQUIRE_TIMEOUT', '90'))
+
 class DevelopmentConfig(Config):
     """Kehitysympäristön konfiguraatio"""
     DEBUG = True
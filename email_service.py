@@ -1,6 +1,4 @@
 import os
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, To, Content, HtmlContent
 import logging
 import datetime
 
@@ -154,6 +152,10 @@ def send_verification_email(to_email, verification_token, first_name=None):
 </html>
         """
         
+        # SendGrid ladataan vasta viestiä lähetettäessä, jotta web-workerit käynnistyvät nopeasti
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Email, To, HtmlContent
+
         # Luo viesti
         message = Mail(
             from_email=Email(mail_sender),
@@ -301,6 +303,9 @@ def send_password_reset_email(to_email, reset_token, first_name=None):
 </html>
         """
         
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Email, To, HtmlContent
+
         # Luo viesti
         message = Mail(
             from_email=Email(mail_sender),
@@ -463,6 +468,9 @@ def send_subscription_renewal_email(to_email, first_name, payment_url):
 </html>
         """
         
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Email, To, HtmlContent
+
         # Luo viesti
         message = Mail(
             from_email=Email(mail_sender),
@@ -629,6 +637,9 @@ def send_subscription_renewal_reminder_email(to_email, first_name, renewal_date)
 </html>
         """
         
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Email, To, HtmlContent
+
         # Luo viesti
         message = Mail(
             from_email=Email(mail_sender),
@@ -785,6 +796,9 @@ def send_failed_payment_retry_email(to_email, first_name, payment_url):
 </html>
         """
         
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Email, To, HtmlContent
+
         # Luo viesti
         message = Mail(
             from_email=Email(mail_sender),
@@ -954,6 +968,9 @@ def send_subscription_expired_email(to_email, first_name, status):
 </html>
         """
         
+        from sendgrid import SendGridAPIClient
+        from sendgrid.helpers.mail import Mail, Email, To, HtmlContent
+
         # Luo viesti
         message = Mail(
             from_email=Email(mail_sender),
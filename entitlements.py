@@ -0,0 +1,198 @@
+"""
+Kirjautuneen käyttäjän ja analyysioikeuden välimuisti.
+
+Flask-Login lataa käyttäjän jokaisessa pyynnössä. load_user hakee samalla kyselyllä
+tiedon aktiivisesta kuukausijäsenyydestä ja tallentaa sen pyynnön ajaksi, joten
+oikeuden tarkistus ei tee omaa kyselyään. Lisäksi käyttäjän tiedot voidaan säilyttää
+prosessin muistissa ENTITLEMENT_CACHE_TTL sekunnin ajan, jolloin pyyntö ei tee yhtään
+kyselyä ennen varsinaista työtä. Merkintä poistetaan, kun käyttäjän tai hänen
+tilaustensa muutokset tallennetaan tässä prosessissa (esim. maksun vahvistus tai
+subscription_service); muiden prosessien muutokset näkyvät viimeistään TTL:n kuluttua.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+from flask import g, has_request_context
+from sqlalchemy import event, exists, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import db, User, Subscription
+
+logger = logging.getLogger(__name__)
+
+
+def active_subscription_exists(user_id):
+    """
+    Muodostaa EXISTS-ehdon käyttäjän aktiiviselle kuukausijäsenyydelle
+
+    Args:
+        user_id: Käyttäjän ID tai User.id-sarake korreloitua alikyselyä varten
+
+    Returns:
+        Exists: SQLAlchemy-lauseke
+    """
+    return exists().where(
+        Subscription.user_id == user_id,
+        Subscription.status == 'active',
+        Subscription.subscription_type == 'monthly'
+    )
+
+
+class EntitlementCache:
+    """
+    Pyyntökohtainen ja valinnainen prosessikohtainen välimuisti käyttäjälle ja
+    tiedolle aktiivisesta kuukausijäsenyydestä
+    """
+
+    def __init__(self, ttl=0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (tallennusaika, sarakkeiden arvot, kuukausijäsenyys)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        """Lukee välimuistin asetukset sovelluksen konfiguraatiosta"""
+        self.ttl = int(app.config.get('ENTITLEMENT_CACHE_TTL', self.ttl))
+        self.max_entries = int(app.config.get('ENTITLEMENT_CACHE_MAX_ENTRIES', self.max_entries))
+
+    def load_user(self, user_id):
+        """
+        Lataa käyttäjän ja tiedon aktiivisesta kuukausijäsenyydestä yhdellä kyselyllä,
+        tai ilman kyselyä, jos käyttäjä on prosessin välimuistissa
+
+        Args:
+            user_id (int): Käyttäjän ID
+
+        Returns:
+            User: Istuntoon liitetty käyttäjä tai None, jos käyttäjää ei löydy
+        """
+        entry = self._get(user_id)
+        if entry is not None:
+            values, has_subscription = entry
+            # Liitetään istuntoon ilman kyselyä; myöhemmät muutokset tallentuvat normaalisti
+            user = db.session.merge(_detached_user(values), load=False)
+        else:
+            row = (db.session.query(User, active_subscription_exists(User.id))
+                   .filter(User.id == user_id)
+                   .first())
+            if row is None:
+                return None
+            user, has_subscription = row
+            has_subscription = bool(has_subscription)
+            self._set(user_id, _column_values(user), has_subscription)
+
+        self._request_cache()[user_id] = has_subscription
+        return user
+
+    def has_subscription(self, user):
+        """
+        Kertoo, onko käyttäjällä aktiivinen kuukausijäsenyys. Tieto haetaan vain, jos
+        sitä ei ladattu tässä pyynnössä jo käyttäjän mukana.
+
+        Args:
+            user (User): Käyttäjä
+
+        Returns:
+            bool: True jos aktiivinen kuukausijäsenyys on olemassa
+        """
+        cache = self._request_cache()
+        if user.id not in cache:
+            cache[user.id] = bool(db.session.query(active_subscription_exists(user.id)).scalar())
+        return cache[user.id]
+
+    def invalidate(self, user_id):
+        """Poistaa käyttäjän tiedot välimuisteista"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+        self._request_cache().pop(user_id, None)
+
+    def clear(self):
+        """Tyhjentää prosessin välimuistin"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Palauttaa välimuistin tilastot"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+    def _request_cache(self):
+        """Palauttaa pyynnön aikaisen välimuistin; pyynnön ulkopuolella tietoa ei säilytetä"""
+        if not has_request_context():
+            return {}
+        return g.setdefault('active_subscriptions', {})
+
+    def _get(self, user_id):
+        """Palauttaa voimassa olevan merkinnän (sarakkeet, kuukausijäsenyys) tai None"""
+        if self.ttl <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def _set(self, user_id, values, has_subscription):
+        """Tallentaa käyttäjän tiedot prosessin välimuistiin"""
+        if self.ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[user_id] = (time.time(), values, has_subscription)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _column_values(user):
+    """Palauttaa käyttäjän sarakkeiden arvot sanakirjana"""
+    return {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+
+
+def _detached_user(values):
+    """Muodostaa tallennetuista arvoista irrallisen käyttäjäolion, jota pidetään tietokannan tilana"""
+    user = User.__mapper__.class_manager.new_instance()
+    for key, value in values.items():
+        set_committed_value(user, key, value)
+    make_transient_to_detached(user)
+    return user
+
+
+# Luodaan singleton-instanssi
+entitlement_cache = EntitlementCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_users(session, flush_context):
+    """Kerää käyttäjät, joiden tietoja tai tilauksia muutettiin istunnossa"""
+    user_ids = session.info.setdefault('entitlement_user_ids', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            user_ids.add(obj.id)
+        elif isinstance(obj, Subscription):
+            user_ids.add(obj.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_changed_users(session):
+    """Poistaa muutettujen käyttäjien tiedot välimuistista vasta, kun muutokset ovat pysyviä"""
+    for user_id in session.info.pop('entitlement_user_ids', ()):
+        entitlement_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    """Peruttuja muutoksia ei tarvitse huomioida"""
+    session.info.pop('entitlement_user_ids', None)
@@ -20,19 +20,20 @@ import argparse
 import requests
 import glob
 import shutil
-import PyPDF2
 import logging
 import traceback
 import uuid
 import tempfile
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import base64
+import re
+from urllib.parse import urljoin
+from contextlib import contextmanager
+
+from browser_pool import browser_pool
+from pdf_document import PdfDocument
 
 # Asetetaan lokitus
+os.makedirs("logs", exist_ok=True)
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
@@ -51,6 +52,11 @@ def setup_driver(headless=True, download_dir=None):
         headless (bool): Whether to run in headless mode. Set to False if having trouble locating elements.
         download_dir (str): Directory where files will be downloaded.
     """
+    # Selenium ladataan vasta, kun selainta tarvitaan, jotta web-workerit käynnistyvät nopeasti
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.chrome.options import Options
+
     try:
         logger.info("Alustetaan Chrome WebDriver...")
         chrome_options = Options()
@@ -98,31 +104,199 @@ def setup_driver(headless=True, download_dir=None):
         logger.error(traceback.format_exc())
         raise
 
-def is_valid_pdf(file_path):
+@contextmanager
+def _driver_session(headless, download_dir):
+    """
+    Palauttaa selaimen latausta varten. Headless-lataukset käyttävät poolin
+    lämpimiä selaimia, näkyvällä selaimella (vianetsintä) käynnistetään oma selain.
+    
+    Args:
+        headless (bool): Käytetäänkö headless-moodia
+        download_dir (str): Hakemisto, johon lataukset tallennetaan
+    """
+    if headless and browser_pool.enabled:
+        with browser_pool.checkout(download_dir) as driver:
+            yield driver
+        return
+    
+    driver = setup_driver(headless=headless, download_dir=download_dir)
+    try:
+        yield driver
+    finally:
+        try:
+            driver.quit()
+            logger.info("Selain suljettu")
+        except Exception as e:
+            logger.warning(f"Selaimen sulkeminen epäonnistui: {e}")
+
+def is_valid_pdf(pdf_source):
     """
-    Tarkistaa, onko PDF-tiedosto validi.
+    Tarkistaa, onko PDF validi.
     
     Args:
-        file_path (str): Tiedostopolku tarkistettavaan PDF-tiedostoon
+        pdf_source (str | bytes | PdfDocument): Tiedostopolku, PDF:n sisältö tavuina tai jäsennetty dokumentti
         
     Returns:
         bool: True jos PDF on validi, False muuten
     """
     try:
-        # Yritetään avata PDF PyPDF2:lla
-        with open(file_path, 'rb') as f:
-            try:
-                reader = PyPDF2.PdfReader(f)
-                # Tarkistetaan että vähintään 1 sivu
-                if len(reader.pages) > 0:
-                    return True
-            except Exception as e:
-                logger.error(f"PDF validointi epäonnistui: {e}")
-                return False
-        return False
+        document = PdfDocument.open(pdf_source)
     except Exception as e:
         logger.error(f"Tiedoston avaaminen validointia varten epäonnistui: {e}")
         return False
+    return document.is_valid()
+
+def pdf_to_text(pdf_source):
+    """
+    Muuntaa PDF:n tekstiksi sivuittain ilman välitiedostoja.
+    
+    Args:
+        pdf_source (bytes | PdfDocument): PDF:n sisältö tai jo jäsennetty dokumentti
+        
+    Returns:
+        str: PDF:n teksti sivuittain
+    """
+    document = PdfDocument.open(pdf_source)
+    page_texts = document.page_texts()
+    
+    # Check if PDF has pages
+    if not page_texts:
+        raise ValueError("PDF ei sisällä sivuja")
+    
+    logger.info(f"PDF muunnettu tekstiksi ({len(page_texts)} sivua)")
+    return document.paged_text(empty_page_text="Sivulta ei löytynyt tekstiä.")
+
+def _save_pdf(pdf_bytes, output_filename):
+    """Tallentaa PDF:n työhakemistoon ja palauttaa sen absoluuttisen polun"""
+    output_path = os.path.join(os.getcwd(), output_filename)
+    with open(output_path, "wb") as f:
+        f.write(pdf_bytes)
+    logger.info(f"PDF tallennettu polkuun: {output_path}")
+    return os.path.abspath(output_path)
+
+# Suora HTTP-lataus ilman selainta. Esitteeksi hyväksytään vain osoite, joka on varmasti
+# tämän kohteen tulostettava PDF, koska ilmoitussivulla on myös muita PDF:iä (energiatodistus,
+# mainokset, taloyhtiön asiakirjat):
+# - ETUOVI_PDF_URL_TEMPLATE (esim. "https://www.etuovi.com/.../{listing_id}.pdf") on tunnettu osoitemalli.
+# - ETUOVI_PDF_LINK_PATTERN on säännöllinen lauseke esitteen linkeille ilmoitussivulla. Linkin
+#   on lisäksi sisällettävä kohteen tunniste.
+# Jos kumpaakaan ei ole asetettu, suoraa latausta ei yritetä eikä ilmoitussivua haeta.
+HTTP_FAST_PATH_ENABLED = os.environ.get('ETUOVI_HTTP_FAST_PATH', 'true').lower() == 'true'
+PDF_URL_TEMPLATE = os.environ.get('ETUOVI_PDF_URL_TEMPLATE', '')
+_PDF_LINK_PATTERN = os.environ.get('ETUOVI_PDF_LINK_PATTERN', '')
+PDF_LINK_PATTERN = re.compile(_PDF_LINK_PATTERN, re.IGNORECASE) if _PDF_LINK_PATTERN else None
+HTTP_TIMEOUT = 15
+# Ilmoitussivun haku viivästyttää selainpolkua, jos esitettä ei löydy, joten aikaraja on lyhyt
+PAGE_PROBE_TIMEOUT = 3
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+LINK_PATTERN = re.compile(r'(?:href|src)=["\']([^"\']+)["\']', re.IGNORECASE)
+
+def get_listing_id(url):
+    """
+    Poimii Etuovi-kohteen tunnisteen URL:sta
+    
+    Args:
+        url (str): Etuovi.com kohteen URL
+        
+    Returns:
+        str: Kohteen tunniste (esim. "w67778") tai None
+    """
+    match = re.search(r'/kohde/([A-Za-z0-9]+)', url)
+    return match.group(1) if match else None
+
+def _contains_listing_id(candidate, listing_id):
+    """Tarkistaa, että osoitteessa on kohteen tunniste kokonaisena (w1 ei täsmää w12:een)"""
+    return re.search(rf'(?<![A-Za-z0-9]){re.escape(listing_id)}(?![A-Za-z0-9])', candidate, re.IGNORECASE) is not None
+
+def resolve_printable_pdf_url(url, html=None):
+    """
+    Selvittää Etuovi-ilmoituksen tulostettavan PDF:n ehdokasosoitteet
+    
+    Args:
+        url (str): Etuovi.com kohteen URL
+        html (str, optional): Ilmoitussivun HTML, jos se on jo haettu
+        
+    Returns:
+        list: Ehdokasosoitteet todennäköisimmästä alkaen
+    """
+    listing_id = get_listing_id(url)
+    if not listing_id:
+        return []
+    
+    candidates = []
+    if PDF_URL_TEMPLATE:
+        candidates.append(PDF_URL_TEMPLATE.format(listing_id=listing_id))
+    
+    if html and PDF_LINK_PATTERN:
+        # Sivun muut PDF:t ohitetaan: linkin on täsmättävä esitteen malliin ja kohteen tunnisteeseen
+        for link in LINK_PATTERN.findall(html):
+            absolute = urljoin(url, link)
+            if PDF_LINK_PATTERN.search(absolute) and _contains_listing_id(absolute, listing_id):
+                candidates.append(absolute)
+    
+    # Duplikaatit pois järjestys säilyttäen
+    resolved = []
+    for candidate in candidates:
+        if candidate not in resolved:
+            resolved.append(candidate)
+    return resolved
+
+def _fetch_pdf(session, pdf_url):
+    """Hakee osoitteen ja palauttaa jäsennetyn dokumentin, jos vastaus on validi PDF"""
+    response = session.get(pdf_url, timeout=HTTP_TIMEOUT)
+    # Tarkistetaan sisältö eikä vain Content-Typeä, koska virhesivut palautuvat usein HTML:nä
+    if response.status_code != 200 or not response.content.startswith(b'%PDF'):
+        logger.info(f"Osoite ei palauttanut PDF:ää ({response.status_code}): {pdf_url}")
+        return None
+    document = PdfDocument(response.content, name=pdf_url)
+    return document if document.is_valid() else None
+
+def fetch_pdf_http(url):
+    """
+    Yrittää ladata tulostettavan PDF:n suoraan HTTP:llä ilman selainta
+    
+    Args:
+        url (str): Etuovi.com kohteen URL
+        
+    Returns:
+        PdfDocument: Validoitu PDF tai None, jos PDF:ää ei löytynyt tai suoraa latausta ei ole määritetty
+    """
+    if not get_listing_id(url) or not (PDF_URL_TEMPLATE or PDF_LINK_PATTERN):
+        return None
+    
+    start_time = time.time()
+    tried = set()
+    try:
+        with requests.Session() as session:
+            session.headers.update(HTTP_HEADERS)
+            
+            # Tunnettu osoitemalli kokeillaan ensin, ilmoitussivu haetaan vasta tarvittaessa
+            for html_needed in (False, True):
+                html = None
+                if html_needed:
+                    if not PDF_LINK_PATTERN:
+                        break
+                    response = session.get(url, timeout=PAGE_PROBE_TIMEOUT)
+                    response.raise_for_status()
+                    html = response.text
+                
+                for pdf_url in resolve_printable_pdf_url(url, html):
+                    if pdf_url in tried:
+                        continue
+                    tried.add(pdf_url)
+                    
+                    document = _fetch_pdf(session, pdf_url)
+                    if document:
+                        logger.info(f"PDF ladattu suoraan HTTP:llä {time.time() - start_time:.2f} sekunnissa: {pdf_url}")
+                        return document
+    except Exception as e:
+        logger.warning(f"Suora HTTP-lataus epäonnistui: {e}")
+    
+    logger.info(f"Tulostettavaa PDF:ää ei saatu HTTP:llä ({time.time() - start_time:.2f} s), käytetään selainta")
+    return None
 
 def download_pdf_with_retry(url, output_filename=None, headless=False, max_retries=3):
     """
@@ -137,19 +311,24 @@ def download_pdf_with_retry(url, output_filename=None, headless=False, max_retri
     Returns:
         str: Polku ladattuun PDF-tiedostoon
     """
+    if not output_filename:
+        output_filename = f"etuovi_{url.split('/')[-1].split('?')[0]}.pdf"
+    
+    # Nopea polku kokeillaan kerran ennen selainyrityksiä
+    if HTTP_FAST_PATH_ENABLED:
+        document = fetch_pdf_http(url)
+        if document:
+            return _save_pdf(document.data, output_filename)
+    
     retry_count = 0
     last_error = None
     
     while retry_count < max_retries:
         try:
-            pdf_path = download_pdf(url, output_filename, headless)
-            
-            # Tarkista että PDF on validi
-            if pdf_path and os.path.exists(pdf_path) and is_valid_pdf(pdf_path):
-                logger.info(f"PDF ladattu ja validoitu onnistuneesti yrityskerralla {retry_count + 1}")
-                return pdf_path
-            else:
-                raise Exception(f"Ladattu PDF ei ole validi: {pdf_path}")
+            # Ladattu dokumentti on jo validoitu, joten sitä ei jäsennetä uudelleen
+            document = download_pdf_document(url, headless, try_http=False)
+            logger.info(f"PDF ladattu ja validoitu onnistuneesti yrityskerralla {retry_count + 1}")
+            return _save_pdf(document.data, output_filename)
                 
         except Exception as e:
             retry_count += 1
@@ -171,14 +350,11 @@ def download_pdf_with_retry(url, output_filename=None, headless=False, max_retri
             property_id = url.split('/')[-1].split('?')[0]  # Poista query-parametrit
             output_filename = f"etuovi_{property_id}.pdf"
             
-        output_path = os.path.join(os.getcwd(), output_filename)
-        
         response = requests.get(url, timeout=30)
-        with open(output_path, "wb") as f:
-            f.write(response.content)
             
         # Validate the PDF
-        if is_valid_pdf(output_path):
+        if is_valid_pdf(response.content):
+            output_path = _save_pdf(response.content, output_filename)
             logger.info(f"PDF ladattu onnistuneesti vaihtoehtoisella tavalla: {output_path}")
             return output_path
         else:
@@ -188,27 +364,185 @@ def download_pdf_with_retry(url, output_filename=None, headless=False, max_retri
         logger.error(f"Vaihtoehtoinen latausyritys epäonnistui: {e}")
         raise Exception(f"PDF:n lataus ei onnistunut useiden yritysten jälkeen: {str(last_error)}")
 
-def download_pdf(url, output_filename=None, headless=False):
+# Odotusten aikarajat (s). Odotukset päättyvät heti, kun ehto täyttyy.
+BUTTON_WAIT_TIMEOUT = 15
+NEW_WINDOW_TIMEOUT = 10
+DOWNLOAD_TIMEOUT = 45
+POLL_INTERVAL = 0.2
+
+# Avainsanat, joilla PDF-painike tunnistetaan
+PDF_BUTTON_KEYWORDS = ["tulosta", "pdf", "print", "lataa"]
+PDF_BUTTON_XPATHS = [
+    "//button[contains(., 'PDF')]",
+    "//button[contains(., 'Tulosta')]",
+    "//button[contains(., 'tulosta')]",
+    "//a[contains(., 'PDF')]",
+    "//div[contains(@class, 'pdf')]//button",
+    "//div[contains(@class, 'print')]//button"
+]
+
+class _PhaseTimer:
+    """Mittaa latauksen vaiheiden keston ja kirjaa ne lokiin"""
+    
+    def __init__(self):
+        self.start = time.time()
+        self.last = self.start
+        self.phases = []
+    
+    def mark(self, phase):
+        now = time.time()
+        self.phases.append((phase, now - self.last))
+        logger.info(f"Vaihe '{phase}' kesti {now - self.last:.2f} s")
+        self.last = now
+    
+    def summary(self):
+        details = ", ".join(f"{phase} {duration:.2f} s" for phase, duration in self.phases)
+        logger.info(f"PDF-lataus valmis {time.time() - self.start:.2f} sekunnissa ({details})")
+
+def _find_pdf_button(driver):
+    """
+    Etsii PDF-painikkeen sivulta
+    
+    Returns:
+        WebElement: Löydetty painike tai None
+    """
+    from selenium.webdriver.common.by import By
+
+    # Strategy 1: Find by scanning all buttons for PDF-related content
+    try:
+        for button in driver.find_elements(By.TAG_NAME, 'button'):
+            try:
+                button_html = button.get_attribute("innerHTML").lower()
+                button_text = button.text.lower()
+                if any(keyword in button_html or keyword in button_text for keyword in PDF_BUTTON_KEYWORDS):
+                    logger.info("PDF-painike löydetty painikkeiden skannauksella")
+                    return button
+            except Exception as e:
+                logger.warning(f"Painikkeen tarkistus epäonnistui: {e}")
+    except Exception as e:
+        logger.error(f"Painikkeiden etsiminen epäonnistui: {e}")
+    
+    # Strategy 2: Try finding by XPath with multiple patterns
+    for xpath in PDF_BUTTON_XPATHS:
+        try:
+            elements = driver.find_elements(By.XPATH, xpath)
+            if elements:
+                logger.info(f"PDF-painike löydetty XPath:lla: {xpath}")
+                return elements[0]
+        except Exception as e:
+            logger.warning(f"XPath-haku epäonnistui: {xpath} - {e}")
+    
+    return None
+
+def _pdf_button_or_scroll(driver):
+    """
+    WebDriverWait-ehto: palauttaa PDF-painikkeen, tai skrollaa sivua alaspäin,
+    jotta laiskasti ladattavat osiot renderöityvät seuraavaa tarkistusta varten.
+    """
+    button = _find_pdf_button(driver)
+    if button is None:
+        driver.execute_script("window.scrollBy(0, 300);")
+        return False
+    return button
+
+def _find_downloaded_pdfs(download_dir):
+    """Palauttaa valmiit PDF-tiedostot. Keskeneräiset (.crdownload) ohitetaan."""
+    return [
+        path for path in glob.glob(os.path.join(download_dir, "*.pdf"))
+        if not os.path.exists(path + ".crdownload")
+    ]
+
+def _wait_for_download(download_dir, timeout, poll_interval=POLL_INTERVAL):
+    """
+    Odottaa, että lataushakemistoon ilmestyy validi PDF-tiedosto
+    
+    Args:
+        download_dir (str): Seurattava hakemisto
+        timeout (float): Enimmäisodotusaika sekunteina
+        poll_interval (float): Tarkistusväli sekunteina
+        
+    Returns:
+        PdfDocument: Ladattu ja validoitu PDF tai None, jos latausta ei havaittu ajoissa
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        for downloaded_file in _find_downloaded_pdfs(download_dir):
+            logger.info(f"Ladattu tiedosto löydetty: {downloaded_file}")
+            
+            # Validate PDF before returning
+            document = PdfDocument(downloaded_file)
+            if document.is_valid():
+                return document
+            
+            logger.warning(f"Ladattu PDF ei ole validi: {downloaded_file}")
+            # Delete invalid file and continue waiting
+            try:
+                os.remove(downloaded_file)
+                logger.info(f"Poistettu viallinen tiedosto: {downloaded_file}")
+            except Exception as e:
+                logger.warning(f"Viallisen tiedoston poistaminen epäonnistui: {e}")
+        
+        time.sleep(poll_interval)
+    
+    return None
+
+def download_pdf(url, output_filename=None, headless=False, try_http=True):
     """
-    Download a PDF from an Etuovi.com property listing.
+    Download a PDF from an Etuovi.com property listing and save it to the working directory.
     
     Args:
         url (str): The URL of the property listing.
         output_filename (str, optional): The filename to save the PDF as.
             If not provided, a default name will be generated.
         headless (bool): Whether to run in headless mode. Set to False if having trouble locating elements.
+        try_http (bool): Try the direct HTTP fast path before starting a browser.
     
     Returns:
         str: The path to the downloaded PDF file.
     """
-    logger.info(f"Aloitetaan PDF:n lataus URL:sta {url}")
-    
     if not output_filename:
         # Extract property ID from URL for default filename
         property_id = url.split('/')[-1].split('?')[0]  # Poista query-parametrit
         output_filename = f"etuovi_{property_id}.pdf"
         logger.info(f"Luodaan oletustiedostonimi: {output_filename}")
     
+    return _save_pdf(download_pdf_bytes(url, headless, try_http), output_filename)
+
+def download_pdf_bytes(url, headless=False, try_http=True):
+    """
+    Lataa Etuovi-ilmoituksen PDF:n muistiin ilman tiedostoja työhakemistoon.
+    
+    Args:
+        url (str): Etuovi.com kohteen URL
+        headless (bool): Käytetäänkö headless-moodia
+        try_http (bool): Kokeillaanko suoraa HTTP-latausta ennen selainta
+    
+    Returns:
+        bytes: PDF:n sisältö
+    """
+    return download_pdf_document(url, headless, try_http).data
+
+def download_pdf_document(url, headless=False, try_http=True):
+    """
+    Lataa Etuovi-ilmoituksen PDF:n jäsennettynä dokumenttina. Dokumentti on jo
+    validoitu, ja sen sivutekstit säilyvät välimuistissa tekstiksi muuntoa varten.
+    
+    Args:
+        url (str): Etuovi.com kohteen URL
+        headless (bool): Käytetäänkö headless-moodia
+        try_http (bool): Kokeillaanko suoraa HTTP-latausta ennen selainta
+    
+    Returns:
+        PdfDocument: Ladattu PDF
+    """
+    logger.info(f"Aloitetaan PDF:n lataus URL:sta {url}")
+    
+    # Kokeillaan ensin suoraa HTTP-latausta, selainta käytetään vain varalla
+    if try_http and HTTP_FAST_PATH_ENABLED:
+        document = fetch_pdf_http(url)
+        if document:
+            return document
+    
     # Create a temporary download directory with unique identifier
     session_id = str(uuid.uuid4())
     timestamp = int(time.time())
@@ -219,218 +553,158 @@ def download_pdf(url, output_filename=None, headless=False):
     os.makedirs(temp_download_dir, exist_ok=True)
     logger.info(f"Luotu väliaikainen lataushakemisto: {temp_download_dir}")
     
-    driver = None
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.common.exceptions import TimeoutException
+
+    timer = _PhaseTimer()
     try:
-        driver = setup_driver(headless=headless, download_dir=temp_download_dir)
-        
-        logger.info(f"Navigoidaan osoitteeseen: {url}")
-        driver.get(url)
+        with _driver_session(headless, temp_download_dir) as driver:
+            timer.mark("selaimen käynnistys")
+            logger.info(f"Navigoidaan osoitteeseen: {url}")
+            driver.get(url)
         
-        # Wait for the page to load
-        logger.info("Odotetaan sivun latautumista...")
-        WebDriverWait(driver, 20).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        logger.info("Sivu ladattu onnistuneesti")
+            # Wait for the page to load
+            logger.info("Odotetaan sivun latautumista...")
+            WebDriverWait(driver, 20).until(
+                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            )
+            logger.info("Sivu ladattu onnistuneesti")
+            timer.mark("sivun lataus")
         
-        # Scroll down to make the PDF button visible (multiple scrolls to ensure it's in view)
-        logger.info("Skrollataan sivua PDF-painikkeen löytämiseksi...")
-        for i in range(5):  # Increased scroll attempts
-            driver.execute_script("window.scrollBy(0, 300);")
-            time.sleep(1)
-        
-        # Find the "TULOSTA PDF" button using multiple strategies
-        logger.info("Etsitään PDF-painiketta...")
-        pdf_button = None
+            # Find the "TULOSTA PDF" button, scrolling only while it has not been rendered yet
+            logger.info("Etsitään PDF-painiketta...")
+            try:
+                pdf_button = WebDriverWait(driver, BUTTON_WAIT_TIMEOUT, poll_frequency=POLL_INTERVAL).until(
+                    _pdf_button_or_scroll
+                )
+            except TimeoutException:
+                raise Exception("PDF-painiketta ei löytynyt sivulta")
+            timer.mark("painikkeen haku")
         
-        # Strategy 1: Find by scanning all buttons for PDF-related content
-        try:
-            all_buttons = driver.find_elements(By.TAG_NAME, 'button')
-            logger.info(f"Löydettiin {len(all_buttons)} painiketta")
+            # Click the PDF button once it is clickable
+            logger.info("Klikataan PDF-painiketta...")
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", pdf_button)
+            try:
+                WebDriverWait(driver, 5, poll_frequency=POLL_INTERVAL).until(
+                    EC.element_to_be_clickable(pdf_button)
+                )
+            except TimeoutException:
+                logger.warning("PDF-painike ei muuttunut klikattavaksi, yritetään silti")
             
-            for button in all_buttons:
-                try:
-                    button_html = button.get_attribute("innerHTML").lower()
-                    button_text = button.text.lower()
-                    
-                    # More comprehensive search criteria
-                    if any(keyword in button_html or keyword in button_text 
-                           for keyword in ["tulosta", "pdf", "print", "lataa"]):
-                        pdf_button = button
-                        logger.info("PDF-painike löydetty painikkeiden skannauksella")
-                        break
-                except Exception as e:
-                    logger.warning(f"Painikkeen tarkistus epäonnistui: {e}")
-                    continue
-        except Exception as e:
-            logger.error(f"Painikkeiden etsiminen epäonnistui: {e}")
+            handles_before = len(driver.window_handles)
         
-        # Strategy 2: Try finding by XPath with multiple patterns
-        if not pdf_button:
-            xpath_patterns = [
-                "//button[contains(., 'PDF')]",
-                "//button[contains(., 'Tulosta')]",
-                "//button[contains(., 'tulosta')]",
-                "//a[contains(., 'PDF')]",
-                "//div[contains(@class, 'pdf')]//button",
-                "//div[contains(@class, 'print')]//button"
-            ]
-            
-            for xpath in xpath_patterns:
+            # Try multiple click methods
+            try:
+                # Try normal click first
+                pdf_button.click()
+            except Exception as e:
+                logger.warning(f"Normaali klikki epäonnistui: {e}")
                 try:
-                    elements = driver.find_elements(By.XPATH, xpath)
-                    if elements:
-                        pdf_button = elements[0]
-                        logger.info(f"PDF-painike löydetty XPath:lla: {xpath}")
-                        break
-                except Exception as e:
-                    logger.warning(f"XPath-haku epäonnistui: {xpath} - {e}")
-        
-        if not pdf_button:
-            raise Exception("PDF-painiketta ei löytynyt sivulta")
-        
-        # Click the PDF button
-        logger.info("Klikataan PDF-painiketta...")
-        driver.execute_script("arguments[0].scrollIntoView(true);", pdf_button)
-        time.sleep(2)  # Increased wait time
+                    # Try JavaScript click if normal click fails
+                    driver.execute_script("arguments[0].click();", pdf_button)
+                    logger.info("Käytetty JavaScript-klikkiä")
+                except Exception as js_e:
+                    logger.error(f"JavaScript-klikki epäonnistui: {js_e}")
+                    raise
+            timer.mark("klikkaus")
         
-        # Try multiple click methods
-        try:
-            # Try normal click first
-            pdf_button.click()
-        except Exception as e:
-            logger.warning(f"Normaali klikki epäonnistui: {e}")
+            # Klikkaus joko avaa PDF:n uuteen välilehteen tai aloittaa latauksen suoraan
+            logger.info("Odotetaan PDF:n latautumista...")
             try:
-                # Try JavaScript click if normal click fails
-                driver.execute_script("arguments[0].click();", pdf_button)
-                logger.info("Käytetty JavaScript-klikkiä")
-            except Exception as js_e:
-                logger.error(f"JavaScript-klikki epäonnistui: {js_e}")
-                raise
+                WebDriverWait(driver, NEW_WINDOW_TIMEOUT, poll_frequency=POLL_INTERVAL).until(
+                    lambda d: len(d.window_handles) > handles_before or _find_downloaded_pdfs(temp_download_dir)
+                )
+            except TimeoutException:
+                logger.warning("Uutta välilehteä tai latausta ei havaittu klikkauksen jälkeen")
         
-        # Wait for the PDF to load in a new tab or iframe
-        logger.info("Odotetaan PDF:n latautumista...")
-        time.sleep(7)  # Increased wait time
+            # Check if a new tab was opened
+            if len(driver.window_handles) > handles_before:
+                logger.info("Uusi välilehti avattu, siirrytään siihen")
+                driver.switch_to.window(driver.window_handles[-1])
         
-        # Check if a new tab was opened
-        if len(driver.window_handles) > 1:
-            logger.info("Uusi välilehti avattu, siirrytään siihen")
-            driver.switch_to.window(driver.window_handles[1])
+            # Get the current URL (which might be the PDF URL)
+            current_url = driver.current_url
+            logger.info(f"Nykyinen URL klikkauksen jälkeen: {current_url}")
         
-        # Get the current URL (which might be the PDF URL)
-        current_url = driver.current_url
-        logger.info(f"Nykyinen URL klikkauksen jälkeen: {current_url}")
-        
-        # Wait for the download to complete
-        logger.info("Odotetaan latauksen valmistumista...")
-        max_wait_time = 45  # Increased maximum wait time
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait_time:
-            # Check if any PDF files have been downloaded
-            pdf_files = glob.glob(os.path.join(temp_download_dir, "*.pdf"))
-            
-            if pdf_files:
-                # Found a downloaded PDF file
-                downloaded_file = pdf_files[0]  # Take the first PDF file found
-                logger.info(f"Ladattu tiedosto löydetty: {downloaded_file}")
-                
-                # Validate PDF before copying
-                if is_valid_pdf(downloaded_file):
-                    # Copy the file to the desired output location
-                    output_path = os.path.join(os.getcwd(), output_filename)
-                    shutil.copy2(downloaded_file, output_path)
-                    logger.info(f"PDF tallennettu polkuun: {output_path}")
-                    
-                    return os.path.abspath(output_path)
-                else:
-                    logger.warning(f"Ladattu PDF ei ole validi: {downloaded_file}")
-                    # Delete invalid file and continue waiting
-                    try:
-                        os.remove(downloaded_file)
-                        logger.info(f"Poistettu viallinen tiedosto: {downloaded_file}")
-                    except Exception as e:
-                        logger.warning(f"Viallisen tiedoston poistaminen epäonnistui: {e}")
+            # Wait for the download to complete
+            logger.info("Odotetaan latauksen valmistumista...")
+            # Selain kirjoittaa latauksen levylle, dokumentti luetaan muistiin ennen hakemiston poistoa
+            document = _wait_for_download(temp_download_dir, DOWNLOAD_TIMEOUT)
+            timer.mark("lataus")
             
-            # If no file found yet, wait a bit and check again
-            time.sleep(1)
+            if document:
+                timer.summary()
+                return document
         
-        # If we reach here, no PDF file was found in the download directory
-        # Try to download directly from the blob URL if available
-        if "blob:" in current_url:
-            logger.info(f"Ladattua tiedostoa ei löytynyt. Yritetään ladata blob-URL:sta: {current_url}")
+            # If we reach here, no PDF file was found in the download directory
+            # Try to download directly from the blob URL if available
+            if "blob:" in current_url:
+                logger.info(f"Ladattua tiedostoa ei löytynyt. Yritetään ladata blob-URL:sta: {current_url}")
             
-            # Use JavaScript to get the PDF data
-            pdf_content = driver.execute_script("""
-                var xhr = new XMLHttpRequest();
-                var blobUrl = arguments[0];
-                xhr.open('GET', blobUrl, false);
-                xhr.responseType = 'blob';
-                xhr.send(null);
+                # Use JavaScript to get the PDF data
+                pdf_content = driver.execute_script("""
+                    var xhr = new XMLHttpRequest();
+                    var blobUrl = arguments[0];
+                    xhr.open('GET', blobUrl, false);
+                    xhr.responseType = 'blob';
+                    xhr.send(null);
                 
-                var reader = new FileReader();
-                reader.readAsDataURL(xhr.response);
+                    var reader = new FileReader();
+                    reader.readAsDataURL(xhr.response);
                 
-                // This is a synchronous operation in this context
-                var base64data = null;
-                reader.onloadend = function() {
-                    base64data = reader.result;
-                }
+                    // This is a synchronous operation in this context
+                    var base64data = null;
+                    reader.onloadend = function() {
+                        base64data = reader.result;
+                    }
                 
-                // Wait for reader to complete
-                var start = Date.now();
-                while (base64data === null) {
-                    if (Date.now() - start > 5000) {
-                        throw new Error('Timeout waiting for FileReader');
+                    // Wait for reader to complete
+                    var start = Date.now();
+                    while (base64data === null) {
+                        if (Date.now() - start > 5000) {
+                            throw new Error('Timeout waiting for FileReader');
+                        }
                     }
-                }
                 
-                return base64data;
-            """, current_url)
+                    return base64data;
+                """, current_url)
             
-            # Extract the base64 data
-            if pdf_content and "base64," in pdf_content:
-                base64_data = pdf_content.split("base64,")[1]
-                
-                # Save the PDF file
-                output_path = os.path.join(os.getcwd(), output_filename)
-                with open(output_path, "wb") as f:
-                    import base64
-                    f.write(base64.b64decode(base64_data))
+                # Extract the base64 data
+                if pdf_content and "base64," in pdf_content:
+                    document = PdfDocument(base64.b64decode(pdf_content.split("base64,")[1]))
                 
-                # Validate the PDF
-                if is_valid_pdf(output_path):
-                    logger.info(f"PDF tallennettu blob-URL:sta polkuun: {output_path}")
-                    return os.path.abspath(output_path)
+                    # Validate the PDF
+                    if document.is_valid():
+                        logger.info("PDF ladattu blob-URL:sta")
+                        timer.summary()
+                        return document
+                    else:
+                        logger.warning(f"Blob-URL:sta ladattu PDF ei ole validi")
+                        raise Exception("Blob-URL:sta ladattu PDF ei ole validi")
                 else:
-                    logger.warning(f"Blob-URL:sta ladattu PDF ei ole validi")
-                    raise Exception("Blob-URL:sta ladattu PDF ei ole validi")
+                    raise Exception("PDF-sisällön purkaminen blob-URL:sta epäonnistui")
             else:
-                raise Exception("PDF-sisällön purkaminen blob-URL:sta epäonnistui")
-        else:
-            # If it's a direct PDF URL, download it with requests
-            logger.info(f"Ladattua tiedostoa ei löytynyt. Ladataan PDF suoraan URL:sta: {url}")
+                # If it's a direct PDF URL, download it with requests
+                logger.info(f"Ladattua tiedostoa ei löytynyt. Ladataan PDF suoraan URL:sta: {url}")
             
-            # Kokeillaan kohteen URL:ia
-            try:
-                response = requests.get(url, stream=True, timeout=30)
-                output_path = os.path.join(os.getcwd(), output_filename)
-                
-                with open(output_path, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
+                # Kokeillaan kohteen URL:ia
+                try:
+                    response = requests.get(url, timeout=30)
+                    document = PdfDocument(response.content, name=url)
                 
-                # Validate the PDF
-                if is_valid_pdf(output_path):
-                    logger.info(f"PDF tallennettu suoraan URL:sta polkuun: {output_path}")
-                    return os.path.abspath(output_path)
-                else:
-                    logger.warning(f"Suoraan URL:sta ladattu PDF ei ole validi")
-                    raise Exception("Suoraan URL:sta ladattu PDF ei ole validi")
-            except Exception as e:
-                logger.error(f"Suora URL-lataus epäonnistui: {e}")
-                raise
+                    # Validate the PDF
+                    if document.is_valid():
+                        logger.info("PDF ladattu suoraan URL:sta")
+                        timer.summary()
+                        return document
+                    else:
+                        logger.warning(f"Suoraan URL:sta ladattu PDF ei ole validi")
+                        raise Exception("Suoraan URL:sta ladattu PDF ei ole validi")
+                except Exception as e:
+                    logger.error(f"Suora URL-lataus epäonnistui: {e}")
+                    raise
     
     except Exception as e:
         logger.error(f"Virhe PDF:n lataamisessa: {e}")
@@ -438,14 +712,6 @@ def download_pdf(url, output_filename=None, headless=False):
         raise
     
     finally:
-        # Close the browser
-        if driver:
-            try:
-                driver.quit()
-                logger.info("Selain suljettu")
-            except Exception as e:
-                logger.warning(f"Selaimen sulkeminen epäonnistui: {e}")
-        
         # Clean up the temporary download directory
         try:
             if os.path.exists(temp_download_dir) and os.path.isdir(temp_download_dir):
@@ -486,25 +752,10 @@ def convert_pdf_to_text(pdf_path):
         
         while not success and retry_count < max_retries:
             try:
-                # Open the PDF file
-                with open(pdf_path, 'rb') as pdf_file:
-                    # Create a PDF reader object
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    
-                    # Check if PDF has pages
-                    if len(pdf_reader.pages) == 0:
-                        raise ValueError(f"PDF ei sisällä sivuja: {pdf_path}")
-                    
-                    # Open text file for writing
-                    with open(text_path, 'w', encoding='utf-8') as text_file:
-                        # Extract text from each page and write to text file
-                        for page_num in range(len(pdf_reader.pages)):
-                            logger.info(f"Käsitellään sivu {page_num + 1}/{len(pdf_reader.pages)}")
-                            page = pdf_reader.pages[page_num]
-                            text = page.extract_text()
-                            text_file.write(f"--- Page {page_num + 1} ---\n")
-                            text_file.write(text if text else "Sivulta ei löytynyt tekstiä.")
-                            text_file.write('\n\n')
+                text = pdf_to_text(PdfDocument(pdf_path))
+                
+                with open(text_path, 'w', encoding='utf-8') as text_file:
+                    text_file.write(text)
                 
                 # Tarkista että tekstitiedosto luotiin
                 if os.path.exists(text_path) and os.path.getsize(text_path) > 0:
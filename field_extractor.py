@@ -0,0 +1,152 @@
+"""
+Kenttien poiminta tekstistä yhdellä läpikäynnillä.
+
+Kenttätaulukko käännetään kerran: jokaisella kentällä on säännöllinen lauseke
+ja sen alussa oleva tunnistesana (esim. "Velaton hinta"). Kaikista tunnistesanoista
+muodostetaan yksi trie-muotoinen lauseke, jolla teksti käydään läpi kerran. Kun
+tunnistesana löytyy, vain sen kenttien lausekkeita kokeillaan juuri siinä
+kohdassa. Tulos vastaa sitä, että jokaiselle kentälle ajettaisiin oma
+re.search koko tekstiin: kentän arvoksi tulee sen ensimmäinen osuma.
+"""
+
+import re
+
+# Merkit, joihin lausekkeen kirjaimellinen alku päättyy
+_REGEX_META = set('\\.^$*+?{}[]|()')
+
+
+def _literal_prefix(pattern):
+    """Palauttaa lausekkeen alun, joka on pelkkää tekstiä"""
+    prefix = []
+    for char in pattern:
+        if char in _REGEX_META:
+            break
+        prefix.append(char)
+    return ''.join(prefix).strip()
+
+
+class Field:
+    """
+    Poimittava kenttä
+
+    Args:
+        name (str): Kentän nimi tuloksessa
+        pattern (str): Säännöllinen lauseke, jonka ryhmä 1 on kentän arvo
+        flags (int): re-liput
+        triggers (tuple, optional): Tunnistesanat, joista osuma voi alkaa. Oletuksena
+            lausekkeen kirjaimellinen alku.
+    """
+
+    def __init__(self, name, pattern, flags=0, triggers=None):
+        self.name = name
+        self.regex = re.compile(pattern, flags)
+        self.triggers = tuple(triggers) if triggers else (_literal_prefix(pattern),)
+        if not all(self.triggers):
+            raise ValueError(f"Kentälle {name} ei voitu päätellä tunnistesanaa, anna triggers")
+
+
+def _case_atoms(word, ignore_case):
+    """Pilkkoo sanan merkkeihin; kirjainkoosta riippumattomalle sanalle merkkiluokat"""
+    atoms = []
+    for char in word:
+        variants = sorted({char, char.lower(), char.upper()}) if ignore_case else [char]
+        variants = [v for v in variants if len(v) == 1]
+        if len(variants) == 1:
+            atoms.append(re.escape(variants[0]))
+        else:
+            atoms.append('[' + ''.join(re.escape(v) for v in variants) + ']')
+    return atoms
+
+
+def _trie_pattern(words):
+    """
+    Muodostaa sanoista trie-muotoisen vaihtoehtolausekkeen. Yhteiset alkuosat
+    käsitellään vain kerran, ja pidempi sana valitaan ennen sen alkuosaa.
+
+    Args:
+        words (list): Sanat merkkiatomeina (ks. _case_atoms)
+
+    Returns:
+        str: Säännöllinen lauseke
+    """
+    tree = {}
+    for atoms in words:
+        node = tree
+        for atom in atoms:
+            node = node.setdefault(atom, {})
+        node[''] = {}
+
+    def emit(node):
+        ends_here = '' in node
+        branches = [atom + emit(child) for atom, child in sorted(node.items()) if atom]
+        if not branches:
+            return ''
+        if len(branches) == 1 and not ends_here:
+            return branches[0]
+        if ends_here:
+            branches.append('')
+        return '(?:' + '|'.join(branches) + ')'
+
+    return emit(tree)
+
+
+class FieldExtractor:
+    """
+    Esikäännetty kenttätaulukko, joka poimii kaikki kentät yhdellä läpikäynnillä
+    """
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+
+        # Jokaiselle tunnistesanalle ne kentät, joiden osuma voi alkaa sen kohdalta.
+        # Hakulauseke löytää kustakin kohdasta pisimmän tunnistesanan, joten samassa
+        # kohdassa alkavat lyhyemmät sanat ovat sen alkuosia.
+        triggers = {}
+        for field in self.fields:
+            for trigger in field.triggers:
+                ignore_case = bool(field.regex.flags & re.IGNORECASE)
+                triggers[trigger] = triggers.get(trigger, False) or ignore_case
+
+        self._candidates = {}
+        for trigger in triggers:
+            self._candidates[trigger.lower()] = [
+                field for field in self.fields
+                if any(trigger.lower().startswith(t.lower()) for t in field.triggers)
+            ]
+
+        # Kirjainkoosta riippuvana trie-lausekkeena haku pystyy ohittamaan
+        # tekstin nopeasti kohtiin, joissa jokin tunnistesana voi alkaa
+        self._scanner = re.compile(_trie_pattern(
+            [_case_atoms(trigger, ignore_case) for trigger, ignore_case in triggers.items()]
+        ))
+
+    def extract(self, text):
+        """
+        Poimii kentät tekstistä
+
+        Args:
+            text (str): Käsiteltävä teksti
+
+        Returns:
+            dict: Kentän nimi -> ensimmäinen re.Match tai None
+        """
+        matches = dict.fromkeys(field.name for field in self.fields)
+        remaining = len(self.fields)
+        position = 0
+
+        while remaining:
+            hit = self._scanner.search(text, position)
+            if hit is None:
+                break
+            position = hit.start()
+            for field in self._candidates.get(hit.group().lower(), ()):
+                if matches[field.name] is not None:
+                    continue
+                match = field.regex.match(text, position)
+                if match:
+                    matches[field.name] = match
+                    remaining -= 1
+            # Jatketaan seuraavasta merkistä, jotta päällekkäiset tunnistesanat löytyvät
+            position += 1
+
+        return matches
@@ -0,0 +1,53 @@
+"""
+Gunicornin asetukset. Gunicorn lukee tämän tiedoston automaattisesti projektin juuresta.
+
+PRELOAD_APP=true lataa sovelluksen kerran emoprosessissa ennen workerien käynnistystä.
+Workerit jakavat ladatut moduulit copy-on-write-muistina, joten workerikohtainen muisti
+pienenee ja aikakatkaisun jälkeen uusi worker on käytössä lähes heti. Haarautumisen
+jälkeen worker hylkää emoprosessilta periytyneet yhteydet (worker_lifecycle.reset_after_fork).
+
+Taustasäikeet käynnistetään vasta workerissa: analyysijono jokaisessa workerissa ja
+tilausten ajastin vain yhdessä kerrallaan. Jos ajastinta ajava worker kuolee, sen tilalle
+käynnistetty worker ottaa ajastimen.
+
+Käyttö:
+    gunicorn app:app
+    PRELOAD_APP=true gunicorn app:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+threads = int(os.environ.get('GUNICORN_THREADS', '2'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = os.environ.get('PRELOAD_APP', 'false').lower() == 'true'
+
+# app.py ei käynnistä taustasäikeitä latautuessaan, vaan post_worker_init käynnistää ne workerissa
+os.environ.setdefault('BACKGROUND_SERVICES', 'worker')
+
+
+def when_ready(server):
+    """Emoprosessi ei palvele pyyntöjä, joten esiladatun sovelluksen yhteydet suljetaan ennen haarautumista"""
+    if server.cfg.preload_app:
+        from worker_lifecycle import dispose_engines
+        dispose_engines(server.app.wsgi())
+
+
+def pre_fork(server, worker):
+    """Valitsee tilausten ajastimen ajajaksi uuden workerin, jos yksikään elossa oleva ei aja sitä"""
+    worker.runs_scheduler = not any(getattr(w, 'runs_scheduler', False) for w in server.WORKERS.values())
+
+
+def post_fork(server, worker):
+    """Hylkää esiladatun sovelluksen emoprosessilta periytyneet yhteydet"""
+    if server.cfg.preload_app:
+        from worker_lifecycle import reset_after_fork
+        reset_after_fork(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    """Käynnistää taustasäikeet, kun sovellus on ladattu workeriin"""
+    from worker_lifecycle import start_background_services
+    start_background_services(worker.wsgi, run_scheduler=worker.runs_scheduler)
+    worker.log.info(f"Worker {worker.pid} valmis (tilausten ajastin: {'kyllä' if worker.runs_scheduler else 'ei'})")
@@ -66,20 +66,22 @@ def save_property_data_to_db(property_data, analysis_id=None, user_id=None):
         logger.error(f"Virhe kiinteistön tietojen tallentamisessa: {e}")
         return None
 
-def process_single_pdf(pdf_path, kaupunki_nimi="PDF-lataus", user_id=None):
+def process_single_pdf(pdf_path, kaupunki_nimi="PDF-lataus", user_id=None, filename=None):
     """
     Käsittelee yksittäisen PDF-tiedoston ja palauttaa siitä poimitut tiedot.
     
     Args:
-        pdf_path (str): Polku PDF-tiedostoon
+        pdf_path (str | PdfDocument): Polku PDF-tiedostoon tai jo jäsennetty dokumentti
         kaupunki_nimi (str): Kaupungin nimi, jos tiedossa (oletuksena "PDF-lataus")
         user_id (int): Käyttäjän ID, jolle tiedot tallennetaan
+        filename (str, optional): Tiedoston nimi, jos pdf_path ei ole polku
     
     Returns:
         dict: Poimitut tiedot tai None, jos poiminta epäonnistui
     """
     try:
-        logger.info(f"Käsitellään PDF-tiedosto: {pdf_path}")
+        filename = filename or os.path.basename(str(pdf_path))
+        logger.info(f"Käsitellään PDF-tiedosto: {filename}")
         
         # Poimitaan teksti PDF-tiedostosta
         text_content = oikotie_downloader.extract_text_from_pdf(pdf_path)
@@ -91,7 +93,7 @@ def process_single_pdf(pdf_path, kaupunki_nimi="PDF-lataus", user_id=None):
         # Luodaan väliaikainen tiedostonimi PDF:n polusta
         import os
         import time
-        file_stem = os.path.splitext(os.path.basename(pdf_path))[0]
+        file_stem = os.path.splitext(filename)[0]
         property_id = f"{file_stem}_{int(time.time())}"
         
         # Muotoillaan teksti markdown-muotoon analyysiä varten
@@ -99,7 +101,7 @@ def process_single_pdf(pdf_path, kaupunki_nimi="PDF-lataus", user_id=None):
 
 ## Perustiedot
 Lähde: Ladattu PDF
-Tiedostonimi: {os.path.basename(pdf_path)}
+Tiedostonimi: {filename}
 ID: {property_id}
 Sijainti: {kaupunki_nimi}
 
@@ -1,10 +1,13 @@
 import os
 import json
-import pdfplumber
 import re
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
 from decimal import Decimal
 from models import db, Kohde
+from pdf_document import PdfDocument
+from field_extractor import Field, FieldExtractor
 import tempfile
 import decimal
 
@@ -20,181 +23,191 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 👇 Oletusarvoinen tietojen poimintafunktio (lyhennettynä, olettaa että olet jo määritellyt extract_listing_data)
-
-def extract_listing_data(pdf_path, kaupunki_nimi):
-    with pdfplumber.open(pdf_path) as pdf:
-        full_text = "\n".join(page.extract_text() or "" for page in pdf.pages)
-
-    data = {}
-    
+# Kenttätaulukko käännetään kerran moduulin latauksessa. Jokaisen kentän arvo on
+# lausekkeen ensimmäinen osuma koko tekstissä (ryhmä 1).
+LISTING_FIELDS = [
     # Perustiedot
-    match = re.search(
-        r"([A-ZÅÄÖa-zåäö]+\s\d+[A-Za-z]?(?:\s?[a-z])?,\s?[A-ZÅÄÖa-zåäö\- ]+,\s?[A-ZÅÄÖa-zåäö\-]+)", 
-        full_text
-    )
-    data["osoite"] = match.group(1) if match else None
-    
-    data["kaupunginosa"] = re.search(r"Kaupunginosa\s+([^\n]+)", full_text)
-    data["kaupunki"] = kaupunki_nimi
-    data["kohdenumero"] = re.search(r"Kohdenumero\s+([^\n]+)", full_text)
-    data["postitoimipaikka"] = re.search(r"Postitoimipaikka\s+([^\n]+)", full_text)
-    data["asuinpinta_ala"] = re.search(r"Asuinpinta-ala\s+([0-9,\.]+)\s*m²", full_text)
-    data["kokonaispinta_ala"] = re.search(r"Kokonaispinta-ala\s+([0-9,\.]+)\s*m²", full_text)
-    data["kerrosala"] = re.search(r"Kerrosala\s+([0-9,\.]+)\s*m²", full_text)
-    data["tontin_pinta_ala"] = re.search(r"Tontin pinta-ala\s+([0-9,\.]+)\s*m²", full_text)
-    data["muut_tilat"] = re.search(r"Muut tilat\s+([^\n]+)", full_text)
-    data["kerros"] = re.search(r"Kerros\s+([^\n]+)", full_text)
-    data["kerroksia"] = re.search(r"Kerroksia\s+([^\n]+)", full_text)
-    data["huoneiston_kokoonpano"] = re.search(r"Huoneiston kokoonpano\s+([^\n]+)", full_text)
-    data["huoneita"] = re.search(r"Huoneita\s+([^\n]+)", full_text)
-    data["makuuhuoneita"] = re.search(r"Makuuhuoneita\s+([^\n]+)", full_text)
-    data["kunto"] = re.search(r"Kunto\s+([^\n]+)", full_text)
-    data["kunnon_lisatiedot"] = re.search(r"Kunnon lisätiedot\s+([^\n]+)", full_text)
-    data["vapautuminen"] = re.search(r"Vapautuminen\s+([^\n]+)", full_text)
-    data["ensiesittelyssa"] = re.search(r"Ensiesittelyssä\s+([^\n]+)", full_text)
-    data["asumistyyppi"] = re.search(r"Asumistyyppi\s+([^\n]+)", full_text)
-    data["vuokrattu"] = re.search(r"Vuokrattu\s+([^\n]+)", full_text)
-    data["kohdetyyppi"] = re.search(r"Kohde on\s+([^\n]+)", full_text)
-    data["uudiskohde"] = re.search(r"Uudiskohde\s+([^\n]+)", full_text)
-    data["osakeluettelo_siirretty"] = re.search(r"Osakeluettelo siirretty huoneistojärjestelmään\s+([^\n]+)", full_text)
-    data["kiinteistötunnus"] = re.search(r"Kiinteistötunnus\s+([^\n]+)", full_text)
-    data["kunnan_numero"] = re.search(r"Kunnan numero\s+([^\n]+)", full_text)
+    Field("kaupunginosa", r"Kaupunginosa\s+([^\n]+)"),
+    Field("kohdenumero", r"Kohdenumero\s+([^\n]+)"),
+    Field("postitoimipaikka", r"Postitoimipaikka\s+([^\n]+)"),
+    Field("asuinpinta_ala", r"Asuinpinta-ala\s+([0-9,\.]+)\s*m²"),
+    Field("kokonaispinta_ala", r"Kokonaispinta-ala\s+([0-9,\.]+)\s*m²"),
+    Field("kerrosala", r"Kerrosala\s+([0-9,\.]+)\s*m²"),
+    Field("tontin_pinta_ala", r"Tontin pinta-ala\s+([0-9,\.]+)\s*m²"),
+    Field("muut_tilat", r"Muut tilat\s+([^\n]+)"),
+    Field("kerros", r"Kerros\s+([^\n]+)"),
+    Field("kerroksia", r"Kerroksia\s+([^\n]+)"),
+    Field("huoneiston_kokoonpano", r"Huoneiston kokoonpano\s+([^\n]+)"),
+    Field("huoneita", r"Huoneita\s+([^\n]+)"),
+    Field("makuuhuoneita", r"Makuuhuoneita\s+([^\n]+)"),
+    Field("kunto", r"Kunto\s+([^\n]+)"),
+    Field("kunnon_lisatiedot", r"Kunnon lisätiedot\s+([^\n]+)"),
+    Field("vapautuminen", r"Vapautuminen\s+([^\n]+)"),
+    Field("ensiesittelyssa", r"Ensiesittelyssä\s+([^\n]+)"),
+    Field("asumistyyppi", r"Asumistyyppi\s+([^\n]+)"),
+    Field("vuokrattu", r"Vuokrattu\s+([^\n]+)"),
+    Field("kohdetyyppi", r"Kohde on\s+([^\n]+)"),
+    Field("uudiskohde", r"Uudiskohde\s+([^\n]+)"),
+    Field("osakeluettelo_siirretty", r"Osakeluettelo siirretty huoneistojärjestelmään\s+([^\n]+)"),
+    Field("kiinteistötunnus", r"Kiinteistötunnus\s+([^\n]+)"),
+    Field("kunnan_numero", r"Kunnan numero\s+([^\n]+)"),
 
     # Hinta ja rahoitus
-    data["velaton_hinta"] = re.search(r"Velaton hinta\s+([0-9\s]+)€", full_text)
-    data["myyntihinta"] = re.search(r"Myyntihinta\s+([0-9\s]+)€", full_text)
-    data["velkaosuus"] = re.search(r"Velkaosuus\s+([0-9\s]+)€", full_text)
-    data["kiinnitykset"] = re.search(r"Kiinnitykset\s+([0-9\s]+)€", full_text)
-    data["lainaosuuden_maksu"] = re.search(r"Lainaosuuden maksu\s+([^\n]+)", full_text)
-    data["neliöhinta"] = re.search(r"Neliöhinta\s+([0-9\s,]+)\s*/\s*m²", full_text)
-    data["yhtiölainoitus"] = re.search(r"Yhtiölainoitus\s+([^\n]+)", full_text)
-    data["vastikevastuu_yhtiölainasta"] = re.search(r"Vastikevastuu yhtiölainasta\s+([^\n]+)", full_text)
-    data["varainsiirtovero"] = re.search(r"Varainsiirtovero\s+([^\n]+)", full_text)
-    data["myydaan_kalustettuna"] = re.search(r"Myydään kalustettuna\s+([^\n]+)", full_text)
-    data["muuta_kauppaan_kuuluvaa"] = re.search(r"Muuta kauppaan kuuluvaa\s*:\s*([^\n]+)", full_text)
-    match = re.search(r"Rahoitusmuoto\s*((?:.|\n)*?)(?=\n\S|\Z)", full_text, re.DOTALL)
-    if match:
-        data["rahoitusmuoto"] = match.group(1).strip()
+    Field("velaton_hinta", r"Velaton hinta\s+([0-9\s]+)€"),
+    Field("myyntihinta", r"Myyntihinta\s+([0-9\s]+)€"),
+    Field("velkaosuus", r"Velkaosuus\s+([0-9\s]+)€"),
+    Field("kiinnitykset", r"Kiinnitykset\s+([0-9\s]+)€"),
+    Field("lainaosuuden_maksu", r"Lainaosuuden maksu\s+([^\n]+)"),
+    Field("neliöhinta", r"Neliöhinta\s+([0-9\s,]+)\s*/\s*m²"),
+    Field("yhtiölainoitus", r"Yhtiölainoitus\s+([^\n]+)"),
+    Field("vastikevastuu_yhtiölainasta", r"Vastikevastuu yhtiölainasta\s+([^\n]+)"),
+    Field("varainsiirtovero", r"Varainsiirtovero\s+([^\n]+)"),
+    Field("myydaan_kalustettuna", r"Myydään kalustettuna\s+([^\n]+)"),
+    Field("muuta_kauppaan_kuuluvaa", r"Muuta kauppaan kuuluvaa\s*:\s*([^\n]+)"),
+    Field("rahoitusmuoto", r"Rahoitusmuoto\s*((?:.|\n)*?)(?=\n\S|\Z)", re.DOTALL),
 
     # Maksut ja vastikkeet
-    data["hoitovastike"] = re.search(r"Hoitovastike\s+([^\n€]+)\s*€?\s*/\s*kk", full_text)
-    data["pääomavastike"] = re.search(r"Pääomavastike\s+([^\n€]+)\s*€?\s*/\s*kk", full_text)
-    data["yhtiövastike_yhteensä"] = re.search(r"Yhtiövastike yhteensä\s+([^\n€]+)\s*€?\s*/\s*kk", full_text)
-    data["tontin_vuokravastike"] = re.search(r"Tontin vuokravastike\s+([^\n€]+)\s*€?\s*/\s*kk", full_text)
-    data["vesimaksu"] = re.search(r"Vesimaksu\s+([^\n]+)", full_text)
-    data["saunan_kustannukset"] = re.search(r"Saunan kustannukset\s+([^\n]+)", full_text)
-    data["autopaikan_vuokra"] = re.search(r"(?:Autopaikka|Autopaikan vuokra)\s+([^\n€]+)\s*€?\s*/\s*kk", full_text)
-    data["muut_maksut"] = re.search(r"Muut maksut\s+([^\n]+)", full_text)
-    data["sähkönkulutus"] = re.search(r"Sähkön.*kulutus.*?([0-9\s]+)\s*kWh(?:/vuosi|/v)?", full_text, re.IGNORECASE)
-    data["kiinteistövero"] = re.search(r"Kiinteistövero\s+([^\n€]+)\s*€?\s*/?\s*vuosi?", full_text)
+    Field("hoitovastike", r"Hoitovastike\s+([^\n€]+)\s*€?\s*/\s*kk"),
+    Field("pääomavastike", r"Pääomavastike\s+([^\n€]+)\s*€?\s*/\s*kk"),
+    Field("yhtiövastike_yhteensä", r"Yhtiövastike yhteensä\s+([^\n€]+)\s*€?\s*/\s*kk"),
+    Field("tontin_vuokravastike", r"Tontin vuokravastike\s+([^\n€]+)\s*€?\s*/\s*kk"),
+    Field("vesimaksu", r"Vesimaksu\s+([^\n]+)"),
+    Field("saunan_kustannukset", r"Saunan kustannukset\s+([^\n]+)"),
+    Field("autopaikan_vuokra", r"(?:Autopaikka|Autopaikan vuokra)\s+([^\n€]+)\s*€?\s*/\s*kk", triggers=("Autopaikka", "Autopaikan vuokra")),
+    Field("muut_maksut", r"Muut maksut\s+([^\n]+)"),
+    Field("sähkönkulutus", r"Sähkön.*kulutus.*?([0-9\s]+)\s*kWh(?:/vuosi|/v)?", re.IGNORECASE),
+    Field("kiinteistövero", r"Kiinteistövero\s+([^\n€]+)\s*€?\s*/?\s*vuosi?"),
 
     # Rakennus ja tontti
-    data["taloyhtiön_nimi"] = re.search(r"Taloyhtiön nimi\s+([^\n]+)", full_text)
-    data["rakennuksen_tyyppi"] = re.search(r"Rakennuksen tyyppi\s+([^\n]+)", full_text)
-    data["rakennusvuosi"] = re.search(r"Rakennusvuosi\s+([^\n]+)", full_text)
-    data["käyttöönottovuosi"] = re.search(r"Käyttöönottovuosi\s+([^\n]+)", full_text)
-    data["rakennusmateriaali"] = re.search(r"Rakennusmateriaali\s+([^\n]+)", full_text)
-    data["kattotyyppi"] = re.search(r"Kattotyyppi\s+([^\n]+)", full_text)
-    data["kattomateriaali"] = re.search(r"Kattomateriaali\s+([^\n]+)", full_text)
-    data["energialuokka"] = re.search(r"Energialuokka\s+([^\n]+)", full_text)
-    data["e_luku"] = re.search(r"E-luku\s+([0-9,\.]+)", full_text)
-    data["energiatodistus"] = re.search(r"Energiatodistus\s+([^\n]+)", full_text)
-    data["rakennusoikeus"] = re.search(r"Rakennusoikeus\s+([0-9,\.]+)\s*m²", full_text)
-    data["kaavatilanne"] = re.search(r"Kaavatilanne\s+([^\n]+)", full_text)
-    data["kaavoitustiedot"] = re.search(r"Kaavoitustiedot\s+([^\n]+)", full_text)
-    data["kaavan_tyyppi"] = re.search(r"Kaavan tyyppi\s+([^\n]+)", full_text)
-    data["tontin_omistus"] = re.search(r"Tontin omistus\s+([^\n]+)", full_text)
-    data["tontin_koko"] = re.search(r"Tontin koko\s+([0-9,\.]+)\s*m²", full_text)
-    data["piha"] = re.search(r"Pihan kuvaus\s+([^\n]+)", full_text)
-    data["autopaikat"] = re.search(r"Autopaikat\s+([^\n]+)", full_text)
-    data["varasto"] = re.search(r"Varasto\s+([^\n]+)", full_text)
-    data["huoneistojen_lukumäärä"] = re.search(r"Huoneistojen lukumäärä\s+([0-9]+)", full_text)
+    Field("taloyhtiön_nimi", r"Taloyhtiön nimi\s+([^\n]+)"),
+    Field("rakennuksen_tyyppi", r"Rakennuksen tyyppi\s+([^\n]+)"),
+    Field("rakennusvuosi", r"Rakennusvuosi\s+([^\n]+)"),
+    Field("käyttöönottovuosi", r"Käyttöönottovuosi\s+([^\n]+)"),
+    Field("rakennusmateriaali", r"Rakennusmateriaali\s+([^\n]+)"),
+    Field("kattotyyppi", r"Kattotyyppi\s+([^\n]+)"),
+    Field("kattomateriaali", r"Kattomateriaali\s+([^\n]+)"),
+    Field("energialuokka", r"Energialuokka\s+([^\n]+)"),
+    Field("e_luku", r"E-luku\s+([0-9,\.]+)"),
+    Field("energiatodistus", r"Energiatodistus\s+([^\n]+)"),
+    Field("rakennusoikeus", r"Rakennusoikeus\s+([0-9,\.]+)\s*m²"),
+    Field("kaavatilanne", r"Kaavatilanne\s+([^\n]+)"),
+    Field("kaavoitustiedot", r"Kaavoitustiedot\s+([^\n]+)"),
+    Field("kaavan_tyyppi", r"Kaavan tyyppi\s+([^\n]+)"),
+    Field("tontin_omistus", r"Tontin omistus\s+([^\n]+)"),
+    Field("tontin_koko", r"Tontin koko\s+([0-9,\.]+)\s*m²"),
+    Field("piha", r"Pihan kuvaus\s+([^\n]+)"),
+    Field("autopaikat", r"Autopaikat\s+([^\n]+)"),
+    Field("varasto", r"Varasto\s+([^\n]+)"),
+    Field("huoneistojen_lukumäärä", r"Huoneistojen lukumäärä\s+([0-9]+)"),
 
     # Talotekniikka ja lämmitys
-    data["lämmitysmuoto"] = re.search(r"Lämmitysmuoto\s+([^\n]+)", full_text)
-    data["lämmitysjärjestelmä"] = re.search(r"Lämmitysjärjestelmä\s+([^\n]+)", full_text)
-    data["lämmönjakelu"] = re.search(r"Lämmönjako(?:elu)?\s+([^\n]+)", full_text)
-    data["ilmalämpöpumppu"] = re.search(r"Ilmalämpöpumppu\s+([^\n]+)", full_text)
-    data["varaava_takka"] = re.search(r"Varaava takka\s+([^\n]+)", full_text)
-    data["ilmastointi"] = re.search(r"Ilmastointi\s+([^\n]+)", full_text)
-    data["ilmanvaihto"] = re.search(r"Ilmanvaihto\s+([^\n]+)", full_text)
-    data["antennijärjestelmä"] = re.search(r"Antennijärjestelmä\s+([^\n]+)", full_text)
-    data["tietoliikennepalvelut"] = re.search(r"Tietoliikennepalvelut\s+([^\n]+)", full_text)
-    data["vesi"] = re.search(r"Vesi(?:johto)?\s*:\s*([^\n]+)", full_text)
-    data["viemäröinti"] = re.search(r"Viemäröinti\s*:\s*([^\n]+)", full_text)
-    data["kunnallistekniikka"] = re.search(r"Kunnallistekniikka\s+([^\n]+)", full_text)
+    Field("lämmitysmuoto", r"Lämmitysmuoto\s+([^\n]+)"),
+    Field("lämmitysjärjestelmä", r"Lämmitysjärjestelmä\s+([^\n]+)"),
+    Field("lämmönjakelu", r"Lämmönjako(?:elu)?\s+([^\n]+)"),
+    Field("ilmalämpöpumppu", r"Ilmalämpöpumppu\s+([^\n]+)"),
+    Field("varaava_takka", r"Varaava takka\s+([^\n]+)"),
+    Field("ilmastointi", r"Ilmastointi\s+([^\n]+)"),
+    Field("ilmanvaihto", r"Ilmanvaihto\s+([^\n]+)"),
+    Field("antennijärjestelmä", r"Antennijärjestelmä\s+([^\n]+)"),
+    Field("tietoliikennepalvelut", r"Tietoliikennepalvelut\s+([^\n]+)"),
+    Field("vesi", r"Vesi(?:johto)?\s*:\s*([^\n]+)"),
+    Field("viemäröinti", r"Viemäröinti\s*:\s*([^\n]+)"),
+    Field("kunnallistekniikka", r"Kunnallistekniikka\s+([^\n]+)"),
 
     # Keittiö
-    data["keittiön_varusteet"] = re.search(r"Keittiön varusteet\s+([^\n]+)", full_text)
-    data["keittiön_kalusteet"] = re.search(r"Kalusteet\s+([^\n]+)", full_text)
-    data["keittiön_työtasot"] = re.search(r"Työtasot\s+([^\n]+)", full_text)
-    data["keittiön_lattia"] = re.search(r"Keittiön lattia\s+([^\n]+)", full_text)
-    data["keittiön_seinät"] = re.search(r"Keittiön seinät\s+([^\n]+)", full_text)
+    Field("keittiön_varusteet", r"Keittiön varusteet\s+([^\n]+)"),
+    Field("keittiön_kalusteet", r"Kalusteet\s+([^\n]+)"),
+    Field("keittiön_työtasot", r"Työtasot\s+([^\n]+)"),
+    Field("keittiön_lattia", r"Keittiön lattia\s+([^\n]+)"),
+    Field("keittiön_seinät", r"Keittiön seinät\s+([^\n]+)"),
 
     # Sauna
-    data["kylpyhuoneen_varusteet"] = re.search(r"Kylpyhuone(?:en)? varusteet\s+([^\n]+)", full_text)
-    data["wc_varusteet"] = re.search(r"WC(?:-tilojen)? varusteet\s+([^\n]+)", full_text)
-    data["sauna"] = re.search(r"Sauna\s+([^\n]+)", full_text)
-    data["saunan_varusteet"] = re.search(r"Saunan varusteet\s+([^\n]+)", full_text)
+    Field("kylpyhuoneen_varusteet", r"Kylpyhuone(?:en)? varusteet\s+([^\n]+)"),
+    Field("wc_varusteet", r"WC(?:-tilojen)? varusteet\s+([^\n]+)"),
+    Field("sauna", r"Sauna\s+([^\n]+)"),
+    Field("saunan_varusteet", r"Saunan varusteet\s+([^\n]+)"),
 
     # MH
-    data["makuuhuoneiden_lattia"] = re.search(r"Makuuhuone(?:iden)? lattia\s+([^\n]+)", full_text)
-    data["makuuhuoneiden_seinät"] = re.search(r"Makuuhuone(?:iden)? seinät\s+([^\n]+)", full_text)
-    data["makuuhuoneiden_varusteet"] = re.search(r"Makuuhuone(?:iden)? varusteet\s+([^\n]+)", full_text)
+    Field("makuuhuoneiden_lattia", r"Makuuhuone(?:iden)? lattia\s+([^\n]+)"),
+    Field("makuuhuoneiden_seinät", r"Makuuhuone(?:iden)? seinät\s+([^\n]+)"),
+    Field("makuuhuoneiden_varusteet", r"Makuuhuone(?:iden)? varusteet\s+([^\n]+)"),
 
     # OH
-    data["olohuoneen_lattia"] = re.search(r"Olohuone(?:en)? lattia\s+([^\n]+)", full_text)
-    data["olohuoneen_seinät"] = re.search(r"Olohuone(?:en)? seinät\s+([^\n]+)", full_text)
-    data["olohuoneen_varusteet"] = re.search(r"Olohuone(?:en)? varusteet\s+([^\n]+)", full_text)
+    Field("olohuoneen_lattia", r"Olohuone(?:en)? lattia\s+([^\n]+)"),
+    Field("olohuoneen_seinät", r"Olohuone(?:en)? seinät\s+([^\n]+)"),
+    Field("olohuoneen_varusteet", r"Olohuone(?:en)? varusteet\s+([^\n]+)"),
 
     # SÄILYTYS
-    data["säilytystilat"] = re.search(r"Säilytystilat\s+([^\n]+)", full_text)
-    data["säilytystilojen_varusteet"] = re.search(r"Säilytystilojen varusteet\s+([^\n]+)", full_text)
+    Field("säilytystilat", r"Säilytystilat\s+([^\n]+)"),
+    Field("säilytystilojen_varusteet", r"Säilytystilojen varusteet\s+([^\n]+)"),
 
     # PINTAMATERIAALIT
-    data["lattiamateriaalit"] = re.search(r"Lattiamateriaalit\s+([^\n]+)", full_text)
-    data["seinämateriaalit"] = re.search(r"Seinämateriaalit\s+([^\n]+)", full_text)
-    data["katon_materiaalit"] = re.search(r"Katon materiaalit\s+([^\n]+)", full_text)
+    Field("lattiamateriaalit", r"Lattiamateriaalit\s+([^\n]+)"),
+    Field("seinämateriaalit", r"Seinämateriaalit\s+([^\n]+)"),
+    Field("katon_materiaalit", r"Katon materiaalit\s+([^\n]+)"),
 
     # SIJAINTI JA YMPÄRISTÖ
-    data["etäisyys_keskustasta"] = re.search(r"Etäisyys keskustaan\s+([^\n]+)", full_text)
-    data["luonnonläheisyys"] = re.search(r"Luonnonläheisyys\s+([^\n]+)", full_text)
-    data["palvelut"] = re.search(r"Palvelut\s*[:\-]?\s+([^\n]+)", full_text)
-    data["lähin_palvelu"] = re.search(r"Lähin palvelu\s+([^\n]+)", full_text)
-    data["koulut"] = re.search(r"Koulut\s+([^\n]+)", full_text)
-    data["leikkipuisto_ulkoilualue"] = re.search(r"(Leikkipuisto|Ulkoilualueet?|Puistoalueet?)\s+([^\n]+)", full_text)
-    data["veneilymahdollisuus"] = re.search(r"(Venesatama|Veneilymahdollisuus)\s+([^\n]+)", full_text)
-    data["liikenneyhteydet"] = re.search(r"Liikenneyhteydet\s+([^\n]+)", full_text)
-    data["yhteydet_keskustaan"] = re.search(r"Yhteydet keskustaan\s+([^\n]+)", full_text)
+    Field("etäisyys_keskustasta", r"Etäisyys keskustaan\s+([^\n]+)"),
+    Field("luonnonläheisyys", r"Luonnonläheisyys\s+([^\n]+)"),
+    Field("palvelut", r"Palvelut\s*[:\-]?\s+([^\n]+)"),
+    Field("lähin_palvelu", r"Lähin palvelu\s+([^\n]+)"),
+    Field("koulut", r"Koulut\s+([^\n]+)"),
+    Field("leikkipuisto_ulkoilualue", r"(Leikkipuisto|Ulkoilualueet?|Puistoalueet?)\s+([^\n]+)", triggers=("Leikkipuisto", "Ulkoilualue", "Puistoalue")),
+    Field("veneilymahdollisuus", r"(Venesatama|Veneilymahdollisuus)\s+([^\n]+)", triggers=("Venesatama", "Veneilymahdollisuus")),
+    Field("liikenneyhteydet", r"Liikenneyhteydet\s+([^\n]+)"),
+    Field("yhteydet_keskustaan", r"Yhteydet keskustaan\s+([^\n]+)"),
 
     # ARKKITEHTUURI JA RAKENTAMINEN
-    data["arkkitehtisuunnittelu"] = re.search(r"Arkkitehtisuunnittelu\s+([^\n]+)", full_text)
-    data["rakennuttaja"] = re.search(r"Rakennuttaja\s+([^\n]+)", full_text)
-    data["rakennuskokemus"] = re.search(r"Rakennuskokemus\s+([^\n]+)", full_text)
-    data["virtuaaliesittelylinkki"] = re.search(r"(https?://[^\s]+(?:matterport\.com|virtualtour|3d|esittely)[^\s]*)", full_text)
+    Field("arkkitehtisuunnittelu", r"Arkkitehtisuunnittelu\s+([^\n]+)"),
+    Field("rakennuttaja", r"Rakennuttaja\s+([^\n]+)"),
+    Field("rakennuskokemus", r"Rakennuskokemus\s+([^\n]+)"),
+    Field("virtuaaliesittelylinkki", r"(https?://[^\s]+(?:matterport\.com|virtualtour|3d|esittely)[^\s]*)", triggers=("http",)),
 
     # REMONTIT
-    data["tehdyt_remontit"] = re.search(
-        r"Tehdyt remontit[:\s]*\n?((?:.+\n){0,10})", full_text, re.IGNORECASE
-    )
-
-    data["tulevat_remontit"] = re.search(
-        r"Tulevat remontit(?:\s*\([^)]+\))?[:\s]*\n?((?:.+\n){0,10})", full_text, re.IGNORECASE
-    )
-
+    Field("tehdyt_remontit", r"Tehdyt remontit[:\s]*\n?((?:.+\n){0,10})", re.IGNORECASE),
+    Field("tulevat_remontit", r"Tulevat remontit(?:\s*\([^)]+\))?[:\s]*\n?((?:.+\n){0,10})", re.IGNORECASE),
 
     # YHTEISET TILAT
-    data["yhteiset_tilat"] = re.search(r"Yhteiset tilat\s+([^\n]+)", full_text)
-    data["pysäköintitilan_kuvaus"] = re.search(r"Pysäköintitilan kuvaus\s+([^\n]+)", full_text)
+    Field("yhteiset_tilat", r"Yhteiset tilat\s+([^\n]+)"),
+    Field("pysäköintitilan_kuvaus", r"Pysäköintitilan kuvaus\s+([^\n]+)"),
 
     # ILMOITTAJANTIEDOT
-    data["ilmoittajan_nimi"] = re.search(r"(?:Ilmoittaja|Nimi)\s*[:\-]?\s+([^\n]+)", full_text)
-    data["ilmoittajan_puhelin"] = re.search(r"(?:Puh\.?|Puhelin)\s*[:\-]?\s+([0-9\s]+)", full_text)
-    data["yrityksen_nimi"] = re.search(r"(?:Yritys|Toimisto|Välittäjä)\s*[:\-]?\s+([^\n]+)", full_text)
-    data["yrityksen_osoite"] = re.search(r"(?:Yrityksen osoite|Osoite)\s*[:\-]?\s+([^\n]+)", full_text)
-    data["yrityksen_puhelin"] = re.search(r"(?:Yrityksen puhelin|Puhelin)\s*[:\-]?\s+([0-9\s]+)", full_text)
-    data["toinen_yhteyshenkilö"] = re.search(r"(?:Toinen yhteyshenkilö|Lisätiedot)\s*[:\-]?\s+([^\n]+)", full_text)
+    Field("ilmoittajan_nimi", r"(?:Ilmoittaja|Nimi)\s*[:\-]?\s+([^\n]+)", triggers=("Ilmoittaja", "Nimi")),
+    Field("ilmoittajan_puhelin", r"(?:Puh\.?|Puhelin)\s*[:\-]?\s+([0-9\s]+)", triggers=("Puh",)),
+    Field("yrityksen_nimi", r"(?:Yritys|Toimisto|Välittäjä)\s*[:\-]?\s+([^\n]+)", triggers=("Yritys", "Toimisto", "Välittäjä")),
+    Field("yrityksen_osoite", r"(?:Yrityksen osoite|Osoite)\s*[:\-]?\s+([^\n]+)", triggers=("Yrityksen osoite", "Osoite")),
+    Field("yrityksen_puhelin", r"(?:Yrityksen puhelin|Puhelin)\s*[:\-]?\s+([0-9\s]+)", triggers=("Yrityksen puhelin", "Puhelin")),
+    Field("toinen_yhteyshenkilö", r"(?:Toinen yhteyshenkilö|Lisätiedot)\s*[:\-]?\s+([^\n]+)", triggers=("Toinen yhteyshenkilö", "Lisätiedot")),
+]
+
+# Osoitteella ei ole tunnistesanaa, joten se haetaan omalla lausekkeellaan. Osuma voi
+# alkaa vain kirjainjakson alusta, joten muut kohdat ohitetaan ilman takaisinperäytystä.
+ADDRESS_PATTERN = re.compile(
+    r"(?<![A-ZÅÄÖa-zåäö])([A-ZÅÄÖa-zåäö]+\s\d+[A-Za-z]?(?:\s?[a-z])?,\s?[A-ZÅÄÖa-zåäö\- ]+,\s?[A-ZÅÄÖa-zåäö\-]+)"
+)
+
+listing_field_extractor = FieldExtractor(LISTING_FIELDS)
+
+
+def extract_listing_fields(full_text, kaupunki_nimi):
+    """
+    Poimii ilmoituksen kentät tekstistä yhdellä läpikäynnillä
+
+    Args:
+        full_text (str): Ilmoituksen teksti
+        kaupunki_nimi (str): Kaupungin nimi
+
+    Returns:
+        dict: Kentät siivottuina merkkijonoina, puuttuvat kentät None
+    """
+    data = {"osoite": ADDRESS_PATTERN.search(full_text)}
+    for name, match in listing_field_extractor.extract(full_text).items():
+        # Rahoitusmuoto lisätään vain, jos se löytyi
+        if name == "rahoitusmuoto" and match is None:
+            continue
+        data[name] = match
+        if name == "kaupunginosa":
+            data["kaupunki"] = kaupunki_nimi
 
     # Puhdistetaan tulokset
     cleaned_data = {}
@@ -209,53 +222,348 @@ def extract_listing_data(pdf_path, kaupunki_nimi):
     return cleaned_data
 
 
+def extract_listing_data(pdf_source, kaupunki_nimi):
+    # pdf_source voi olla tiedostopolku, PDF:n sisältö tavuina, binäärivirta tai PdfDocument
+    full_text = PdfDocument.open(pdf_source).layout_text()
+    return extract_listing_fields(full_text, kaupunki_nimi)
+
+
 # 📁 📄 Käsittele koko kansio
 
-def process_all_pdfs(input_folder, output_json_path, analysis_id=None, user_id=None):
-    listings = []
+def _find_pdf_files(input_folder):
+    """Palauttaa kansion ja sen alikansioiden PDF-tiedostot os.walk-järjestyksessä"""
+    tasks = []
+    for root, dirs, files in os.walk(input_folder):
+        for filename in files:
+            if filename.lower().endswith(".pdf"):
+                # käytä alikansion nimeä "kaupunki"-kenttänä
+                tasks.append((os.path.join(root, filename), os.path.basename(root), input_folder))
+    return tasks
+
+
+def _parse_pdf_file(task):
+    """
+    Jäsentää yhden PDF-tiedoston. Ajetaan prosessipoolissa, joten funktio ei käytä tietokantaa.
+
+    Args:
+        task (tuple): (tiedostopolku, kaupungin nimi, pääkansio)
+
+    Returns:
+        tuple: (tiedostopolku, poimitut tiedot tai None, virheilmoitus tai None)
+    """
+    filepath, kaupunki_nimi, input_folder = task
+    try:
+        extracted = extract_listing_data(filepath, kaupunki_nimi)
+        extracted["tiedostonimi"] = os.path.relpath(filepath, input_folder)
+        extracted["kaupunki"] = kaupunki_nimi  # ylikirjoitetaan mahdollinen vanha arvo
+        return filepath, extracted, None
+    except Exception as e:
+        return filepath, None, str(e)
 
-    # 1. Lue olemassa oleva JSON-tiedosto, jos se on olemassa
-    if os.path.exists(output_json_path):
+
+def _parse_pdf_files(tasks, workers):
+    """
+    Jäsentää tiedostot joko tässä prosessissa tai prosessipoolissa. Tulokset
+    palautetaan samassa järjestyksessä kuin tiedostot annettiin.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield _parse_pdf_file(task)
+        return
+
+    # Pienet erät vähentävät prosessien välistä viestintää, mutta pitävät kuorman tasaisena
+    chunksize = max(1, min(16, len(tasks) // (workers * 4)))
+    logger.info(f"Jäsennetään {len(tasks)} PDF-tiedostoa {workers} prosessilla (erän koko {chunksize})")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_parse_pdf_file, tasks, chunksize=chunksize)
+
+
+def read_jsonl(path):
+    """
+    Lukee JSONL-tiedoston kohteet. Aiemmin kirjoitettu JSON-taulukko luetaan
+    sellaisenaan, ja keskeytyneen ajon puolikas viimeinen rivi ohitetaan.
+
+    Args:
+        path (str): Tiedoston polku
+
+    Returns:
+        list: Tiedoston kohteet sanakirjoina
+    """
+    if not os.path.exists(path):
+        return []
+
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    if content.lstrip().startswith("["):
         try:
-            with open(output_json_path, "r", encoding="utf-8") as f:
-                existing_data = json.load(f)
-                if isinstance(existing_data, list):
-                    listings.extend(existing_data)
+            existing_data = json.loads(content)
+            return existing_data if isinstance(existing_data, list) else []
         except Exception as e:
             logger.error(f"Virhe luettaessa olemassa olevaa JSON-tiedostoa: {e}")
+            return []
+
+    records = []
+    for line_number, line in enumerate(content.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except Exception as e:
+            logger.warning(f"Ohitetaan virheellinen rivi {line_number} tiedostossa {path}: {e}")
+    return records
+
+
+def pending_path(path):
+    """Palauttaa tiedoston, johon tietokantaan tallennettava erä kirjataan ennen tallennusta"""
+    return path + ".pending"
+
+
+def read_pending(path):
+    """
+    Lukee keskeytyneen ajon kesken jääneen erän
+
+    Args:
+        path (str): JSONL-tiedoston polku
+
+    Returns:
+        dict: {'aloitettu': datetime, 'tiedostonimet': list} tai None, jos kesken jäänyttä erää ei ole
+    """
+    try:
+        with open(pending_path(path), "r", encoding="utf-8") as f:
+            pending = json.load(f)
+        return {
+            "aloitettu": datetime.fromisoformat(pending["aloitettu"]),
+            "tiedostonimet": list(pending["tiedostonimet"])
+        }
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ohitetaan virheellinen keskeneräisen erän tiedosto {pending_path(path)}: {e}")
+        return None
+
+
+class JsonlWriter:
+    """
+    Lisää kohteet JSONL-tiedoston loppuun rivi kerrallaan. Aiemmin kirjoitettua
+    sisältöä ei lueta eikä kirjoiteta uudelleen, ja jokainen erä viedään levylle
+    ennen kuin seuraava aloitetaan, joten tiedosto toimii myös tarkistuspisteenä.
+
+    Erä kirjataan .pending-tiedostoon ennen tietokantaan tallennusta ja kirjaus
+    poistetaan, kun erä on tiedostossa. Jos ajo keskeytyy näiden välissä, jatkettu
+    ajo tunnistaa kirjauksen avulla jo tallennetut kohteet.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def begin_batch(self, records, started_at=None):
+        """
+        Kirjaa erän keskeneräiseksi ennen kuin se tallennetaan tietokantaan
+
+        Args:
+            records (list): Tallennettavat kohteet sanakirjoina
+            started_at (datetime, optional): Aloitusaika, jos erässä on keskeytyneen
+                ajon jo tallentamia kohteita. Oletuksena nykyhetki.
+        """
+        pending = pending_path(self.path)
+        temp_path = pending + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "aloitettu": (started_at or datetime.utcnow()).isoformat(),
+                "tiedostonimet": [record.get("tiedostonimi") for record in records]
+            }, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, pending)
+
+    def end_batch(self):
+        """Poistaa keskeneräisen erän kirjauksen, kun erä on kirjoitettu tiedostoon"""
+        try:
+            os.remove(pending_path(self.path))
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        self._convert_legacy_json()
+
+        # Keskeytynyt ajo on voinut jättää viimeisen rivin kesken
+        needs_newline = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b"\n"
+
+        self._file = open(self.path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._file.close()
+        self._file = None
+
+    def write(self, records):
+        """
+        Kirjoittaa kohteet tiedoston loppuun ja vie ne levylle
+
+        Args:
+            records (list): Tallennettavat kohteet sanakirjoina
+        """
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _convert_legacy_json(self):
+        """Muuntaa aiemmin kirjoitetun JSON-taulukon JSONL-muotoon"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            is_legacy = f.read(64).lstrip().startswith("[")
+        if not is_legacy:
+            return
+
+        records = read_jsonl(self.path)
+        logger.info(f"Muunnetaan {self.path} JSONL-muotoon ({len(records)} kohdetta)")
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        os.replace(temp_path, self.path)
+
+
+def find_saved_kohteet(pending, analysis_id=None, user_id=None):
+    """
+    Etsii keskeytyneen ajon erästä kohteet, jotka ehdittiin tallentaa tietokantaan
+    ennen kuin erä kirjoitettiin tiedostoon
+
+    Args:
+        pending (dict): read_pending-funktion palauttama erä
+        analysis_id (int, optional): Analyysin ID, johon kohteet liittyvät
+        user_id (int, optional): Käyttäjän ID
+
+    Returns:
+        dict: Kohteen ID tiedostonimen mukaan
+    """
+    tiedostonimet = [name for name in pending["tiedostonimet"] if name]
+    if not tiedostonimet:
+        return {}
+
+    rows = db.session.query(Kohde.tiedostonimi, Kohde.id).filter(
+        Kohde.tiedostonimi.in_(tiedostonimet),
+        Kohde.analysis_id == analysis_id,
+        Kohde.user_id == user_id,
+        Kohde.created_at >= pending["aloitettu"]
+    ).order_by(Kohde.id).all()
+    return {tiedostonimi: kohde_id for tiedostonimi, kohde_id in rows}
+
+
+def _save_batch(batch, writer, analysis_id, user_id, saved=None, started_at=None):
+    """
+    Tallentaa erän tietokantaan ja sen jälkeen tiedostoon. Tiedostoon päätyvät
+    vain käsitellyt tiedostot, joten keskeytetty ajo voidaan jatkaa siitä.
+
+    Args:
+        saved (dict, optional): Keskeytyneessä ajossa jo tallennettujen kohteiden ID:t
+            tiedostonimen mukaan. Niitä ei tallenneta uudelleen.
+        started_at (datetime, optional): Keskeytyneen erän aloitusaika, jotta jo tallennetut
+            kohteet löytyvät, vaikka tämäkin ajo keskeytyisi
+    """
+    saved = saved or {}
+    new_items = [extracted for extracted in batch if extracted["tiedostonimi"] not in saved]
+
+    writer.begin_batch(batch, started_at)
+    new_ids = iter(save_property_data_batch(new_items, analysis_id, user_id) if new_items else [])
+    for extracted in batch:
+        if extracted["tiedostonimi"] in saved:
+            extracted["kohde_id"] = saved[extracted["tiedostonimi"]]
+            logger.info(f"Kohde oli jo tallennettu keskeytyneessä ajossa: {extracted['tiedostonimi']}")
+        else:
+            extracted["kohde_id"] = next(new_ids)
+        if extracted["kohde_id"] is None:
+            logger.error(f"Tietokantaan tallentaminen epäonnistui tiedostolle: {extracted['tiedostonimi']}")
+    writer.write(batch)
+    writer.end_batch()
+    logger.info(f"Tallennettu {len(batch)} kohteen erä tiedostoon {writer.path}")
+
+
+def process_all_pdfs(input_folder, output_json_path, analysis_id=None, user_id=None, workers=1, batch_size=50):
+    """
+    Käsittelee kansion ja sen alikansioiden PDF-tiedostot ja tallentaa tiedot
+
+    Kohteet tallennetaan tietokantaan batch_size kohteen erissä ja lisätään
+    JSONL-tiedostoon rivi kohdetta kohden. Tiedostossa jo olevat PDF:t ohitetaan,
+    joten keskeytynyt ajo jatkuu ensimmäisestä tallentamattomasta erästä.
+    Jos ajo keskeytyi erän tietokantaan tallennuksen ja tiedostoon kirjoittamisen
+    välissä, erän jo tallennetut kohteet tunnistetaan .pending-kirjauksesta eikä
+    niitä tallenneta toiseen kertaan.
+
+    Args:
+        input_folder (str): Pääkansio
+        output_json_path (str): JSONL-tiedosto, johon tiedot lisätään
+        analysis_id (int, optional): Analyysin ID, johon kohteet liittyvät
+        user_id (int, optional): Käyttäjän ID
+        workers (int): Jäsentävien prosessien määrä. None tai 0 käyttää kaikkia ytimiä.
+            Tietokantaan tallennus tehdään aina tässä prosessissa.
+        batch_size (int): Yhdessä transaktiossa tallennettavien kohteiden määrä
+
+    Returns:
+        int: Tiedostossa olevien kohteiden määrä
+    """
+    workers = workers or os.cpu_count() or 1
+    batch_size = max(1, batch_size or 1)
+
+    # 1. Selvitä aiemmin käsitellyt tiedostot
+    existing = read_jsonl(output_json_path)
+    processed = {item.get("tiedostonimi") for item in existing}
+    count = len(existing)
+
+    # 2. Käsittele käsittelemättömät PDF-tiedostot pääkansiossa ja alikansioissa
+    tasks = []
+    for task in _find_pdf_files(input_folder):
+        if os.path.relpath(task[0], input_folder) not in processed:
+            tasks.append(task)
+    if count:
+        logger.info(f"Jatketaan aiempaa ajoa: {count} kohdetta tallennettu, {len(tasks)} tiedostoa jäljellä")
+
+    # Ajo on voinut keskeytyä erän tietokantaan tallennuksen ja tiedostoon kirjoittamisen välissä
+    saved = {}
+    started_at = None
+    pending = read_pending(output_json_path)
+    if pending:
+        saved = find_saved_kohteet(pending, analysis_id, user_id)
+        saved = {name: kohde_id for name, kohde_id in saved.items() if name not in processed}
+        started_at = pending["aloitettu"] if saved else None
+        logger.info(f"Keskeytyneestä erästä löytyi {len(saved)} jo tallennettua kohdetta")
 
-    # 2. Käsittele kaikki PDF-tiedostot pääkansiossa ja alikansioissa
-    for root, dirs, files in os.walk(input_folder):
-        for filename in files:
-            if filename.lower().endswith(".pdf"):
-                filepath = os.path.join(root, filename)
-                kaupunki_nimi = os.path.basename(root)  # käytä alikansion nimeä "kaupunki"-kenttänä
-                logger.info(f"Käsitellään: {filepath} (kaupunki: {kaupunki_nimi})")
-                try:
-                    extracted = extract_listing_data(filepath, kaupunki_nimi)
-                    extracted["tiedostonimi"] = os.path.relpath(filepath, input_folder)
-                    extracted["kaupunki"] = kaupunki_nimi  # ylikirjoitetaan mahdollinen vanha arvo
-                    listings.append(extracted)
-                    
-                    # Tallenna tiedot myös tietokantaan
-                    kohde_id = save_property_data_to_db(extracted, analysis_id, user_id)
-                    if kohde_id:
-                        logger.info(f"Tallennettu PDF-tiedot tietokantaan kohde_id: {kohde_id}")
-                    else:
-                        logger.error(f"Tietokantaan tallentaminen epäonnistui tiedostolle: {filename}")
-                        
-                except Exception as e:
-                    logger.error(f"Virhe tiedostossa {filename}: {e}")
-
-    # 3. Tallenna kaikki tiedot takaisin JSON-tiedostoon
     try:
-        with open(output_json_path, "w", encoding="utf-8") as f:
-            json.dump(listings, f, indent=2, ensure_ascii=False)
-        logger.info(f"Kaikki tiedot tallennettu tiedostoon: {output_json_path}")
-        return len(listings)
+        with JsonlWriter(output_json_path) as writer:
+            batch = []
+            for filepath, extracted, error in _parse_pdf_files(tasks, workers):
+                if error:
+                    logger.error(f"Virhe tiedostossa {os.path.basename(filepath)}: {error}")
+                    continue
+
+                logger.info(f"Käsitelty: {filepath} (kaupunki: {extracted['kaupunki']})")
+                batch.append(extracted)
+
+                # 3. Tallenna täysi erä tietokantaan ja tiedostoon
+                if len(batch) >= batch_size:
+                    _save_batch(batch, writer, analysis_id, user_id, saved, started_at)
+                    count += len(batch)
+                    batch = []
+
+            if batch:
+                _save_batch(batch, writer, analysis_id, user_id, saved, started_at)
+                count += len(batch)
     except Exception as e:
         logger.error(f"Virhe kirjoitettaessa tiedostoon {output_json_path}: {e}")
-        return 0
+
+    logger.info(f"Kaikki tiedot tallennettu tiedostoon: {output_json_path}")
+    return count
+
 
 def process_single_pdf(pdf_path, output_json_path=None, kaupunki_nimi="", analysis_id=None, user_id=None):
     """
@@ -263,7 +571,7 @@ def process_single_pdf(pdf_path, output_json_path=None, kaupunki_nimi="", analys
     
     Args:
         pdf_path (str): Polku PDF-tiedostoon
-        output_json_path (str, optional): Polku JSON-tiedostoon johon tiedot tallennetaan
+        output_json_path (str, optional): Polku JSONL-tiedostoon, jonka loppuun tiedot lisätään
         kaupunki_nimi (str): Kaupungin nimi
         analysis_id (int, optional): Analyysin ID, johon kohde liittyy
         user_id (int, optional): Käyttäjän ID
@@ -280,23 +588,11 @@ def process_single_pdf(pdf_path, output_json_path=None, kaupunki_nimi="", analys
         kohde_id = save_property_data_to_db(extracted, analysis_id, user_id)
         extracted["kohde_id"] = kohde_id
         
-        # Tallenna JSON-tiedostoon jos polku on annettu
+        # Tallenna tiedostoon jos polku on annettu
         if output_json_path:
-            listings = []
-            if os.path.exists(output_json_path):
-                try:
-                    with open(output_json_path, "r", encoding="utf-8") as f:
-                        existing_data = json.load(f)
-                        if isinstance(existing_data, list):
-                            listings.extend(existing_data)
-                except Exception as e:
-                    logger.error(f"Virhe luettaessa olemassa olevaa JSON-tiedostoa: {e}")
-            
-            listings.append(extracted)
-            
             try:
-                with open(output_json_path, "w", encoding="utf-8") as f:
-                    json.dump(listings, f, indent=2, ensure_ascii=False)
+                with JsonlWriter(output_json_path) as writer:
+                    writer.write([extracted])
                 logger.info(f"Tiedot tallennettu tiedostoon: {output_json_path}")
             except Exception as e:
                 logger.error(f"Virhe kirjoitettaessa tiedostoon {output_json_path}: {e}")
@@ -308,9 +604,9 @@ def process_single_pdf(pdf_path, output_json_path=None, kaupunki_nimi="", analys
         return None
 
 
-def save_property_data_to_db(extracted_data, analysis_id=None, user_id=None):
+def build_kohde(extracted_data, analysis_id=None, user_id=None):
     """
-    Tallentaa PDF:stä poimitut kiinteistön tiedot tietokantaan
+    Muodostaa PDF:stä poimituista tiedoista Kohde-olion tallentamatta sitä
     
     Args:
         extracted_data (dict): PDF:stä poimitut tiedot sanakirjana
@@ -318,125 +614,144 @@ def save_property_data_to_db(extracted_data, analysis_id=None, user_id=None):
         user_id (int, optional): Käyttäjän ID
         
     Returns:
-        int: Luodun kohteen ID tai None, jos tallennus epäonnistui
+        Kohde: Tallentamaton kohde tai None, jos tiedot puuttuvat
     """
-    try:
-        if not extracted_data:
-            logger.error("Kiinteistön tietoja ei voitu tallentaa: Tiedot puuttuvat")
-            return None
-        
-        # Haetaan tarvittavat tiedot
-        osoite = None
-        # Tarkistetaan onko osoite sanakirjana vai merkkijonona
-        if isinstance(extracted_data.get("osoite"), dict):
-            # Muodostetaan osoite merkkijonoksi
-            osoite_dict = extracted_data.get("osoite")
-            osoite_parts = []
-            if "katu" in osoite_dict and osoite_dict["katu"]:
-                osoite_parts.append(osoite_dict["katu"])
-            if "kaupunki" in osoite_dict and osoite_dict["kaupunki"]:
-                osoite_parts.append(osoite_dict["kaupunki"])
-            
-            osoite = ", ".join(osoite_parts) if osoite_parts else "Tuntematon"
-            logger.info(f"Muodostettu osoite sanakirjasta: '{osoite}'")
-        else:
-            osoite = extracted_data.get("osoite") or "Tuntematon"
+    if not extracted_data:
+        logger.error("Kiinteistön tietoja ei voitu tallentaa: Tiedot puuttuvat")
+        return None
+    
+    # Haetaan tarvittavat tiedot
+    osoite = None
+    # Tarkistetaan onko osoite sanakirjana vai merkkijonona
+    if isinstance(extracted_data.get("osoite"), dict):
+        # Muodostetaan osoite merkkijonoksi
+        osoite_dict = extracted_data.get("osoite")
+        osoite_parts = []
+        if "katu" in osoite_dict and osoite_dict["katu"]:
+            osoite_parts.append(osoite_dict["katu"])
+        if "kaupunki" in osoite_dict and osoite_dict["kaupunki"]:
+            osoite_parts.append(osoite_dict["kaupunki"])
         
-        # Haetaan rakennustyyppi
-        tyyppi = None
-        # Tarkistetaan eri rakennustyyppi-kentät
-        if "rakennustyyppi" in extracted_data:
-            tyyppi = extracted_data.get("rakennustyyppi")
-        elif "rakennuksen_tyyppi" in extracted_data:
-            tyyppi = extracted_data.get("rakennuksen_tyyppi")
+        osoite = ", ".join(osoite_parts) if osoite_parts else "Tuntematon"
+        logger.info(f"Muodostettu osoite sanakirjasta: '{osoite}'")
+    else:
+        osoite = extracted_data.get("osoite") or "Tuntematon"
+    
+    # Haetaan rakennustyyppi
+    tyyppi = None
+    # Tarkistetaan eri rakennustyyppi-kentät
+    if "rakennustyyppi" in extracted_data:
+        tyyppi = extracted_data.get("rakennustyyppi")
+    elif "rakennuksen_tyyppi" in extracted_data:
+        tyyppi = extracted_data.get("rakennuksen_tyyppi")
+    
+    # Käsitellään hinta (ensisijaisesti velaton hinta, toissijaisesti myyntihinta)
+    hinta_str = None
+    if extracted_data.get("velaton_hinta"):
+        hinta_str = extracted_data.get("velaton_hinta")
+    elif extracted_data.get("myyntihinta"):
+        hinta_str = extracted_data.get("myyntihinta")
+    elif extracted_data.get("hinta"):
+        hinta_str = extracted_data.get("hinta")
         
-        # Käsitellään hinta (ensisijaisesti velaton hinta, toissijaisesti myyntihinta)
-        hinta_str = None
-        if extracted_data.get("velaton_hinta"):
-            hinta_str = extracted_data.get("velaton_hinta")
-        elif extracted_data.get("myyntihinta"):
-            hinta_str = extracted_data.get("myyntihinta")
-        elif extracted_data.get("hinta"):
-            hinta_str = extracted_data.get("hinta")
+    hinta = None
+    if hinta_str:
+        try:
+            # Convert to string and remove currency symbols
+            hinta_str = str(hinta_str).replace("€", "").strip()
             
-        hinta = None
-        if hinta_str:
-            try:
-                # Convert to string and remove currency symbols
-                hinta_str = str(hinta_str).replace("€", "").strip()
-                
-                # DEBUG: Log the raw price string
-                logger.info(f"Raw price string: '{hinta_str}'")
-                
-                # IMPORTANT: Remove ALL spaces first - this is critical for formats like "339 000"
-                hinta_str = ''.join(hinta_str.split())
-                
-                # DEBUG: Log the cleaned price string
-                logger.info(f"Cleaned price string: '{hinta_str}'")
-                
-                # Replace comma with dot for decimal handling
-                hinta_str = hinta_str.replace(",", ".")
-                
-                # If we have multiple dots (e.g., European format like 1.234.567,89)
-                if hinta_str.count(".") > 1:
-                    parts = hinta_str.split(".")
-                    hinta_str = "".join(parts[:-1]) + "." + parts[-1]
-                
-                # If string is empty after cleaning, skip conversion
-                if not hinta_str:
-                    logger.warning("Empty price string after cleaning")
-                    hinta = None
-                else:
-                    # Try direct integer conversion as a fallback
-                    try:
-                        hinta = Decimal(hinta_str)
-                        logger.info(f"Successfully converted price: {hinta}")
-                    except:
-                        # For pure integer values, extra safety
-                        hinta = Decimal(int(float(hinta_str)))
-                        logger.info(f"Converted price using fallback: {hinta}")
-            except Exception as e:
-                logger.warning(f"Hintaa ei voitu muuntaa numeeriseksi: '{hinta_str}': {str(e)} ({type(e).__name__})")
+            # DEBUG: Log the raw price string
+            logger.info(f"Raw price string: '{hinta_str}'")
+            
+            # IMPORTANT: Remove ALL spaces first - this is critical for formats like "339 000"
+            hinta_str = ''.join(hinta_str.split())
+            
+            # DEBUG: Log the cleaned price string
+            logger.info(f"Cleaned price string: '{hinta_str}'")
+            
+            # Replace comma with dot for decimal handling
+            hinta_str = hinta_str.replace(",", ".")
+            
+            # If we have multiple dots (e.g., European format like 1.234.567,89)
+            if hinta_str.count(".") > 1:
+                parts = hinta_str.split(".")
+                hinta_str = "".join(parts[:-1]) + "." + parts[-1]
+            
+            # If string is empty after cleaning, skip conversion
+            if not hinta_str:
+                logger.warning("Empty price string after cleaning")
                 hinta = None
-                
-        # Poimitaan rakennusvuosi
-        rakennusvuosi = None
-        if extracted_data.get("rakennusvuosi"):
-            try:
-                rakennusvuosi = int(extracted_data.get("rakennusvuosi"))
-            except Exception as e:
-                logger.warning(f"Rakennusvuotta ei voitu muuntaa kokonaisluvuksi: {extracted_data.get('rakennusvuosi')}: {str(e)}")
-                
-        # Poimitaan pinta-ala
-        neliot = None
-        if extracted_data.get("asuinpinta_ala"):
-            try:
-                neliot_str = extracted_data.get("asuinpinta_ala").replace(",", ".").replace(" ", "")
-                neliot = float(neliot_str)
-            except Exception as e:
-                logger.warning(f"Pinta-alaa ei voitu muuntaa numeroksi: {extracted_data.get('asuinpinta_ala')}: {str(e)}")
-                
-        # Poimitaan huoneiden lukumäärä
-        huoneet = None
-        if extracted_data.get("huoneita"):
-            try:
-                huoneet = int(extracted_data.get("huoneita"))
-            except Exception as e:
-                logger.warning(f"Huoneiden lukumäärää ei voitu muuntaa kokonaisluvuksi: {extracted_data.get('huoneita')}: {str(e)}")
-        
-        # Luodaan uusi kohdeobjekti
-        kohde = Kohde(
-            osoite=osoite,
-            tyyppi=tyyppi,
-            hinta=hinta,
-            rakennusvuosi=rakennusvuosi,
-            analysis_id=analysis_id,
-            user_id=user_id,
-            neliot=neliot,
-            huoneet=huoneet
-        )
+            else:
+                # Try direct integer conversion as a fallback
+                try:
+                    hinta = Decimal(hinta_str)
+                    logger.info(f"Successfully converted price: {hinta}")
+                except:
+                    # For pure integer values, extra safety
+                    hinta = Decimal(int(float(hinta_str)))
+                    logger.info(f"Converted price using fallback: {hinta}")
+        except Exception as e:
+            logger.warning(f"Hintaa ei voitu muuntaa numeeriseksi: '{hinta_str}': {str(e)} ({type(e).__name__})")
+            hinta = None
+            
+    # Poimitaan rakennusvuosi
+    rakennusvuosi = None
+    if extracted_data.get("rakennusvuosi"):
+        try:
+            rakennusvuosi = int(extracted_data.get("rakennusvuosi"))
+        except Exception as e:
+            logger.warning(f"Rakennusvuotta ei voitu muuntaa kokonaisluvuksi: {extracted_data.get('rakennusvuosi')}: {str(e)}")
+            
+    # Poimitaan pinta-ala
+    neliot = None
+    if extracted_data.get("asuinpinta_ala"):
+        try:
+            neliot_str = extracted_data.get("asuinpinta_ala").replace(",", ".").replace(" ", "")
+            neliot = float(neliot_str)
+        except Exception as e:
+            logger.warning(f"Pinta-alaa ei voitu muuntaa numeroksi: {extracted_data.get('asuinpinta_ala')}: {str(e)}")
+            
+    # Poimitaan huoneiden lukumäärä
+    huoneet = None
+    if extracted_data.get("huoneita"):
+        try:
+            huoneet = int(extracted_data.get("huoneita"))
+        except Exception as e:
+            logger.warning(f"Huoneiden lukumäärää ei voitu muuntaa kokonaisluvuksi: {extracted_data.get('huoneita')}: {str(e)}")
+    
+    # Luodaan uusi kohdeobjekti
+    kohde = Kohde(
+        osoite=osoite,
+        tyyppi=tyyppi,
+        hinta=hinta,
+        rakennusvuosi=rakennusvuosi,
+        analysis_id=analysis_id,
+        user_id=user_id,
+        neliot=neliot,
+        huoneet=huoneet,
+        tiedostonimi=extracted_data.get("tiedostonimi")
+    )
+    
+    logger.info(f"Luotu kohde: osoite={osoite}, tyyppi={tyyppi}, hinta={hinta}, rakennusvuosi={rakennusvuosi}, neliot={neliot}, huoneet={huoneet}")
+    return kohde
+
+
+def save_property_data_to_db(extracted_data, analysis_id=None, user_id=None):
+    """
+    Tallentaa PDF:stä poimitut kiinteistön tiedot tietokantaan
+    
+    Args:
+        extracted_data (dict): PDF:stä poimitut tiedot sanakirjana
+        analysis_id (int, optional): Analyysin ID, johon kohde liittyy
+        user_id (int, optional): Käyttäjän ID
         
-        logger.info(f"Luotu kohde: osoite={osoite}, tyyppi={tyyppi}, hinta={hinta}, rakennusvuosi={rakennusvuosi}, neliot={neliot}, huoneet={huoneet}")
+    Returns:
+        int: Luodun kohteen ID tai None, jos tallennus epäonnistui
+    """
+    try:
+        kohde = build_kohde(extracted_data, analysis_id, user_id)
+        if kohde is None:
+            return None
         
         # Lisätään tietokantaan
         db.session.add(kohde)
@@ -450,6 +765,39 @@ def save_property_data_to_db(extracted_data, analysis_id=None, user_id=None):
         db.session.rollback()
         return None
 
+
+def save_property_data_batch(extracted_list, analysis_id=None, user_id=None):
+    """
+    Tallentaa erän PDF:stä poimittuja kohteita tietokantaan yhdessä transaktiossa.
+    Jos erän tallennus epäonnistuu, kohteet tallennetaan yksitellen, jotta yksi
+    virheellinen rivi ei hylkää koko erää.
+    
+    Args:
+        extracted_list (list): PDF:stä poimitut tiedot sanakirjoina
+        analysis_id (int, optional): Analyysin ID, johon kohteet liittyvät
+        user_id (int, optional): Käyttäjän ID
+        
+    Returns:
+        list: Luotujen kohteiden ID:t samassa järjestyksessä, None epäonnistuneille
+    """
+    kohteet = []
+    for extracted_data in extracted_list:
+        try:
+            kohteet.append(build_kohde(extracted_data, analysis_id, user_id))
+        except Exception as e:
+            logger.error(f"Virhe kohteen muodostamisessa: {e}")
+            kohteet.append(None)
+    
+    try:
+        db.session.add_all([kohde for kohde in kohteet if kohde is not None])
+        db.session.commit()
+        logger.info(f"Tallennettu {sum(1 for k in kohteet if k is not None)} kohdetta tietokantaan")
+        return [kohde.id if kohde is not None else None for kohde in kohteet]
+    except Exception as e:
+        logger.error(f"Virhe kohde-erän tallentamisessa, tallennetaan kohteet yksitellen: {e}")
+        db.session.rollback()
+        return [save_property_data_to_db(extracted_data, analysis_id, user_id) for extracted_data in extracted_list]
+
 def get_property_data(markdown_data: str) -> str:
     """
     Compatibility function to replace kat_api_call.get_property_data
@@ -560,7 +908,7 @@ if __name__ == "__main__":
     if len(sys.argv) > 1:
         # Käsitellään yksittäinen PDF-tiedosto
         pdf_path = sys.argv[1]
-        output_json = "oikotie.json" if len(sys.argv) <= 2 else sys.argv[2]
+        output_json = "oikotie.jsonl" if len(sys.argv) <= 2 else sys.argv[2]
         kaupunki = "Tuntematon" if len(sys.argv) <= 3 else sys.argv[3]
         
         logger.info(f"Käsitellään yksittäinen tiedosto: {pdf_path}")
@@ -572,7 +920,10 @@ if __name__ == "__main__":
     else:
         # Käsitellään koko kansio
         kansio = "D:/OIKOTIE LATAUKSET/testi"  # pääkansio, jossa alikansioita
-        json_output = "oikotie.json"
-        count = process_all_pdfs(kansio, json_output)
+        json_output = "oikotie.jsonl"
+        # PDF_INGEST_WORKERS=1 jäsentää yhdellä ytimellä, oletuksena käytetään kaikkia
+        workers = int(os.environ.get("PDF_INGEST_WORKERS", "0"))
+        batch_size = int(os.environ.get("PDF_INGEST_BATCH_SIZE", "50"))
+        count = process_all_pdfs(kansio, json_output, workers=workers, batch_size=batch_size)
         print(f"\n✅ Valmis! Käsitelty {count} PDF-tiedostoa. Tiedot tallennettu tiedostoon: {json_output}")
 
@@ -1,8 +1,7 @@
-from openai import OpenAI
-import os
 import logging
 import json
 from models import db, Kohde
+from llm_gateway import llm_gateway
 from decimal import Decimal
 
 # Asetetaan lokitus
@@ -17,10 +16,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Haetaan OpenAI API-avain ympäristömuuttujasta
-api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
-
 def get_property_data(markdown_data: str) -> str:
     """
     Hakee kiinteistön perustiedot markdown-muotoisesta datasta käyttäen OpenAI API:a.
@@ -34,7 +29,7 @@ def get_property_data(markdown_data: str) -> str:
     try:
         logger.info("Haetaan kiinteistön tietoja OpenAI API:sta")
         
-        response = client.responses.create(
+        response = llm_gateway.create(
             model="gpt-4.1-nano",
             input=[
                 {
@@ -0,0 +1,178 @@
+"""
+Haettujen asuntoilmoitusten välimuisti.
+
+Ilmoituksen teksti (get_property_data-funktion tuottama markdown) tallennetaan
+lähteen ja ilmoitus-ID:n mukaan, jotta saman ilmoituksen uusi analyysi, myös
+toiselta käyttäjältä, ei käynnistä Seleniumia tai PDF:n jäsennystä uudelleen.
+Merkinnät ovat listing_content_cache-taulussa, joten kaikki gunicorn-workerit
+käyttävät samaa välimuistia. Merkinnät vanhenevat TTL:n jälkeen, ja pisimpään
+käyttämättömät poistetaan, kun kokonaiskoko ylittää rajan.
+"""
+
+import re
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import has_app_context
+from sqlalchemy import func
+
+from models import db, ListingContentCache
+
+logger = logging.getLogger(__name__)
+
+# Oikotien ilmoitus-ID on URL:n viimeinen numerosarja, esim.
+# https://asunnot.oikotie.fi/myytavat-asunnot/helsinki/22948375 tai .../nayttoesite/22948375
+OIKOTIE_ID_PATTERN = re.compile(r'/(\d+)/?$')
+# Etuoven ilmoitus-ID on /kohde/-polun jälkeinen tunniste, esim. https://www.etuovi.com/kohde/w12345
+ETUOVI_ID_PATTERN = re.compile(r'/kohde/([A-Za-z0-9]+)')
+
+
+def listing_key(url):
+    """
+    Muodostaa välimuistiavaimen ilmoituksen URL:sta
+
+    Args:
+        url (str): Asuntoilmoituksen URL
+
+    Returns:
+        tuple: (lähde, ilmoitus-ID) tai None, jos ID:tä ei voida päätellä
+    """
+    if not url:
+        return None
+
+    # Kyselyparametrit ja ankkurit eivät vaikuta ilmoitukseen
+    path = url.split('?', 1)[0].split('#', 1)[0]
+
+    if 'oikotie.fi' in path:
+        match = OIKOTIE_ID_PATTERN.search(path)
+        return ('oikotie', match.group(1)) if match else None
+    if 'etuovi.com' in path:
+        match = ETUOVI_ID_PATTERN.search(path)
+        if match:
+            return ('etuovi', match.group(1).lower())
+        last_part = path.rstrip('/').split('/')[-1]
+        return ('etuovi', last_part.lower()) if last_part else None
+    return None
+
+
+class ListingCache:
+    """
+    Tietokantaan tallennettu LRU-välimuisti, jossa on vanhenemisaika ja kokoraja tavuina
+    """
+
+    def __init__(self, ttl=3600, max_bytes=50 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Lukee välimuistin asetukset sovelluksen konfiguraatiosta"""
+        self.ttl = int(app.config.get('LISTING_CACHE_TTL', self.ttl))
+        self.max_bytes = int(app.config.get('LISTING_CACHE_MAX_BYTES', self.max_bytes))
+
+    def get(self, key):
+        """Palauttaa välimuistissa olevan ilmoituksen tai None"""
+        if key is None or self.ttl <= 0 or not has_app_context():
+            return None
+
+        try:
+            entry = db.session.get(ListingContentCache, key)
+            if entry is not None:
+                if entry.created_at and entry.created_at > datetime.utcnow() - timedelta(seconds=self.ttl):
+                    markdown_data = entry.markdown
+                    # Merkitään viimeksi käytetyksi
+                    entry.last_used_at = datetime.utcnow()
+                    db.session.commit()
+                    self._count(hit=True)
+                    return markdown_data
+                db.session.delete(entry)
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Virhe ilmoitusvälimuistin lukemisessa: {e}")
+
+        self._count(hit=False)
+        return None
+
+    def set(self, key, markdown_data):
+        """Tallentaa ilmoituksen välimuistiin"""
+        if key is None or not markdown_data or self.ttl <= 0 or not has_app_context():
+            return
+
+        size = len(markdown_data.encode('utf-8'))
+        if size > self.max_bytes:
+            logger.warning(f"Ilmoitus {key} on liian suuri välimuistiin ({size} tavua)")
+            return
+
+        now = datetime.utcnow()
+        try:
+            entry = db.session.get(ListingContentCache, key)
+            if entry is None:
+                entry = ListingContentCache(source=key[0], listing_id=key[1])
+                db.session.add(entry)
+            entry.markdown = markdown_data
+            entry.size_bytes = size
+            entry.created_at = now
+            entry.last_used_at = now
+            db.session.commit()
+            self._evict(now)
+        except Exception as e:
+            # Rinnakkainen tallennus samalla avaimella on harmiton
+            db.session.rollback()
+            logger.warning(f"Ilmoitusta {key} ei voitu tallentaa välimuistiin: {e}")
+
+    def invalidate(self, key):
+        """Poistaa ilmoituksen välimuistista"""
+        ListingContentCache.query.filter_by(source=key[0], listing_id=key[1]).delete()
+        db.session.commit()
+
+    def clear(self):
+        """Tyhjentää välimuistin"""
+        ListingContentCache.query.delete()
+        db.session.commit()
+
+    def stats(self):
+        """Palauttaa välimuistin tilastot; osumat ja ohitukset ovat prosessikohtaisia"""
+        entries, total_bytes = db.session.query(
+            func.count(ListingContentCache.listing_id), func.coalesce(func.sum(ListingContentCache.size_bytes), 0)
+        ).one()
+        with self._lock:
+            return {
+                'entries': entries,
+                'bytes': int(total_bytes),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def _evict(self, now):
+        """Poistaa vanhentuneet merkinnät ja pisimpään käyttämättömät, kunnes kokoraja täyttyy"""
+        ListingContentCache.query.filter(
+            ListingContentCache.created_at < now - timedelta(seconds=self.ttl)
+        ).delete(synchronize_session=False)
+
+        total_bytes = db.session.query(func.coalesce(func.sum(ListingContentCache.size_bytes), 0)).scalar()
+        if total_bytes > self.max_bytes:
+            rows = db.session.query(
+                ListingContentCache.source, ListingContentCache.listing_id, ListingContentCache.size_bytes
+            ).order_by(ListingContentCache.last_used_at)
+            for source, listing_id, size in rows.all():
+                if total_bytes <= self.max_bytes:
+                    break
+                ListingContentCache.query.filter_by(source=source, listing_id=listing_id).delete(
+                    synchronize_session=False)
+                total_bytes -= size
+        db.session.commit()
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+# Luodaan singleton-instanssi
+listing_cache = ListingCache()
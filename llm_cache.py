@@ -0,0 +1,174 @@
+"""
+LLM-vastausten välimuisti.
+
+Kun sama malli saa täsmälleen saman promptin ja syötteen (esim. suosittu ilmoitus,
+jonka useampi käyttäjä analysoi), vastaus palautetaan tietokannasta OpenAI-kutsun
+sijaan. Avain on sha256-tiiviste mallin nimestä, promptin sisällöstä ja syötteestä,
+joten promptin muuttaminen ohittaa vanhat merkinnät automaattisesti.
+"""
+
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from models import db, User, LLMResultCache
+from entitlements import entitlement_cache
+
+logger = logging.getLogger(__name__)
+
+# Tuotetasot, joita välimuistin käyttö voi koskea
+TIERS = ('admin', 'subscription', 'one_time')
+
+
+def make_cache_key(model, prompt, input_text):
+    """
+    Muodostaa välimuistiavaimen mallista, promptista ja syötteestä
+
+    Args:
+        model (str): Mallin nimi
+        prompt (str): Promptin sisältö
+        input_text (str): Mallille annettava syöte
+
+    Returns:
+        str: sha256-tiiviste heksamuodossa
+    """
+    digest = hashlib.sha256()
+    for part in (model, prompt, input_text):
+        digest.update((part or '').encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def user_tier(user_id):
+    """
+    Päättelee käyttäjän tuotetason. Pyynnön aikana käyttäjä ja tieto aktiivisesta
+    kuukausijäsenyydestä on yleensä jo ladattu kirjautumisen yhteydessä, jolloin
+    tarkistus ei tee kyselyjä.
+
+    Returns:
+        str: 'admin', 'subscription' tai 'one_time', tai None jos käyttäjää ei löydy
+    """
+    user = db.session.get(User, user_id)
+    if not user:
+        return None
+    if user.is_admin:
+        return 'admin'
+    return 'subscription' if entitlement_cache.has_subscription(user) else 'one_time'
+
+
+class LLMCache:
+    """
+    Tietokantaan tallennettu LLM-vastausten välimuisti ja sen osumatilastot
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.max_age = timedelta(days=7)
+        self.opt_out_tiers = set()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Lukee välimuistin asetukset sovelluksen konfiguraatiosta"""
+        self.enabled = bool(app.config.get('LLM_CACHE_ENABLED', True))
+        self.max_age = timedelta(seconds=int(app.config.get('LLM_CACHE_MAX_AGE', 7 * 24 * 3600)))
+        tiers = app.config.get('LLM_CACHE_OPT_OUT_TIERS', '') or ''
+        self.opt_out_tiers = {tier.strip() for tier in tiers.split(',') if tier.strip()}
+        unknown = self.opt_out_tiers - set(TIERS)
+        if unknown:
+            logger.warning(f"Tuntemattomat tuotetasot LLM_CACHE_OPT_OUT_TIERS-asetuksessa: {', '.join(sorted(unknown))}")
+
+    def allowed_for_user(self, user_id):
+        """
+        Tarkistaa, saako käyttäjän analyyseissä käyttää välimuistia. Käyttäjän
+        tuotetaso voidaan rajata pois välimuistista, jolloin vastauksia ei lueta
+        eikä tallenneta.
+        """
+        if not self.enabled:
+            return False
+        if not self.opt_out_tiers or not user_id:
+            return True
+        try:
+            return user_tier(user_id) not in self.opt_out_tiers
+        except Exception as e:
+            logger.error(f"Virhe käyttäjän {user_id} tuotetason tarkistuksessa: {e}")
+            return False
+
+    def get(self, model, prompt, input_text):
+        """
+        Hakee tuoreen vastauksen välimuistista
+
+        Returns:
+            str: Tallennettu vastaus tai None
+        """
+        if not self.enabled:
+            return None
+
+        cache_key = make_cache_key(model, prompt, input_text)
+        try:
+            entry = LLMResultCache.query.get(cache_key)
+            if entry and entry.created_at and entry.created_at > datetime.utcnow() - self.max_age:
+                LLMResultCache.query.filter_by(cache_key=cache_key).update({
+                    'hit_count': LLMResultCache.hit_count + 1,
+                    'last_hit_at': datetime.utcnow()
+                }, synchronize_session=False)
+                db.session.commit()
+                self._count(hit=True)
+                logger.info(f"LLM-välimuistiosuma ({model}, {entry.prompt_name}, {cache_key[:12]})")
+                return entry.output
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Virhe LLM-välimuistin lukemisessa: {e}")
+
+        self._count(hit=False)
+        return None
+
+    def set(self, model, prompt, input_text, output, prompt_name=None):
+        """Tallentaa vastauksen välimuistiin, vanha merkintä korvataan"""
+        if not self.enabled or not output:
+            return
+
+        cache_key = make_cache_key(model, prompt, input_text)
+        try:
+            entry = LLMResultCache.query.get(cache_key)
+            if entry:
+                entry.output = output
+                entry.prompt_name = prompt_name
+                entry.created_at = datetime.utcnow()
+                entry.hit_count = 0
+            else:
+                db.session.add(LLMResultCache(
+                    cache_key=cache_key,
+                    model=model,
+                    prompt_name=prompt_name,
+                    output=output,
+                    created_at=datetime.utcnow()
+                ))
+            db.session.commit()
+        except Exception as e:
+            # Rinnakkainen tallennus samalla avaimella on harmiton
+            db.session.rollback()
+            logger.warning(f"LLM-vastausta ei voitu tallentaa välimuistiin: {e}")
+
+    def stats(self):
+        """Palauttaa prosessin osumatilastot"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+# Luodaan singleton-instanssi
+llm_cache = LLMCache()
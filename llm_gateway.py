@@ -0,0 +1,463 @@
+"""
+Kaikkien OpenAI-kutsujen yhteinen yhdyskäytävä.
+
+Sovelluksella on yksi OpenAI-asiakas, jonka HTTP-yhteyspooli on jaettu kaikkien
+säikeiden kesken. Kutsujen määrää rajoitetaan sekä yhteisellä että mallikohtaisella
+semaforilla, ja pyyntö- ja tokenimäärät pidetään OpenAI-tason rajoissa token bucket
+-rajoittimilla. Ruuhkassa kutsut jäävät jonoon odottamaan vuoroaan sen sijaan, että
+ne epäonnistuisivat. Uudelleenyrityksissä noudatetaan Retry-After-otsaketta ja
+muuten käytetään eksponentiaalista viivettä satunnaistettuna. Jokaisen kutsun kesto
+ja tokenimäärät kirjataan.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class LLMGatewayTimeout(Exception):
+    """Kutsu ei saanut vuoroa jonosta odotusajan kuluessa"""
+
+
+class LLMCallCancelled(Exception):
+    """Kutsu peruttiin, koska sen tulosta ei enää tarvita"""
+
+
+class TokenBucket:
+    """
+    Token bucket -rajoitin: kapasiteetti täyttyy tasaisesti rate_per_minute-nopeudella.
+    Jos tokeneita ei ole tarpeeksi, acquire odottaa niiden täyttymistä.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount=1, timeout=None):
+        """
+        Varaa tokenit ja odottaa tarvittaessa niiden täyttymistä
+
+        Args:
+            amount (float): Varattava määrä. Kapasiteettia suurempi pyyntö rajataan kapasiteettiin.
+            timeout (float, optional): Enimmäisodotus sekunteina
+
+        Returns:
+            float: Odotettu aika sekunteina
+
+        Raises:
+            LLMGatewayTimeout: Jos tokeneita ei saatu odotusajan kuluessa
+        """
+        amount = min(float(amount), self.capacity)
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return time.monotonic() - start
+                wait = (amount - self.tokens) / self.rate if self.rate > 0 else 1.0
+
+            if timeout is not None and time.monotonic() - start + wait > timeout:
+                raise LLMGatewayTimeout(f"Rajoitin ei vapautunut {timeout} sekunnissa")
+            time.sleep(min(wait, 1.0))
+
+    def refund(self, amount):
+        """Palauttaa käyttämättä jääneet tokenit"""
+        if amount <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMGateway:
+    """
+    Jaettu OpenAI-asiakas, samanaikaisuuden ja nopeuden rajoitus sekä uudelleenyritykset
+    """
+
+    def __init__(self):
+        self.max_concurrency = 8
+        self.default_model_concurrency = 4
+        self.model_concurrency = {}
+        self.requests_per_minute = 500
+        self.tokens_per_minute = 30000
+        self.max_retries = 4
+        self.base_backoff = 1.0
+        self.max_backoff = 30.0
+        self.request_timeout = 120.0
+        self.queue_timeout = 180.0
+        self.max_connections = 20
+        self._client = None
+        self._init_state()
+
+    def _init_state(self):
+        """Luo lukot, semaforit ja rajoittimet nykyisillä asetuksilla"""
+        self._lock = threading.Lock()
+        self._global_slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._model_slots = {}
+        self._request_bucket = TokenBucket(self.requests_per_minute)
+        self._token_bucket = TokenBucket(self.tokens_per_minute)
+        self._stats = {}
+
+    def init_app(self, app):
+        """Lukee asetukset sovelluksen konfiguraatiosta"""
+        self.max_concurrency = int(app.config.get('LLM_MAX_CONCURRENCY', self.max_concurrency))
+        self.default_model_concurrency = int(app.config.get('LLM_MODEL_CONCURRENCY_DEFAULT', self.default_model_concurrency))
+        self.model_concurrency = parse_model_limits(app.config.get('LLM_MODEL_CONCURRENCY', ''))
+        self.requests_per_minute = int(app.config.get('LLM_REQUESTS_PER_MINUTE', self.requests_per_minute))
+        self.tokens_per_minute = int(app.config.get('LLM_TOKENS_PER_MINUTE', self.tokens_per_minute))
+        self.max_retries = int(app.config.get('LLM_MAX_RETRIES', self.max_retries))
+        self.request_timeout = float(app.config.get('LLM_REQUEST_TIMEOUT', self.request_timeout))
+        self.queue_timeout = float(app.config.get('LLM_QUEUE_TIMEOUT', self.queue_timeout))
+        self.max_connections = int(app.config.get('LLM_MAX_CONNECTIONS', self.max_connections))
+        self._init_state()
+        self.close()
+
+    @property
+    def client(self):
+        """Jaettu OpenAI-asiakas, joka luodaan ensimmäisellä käyttökerralla"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # OpenAI-kirjasto ladataan vasta ensimmäisessä kutsussa, jotta workerit käynnistyvät nopeasti
+                    from openai import OpenAI
+
+                    http_client = httpx.Client(
+                        timeout=self.request_timeout,
+                        limits=httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections
+                        )
+                    )
+                    # Uudelleenyritykset tehdään tässä moduulissa, joten SDK:n omat poistetaan
+                    self._client = OpenAI(
+                        api_key=os.environ.get("OPENAI_API_KEY"),
+                        max_retries=0,
+                        timeout=self.request_timeout,
+                        http_client=http_client
+                    )
+        return self._client
+
+    def close(self):
+        """Sulkee asiakkaan yhteyspoolin"""
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"OpenAI-asiakkaan sulkeminen epäonnistui: {e}")
+
+    def reset_after_fork(self):
+        """
+        Unohtaa emoprosessilta periytyneen asiakkaan ja lukot. Yhteyksiä ei
+        suljeta, koska ne kuuluvat emoprosessille.
+        """
+        self._client = None
+        self._init_state()
+
+    def create(self, cancel=None, **request_args):
+        """
+        Tekee client.responses.create-kutsun rajoitusten ja uudelleenyritysten kanssa
+
+        Args:
+            cancel (threading.Event, optional): Asetettuna kutsua ei tehdä, vaan nostetaan LLMCallCancelled
+            **request_args: responses.create-kutsun parametrit, vähintään model
+
+        Returns:
+            Response: OpenAI:n vastaus
+        """
+        model = request_args.get('model')
+        estimate = estimate_tokens(request_args)
+        attempt = 0
+
+        while True:
+            with self._slot(model, estimate) as reserved:
+                _check_cancelled(cancel, model, reserved)
+                start_time = time.time()
+                try:
+                    response = self.client.responses.create(**request_args)
+                except Exception as e:
+                    self._record(model, time.time() - start_time, error=True)
+                    delay = self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                    last_error = e
+                else:
+                    reserved['used'] = self._record(model, time.time() - start_time, response=response)
+                    return response
+
+            attempt += 1
+            logger.warning(f"OpenAI-kutsu ({model}) epäonnistui: {last_error}. Uusi yritys {attempt}/{self.max_retries} {delay:.1f} sekunnin kuluttua")
+            time.sleep(delay)
+
+    def stream(self, cancel=None, **request_args):
+        """
+        Tekee striimaavan responses.create-kutsun. Kutsu pitää paikkansa rajoittimissa
+        koko striimin ajan. Yhteysvirhe yritetään uudelleen vain, jos yhtään
+        tapahtumaa ei ole vielä välitetty kutsujalle.
+
+        Args:
+            cancel (threading.Event, optional): Kun asetetaan, striimi suljetaan ennen seuraavaa
+                tapahtumaa, paikka vapautetaan ja nostetaan LLMCallCancelled
+            **request_args: responses.create-kutsun parametrit, vähintään model
+
+        Yields:
+            Striimin tapahtumat
+        """
+        model = request_args.get('model')
+        estimate = estimate_tokens(request_args)
+        attempt = 0
+
+        while True:
+            started = False
+            with self._slot(model, estimate) as reserved:
+                _check_cancelled(cancel, model, reserved)
+                start_time = time.time()
+                events = None
+                try:
+                    events = self.client.responses.create(stream=True, **request_args)
+                    for event in events:
+                        _check_cancelled(cancel, model)
+                        started = True
+                        if getattr(event, 'type', None) == 'response.completed':
+                            reserved['used'] = self._record(model, time.time() - start_time,
+                                                            response=getattr(event, 'response', None))
+                        yield event
+                    if reserved.get('used') is None:
+                        self._record(model, time.time() - start_time)
+                    return
+                except LLMCallCancelled:
+                    raise
+                except Exception as e:
+                    self._record(model, time.time() - start_time, error=True)
+                    delay = None if started else self._retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+                    last_error = e
+                finally:
+                    # Suljetaan HTTP-yhteys myös, kun kutsuja lopettaa striimin lukemisen kesken
+                    if events is not None and hasattr(events, 'close'):
+                        events.close()
+
+            attempt += 1
+            logger.warning(f"OpenAI-striimi ({model}) epäonnistui: {last_error}. Uusi yritys {attempt}/{self.max_retries} {delay:.1f} sekunnin kuluttua")
+            time.sleep(delay)
+
+    def stats(self):
+        """Palauttaa mallikohtaiset kutsutilastot"""
+        with self._lock:
+            return {model: dict(values) for model, values in self._stats.items()}
+
+    @contextmanager
+    def _slot(self, model, estimate):
+        """
+        Odottaa vuoroa nopeusrajoittimissa ja semaforeissa
+
+        Yields:
+            dict: Kutsun tiedot; 'used' asetetaan toteutuneeseen tokenimäärään
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        waited = self._request_bucket.acquire(1, timeout=self.queue_timeout)
+        try:
+            waited += self._token_bucket.acquire(estimate, timeout=max(0, deadline - time.monotonic()))
+        except LLMGatewayTimeout:
+            self._request_bucket.refund(1)
+            raise
+
+        start = time.monotonic()
+        global_slots = self._global_slots
+        if not global_slots.acquire(timeout=max(0, deadline - time.monotonic())):
+            self._refund_rate_limits(estimate)
+            raise LLMGatewayTimeout(f"OpenAI-kutsu ei saanut vuoroa {self.queue_timeout} sekunnissa")
+        model_slots = self._model_semaphore(model)
+        if not model_slots.acquire(timeout=max(0, deadline - time.monotonic())):
+            global_slots.release()
+            self._refund_rate_limits(estimate)
+            raise LLMGatewayTimeout(f"Mallin {model} kutsu ei saanut vuoroa {self.queue_timeout} sekunnissa")
+        waited += time.monotonic() - start
+
+        if waited > 1:
+            logger.info(f"OpenAI-kutsu ({model}) odotti jonossa {waited:.1f} sekuntia")
+
+        reserved = {'used': None}
+        try:
+            yield reserved
+        finally:
+            model_slots.release()
+            global_slots.release()
+            # Arvioitua pienempi todellinen käyttö palautetaan rajoittimeen
+            if reserved['used'] is not None:
+                self._token_bucket.refund(estimate - reserved['used'])
+
+    def _refund_rate_limits(self, estimate):
+        """Palauttaa varatut rajoittimien tokenit, kun kutsu ei saanut vuoroa eikä sitä lähetetty"""
+        self._request_bucket.refund(1)
+        self._token_bucket.refund(estimate)
+
+    def _model_semaphore(self, model):
+        with self._lock:
+            if model not in self._model_slots:
+                limit = self.model_concurrency.get(model, self.default_model_concurrency)
+                self._model_slots[model] = threading.BoundedSemaphore(max(1, limit))
+            return self._model_slots[model]
+
+    def _retry_delay(self, error, attempt):
+        """
+        Palauttaa odotusajan ennen uutta yritystä tai None, jos virhettä ei yritetä uudelleen
+
+        Args:
+            error (Exception): Kutsun virhe
+            attempt (int): Tähänastisten uusintojen määrä
+        """
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            # Palvelimen pyytämä odotus ja pieni satunnaisuus, jotta säikeet eivät herää yhtä aikaa
+            return min(self.max_backoff, retry_after) + random.uniform(0, 0.5)
+
+        backoff = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return random.uniform(backoff / 2, backoff)
+
+    def _record(self, model, latency, response=None, error=False):
+        """
+        Kirjaa kutsun keston ja tokenit
+
+        Returns:
+            int: Kutsun käyttämät tokenit tai None, jos tieto puuttuu
+        """
+        usage = getattr(response, 'usage', None)
+        input_tokens = getattr(usage, 'input_tokens', None) or 0
+        output_tokens = getattr(usage, 'output_tokens', None) or 0
+
+        with self._lock:
+            stats = self._stats.setdefault(model, {
+                'calls': 0, 'errors': 0, 'input_tokens': 0, 'output_tokens': 0, 'total_latency': 0.0
+            })
+            stats['calls'] += 1
+            stats['errors'] += 1 if error else 0
+            stats['input_tokens'] += input_tokens
+            stats['output_tokens'] += output_tokens
+            stats['total_latency'] += latency
+
+        if error:
+            return None
+        logger.info(f"OpenAI-kutsu ({model}) valmis {latency:.2f} sekunnissa, tokenit: {input_tokens} sisään, {output_tokens} ulos")
+        return input_tokens + output_tokens if usage is not None else None
+
+
+def _check_cancelled(cancel, model, reserved=None):
+    """
+    Nostaa LLMCallCancelled, jos kutsu on peruttu
+
+    Args:
+        cancel (threading.Event): Peruutusmerkki tai None
+        model (str): Malli lokia varten
+        reserved (dict, optional): Annetaan ennen kutsua, jolloin varatut tokenit palautetaan kokonaan
+    """
+    if cancel is not None and cancel.is_set():
+        if reserved is not None:
+            reserved['used'] = 0
+        logger.info(f"OpenAI-kutsu ({model}) peruttiin, tulosta ei tarvita")
+        raise LLMCallCancelled(f"Mallin {model} kutsu peruttiin")
+
+
+def estimate_tokens(request_args):
+    """
+    Arvioi kutsun tokenimäärän ennen kutsua: syötteen merkit / 4 ja vastauksen enimmäispituus
+
+    Args:
+        request_args (dict): responses.create-kutsun parametrit
+
+    Returns:
+        int: Arvioitu tokenimäärä
+    """
+    chars = 0
+    items = request_args.get('input')
+    if isinstance(items, str):
+        chars = len(items)
+    else:
+        for item in items or []:
+            content = item.get('content') if isinstance(item, dict) else None
+            if isinstance(content, str):
+                chars += len(content)
+                continue
+            for part in content or []:
+                if isinstance(part, dict):
+                    chars += len(part.get('text') or '')
+    return chars // 4 + int(request_args.get('max_output_tokens') or 0)
+
+
+def is_retryable(error):
+    """Tarkistaa, kannattaako kutsua yrittää uudelleen"""
+    import openai
+
+    if isinstance(error, openai.RateLimitError):
+        # Käyttökiintiön loppuminen ei korjaannu odottamalla
+        return getattr(error, 'code', None) != 'insufficient_quota'
+    return isinstance(error, (openai.APIConnectionError, openai.InternalServerError, openai.ConflictError))
+
+
+def retry_after_seconds(error):
+    """Lukee virhevastauksen retry-after-ms- tai Retry-After-otsakkeen sekunteina"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+    except (TypeError, ValueError):
+        pass
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def parse_model_limits(value):
+    """
+    Jäsentää mallikohtaiset rajat muodossa "gpt-4.1=4,gpt-4.1-mini=8"
+
+    Returns:
+        dict: Malli -> raja
+    """
+    limits = {}
+    for item in (value or '').split(','):
+        if '=' not in item:
+            continue
+        model, limit = item.split('=', 1)
+        try:
+            limits[model.strip()] = int(limit)
+        except ValueError:
+            logger.warning(f"Virheellinen mallikohtainen raja: {item}")
+    return limits
+
+
+# Luodaan singleton-instanssi
+llm_gateway = LLMGateway()
@@ -0,0 +1,49 @@
+"""Add indexes for hot lookups
+
+Revision ID: add_hot_query_indexes
+Revises: add_subscription_type, update_product_prices
+Create Date: 2026-10-17 12:00:00
+
+Yhdistää kaksi erillistä haaraa (add_subscription_type ja update_product_prices)
+ja lisää hakemistot usein suoritettaviin hakuihin. Tilausten ja vahvistustokenin
+hakemistot ovat osittaisia, joten ne kattavat vain haettavat rivit.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_hot_query_indexes'
+down_revision = ('add_subscription_type', 'update_product_prices')
+branch_labels = None
+depends_on = None
+
+# (hakemisto, taulu, sarakkeet, osittaisen hakemiston ehto)
+INDEXES = [
+    ('ix_analyses_user_id_property_url', 'analyses', ['user_id', 'property_url'], None),
+    ('ix_analyses_user_id_created_at', 'analyses', ['user_id', 'created_at'], None),
+    ('ix_kohteet_analysis_id', 'kohteet', ['analysis_id'], None),
+    ('ix_risk_analyses_analysis_id_user_id', 'risk_analyses', ['analysis_id', 'user_id'], None),
+    ('ix_subscriptions_active_user_id_type', 'subscriptions', ['user_id', 'subscription_type'],
+     "status = 'active'"),
+    ('ix_subscriptions_renewal_next_billing_date', 'subscriptions', ['next_billing_date'],
+     "status = 'active' AND cancel_at_period_end = false"),
+    ('ix_users_verification_token', 'users', ['verification_token'], "verification_token IS NOT NULL"),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns, where in INDEXES:
+        # Kehitystietokannoissa db.create_all on voinut jo luoda hakemiston
+        if name in [index['name'] for index in inspector.get_indexes(table)]:
+            continue
+        condition = sa.text(where) if where else None
+        op.create_index(name, table, columns, postgresql_where=condition, sqlite_where=condition)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, table, columns, where in reversed(INDEXES):
+        if name in [index['name'] for index in inspector.get_indexes(table)]:
+            op.drop_index(name, table_name=table)
@@ -48,6 +48,12 @@ class User(UserMixin, db.Model):
     # Maksut
     payments = db.relationship('Payment', backref='user', lazy=True, cascade="all, delete")
     
+    # Vahvistuslinkin token haetaan hakemistosta; vahvistetuilla käyttäjillä tokenia ei ole
+    __table_args__ = (
+        db.Index('ix_users_verification_token', verification_token,
+                 postgresql_where=verification_token.isnot(None), sqlite_where=verification_token.isnot(None)),
+    )
+    
     def __init__(self, email, first_name, last_name, street_address, postal_code, 
                  city, state, country, password=None, is_oauth_user=False, 
                  oauth_provider=None, is_verified=False):
@@ -118,12 +124,13 @@ class User(UserMixin, db.Model):
         return self.analyses_left > 0
     
     def decrement_analyses_left(self):
-        """Vähentää käyttäjän jäljellä olevien analyysien määrää yhdellä."""
-        if self.analyses_left > 0:
-            self.analyses_left -= 1
-            db.session.commit()
-            return True
-        return False
+        """Vähentää käyttäjän jäljellä olevien analyysien määrää yhdellä.
+        Vähennys tehdään ehdollisella päivityksellä, jotta samanaikaiset vähennykset eivät kumoa toisiaan."""
+        updated = User.query.filter(User.id == self.id, User.analyses_left > 0).update(
+            {'analyses_left': User.analyses_left - 1}, synchronize_session=False
+        )
+        db.session.commit()
+        return bool(updated)
     
     def add_analyses(self, count=5):
         """Lisää käyttäjälle analyysejä."""
@@ -160,6 +167,12 @@ class Analysis(db.Model):
     risk_analysis = db.relationship('RiskAnalysis', backref='analysis', lazy=True, uselist=False, 
                                     cascade="all, delete", passive_deletes=True)
     
+    # Käyttäjän analyysi URL:n perusteella sekä käyttäjän analyysit uusimmasta alkaen
+    __table_args__ = (
+        db.Index('ix_analyses_user_id_property_url', 'user_id', 'property_url'),
+        db.Index('ix_analyses_user_id_created_at', 'user_id', 'created_at'),
+    )
+    
     def __repr__(self):
         return f'<Analysis {self.title}>'
 
@@ -176,6 +189,11 @@ class RiskAnalysis(db.Model):
     # Määritellään suhde User-tauluun
     user = db.relationship('User', backref=db.backref('risk_analyses', lazy=True))
     
+    # Riskianalyysi haetaan analyysin ja valinnaisesti käyttäjän perusteella
+    __table_args__ = (
+        db.Index('ix_risk_analyses_analysis_id_user_id', 'analysis_id', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<RiskAnalysis for Analysis {self.analysis_id}>'
 
@@ -239,6 +257,16 @@ class Subscription(db.Model):
     last_payment_date = db.Column(db.DateTime, nullable=True)
     payment_id = db.Column(db.String(100), nullable=True)  # Payment reference or transaction ID
     
+    # Osittaiset hakemistot kattavat vain aktiiviset tilaukset: käyttäjän aktiivinen tilaus
+    # ja uusittavaksi tulevat tilaukset laskutuspäivän mukaan
+    __table_args__ = (
+        db.Index('ix_subscriptions_active_user_id_type', user_id, subscription_type,
+                 postgresql_where=(status == 'active'), sqlite_where=(status == 'active')),
+        db.Index('ix_subscriptions_renewal_next_billing_date', next_billing_date,
+                 postgresql_where=db.and_(status == 'active', cancel_at_period_end == False),
+                 sqlite_where=db.and_(status == 'active', cancel_at_period_end == False)),
+    )
+    
     def is_active(self):
         """Tarkistaa onko tilaus aktiivinen."""
         if self.status != 'active':
@@ -284,13 +312,122 @@ class Kohde(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', name='fk_kohteet_users'), nullable=True)  # Käyttäjä, jolle kohde kuuluu
     neliot = db.Column(db.Float, nullable=True)  # Asuinpinta-ala neliömetreinä
     huoneet = db.Column(db.Integer, nullable=True)  # Huoneiden lukumäärä
+    tiedostonimi = db.Column(db.String(500), nullable=True)  # Lähde-PDF massatuonnissa, jatketun ajon täsmäytystä varten
     
     # Käyttäjäsuhde
     user = db.relationship('User', backref=db.backref('kohteet', lazy=True))
     
+    # Analyysin kohde haetaan analyysin näkymässä ja riskianalyysissä
+    __table_args__ = (
+        db.Index('ix_kohteet_analysis_id', 'analysis_id'),
+    )
+    
     def __repr__(self):
         return f'<Kohde {self.osoite}>'
 
+class LLMResultCache(db.Model):
+    """Käyttäjien kesken jaettu LLM-vastausten välimuisti"""
+    __tablename__ = 'llm_result_cache'
+
+    cache_key = db.Column(db.String(64), primary_key=True)  # sha256(malli, prompt, syöte)
+    model = db.Column(db.String(50), nullable=False)
+    prompt_name = db.Column(db.String(100), nullable=True)  # Esim. prompt-tiedoston nimi lokitusta varten
+    output = db.Column(db.Text, nullable=False)
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_hit_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<LLMResultCache {self.model} {self.cache_key[:12]}>'
+
+class ListingContentCache(db.Model):
+    """Käyttäjien ja gunicorn-workerien kesken jaettu haettujen ilmoitusten välimuisti"""
+    __tablename__ = 'listing_content_cache'
+
+    source = db.Column(db.String(20), primary_key=True)  # 'oikotie' tai 'etuovi'
+    listing_id = db.Column(db.String(50), primary_key=True)
+    markdown = db.Column(db.Text, nullable=False)  # get_property_data-funktion tuottama teksti
+    size_bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Kokorajan ylittyessä poistetaan pisimpään käyttämättömät
+    __table_args__ = (
+        db.Index('ix_listing_content_cache_last_used_at', 'last_used_at'),
+    )
+
+    def __repr__(self):
+        return f'<ListingContentCache {self.source}/{self.listing_id}>'
+
+class SingleFlightLock(db.Model):
+    """Käynnissä olevan vaiheen lukko ja tulos, jolla samanaikaiset pyynnöt yhdistetään"""
+    __tablename__ = 'single_flight_locks'
+
+    key = db.Column(db.String(200), primary_key=True)  # Esim. 'fetch:oikotie:12345678'
+    owner = db.Column(db.String(36), nullable=False)  # Vaihetta suorittavan kutsun tunniste
+    status = db.Column(db.String(20), nullable=False, default='running')  # 'running', 'done', 'failed'
+    result = db.Column(db.Text, nullable=True)  # JSON-muotoinen tulos
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # Lukon tai tuloksen voimassaolo
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<SingleFlightLock {self.key} {self.status}>'
+
+class WebSession(db.Model):
+    """Palvelimelle tallennettu käyttäjän istunto (SESSION_BACKEND=database)"""
+    __tablename__ = 'web_sessions'
+
+    sid = db.Column(db.String(64), primary_key=True)  # Evästeessä kulkeva istuntotunniste
+    data = db.Column(db.Text, nullable=False)  # JSON-muotoinen istunnon sisältö
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)  # Vanhentuneet poistetaan erissä
+
+    def __repr__(self):
+        return f'<WebSession {self.sid[:8]} {self.expires_at}>'
+
+class AnalysisJob(db.Model):
+    """Taustalla suoritettavan analyysin jonotietue"""
+    __tablename__ = 'analysis_jobs'
+
+    id = db.Column(db.String(36), primary_key=True)  # UUID-merkkijono
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    property_url = db.Column(db.String(500), nullable=False)
+    source = db.Column(db.String(20), nullable=True)  # 'oikotie' tai 'etuovi'
+    status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'done', 'failed'
+    stage = db.Column(db.String(20), nullable=True)  # 'fetch', 'extract', 'analysis', 'risk'
+    analysis_id = db.Column(db.Integer, db.ForeignKey('analyses.id', ondelete='SET NULL'), nullable=True)
+    options = db.Column(db.Text, nullable=True)  # JSON-muotoiset lisäasetukset
+    result_data = db.Column(db.Text, nullable=True)  # JSON-muotoinen lopputulos
+    partial_analysis = db.Column(db.Text, nullable=True)  # Striimattavan pääanalyysin tähän asti saapunut teksti
+    error_message = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=True)  # Päivitetään jokaisessa vaiheessa (heartbeat)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    # Jonosta haetaan vanhin odottava työ
+    __table_args__ = (
+        db.Index('ix_analysis_jobs_status_created_at', 'status', 'created_at'),
+    )
+
+    def to_dict(self):
+        """Palauttaa työn tilan sanakirjana API-vastausta varten"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'source': self.source,
+            'property_url': self.property_url,
+            'analysis_id': self.analysis_id,
+            'error': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+    def __repr__(self):
+        return f'<AnalysisJob {self.id} {self.status}>'
+
 class OAuth(db.Model):
     """Google OAuth tiedot käyttäjälle"""
     __tablename__ = 'oauth'
@@ -3,26 +3,14 @@ import re
 import os
 import requests
 import tempfile
-from PyPDF2 import PdfReader
 import unicodedata
+from pdf_document import PdfDocument
+from text_condense import fix_encoding
 
 
 def normalize_text(text):
-    """Normalize Unicode text by replacing special characters."""
-    # Replace common problematic characters
-    replacements = {
-        "Ã¤": "ä",
-        "Ã¶": "ö",
-        "Ã…": "Å",
-        "Ã¥": "å",
-        "â‚¬": "€",
-        "mÂ²": "m²"
-    }
-    
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-    
-    return text
+    """Normalize Unicode text by fixing mis-decoded characters in a single pass."""
+    return fix_encoding(text)
 
 
 def convert_to_showcase_url(url):
@@ -45,6 +33,29 @@ def convert_to_showcase_url(url):
     return f"https://asunnot.oikotie.fi/nayttoesite/{property_id}"
 
 
+def fetch_pdf_bytes(showcase_url):
+    """Download the PDF from the showcase URL into memory.
+    
+    Args:
+        showcase_url (str): The showcase URL to download the PDF from
+        
+    Returns:
+        bytes: Content of the PDF
+    """
+    print(f"Attempting to download PDF from: {showcase_url}")
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    }
+    
+    response = requests.get(showcase_url, headers=headers, timeout=30)
+    
+    # Check if the request was successful
+    if response.status_code != 200:
+        raise Exception(f"Failed to download PDF. Status code: {response.status_code}")
+    
+    return response.content
+
+
 def download_pdf(showcase_url, output_path=None):
     """Download the PDF from the showcase URL.
     
@@ -55,17 +66,8 @@ def download_pdf(showcase_url, output_path=None):
     Returns:
         str: Path to the downloaded PDF file
     """
-    print(f"Attempting to download PDF from: {showcase_url}")
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        
-        response = requests.get(showcase_url, headers=headers)
-        
-        # Check if the request was successful
-        if response.status_code != 200:
-            raise Exception(f"Failed to download PDF. Status code: {response.status_code}")
+        pdf_bytes = fetch_pdf_bytes(showcase_url)
         
         # If no output path is specified, create a temporary file
         if output_path is None:
@@ -74,7 +76,7 @@ def download_pdf(showcase_url, output_path=None):
         
         # Write the PDF content to the file
         with open(output_path, 'wb') as f:
-            f.write(response.content)
+            f.write(pdf_bytes)
         
         print(f"PDF successfully downloaded to: {output_path}")
         return output_path
@@ -83,26 +85,25 @@ def download_pdf(showcase_url, output_path=None):
         raise
 
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file.
+def extract_text_from_pdf(pdf_source):
+    """Extract text from a PDF.
     
     Args:
-        pdf_path (str): Path to the PDF file
+        pdf_source (str | bytes | file-like | PdfDocument): Path to the PDF file, its content
+            as bytes, a binary stream or an already parsed document
     
     Returns:
         str: Extracted text content
     """
-    print(f"Extracting text from PDF: {pdf_path}")
-    
     try:
-        reader = PdfReader(pdf_path)
-        text = ""
+        # An already parsed document reuses its cached page texts
+        document = PdfDocument.open(pdf_source)
+        print(f"Extracting text from PDF: {document.name}")
         
-        # Extract text from each page
-        for i, page in enumerate(reader.pages):
-            print(f"Processing page {i+1}/{len(reader.pages)}")
-            page_text = page.extract_text()
-            text += page_text + "\n\n"
+        page_texts = document.page_texts()
+        print(f"Processing {len(page_texts)} pages")
+        # Page markers let the condenser find headers and footers repeated on every page
+        text = document.paged_text()
         
         # Normalize problematic characters
         normalized_text = normalize_text(text)
@@ -123,31 +124,17 @@ def process_oikotie_url(url):
         str: Extracted text content
     """
     print(f"Processing Oikotie URL: {url}")
-    pdf_path = None
     
     try:
         # Convert the URL to showcase format
         showcase_url = convert_to_showcase_url(url)
         
-        # Download the PDF to a temporary file
-        pdf_path = download_pdf(showcase_url)
-        
-        # Extract text from the PDF
-        text_content = extract_text_from_pdf(pdf_path)
-        
-        return text_content
+        # Download the PDF into memory and extract its text without temporary files
+        pdf_bytes = fetch_pdf_bytes(showcase_url)
+        return extract_text_from_pdf(pdf_bytes)
     except Exception as e:
         print(f"Error processing URL: {e}")
         raise
-    finally:
-        # Clean up: Delete the PDF file
-        if pdf_path and os.path.exists(pdf_path):
-            try:
-                os.remove(pdf_path)
-                print(f"Temporary PDF file deleted: {pdf_path}")
-            except Exception as e:
-                print(f"Warning: Failed to delete temporary PDF file: {e}")
-
 
 def get_property_info(url, verbose=True):
     """Main function to get property information from an Oikotie URL.
@@ -0,0 +1,126 @@
+"""
+Kerran jäsennettävä PDF-dokumentti.
+
+Sama PDF kulkee validoinnin, tekstiksi muunnon ja kenttien poiminnan läpi.
+PdfDocument lukee sisällön muistiin kerran, jäsentää sen vasta tarvittaessa ja
+tallentaa sivujen tekstit välimuistiin, joten kutsujat voivat välittää saman
+olion eteenpäin sen sijaan, että jokainen vaihe avaisi tiedoston uudelleen.
+"""
+
+import io
+import logging
+
+from PyPDF2 import PdfReader
+
+logger = logging.getLogger(__name__)
+
+
+class PdfDocument:
+    """
+    Muistissa oleva PDF, jonka jäsennys ja sivutekstit tallennetaan välimuistiin
+    """
+
+    def __init__(self, source, name=None):
+        """
+        Args:
+            source (str | bytes | file-like): Tiedostopolku, PDF:n sisältö tavuina tai binäärivirta
+            name (str, optional): Dokumentin nimi lokeja varten
+        """
+        if isinstance(source, (bytes, bytearray)):
+            self.data = bytes(source)
+        elif hasattr(source, 'read'):
+            self.data = source.read()
+        else:
+            with open(source, 'rb') as f:
+                self.data = f.read()
+            name = name or source
+
+        self.name = name or 'PDF'
+        self._reader = None
+        self._error = None
+        self._page_texts = None
+        self._plumber_texts = None
+
+    @classmethod
+    def open(cls, source):
+        """Palauttaa annetun dokumentin sellaisenaan tai avaa uuden"""
+        return source if isinstance(source, cls) else cls(source)
+
+    @property
+    def reader(self):
+        """PyPDF2-lukija, joka luodaan ensimmäisellä käyttökerralla"""
+        if self._reader is None and self._error is None:
+            try:
+                self._reader = PdfReader(io.BytesIO(self.data))
+            except Exception as e:
+                self._error = e
+        if self._error is not None:
+            raise self._error
+        return self._reader
+
+    @property
+    def page_count(self):
+        return len(self.reader.pages)
+
+    def is_valid(self):
+        """
+        Tarkistaa, että sisältö on jäsennettävä PDF, jossa on vähintään yksi sivu
+
+        Returns:
+            bool: True jos PDF on validi
+        """
+        if not self.data.startswith(b'%PDF'):
+            logger.error(f"{self.name}: sisältö ei ala PDF-otsakkeella")
+            return False
+        try:
+            return self.page_count > 0
+        except Exception as e:
+            logger.error(f"{self.name}: PDF validointi epäonnistui: {e}")
+            return False
+
+    def page_texts(self):
+        """
+        Palauttaa sivujen tekstit PyPDF2:lla poimittuna. Tyhjä sivu palautetaan tyhjänä merkkijonona.
+
+        Returns:
+            list: Sivujen tekstit
+        """
+        if self._page_texts is None:
+            self._page_texts = [page.extract_text() or "" for page in self.reader.pages]
+        return self._page_texts
+
+    def text(self, separator="\n\n"):
+        """Palauttaa koko dokumentin tekstin sivut erottimella yhdistettynä"""
+        return separator.join(self.page_texts())
+
+    def paged_text(self, empty_page_text=""):
+        """
+        Palauttaa tekstin sivumerkinnöin ("--- Page N ---"), joista tiivistys tunnistaa
+        sivujen rajat ja niiden ylä- ja alatunnisteet
+
+        Args:
+            empty_page_text (str): Teksti tyhjän sivun kohdalle
+
+        Returns:
+            str: Sivujen tekstit sivumerkintöjen jälkeen
+        """
+        return "".join(
+            f"--- Page {page_num} ---\n{text or empty_page_text}\n\n"
+            for page_num, text in enumerate(self.page_texts(), 1)
+        )
+
+    def layout_text(self):
+        """
+        Palauttaa tekstin pdfplumberilla poimittuna. Kenttien poiminnan säännölliset
+        lausekkeet on kirjoitettu pdfplumberin rivitykselle, joten se pidetään erillään
+        PyPDF2:n tekstistä.
+
+        Returns:
+            str: Sivujen tekstit rivinvaihdoin yhdistettynä
+        """
+        if self._plumber_texts is None:
+            import pdfplumber
+
+            with pdfplumber.open(io.BytesIO(self.data)) as pdf:
+                self._plumber_texts = [page.extract_text() or "" for page in pdf.pages]
+        return "\n".join(self._plumber_texts)
@@ -0,0 +1,278 @@
+"""
+Analyysien promptit muistissa.
+
+Kaikki prompt_*.txt-tiedostot luetaan kerran käynnistyksessä, ja tiedosto luetaan
+uudelleen vain, jos sen muokkausaika muuttuu. Jokaisella promptilla on sisällöstä
+laskettu versiotunniste, joka kirjataan lokiin ja LLM-välimuistiin.
+
+Pyynnöt rakennetaan niin, että pitkä staattinen prompt on aina sellaisenaan viestien
+alussa ja vaihtuva ilmoitusteksti vasta sen jälkeen. Näin OpenAI:n prompt-välimuisti
+tunnistaa saman etuliitteen jokaisessa kutsussa.
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Promptitiedostot tyypeittäin: 'okt' omakotitaloille, 'kt' muille kohteille
+ANALYSIS_PROMPT_FILES = {'okt': 'prompt_analyysi_okt.txt', 'kt': 'prompt_analyysi_kt.txt'}
+RISK_PROMPT_FILES = {'okt': 'prompt_riski_okt.txt', 'kt': 'prompt_riski_kt.txt'}
+
+# Käytetään vain, jos promptitiedostoa ei ole lainkaan saatavilla
+FALLBACK_ANALYSIS_PROMPT = """Olet kiinteistö- ja kiinteistövälityksen kokenut ammattilainen.
+Tehtävänäsi on tehdä ostajalle analyysi myynnisssä olevasta kohteesta.
+
+**TÄMÄ ON TÄRKEÄÄ:**
+Perhedy tietoihin huolellisesi. Tee kohteen tiedoista implisiittisiä päätelmiä ostajalle tärkeistä asioista.
+
+Laadi teksi asiantuntijamaiseen tyyliin. Kerro kuitenkin suoraan kohteen puutteet ja negatiiviset asiat.
+Vältä ilmoitustekstin toistoa, ilman että siinä on mielestäsi jotain huomioitavaa. Ota huomioon, että lukija on jo perehtynyt ilmoituksen sisältöön ja odottaa nyt sinulta huomioita, jotka eivät suoraan ilmene tekstistä.
+Koosta analyysin loppuun kolmen kysymyksen kysymyslista. Tee sellaisia kysymyksiä, jotka ovat oikeasti merkittäviä ostajalle.
+Älä kommentoi välitysliikettä tai välittäjää.
+
+Kirjoita teksti hyvällä suomenkielisellä kirjoitustyylillä.
+
+Alla kuvaus vastauksen rakenteesta.
+
+Voit painottaa tekstistä sanoja boldilla.
+
+<rakennekuvaus>
+
+*1. Sijainti ja alueellinen konteksti*
+Anna tässä rehellinen kuvaus alueesta, jossa kiinteistö sijaitsee. Kerro suoraan, jos alue on maineeltaan kyseenalainen.
+
+*2. Rakennus ja taloyhtiö*
+Pyri tekemään omia päätelmiäsi siitä, millainen rakennus ja taloyhtiö on kyseessä, myös sen perusteella, mitä ilmoituksessa ei ole sanottu. On tärkeää, ettei tässä kohdassa ainoastaan toisteta samoja asioita, jotka ilmenevät jo ilmoituksessa.
+
+*3. Asunto ja varustelutaso*
+*4. Markkina- ja ostotilanne*
+*5. Mahdolliset huomiot tai riskitekijät*
+Tämä on tärkeä osio. Pyri kirjoittamaan tämä osio mahdollisimman vakuuttavasti, niin että lukija kokee saaneensa arvokasta tietoa.
+
+*6. Kohteen hinta verrattuna vastaaviin*
+Anna tässä konkreettinen oma hinta-arviosi kohteesta perusteluineen.
+
+*7. Kysymyslista välittäjälle*
+Listaa tähän kolme kysymystä, jotka olisi mielestäsi tärkeä kysyä välittäjältä.
+</rakennekuvaus>
+
+**Tämä on tärkeää:**
+Kirjoita analyysi markdown-muodossa, joka on täysin yhteensopiva verkkosivujen Markdown-renderöijien kanssa. Käytä vain tavallisia ASCII-merkkejä ja vältä erikoisia UNICODE-välilyöntejä kuten narrow no-break space (U+202F).
+
+Käytä ainoastaan seuraavia muotoiluelementtejä:
+Otsikot muodossa ### ja ####
+Lihavoinnit **...**
+Yksinkertaiset listat -...
+Rivinvaihdot käyttäen kaksoisvälilyöntiä + \n (eli \n)
+Älä käytä lainausmerkkejä.
+Käytä ainoastaan tavallisia välilyöntejä.
+
+Älä käytä otsikoinnissa suurempaa kuin h3.
+"""
+
+FALLBACK_RISK_PROMPT = """Olet koknut kiinteistöanalyytikko, joka arvioi asuntokohteiden riskejä ostajille. Sinun tehtäväsi on analysoida annettu kohdeanalyysi ja luoda siitä riskianalyysi.
+
+Arvioi kohteen riskitaso analysoimalla oheinen kohteen analyysi. Käytä riskitasoasteikkoa 1-10, jossa 1 on erittäin matala riski ja 10 on erittäin korkea riski.
+
+Analyysi on jaettava eri riskiosa-alueisiin. Arvioi jokaiselle osa-alueelle oma riskitasonsa. Osa-alueet ovat:
+1. Sijainti ja alue: Alueen arvonkehitys, maineriski, alueen sosioekonominen status
+2. Talous ja rahoitus: Hinnoittelu, arvonkehitys, sijoituksen kannattavuus
+3. Kohteen kunto: Rakenteelliset riskit, korjaustarpeet, tekniset järjestelmät
+4. Juridiikka: Omistusmuoto, rasitteet, kaavoitus, käyttörajoitukset
+5. Taloyhtiö: Jos kyseessä on kerros- tai rivitalo, arvioi taloyhtiön talous, korjausvelka ja hallinnointi
+
+Anna lopuksi kokonaisriskitaso, joka on painotettu keskiarvo osa-alueiden riskeistä.
+
+Vastaa JSON-muodossa:
+{
+  "kokonaisriskitaso": numero välillä 1-10,
+  "riskimittari": [
+    {
+      "osa_alue": "Sijainti ja alue",
+      "riski_taso": numero välillä 1-10,
+      "osuus_prosenttia": numero välillä 1-100,
+      "kuvaus": "Lyhyt kuvaus riskistä"
+    },
+    ...seuraaville osa-alueille
+  ]
+}
+
+Varmista että riskimittarin osa-alueiden osuus_prosenttia-arvojen summa on tasan 100%.
+"""
+
+# Yhdistetyn analyysin ohje, joka lisätään analyysi- ja riskipromptien perään
+COMBINED_INSTRUCTIONS = """Tee samassa vastauksessa kaksi asiaa:
+1. Kirjoita analyysi ensimmäisen ohjeen mukaisesti kenttään "analyysi" markdown-muodossa.
+2. Arvioi kohteen riskit kirjoittamasi analyysin perusteella riskianalyysin ohjeen mukaisesti
+ja palauta tulos kenttään "riskianalyysi".
+Vastauksen rakenne määräytyy annetusta JSON-skeemasta.
+"""
+
+
+def property_kind(kohde_tyyppi):
+    """Palauttaa 'okt' omakotitalolle ja 'kt' muille kohteille"""
+    return 'okt' if kohde_tyyppi and 'omakotitalo' in kohde_tyyppi.lower() else 'kt'
+
+
+def normalize_prompt(text):
+    """
+    Yhtenäistää promptin rivinvaihdot ja lopun, jotta sama sisältö tuottaa aina
+    tavu tavulta saman etuliitteen
+    """
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return '\n'.join(line.rstrip() for line in text.strip().split('\n')) + '\n'
+
+
+class Prompt:
+    """Ladattu prompt ja sen versiotunniste"""
+
+    def __init__(self, name, text, mtime=None):
+        self.name = name
+        self.text = normalize_prompt(text)
+        self.mtime = mtime
+        self.version = hashlib.sha256(self.text.encode('utf-8')).hexdigest()[:12]
+
+    @property
+    def label(self):
+        """Nimi ja versio lokeja ja välimuistia varten"""
+        return f"{self.name}@{self.version}"
+
+
+class PromptRegistry:
+    """
+    Promptitiedostojen välimuisti, joka päivittyy tiedostojen muuttuessa
+    """
+
+    def __init__(self, directory=None, reload_interval=2.0):
+        self.directory = directory or os.path.dirname(os.path.abspath(__file__))
+        self.reload_interval = reload_interval
+        self._prompts = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Lukee asetukset sovelluksen konfiguraatiosta ja lataa promptit"""
+        self.directory = app.config.get('PROMPT_DIR') or self.directory
+        self.reload_interval = float(app.config.get('PROMPT_RELOAD_INTERVAL', self.reload_interval))
+        with self._lock:
+            self._prompts = {}
+            self._checked_at = {}
+        self.preload()
+
+    def preload(self):
+        """Lataa kaikki hakemiston promptitiedostot"""
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith('prompt_') and n.endswith('.txt'))
+        for name in names:
+            self.get(name)
+        logger.info(f"Ladattu {len(names)} promptia: {', '.join(self.versions())}")
+
+    def get(self, name):
+        """
+        Palauttaa promptin. Tiedoston muokkausaika tarkistetaan enintään
+        reload_interval-välein, ja muuttunut tiedosto luetaan uudelleen.
+
+        Args:
+            name (str): Promptitiedoston nimi
+
+        Returns:
+            Prompt: Prompt tai None, jos tiedostoa ei ole
+        """
+        now = time.monotonic()
+        prompt = self._prompts.get(name)
+        if prompt is not None and now - self._checked_at.get(name, 0) < self.reload_interval:
+            return prompt
+
+        with self._lock:
+            self._checked_at[name] = now
+            path = os.path.join(self.directory, name)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                if prompt is not None:
+                    logger.warning(f"Promptitiedosto {name} puuttuu, käytetään aiemmin ladattua versiota")
+                return prompt
+
+            if prompt is None or prompt.mtime != mtime:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        loaded = Prompt(name, f.read(), mtime)
+                except Exception as e:
+                    logger.error(f"Virhe promptin lukemisessa tiedostosta {name}: {e}")
+                    return prompt
+                if prompt is not None and prompt.version != loaded.version:
+                    logger.info(f"Prompt {name} päivitetty: {prompt.version} -> {loaded.version}")
+                self._prompts[name] = prompt = loaded
+            return prompt
+
+    def analysis_prompt(self, kohde_tyyppi=None):
+        """Palauttaa pääanalyysin promptin kohteen tyypin mukaan"""
+        return self._select(ANALYSIS_PROMPT_FILES, kohde_tyyppi, FALLBACK_ANALYSIS_PROMPT)
+
+    def risk_prompt(self, kohde_tyyppi=None):
+        """Palauttaa riskianalyysin promptin kohteen tyypin mukaan"""
+        return self._select(RISK_PROMPT_FILES, kohde_tyyppi, FALLBACK_RISK_PROMPT)
+
+    def versions(self):
+        """Palauttaa ladattujen promptien versiot muodossa nimi@versio"""
+        return [prompt.label for prompt in sorted(self._prompts.values(), key=lambda p: p.name)]
+
+    def _select(self, files, kohde_tyyppi, fallback_text):
+        """Valitsee tyypin promptin; puuttuva tiedosto korvataan kerrostalon promptilla ja lopulta oletuksella"""
+        prompt = self.get(files[property_kind(kohde_tyyppi)]) or self.get(files['kt'])
+        if prompt is None:
+            logger.warning("Promptitiedostoa ei löytynyt, käytetään oletuspromptia")
+            prompt = Prompt('oletus', fallback_text)
+        return prompt
+
+
+def build_input(prompt, user_text):
+    """
+    Muodostaa responses.create-kutsun input-listan. Staattinen prompt on aina
+    ensimmäisenä omana system-viestinään, jotta pyyntöjen alku pysyy samana.
+
+    Args:
+        prompt (Prompt): Käytettävä prompt
+        user_text (str): Kutsukohtainen syöte
+
+    Returns:
+        list: input-parametrin arvo
+    """
+    return [
+        {
+            "role": "system",
+            "content": [{"type": "input_text", "text": prompt.text}]
+        },
+        {
+            "role": "user",
+            "content": [{"type": "input_text", "text": user_text}]
+        }
+    ]
+
+
+def build_combined_input(analysis_prompt, risk_prompt, user_text):
+    """
+    Muodostaa yhdistetyn analyysin ja riskianalyysin input-listan. Molemmat promptit
+    ja yhdistämisohje ovat staattisina system-viesteinä ennen ilmoitustekstiä.
+
+    Args:
+        analysis_prompt (Prompt): Pääanalyysin prompt
+        risk_prompt (Prompt): Riskianalyysin prompt
+        user_text (str): Kutsukohtainen syöte
+
+    Returns:
+        list: input-parametrin arvo
+    """
+    combined = Prompt('yhdistetty', COMBINED_INSTRUCTIONS)
+    system_messages = [
+        {"role": "system", "content": [{"type": "input_text", "text": prompt.text}]}
+        for prompt in (analysis_prompt, risk_prompt, combined)
+    ]
+    return system_messages + build_input(combined, user_text)[1:]
+
+
+# Luodaan singleton-instanssi
+prompt_registry = PromptRegistry()
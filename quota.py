@@ -0,0 +1,137 @@
+"""
+Analyysikiintiön varaus ja palautus.
+
+Oikeus analyysiin päätellään kerran pyyntöä kohden: ylläpitäjä, aktiivinen
+kuukausijäsenyys tai jäljellä olevat analyysit. Jos analyysi maksetaan
+analyysipaketista, yksi analyysi varataan heti jonoon lisättäessä yhdellä
+ehdollisella päivityksellä (UPDATE ... WHERE analyses_left > 0 RETURNING), joten
+samanaikaiset pyynnöt eivät voi käyttää samaa analyysiä kahteen kertaan.
+Varaus jää voimaan, kun analyysi valmistuu, ja palautetaan, jos analyysi epäonnistuu.
+"""
+
+import logging
+
+from flask import g, has_request_context
+from sqlalchemy import update
+
+from models import db, User
+from entitlements import entitlement_cache
+
+logger = logging.getLogger(__name__)
+
+# Oikeuden lähteet
+ENTITLEMENT_ADMIN = 'admin'
+ENTITLEMENT_SUBSCRIPTION = 'subscription'
+ENTITLEMENT_CREDITS = 'credits'
+
+
+class QuotaService:
+    """
+    Käyttäjän analyysioikeuden päättely sekä analyysien atominen varaus ja palautus
+    """
+
+    def entitlement(self, user):
+        """
+        Päättelee, millä perusteella käyttäjä saa tehdä analyysin. Tulos tallennetaan
+        pyynnön ajaksi, joten tilausta ei haeta samassa pyynnössä uudelleen.
+
+        Args:
+            user (User): Käyttäjä
+
+        Returns:
+            str: 'admin', 'subscription' tai 'credits', tai None jos oikeutta ei ole
+        """
+        cache = g.setdefault('quota_entitlements', {}) if has_request_context() else {}
+        if user.id not in cache:
+            cache[user.id] = self._resolve(user)
+        return cache[user.id]
+
+    def _resolve(self, user):
+        """Päättelee oikeuden käyttäjän tiedoista ja kuukausijäsenyydestä"""
+        if user.is_admin:
+            return ENTITLEMENT_ADMIN
+
+        # Tieto ladataan yleensä jo käyttäjän mukana load_user-kyselyssä
+        if entitlement_cache.has_subscription(user):
+            return ENTITLEMENT_SUBSCRIPTION
+
+        return ENTITLEMENT_CREDITS if (user.analyses_left or 0) > 0 else None
+
+    def reserve(self, user):
+        """
+        Varaa käyttäjälle yhden analyysin. Ylläpitäjiltä ja kuukausijäsenyyden
+        haltijoilta ei vähennetä analyysejä.
+
+        Args:
+            user (User): Käyttäjä
+
+        Returns:
+            str: Varauksen peruste ('admin', 'subscription' tai 'credits'),
+                tai None jos käyttäjällä ei ole analyysejä jäljellä
+        """
+        entitlement = self.entitlement(user)
+        if entitlement != ENTITLEMENT_CREDITS:
+            return entitlement
+
+        # Tunniste otetaan talteen, koska commit vanhentaa käyttäjäolion tiedot
+        user_id = user.id
+        analyses_left = self._take(user_id)
+        if analyses_left is None:
+            # Toinen samanaikainen pyyntö ehti käyttää viimeisen analyysin
+            logger.info(f"Käyttäjällä {user_id} ei ole analyysejä jäljellä varaushetkellä")
+            if has_request_context():
+                g.quota_entitlements[user_id] = None
+            return None
+
+        logger.info(f"Varattiin analyysi käyttäjälle {user_id}, analyysejä jäljellä: {analyses_left}")
+        return entitlement
+
+    def refund(self, user_id, reservation):
+        """
+        Palauttaa varatun analyysin käyttäjälle
+
+        Args:
+            user_id (int): Käyttäjän ID
+            reservation (str): reserve-metodin palauttama varauksen peruste
+
+        Returns:
+            bool: True jos analyysi palautettiin
+        """
+        if reservation != ENTITLEMENT_CREDITS:
+            return False
+
+        db.session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(analyses_left=User.analyses_left + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        entitlement_cache.invalidate(user_id)
+        logger.info(f"Palautettiin varattu analyysi käyttäjälle {user_id}")
+        return True
+
+    def _take(self, user_id):
+        """
+        Vähentää yhden analyysin, jos niitä on jäljellä
+
+        Returns:
+            int: Jäljellä olevien analyysien määrä vähennyksen jälkeen, tai None
+        """
+        result = db.session.execute(
+            update(User)
+            .where(User.id == user_id, User.analyses_left > 0)
+            .values(analyses_left=User.analyses_left - 1)
+            .returning(User.analyses_left)
+            .execution_options(synchronize_session=False)
+        )
+        analyses_left = result.scalar_one_or_none()
+        db.session.commit()
+        if analyses_left is not None:
+            # Suora päivitys ei kulje istunnon muutosseurannan kautta
+            entitlement_cache.invalidate(user_id)
+        return analyses_left
+
+
+# Luodaan singleton-instanssi
+quota_service = QuotaService()
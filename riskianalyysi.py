@@ -1,10 +1,12 @@
-from openai import OpenAI
 import os
 import json
 import logging
 from models import db, Analysis, RiskAnalysis, Kohde
 from flask import current_app
 from flask_login import current_user
+from llm_cache import llm_cache
+from llm_gateway import llm_gateway
+from prompt_registry import prompt_registry, build_input
 
 # Asetetaan lokitus
 logging.basicConfig(
@@ -28,11 +30,163 @@ except Exception as e:
     print(f"Varoitus: Lokitiedostoa ei voitu avata: {e}")
     # Jatketaan ilman tiedostolokitusta
 
-api_key = os.environ.get("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
+# Riskianalyysin malli
+RISK_MODEL = "gpt-4.1-mini"
+
+# Riskianalyysin rakenne JSON-skeemana yhdistetyn analyysin strukturoitua vastausta varten
+RISK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "kokonaisriskitaso": {"type": "number"},
+        "riskimittari": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "osa_alue": {"type": "string"},
+                    "riski_taso": {"type": "number"},
+                    "osuus_prosenttia": {"type": "number"},
+                    "kuvaus": {"type": "string"}
+                },
+                "required": ["osa_alue", "riski_taso", "osuus_prosenttia", "kuvaus"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["kokonaisriskitaso", "riskimittari"],
+    "additionalProperties": False
+}
+
+
+def save_risk_analysis(json_data, analysis_id=None, user_id=None, request_id=None, session_id=None):
+    """
+    Korjaa riskianalyysin rakenteen, lisää metatiedot ja tallentaa sen tietokantaan
+    sekä päivittää kohteen riskitason.
+
+    Args:
+        json_data (dict): Mallin palauttama riskianalyysi
+        analysis_id (int, optional): Analysis-taulun ID, johon riskianalyysi liitetään
+        user_id (int, optional): Käyttäjän ID
+        request_id (str, optional): Pyynnön tunniste metatietoihin
+        session_id (str, optional): Session tunniste metatietoihin
+
+    Returns:
+        str: JSON-muotoinen riskianalyysi
+    """
+    # Validoidaan vastauksen rakenne
+    if "kokonaisriskitaso" not in json_data:
+        logger.warning("Kokonaisriskitaso puuttuu vastauksesta, lisätään oletusarvo")
+        json_data["kokonaisriskitaso"] = 5.0
+    else:
+        # Pyöristetään kokonaisriskitaso 1 desimaalin tarkkuuteen
+        alkuperainen = json_data["kokonaisriskitaso"]
+        json_data["kokonaisriskitaso"] = round(float(json_data["kokonaisriskitaso"]), 1)
+        logger.info(f"Kokonaisriskitaso: {alkuperainen} -> {json_data['kokonaisriskitaso']}")
+        
+    if "riskimittari" not in json_data or not isinstance(json_data["riskimittari"], list):
+        logger.warning("Riskimittari puuttuu tai ei ole listana, korjataan")
+        json_data["riskimittari"] = [
+            {
+                "osa_alue": "Kokonaisriski",
+                "riski_taso": json_data.get("kokonaisriskitaso", 5.0),
+                "osuus_prosenttia": 100,
+                "kuvaus": "Arvioitu kokonaisriski kohteelle."
+            }
+        ]
+        
+    # Varmistetaan että jokaisella riskimittarin elementillä on kaikki tarvittavat kentät
+    for i, riski in enumerate(json_data["riskimittari"]):
+        if "osa_alue" not in riski:
+            riski["osa_alue"] = f"Riski {i+1}"
+        if "riski_taso" not in riski:
+            riski["riski_taso"] = 5
+        if "osuus_prosenttia" not in riski:
+            # Lasketaan tasainen osuus jokaiselle riskille
+            riski["osuus_prosenttia"] = round(100 / len(json_data["riskimittari"]))
+        if "kuvaus" not in riski:
+            riski["kuvaus"] = f"Riskitaso kategorialle {riski['osa_alue']}"
+    
+    # Lisätään metadata tunnistusta varten
+    import datetime
+    json_data["meta"] = {
+        "user_id": user_id,
+        "analysis_id": analysis_id,
+        "session_id": session_id,
+        "request_id": request_id,
+        "timestamp": str(datetime.datetime.now())
+    }
+    
+    # Muodostetaan JSON-muotoinen tulos
+    json_result = json.dumps(json_data, ensure_ascii=False)
+    
+    # Jos analysis_id on annettu, tallennetaan riskianalyysi tietokantaan
+    if analysis_id:
+        # Käytämme paikallista tietokantatransaktiohallintaa
+        # Tehdään jokaiselle käsittelyvaiheelle oma yritys ja virheenhallinta
+        
+        # 1. Tarkistetaan olemassa oleva riskianalyysi
+        existing_risk = None
+        
+        try:
+            # Jos käyttäjä ID on tiedossa, etsitään sekä analysis_id että user_id perusteella
+            if user_id:
+                existing_risk = RiskAnalysis.query.filter_by(
+                    analysis_id=analysis_id,
+                    user_id=user_id
+                ).first()
+            else:
+                # Muuten etsitään vain analysis_id:n perusteella
+                existing_risk = RiskAnalysis.query.filter_by(
+                    analysis_id=analysis_id
+                ).first()
+                
+            logger.info(f"Olemassa oleva riskianalyysi haettu: {existing_risk.id if existing_risk else 'ei löytynyt'}")
+        except Exception as query_err:
+            logger.error(f"Virhe haettaessa olemassa olevaa riskianalyysiä: {query_err}")
+        
+        # 2. Päivitetään olemassa oleva tai luodaan uusi riskianalyysi
+        try:
+            if existing_risk:
+                # Päivitetään olemassa olevaa riskianalyysiä, tärkeää lisätä user_id jos puuttuu
+                existing_risk.risk_data = json_result
+                if user_id and not existing_risk.user_id:
+                    existing_risk.user_id = user_id
+                    
+                db.session.commit()
+                logger.info(f"Päivitettiin riskianalyysi {existing_risk.id} analyysille {analysis_id}, käyttäjälle {user_id}")
+            else:
+                # Luodaan uusi riskianalyysi
+                new_risk = RiskAnalysis(
+                    analysis_id=analysis_id,
+                    risk_data=json_result,
+                    user_id=user_id
+                )
+                db.session.add(new_risk)
+                db.session.commit()
+                logger.info(f"Luotiin uusi riskianalyysi analyysille {analysis_id}, käyttäjälle {user_id}")
+        except Exception as db_error:
+            db.session.rollback()
+            logger.error(f"Virhe tallennettaessa riskianalyysiä tietokantaan: {db_error}")
+        
+        # 3. Päivitetään kohteen riskitaso erillisessä transaktioissa
+        try:
+            kohde = Kohde.query.filter_by(analysis_id=analysis_id).first()
+            if kohde:
+                try:
+                    kohde.risk_level = json_data["kokonaisriskitaso"]
+                    db.session.commit()
+                    logger.info(f"Päivitettiin kohteen {kohde.id} riskitaso: {kohde.risk_level}")
+                except Exception as kohde_save_err:
+                    db.session.rollback()
+                    logger.error(f"Virhe tallennettaessa kohteen riskitasoa: {kohde_save_err}")
+        except Exception as kohde_err:
+            logger.error(f"Virhe haettaessa kohdetta analyysille {analysis_id}: {kohde_err}")
+    
+    # Palautetaan korjattu JSON-teksti
+    return json_result
 
 
-def riskianalyysi(kohde_teksti, analysis_id=None, user_id=None):
+def riskianalyysi(kohde_teksti, analysis_id=None, user_id=None, use_cache=None):
     """
     Analysoi asuntokohteen riskitason OpenAI API:n avulla ja tallentaa tuloksen tietokantaan.
     
@@ -40,6 +194,7 @@ def riskianalyysi(kohde_teksti, analysis_id=None, user_id=None):
     kohde_teksti (str): API-kutsussa tuotettu analyysi kohteesta
     analysis_id (int, optional): Analysis-taulun ID, johon riskianalyysi liitetään
     user_id (int, optional): Käyttäjän ID, jolle riskianalyysi tehdään
+    use_cache (bool, optional): Käytetäänkö LLM-välimuistia, oletuksena käyttäjän tuotetason mukaan
     
     Returns:
     str: JSON-muotoinen analyysi riskeistä
@@ -95,56 +250,10 @@ def riskianalyysi(kohde_teksti, analysis_id=None, user_id=None):
     except Exception as e:
         logger.error(f"Virhe kohteen tyypin tarkistuksessa: {e}")
     
-    # Valitaan promptin tiedosto kohteen tyypin mukaan
-    prompt_tiedosto = "prompt_riski_okt.txt" if on_omakotitalo else "prompt_riski_kt.txt"
-    logger.info(f"Käytetään riskianalyysi-promptia: {prompt_tiedosto}")
-    
-    try:
-        # Lataa promptin tiedostosta
-        with open(prompt_tiedosto, "r", encoding="utf-8") as tiedosto:
-            prompt = tiedosto.read()
-    except Exception as e:
-        logger.error(f"Virhe promptin lukemisessa tiedostosta {prompt_tiedosto}: {e}")
-        # Käytetään oletuspromptia jos tiedoston lukeminen epäonnistuu
-        prompt_tiedosto = "prompt_riski_kt.txt"  # Käytetään oletuksena kerrostalopromptia
-        logger.warning(f"Yritetään lukea oletuspromptia: {prompt_tiedosto}")
-        
-        try:
-            with open(prompt_tiedosto, "r", encoding="utf-8") as tiedosto:
-                prompt = tiedosto.read()
-        except Exception as e:
-            logger.error(f"Virhe oletuspromptinkin lukemisessa: {e}")
-            # Jos mikään ei toimi, käytetään kovakoodattua promptia
-            prompt = """Olet koknut kiinteistöanalyytikko, joka arvioi asuntokohteiden riskejä ostajille. Sinun tehtäväsi on analysoida annettu kohdeanalyysi ja luoda siitä riskianalyysi.
-
-Arvioi kohteen riskitaso analysoimalla oheinen kohteen analyysi. Käytä riskitasoasteikkoa 1-10, jossa 1 on erittäin matala riski ja 10 on erittäin korkea riski.
-
-Analyysi on jaettava eri riskiosa-alueisiin. Arvioi jokaiselle osa-alueelle oma riskitasonsa. Osa-alueet ovat:
-1. Sijainti ja alue: Alueen arvonkehitys, maineriski, alueen sosioekonominen status
-2. Talous ja rahoitus: Hinnoittelu, arvonkehitys, sijoituksen kannattavuus
-3. Kohteen kunto: Rakenteelliset riskit, korjaustarpeet, tekniset järjestelmät
-4. Juridiikka: Omistusmuoto, rasitteet, kaavoitus, käyttörajoitukset
-5. Taloyhtiö: Jos kyseessä on kerros- tai rivitalo, arvioi taloyhtiön talous, korjausvelka ja hallinnointi
-
-Anna lopuksi kokonaisriskitaso, joka on painotettu keskiarvo osa-alueiden riskeistä.
-
-Vastaa JSON-muodossa:
-{
-  "kokonaisriskitaso": numero välillä 1-10,
-  "riskimittari": [
-    {
-      "osa_alue": "Sijainti ja alue",
-      "riski_taso": numero välillä 1-10,
-      "osuus_prosenttia": numero välillä 1-100,
-      "kuvaus": "Lyhyt kuvaus riskistä"
-    },
-    ...seuraaville osa-alueille
-  ]
-}
-
-Varmista että riskimittarin osa-alueiden osuus_prosenttia-arvojen summa on tasan 100%.
-"""
-            logger.warning("Käytetään kovakoodattua oletuspromptia.")
+    # Valitaan prompt kohteen tyypin mukaan muistissa olevista prompteista
+    prompt_obj = prompt_registry.risk_prompt("omakotitalo" if on_omakotitalo else None)
+    prompt = prompt_obj.text
+    logger.info(f"Käytetään riskianalyysi-promptia: {prompt_obj.label}")
 
     try:
         logger.info(f"Tehdään riskianalyysi käyttäjälle {effective_user_id}, analyysille {analysis_id}, pyyntö {request_id}")
@@ -153,36 +262,18 @@ Varmista että riskimittarin osa-alueiden osuus_prosenttia-arvojen summa on tasa
         session_id = str(uuid.uuid4())
         logger.info(f"Riskianalyysin session ID: {session_id}")
         
-        # Kokeillaan 3 kertaa, jos OpenAI API epäonnistuu
-        max_retries = 3
-        retry_count = 0
-        last_error = None
+        # Identtiselle analyysitekstille ja promptille käytetään aiempaa vastausta
+        if use_cache is None:
+            use_cache = llm_cache.allowed_for_user(effective_user_id)
+        json_text = llm_cache.get(RISK_MODEL, prompt, kohde_teksti) if use_cache else None
+        from_cache = json_text is not None
         
-        while retry_count < max_retries:
+        # Uudelleenyritykset ja nopeusrajoitukset hoitaa llm_gateway
+        if json_text is None:
             try:
-                response = client.responses.create(
-                    model="gpt-4.1-mini",
-                    input=[
-                        {
-                        "role": "system",
-                        "content": [
-                            {
-                            "type": "input_text",
-                            "text": prompt
-
-                            }
-                        ]
-                        },
-                        {
-                        "role": "user",
-                        "content": [
-                            {
-                            "type": "input_text",
-                            "text": kohde_teksti,
-                            }
-                        ]
-                        }
-                    ],
+                response = llm_gateway.create(
+                    model=RISK_MODEL,
+                    input=build_input(prompt_obj, kohde_teksti),
                     text={
                         "format": {
                         "type": "json_object"
@@ -195,164 +286,43 @@ Varmista että riskimittarin osa-alueiden osuus_prosenttia-arvojen summa on tasa
                     top_p=0.9,
                     store=True
                 )
-                
-                # Onnistui, jatketaan käsittelyä
-                break
+                json_text = response.output_text
                 
             except Exception as api_error:
-                retry_count += 1
-                last_error = api_error
-                wait_time = 2 ** retry_count  # Eksponentiaalinen viive
-                logger.warning(f"OpenAI API-virhe riskianalyysissa (yritys {retry_count}/{max_retries}): {api_error}")
-                logger.info(f"Odotetaan {wait_time}s ennen uudelleenyritystä")
-                
-                if retry_count >= max_retries:
-                    logger.error(f"OpenAI API-virhe riskianalyysissa, kaikki yritykset epäonnistuivat: {last_error}")
-                    # Luodaan virhevastaus
-                    import datetime
-                    default_json = {
-                        "kokonaisriskitaso": 5.0,
-                        "riskimittari": [
-                            {
-                                "osa_alue": "Kokonaisriski",
-                                "riski_taso": 5.0,
-                                "osuus_prosenttia": 100,
-                                "kuvaus": "OpenAI API-virhe: riskitasoa ei voitu määrittää. Tämä on oletusarvio."
-                            }
-                        ],
-                        "meta": {
-                            "user_id": effective_user_id,
-                            "analysis_id": analysis_id,
-                            "error": str(last_error),
-                            "request_id": request_id,
-                            "timestamp": str(datetime.datetime.now())
+                logger.error(f"OpenAI API-virhe riskianalyysissa, kaikki yritykset epäonnistuivat: {api_error}")
+                # Luodaan virhevastaus
+                import datetime
+                default_json = {
+                    "kokonaisriskitaso": 5.0,
+                    "riskimittari": [
+                        {
+                            "osa_alue": "Kokonaisriski",
+                            "riski_taso": 5.0,
+                            "osuus_prosenttia": 100,
+                            "kuvaus": "OpenAI API-virhe: riskitasoa ei voitu määrittää. Tämä on oletusarvio."
                         }
+                    ],
+                    "meta": {
+                        "user_id": effective_user_id,
+                        "analysis_id": analysis_id,
+                        "error": str(api_error),
+                        "request_id": request_id,
+                        "timestamp": str(datetime.datetime.now())
                     }
-                    return json.dumps(default_json, ensure_ascii=False)
-                
-                # Odota ennen uudelleenyritystä
-                import time
-                time.sleep(wait_time)
+                }
+                return json.dumps(default_json, ensure_ascii=False)
         
         # Tarkistetaan saatu vastaus
-        json_text = response.output_text
         logger.info(f"Saatu riskianalyysi sessionille {session_id}, pyyntö {request_id}: {json_text[:100]}...")
         
         # Varmistetaan että vastaus on validia JSON
         try:
             json_data = json.loads(json_text)
+            if use_cache and not from_cache:
+                llm_cache.set(RISK_MODEL, prompt, kohde_teksti, json_text, prompt_name=prompt_obj.label)
             
-            # Validoidaan vastauksen rakenne
-            if "kokonaisriskitaso" not in json_data:
-                logger.warning("Kokonaisriskitaso puuttuu vastauksesta, lisätään oletusarvo")
-                json_data["kokonaisriskitaso"] = 5.0
-            else:
-                # Pyöristetään kokonaisriskitaso 1 desimaalin tarkkuuteen
-                alkuperainen = json_data["kokonaisriskitaso"]
-                json_data["kokonaisriskitaso"] = round(float(json_data["kokonaisriskitaso"]), 1)
-                logger.info(f"Kokonaisriskitaso: {alkuperainen} -> {json_data['kokonaisriskitaso']}")
-                
-            if "riskimittari" not in json_data or not isinstance(json_data["riskimittari"], list):
-                logger.warning("Riskimittari puuttuu tai ei ole listana, korjataan")
-                json_data["riskimittari"] = [
-                    {
-                        "osa_alue": "Kokonaisriski",
-                        "riski_taso": json_data.get("kokonaisriskitaso", 5.0),
-                        "osuus_prosenttia": 100,
-                        "kuvaus": "Arvioitu kokonaisriski kohteelle."
-                    }
-                ]
-                
-            # Varmistetaan että jokaisella riskimittarin elementillä on kaikki tarvittavat kentät
-            for i, riski in enumerate(json_data["riskimittari"]):
-                if "osa_alue" not in riski:
-                    riski["osa_alue"] = f"Riski {i+1}"
-                if "riski_taso" not in riski:
-                    riski["riski_taso"] = 5
-                if "osuus_prosenttia" not in riski:
-                    # Lasketaan tasainen osuus jokaiselle riskille
-                    riski["osuus_prosenttia"] = round(100 / len(json_data["riskimittari"]))
-                if "kuvaus" not in riski:
-                    riski["kuvaus"] = f"Riskitaso kategorialle {riski['osa_alue']}"
-            
-            # Lisätään metadata tunnistusta varten
-            import datetime
-            json_data["meta"] = {
-                "user_id": effective_user_id,
-                "analysis_id": analysis_id,
-                "session_id": session_id,
-                "request_id": request_id,
-                "timestamp": str(datetime.datetime.now())
-            }
-            
-            # Muodostetaan JSON-muotoinen tulos
-            json_result = json.dumps(json_data, ensure_ascii=False)
-            
-            # Jos analysis_id on annettu, tallennetaan riskianalyysi tietokantaan
-            if analysis_id:
-                # Käytämme paikallista tietokantatransaktiohallintaa
-                # Tehdään jokaiselle käsittelyvaiheelle oma yritys ja virheenhallinta
-                
-                # 1. Tarkistetaan olemassa oleva riskianalyysi
-                existing_risk = None
-                
-                try:
-                    # Jos käyttäjä ID on tiedossa, etsitään sekä analysis_id että user_id perusteella
-                    if effective_user_id:
-                        existing_risk = RiskAnalysis.query.filter_by(
-                            analysis_id=analysis_id,
-                            user_id=effective_user_id
-                        ).first()
-                    else:
-                        # Muuten etsitään vain analysis_id:n perusteella
-                        existing_risk = RiskAnalysis.query.filter_by(
-                            analysis_id=analysis_id
-                        ).first()
-                        
-                    logger.info(f"Olemassa oleva riskianalyysi haettu: {existing_risk.id if existing_risk else 'ei löytynyt'}")
-                except Exception as query_err:
-                    logger.error(f"Virhe haettaessa olemassa olevaa riskianalyysiä: {query_err}")
-                
-                # 2. Päivitetään olemassa oleva tai luodaan uusi riskianalyysi
-                try:
-                    if existing_risk:
-                        # Päivitetään olemassa olevaa riskianalyysiä, tärkeää lisätä user_id jos puuttuu
-                        existing_risk.risk_data = json_result
-                        if effective_user_id and not existing_risk.user_id:
-                            existing_risk.user_id = effective_user_id
-                            
-                        db.session.commit()
-                        logger.info(f"Päivitettiin riskianalyysi {existing_risk.id} analyysille {analysis_id}, käyttäjälle {effective_user_id}")
-                    else:
-                        # Luodaan uusi riskianalyysi
-                        new_risk = RiskAnalysis(
-                            analysis_id=analysis_id,
-                            risk_data=json_result,
-                            user_id=effective_user_id
-                        )
-                        db.session.add(new_risk)
-                        db.session.commit()
-                        logger.info(f"Luotiin uusi riskianalyysi analyysille {analysis_id}, käyttäjälle {effective_user_id}")
-                except Exception as db_error:
-                    db.session.rollback()
-                    logger.error(f"Virhe tallennettaessa riskianalyysiä tietokantaan: {db_error}")
-                
-                # 3. Päivitetään kohteen riskitaso erillisessä transaktioissa
-                try:
-                    kohde = Kohde.query.filter_by(analysis_id=analysis_id).first()
-                    if kohde:
-                        try:
-                            kohde.risk_level = json_data["kokonaisriskitaso"]
-                            db.session.commit()
-                            logger.info(f"Päivitettiin kohteen {kohde.id} riskitaso: {kohde.risk_level}")
-                        except Exception as kohde_save_err:
-                            db.session.rollback()
-                            logger.error(f"Virhe tallennettaessa kohteen riskitasoa: {kohde_save_err}")
-                except Exception as kohde_err:
-                    logger.error(f"Virhe haettaessa kohdetta analyysille {analysis_id}: {kohde_err}")
-            
-            # Palautetaan korjattu JSON-teksti
-            return json_result
+            return save_risk_analysis(json_data, analysis_id, effective_user_id,
+                                      request_id=request_id, session_id=session_id)
             
         except json.JSONDecodeError as e:
             logger.error(f"Vastaus ei ole validia JSON: {e}")
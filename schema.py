@@ -0,0 +1,161 @@
+"""
+Tietokannan taulujen luonti ja rakenteen päivitys.
+
+Aiemmin app.py suoritti nämä tarkistukset jokaisen gunicorn-workerin käynnistyessä
+(taulujen listaus, sarakkeiden tarkistus ja tarvittavat ALTER-lauseet). SCHEMA_MANAGEMENT
+valitsee, milloin tarkistukset tehdään:
+
+- 'startup' (oletus): ensure_schema kutsutaan sovelluksen latauksessa kuten ennenkin.
+- 'manual': web-workerit eivät tutki tietokannan rakennetta lainkaan, vaan rakenne
+  päivitetään erillisenä vaiheena ennen käynnistystä:
+
+    python schema.py
+
+Skripti ei lataa app.py:tä, joten se ei käynnistä taustasäikeitä eikä avaa selainta.
+"""
+
+import sys
+import logging
+
+import sqlalchemy
+from flask import Flask
+from sqlalchemy import text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_STARTUP = 'startup'
+SCHEMA_MANUAL = 'manual'
+
+
+def _execute(statement):
+    """Suorittaa rakennetta muuttavan lauseen omassa transaktiossaan"""
+    with db.engine.connect() as conn:
+        with conn.begin():
+            conn.execute(text(statement))
+
+
+def _create_kohteet_table():
+    """Luo kohteet-taulun, jos sitä ei ole olemassa"""
+    logger.info("Kohteet-taulu puuttuu. Luodaan se...")
+    try:
+        # Luodaan taulu käyttäen create_all-funktiota, joka huomioi kaikki määritellyt mallit
+        db.create_all()
+        logger.info("Kohteet-taulu luotu onnistuneesti.")
+    except Exception as e:
+        logger.error(f"Virhe kohteet-taulun luomisessa SQLAlchemylla: {e}")
+
+        # Jos SQLAlchemy epäonnistuu, yritetään luoda taulu suoralla SQL-kyselyllä
+        try:
+            _execute("""
+            CREATE TABLE kohteet (
+                id SERIAL PRIMARY KEY,
+                osoite VARCHAR(255) NOT NULL,
+                tyyppi VARCHAR(50),
+                hinta NUMERIC,
+                rakennusvuosi INTEGER,
+                analysis_id INTEGER,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW(),
+                FOREIGN KEY (analysis_id) REFERENCES analyses (id) ON DELETE SET NULL
+            )
+            """)
+            logger.info("Kohteet-taulu luotu onnistuneesti suoralla SQL-kyselyllä!")
+        except Exception as e2:
+            logger.error(f"Virhe kohteet-taulun luomisessa suoralla SQL-kyselyllä: {e2}")
+
+
+def _upgrade_kohteet(columns):
+    """Päivittää kohteet-taulun vanhan rakenteen"""
+    # analysis_id-sarake ei saa olla ei-null-arvoinen
+    for column in columns:
+        if column['name'] == 'analysis_id' and not column.get('nullable', True):
+            logger.info("Päivitetään kohteet-taulun analysis_id-sarake nullable=True")
+            try:
+                _execute("ALTER TABLE kohteet ALTER COLUMN analysis_id DROP NOT NULL")
+                logger.info("Kohteet-taulun analysis_id-sarake päivitetty onnistuneesti!")
+            except Exception as e:
+                logger.error(f"Virhe kohteet-taulun päivityksessä: {e}")
+
+    if 'risk_level' not in [c['name'] for c in columns]:
+        logger.info("Lisätään risk_level-sarake kohteet-tauluun...")
+        try:
+            _execute("ALTER TABLE kohteet ADD COLUMN risk_level NUMERIC(3,1)")
+            logger.info("risk_level-sarake lisätty onnistuneesti!")
+        except Exception as e:
+            logger.error(f"Virhe risk_level-sarakkeen lisäämisessä: {e}")
+
+    if 'tiedostonimi' not in [c['name'] for c in columns]:
+        logger.info("Lisätään tiedostonimi-sarake kohteet-tauluun...")
+        try:
+            _execute("ALTER TABLE kohteet ADD COLUMN tiedostonimi VARCHAR(500)")
+            logger.info("tiedostonimi-sarake lisätty onnistuneesti!")
+        except Exception as e:
+            logger.error(f"Virhe tiedostonimi-sarakkeen lisäämisessä: {e}")
+
+
+def _upgrade_analysis_jobs(columns):
+    """Lisää analysis_jobs-tauluun striimattavan analyysin sarakkeen"""
+    if 'partial_analysis' not in [c['name'] for c in columns]:
+        logger.info("Lisätään partial_analysis-sarake analysis_jobs-tauluun...")
+        try:
+            _execute("ALTER TABLE analysis_jobs ADD COLUMN partial_analysis TEXT")
+            logger.info("partial_analysis-sarake lisätty onnistuneesti!")
+        except Exception as e:
+            logger.error(f"Virhe partial_analysis-sarakkeen lisäämisessä: {e}")
+
+
+def ensure_schema(app):
+    """
+    Luo puuttuvat taulut ja päivittää vanhojen taulujen rakenteen
+
+    Args:
+        app (Flask): Sovellus, jonka tietokantaa käsitellään
+    """
+    with app.app_context():
+        inspector = sqlalchemy.inspect(db.engine)
+        tables = inspector.get_table_names()
+        if not tables:
+            logger.info("Tietokanta on tyhjä. Luodaan taulut...")
+        else:
+            logger.info(f"Tietokanta sisältää jo taulut: {tables}")
+
+        # Aiemmin olemassa olleiden taulujen rakenne tarkistetaan ennen puuttuvien luontia
+        if 'kohteet' in tables:
+            _upgrade_kohteet(inspector.get_columns('kohteet'))
+        if 'analysis_jobs' in tables:
+            _upgrade_analysis_jobs(inspector.get_columns('analysis_jobs'))
+
+        db.create_all()
+
+        if 'kohteet' not in sqlalchemy.inspect(db.engine).get_table_names():
+            _create_kohteet_table()
+
+        logger.info("Tietokannan rakenne tarkistettu.")
+
+
+def main():
+    """Päivittää tietokannan rakenteen ilman web-sovelluksen käynnistystä"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        handlers=[
+            logging.StreamHandler(sys.stdout)
+        ]
+    )
+    from config import get_config
+
+    app = Flask(__name__)
+    app.config.from_object(get_config())
+    db.init_app(app)
+
+    try:
+        ensure_schema(app)
+    except Exception as e:
+        logger.error(f"Tietokannan rakenteen päivitys epäonnistui: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
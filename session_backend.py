@@ -0,0 +1,273 @@
+"""
+Istuntojen tallennustavan valinta.
+
+SESSION_BACKEND valitsee, mihin istunnot tallennetaan:
+
+- 'filesystem' (oletus): Flask-Session tallentaa istunnot tiedostoihin. Jokainen
+  pyyntö kirjoittaa istuntotiedoston, eikä istuntoja voi jakaa palvelinten kesken.
+- 'database': istunnot tallennetaan web_sessions-tauluun (PostgreSQL tuotannossa).
+  Muuttumatonta istuntoa ei kirjoiteta uudelleen jokaisessa pyynnössä, vaan sen
+  vanhenemisaikaa jatketaan enintään SESSION_REFRESH_INTERVAL sekunnin välein.
+  Vanhentuneet rivit poistetaan hakemistoa käyttäen erissä.
+- 'cookie': Flaskin allekirjoitettu eväste. Ei palvelinpuolen tallennusta lainkaan,
+  joten sopii vain pienille istunnoille (evästeen koko on rajattu noin 4 kt:hen).
+"""
+
+import time
+import secrets
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface
+from flask_session import Session
+from flask_session.sessions import ServerSideSession, SessionInterface
+from itsdangerous import BadSignature, want_bytes
+from sqlalchemy import select, update, delete, insert, bindparam
+
+from models import db, WebSession
+
+logger = logging.getLogger(__name__)
+
+# Lauseet muodostetaan kerran, jotta pyynnöissä käytetään SQLAlchemyn käännösvälimuistia
+SESSIONS = WebSession.__table__
+SELECT_SESSION = (select(SESSIONS.c.data, SESSIONS.c.expires_at)
+                  .where(SESSIONS.c.sid == bindparam('sid'), SESSIONS.c.expires_at > bindparam('now')))
+TOUCH_SESSION = (update(SESSIONS)
+                 .where(SESSIONS.c.sid == bindparam('session_id'))
+                 .values(expires_at=bindparam('expires_at')))
+DELETE_SESSION = delete(SESSIONS).where(SESSIONS.c.sid == bindparam('sid'))
+
+BACKEND_FILESYSTEM = 'filesystem'
+BACKEND_DATABASE = 'database'
+BACKEND_COOKIE = 'cookie'
+
+
+class DatabaseSession(ServerSideSession):
+    """Tietokantaan tallennettu istunto, joka muistaa tallennetun vanhenemisaikansa"""
+
+    def __init__(self, initial=None, sid=None, permanent=None, expires_at=None):
+        super().__init__(initial, sid=sid, permanent=permanent)
+        self.expires_at = expires_at
+
+
+def _is_empty(session):
+    """Istunto, jossa on vain pysyvyyden merkintä, on tyhjä eikä sitä tallenneta"""
+    return all(key == '_permanent' for key in session)
+
+
+class DatabaseSessionInterface(SessionInterface):
+    """
+    Tallentaa istunnot web_sessions-tauluun. Istunnon tunniste kulkee evästeessä
+    (allekirjoitettuna, jos SESSION_USE_SIGNER on päällä) ja sisältö tallennetaan
+    JSON-muodossa samalla sarjallistajalla kuin Flaskin evästeistunnoissa.
+    """
+
+    session_class = DatabaseSession
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, use_signer=False, permanent=True, refresh_interval=3600,
+                 cleanup_interval=300, cleanup_batch_size=1000):
+        self.use_signer = use_signer
+        self.permanent = permanent
+        self.refresh_interval = timedelta(seconds=refresh_interval)
+        self.cleanup_interval = cleanup_interval
+        self.cleanup_batch_size = cleanup_batch_size
+        self._last_cleanup = time.monotonic()
+        self._cleanup_lock = threading.Lock()
+        self._upsert_cache = None
+
+    def _generate_sid(self):
+        """Luo arvaamattoman istuntotunnisteen"""
+        return secrets.token_urlsafe(32)
+
+    def open_session(self, app, request):
+        """Lataa evästeen tunnistetta vastaavan voimassa olevan istunnon tai luo uuden"""
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and self.use_signer:
+            try:
+                sid = self._get_signer(app).unsign(sid).decode()
+            except BadSignature:
+                sid = None
+
+        if sid:
+            with db.engine.connect() as connection:
+                row = connection.execute(SELECT_SESSION, {'sid': sid, 'now': datetime.utcnow()}).first()
+            if row is not None:
+                try:
+                    return self.session_class(self.serializer.loads(row.data), sid=sid, expires_at=row.expires_at)
+                except ValueError:
+                    logger.warning("Istunnon tietoja ei voitu lukea, luodaan uusi istunto")
+
+        return self.session_class(sid=self._generate_sid(), permanent=self.permanent)
+
+    def save_session(self, app, session, response):
+        """Tallentaa muuttuneen istunnon ja asettaa evästeen"""
+        cookie_name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if _is_empty(session):
+            if session.modified and session.expires_at is not None:
+                self._delete(session.sid)
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+
+        # Palvelimella istunto vanhenee aina, myös kun eväste on selainistunnon pituinen
+        expires = self.get_expiration_time(app, session)
+        expires_at = expires.replace(tzinfo=None) if expires else datetime.utcnow() + app.permanent_session_lifetime
+
+        if session.modified or session.expires_at is None:
+            self._upsert(session.sid, self.serializer.dumps(dict(session)), expires_at)
+        elif expires_at - session.expires_at > self.refresh_interval:
+            self._touch(session.sid, expires_at)
+
+        self._maybe_cleanup()
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        session_id = session.sid
+        if self.use_signer:
+            session_id = self._get_signer(app).sign(want_bytes(session.sid)).decode()
+        response.set_cookie(
+            cookie_name, session_id,
+            expires=expires,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+    def cleanup(self, max_batches=None):
+        """
+        Poistaa vanhentuneet istunnot erissä, jotta yksittäinen poisto ei lukitse taulua pitkään
+
+        Args:
+            max_batches (int, optional): Erien enimmäismäärä; None poistaa kaikki vanhentuneet
+
+        Returns:
+            int: Poistettujen istuntojen määrä
+        """
+        removed = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            expired = (select(WebSession.sid)
+                       .where(WebSession.expires_at <= datetime.utcnow())
+                       .limit(self.cleanup_batch_size)
+                       .scalar_subquery())
+            with db.engine.begin() as connection:
+                count = connection.execute(delete(WebSession).where(WebSession.sid.in_(expired))).rowcount
+            removed += count
+            batches += 1
+            if count < self.cleanup_batch_size:
+                break
+
+        if removed:
+            logger.info(f"Poistettiin {removed} vanhentunutta istuntoa")
+        return removed
+
+    def _maybe_cleanup(self):
+        """Poistaa yhden erän vanhentuneita istuntoja enintään cleanup_interval sekunnin välein"""
+        if self.cleanup_interval <= 0 or time.monotonic() - self._last_cleanup < self.cleanup_interval:
+            return
+        # Vain yksi säie siivoaa kerrallaan, muut jatkavat odottamatta
+        if not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_cleanup = time.monotonic()
+            self.cleanup(max_batches=1)
+        except Exception as e:
+            logger.warning(f"Vanhentuneiden istuntojen poisto epäonnistui: {e}")
+        finally:
+            self._cleanup_lock.release()
+
+    def _upsert(self, sid, data, expires_at):
+        """Tallentaa istunnon yhdellä lauseella, jos tietokanta tukee ON CONFLICT -ehtoa"""
+        values = {'sid': sid, 'data': data, 'expires_at': expires_at}
+        statement = self._upsert_statement()
+
+        with db.engine.begin() as connection:
+            if statement is not None:
+                connection.execute(statement, values)
+                return
+            updated = connection.execute(
+                update(SESSIONS).where(SESSIONS.c.sid == sid).values(data=data, expires_at=expires_at)
+            ).rowcount
+            if not updated:
+                connection.execute(insert(SESSIONS), values)
+
+    def _upsert_statement(self):
+        """Muodostaa tietokannan murteen mukaisen INSERT ... ON CONFLICT -lauseen tai None"""
+        if self._upsert_cache is None:
+            dialect = db.engine.dialect.name
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            elif dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                dialect_insert = None
+
+            statement = None
+            if dialect_insert is not None:
+                statement = dialect_insert(SESSIONS)
+                statement = statement.on_conflict_do_update(
+                    index_elements=[SESSIONS.c.sid],
+                    set_={'data': statement.excluded.data, 'expires_at': statement.excluded.expires_at}
+                )
+            self._upsert_cache = (statement,)
+        return self._upsert_cache[0]
+
+    def _touch(self, sid, expires_at):
+        """Jatkaa muuttumattoman istunnon vanhenemisaikaa"""
+        with db.engine.begin() as connection:
+            connection.execute(TOUCH_SESSION, {'session_id': sid, 'expires_at': expires_at})
+
+    def _delete(self, sid):
+        """Poistaa istunnon"""
+        with db.engine.begin() as connection:
+            connection.execute(DELETE_SESSION, {'sid': sid})
+
+
+class PermanentCookieSessionInterface(SecureCookieSessionInterface):
+    """Flaskin allekirjoitettu evästeistunto, joka noudattaa SESSION_PERMANENT-asetusta kuten Flask-Session"""
+
+    def save_session(self, app, session, response):
+        # Tyhjälle istunnolle ei aseteta evästettä
+        if session and not session.permanent and app.config.get('SESSION_PERMANENT', True):
+            session.permanent = True
+        super().save_session(app, session, response)
+
+
+def init_session(app):
+    """
+    Ottaa käyttöön SESSION_BACKEND-asetuksen mukaisen istuntojen tallennustavan
+
+    Args:
+        app (Flask): Sovellus
+
+    Returns:
+        str: Käytössä oleva tallennustapa
+    """
+    backend = app.config.get('SESSION_BACKEND', BACKEND_FILESYSTEM)
+
+    if backend == BACKEND_DATABASE:
+        app.session_interface = DatabaseSessionInterface(
+            use_signer=app.config.get('SESSION_USE_SIGNER', False),
+            permanent=app.config.get('SESSION_PERMANENT', True),
+            refresh_interval=int(app.config.get('SESSION_REFRESH_INTERVAL', 3600)),
+            cleanup_interval=int(app.config.get('SESSION_CLEANUP_INTERVAL', 300)),
+            cleanup_batch_size=int(app.config.get('SESSION_CLEANUP_BATCH_SIZE', 1000))
+        )
+    elif backend == BACKEND_COOKIE:
+        app.session_interface = PermanentCookieSessionInterface()
+    else:
+        if backend != BACKEND_FILESYSTEM:
+            logger.warning(f"Tuntematon SESSION_BACKEND '{backend}', käytetään tiedostoja")
+            backend = BACKEND_FILESYSTEM
+        Session(app)
+
+    logger.info(f"Istunnot tallennetaan: {backend}")
+    return backend
@@ -0,0 +1,231 @@
+"""
+Samanaikaisten saman ilmoituksen analyysien yhdistäminen.
+
+Kun usea käyttäjä (tai sama käyttäjä tuplaklikkauksella) analysoi saman ilmoituksen
+yhtä aikaa, vaiheen suorittaa vain ensimmäinen kutsuja. Muut odottavat sen tulosta
+sen sijaan, että jokainen lataisi ilmoituksen ja tekisi LLM-kutsut erikseen.
+
+Lukot ja tulokset ovat single_flight_locks-taulussa, joten yhdistäminen toimii myös
+gunicorn-prosessien välillä. Lukko on voimassa lease_seconds ajan, ja suorittaja jatkaa
+sitä taustasäikeessä niin kauan kuin vaihe on käynnissä. Jos suorittaja kaatuu, jatkaminen
+loppuu ja lukko vanhenee, jolloin yksi odottajista ottaa vaiheen itselleen; samoin käy,
+jos vaihe epäonnistuu. Valmis tulos säilyy result_ttl sekuntia, jotta hetkeä myöhemmin
+saapuvat pyynnöt saavat sen suoraan.
+"""
+
+import json
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app, has_app_context
+from sqlalchemy import insert, select, update, delete, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, SingleFlightLock
+
+logger = logging.getLogger(__name__)
+
+# Lukon tilat
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class SingleFlight:
+    """
+    Tietokantapohjainen lukko, jolla saman avaimen samanaikaiset suoritukset yhdistetään
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.lease_seconds = 180
+        self.wait_timeout = 300
+        self.poll_interval = 0.5
+        self.result_ttl = 60
+        self._table = SingleFlightLock.__table__
+
+    def init_app(self, app):
+        """Lukee asetukset sovelluksen konfiguraatiosta"""
+        self.enabled = bool(app.config.get('SINGLE_FLIGHT_ENABLED', self.enabled))
+        self.lease_seconds = int(app.config.get('SINGLE_FLIGHT_LEASE_SECONDS', self.lease_seconds))
+        self.wait_timeout = int(app.config.get('SINGLE_FLIGHT_WAIT_TIMEOUT', self.wait_timeout))
+        self.poll_interval = float(app.config.get('SINGLE_FLIGHT_POLL_INTERVAL', self.poll_interval))
+        self.result_ttl = int(app.config.get('SINGLE_FLIGHT_RESULT_TTL', self.result_ttl))
+
+    def do(self, key, fn, succeeded=None, serialize=json.dumps, deserialize=json.loads):
+        """
+        Suorittaa funktion tai odottaa saman avaimen jo käynnissä olevan suorituksen tulosta
+
+        Args:
+            key (str): Vaiheen ja ilmoituksen yksilöivä avain, esim. 'fetch:oikotie:12345678'
+            fn (callable): Suoritettava funktio ilman argumentteja
+            succeeded (callable, optional): Saa tuloksen ja palauttaa False, jos tulosta ei
+                jaeta odottajille, vaan yksi niistä yrittää vaihetta uudelleen
+            serialize (callable, optional): Muuntaa tuloksen tallennettavaksi merkkijonoksi
+            deserialize (callable, optional): Muuntaa tallennetun merkkijonon tulokseksi
+
+        Returns:
+            Funktion tai toisen suorittajan tulos
+        """
+        if not self.enabled or not has_app_context():
+            return fn()
+
+        owner = str(uuid.uuid4())
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+
+        while True:
+            try:
+                state = self._acquire(key, owner)
+            except Exception as e:
+                logger.warning(f"Lukon käsittely epäonnistui avaimelle {key}, suoritetaan ilman yhdistämistä: {e}")
+                return fn()
+
+            if state is None:
+                return self._lead(key, owner, fn, succeeded, serialize)
+
+            status, result = state
+            if status == STATUS_DONE and result is not None:
+                logger.info(f"Vaiheen {key} tulos saatiin toiselta suoritukselta")
+                return deserialize(result)
+
+            if time.monotonic() >= deadline:
+                logger.warning(f"Vaiheen {key} tulosta odotettiin {self.wait_timeout} s, suoritetaan itse")
+                return fn()
+
+            if not waited:
+                logger.info(f"Vaihe {key} on jo käynnissä, odotetaan sen tulosta")
+                waited = True
+            time.sleep(self.poll_interval)
+
+    def _acquire(self, key, owner):
+        """
+        Yrittää varata avaimen
+
+        Returns:
+            tuple: (status, result) voimassa olevasta toisen lukosta tai None, jos avain varattiin
+        """
+        table = self._table
+        now = datetime.utcnow()
+        values = {
+            'owner': owner,
+            'status': STATUS_RUNNING,
+            'result': None,
+            'expires_at': now + timedelta(seconds=self.lease_seconds),
+            'updated_at': now
+        }
+
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(insert(table).values(key=key, created_at=now, **values))
+            return None
+        except IntegrityError:
+            pass
+
+        with db.engine.begin() as conn:
+            # Vanhentunut tai epäonnistunut lukko otetaan haltuun; vain yksi odottaja onnistuu
+            taken = conn.execute(
+                update(table)
+                .where(table.c.key == key)
+                .where(or_(table.c.expires_at < now, table.c.status == STATUS_FAILED))
+                .values(**values)
+            ).rowcount
+            if taken:
+                return None
+            row = conn.execute(select(table.c.status, table.c.result).where(table.c.key == key)).first()
+
+        # Lukko poistui välissä, yritetään seuraavalla kierroksella uudelleen
+        return tuple(row) if row else (STATUS_RUNNING, None)
+
+    def _lead(self, key, owner, fn, succeeded, serialize):
+        """Suorittaa vaiheen ja tallentaa tuloksen odottajille"""
+        try:
+            value = self._run_with_heartbeat(key, owner, fn)
+        except Exception:
+            self._finish(key, owner, STATUS_FAILED)
+            raise
+
+        if succeeded is not None and not succeeded(value):
+            self._finish(key, owner, STATUS_FAILED)
+            return value
+
+        try:
+            payload = serialize(value)
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Vaiheen {key} tulosta ei voitu tallentaa: {e}")
+            self._finish(key, owner, STATUS_FAILED)
+            return value
+
+        self._finish(key, owner, STATUS_DONE, payload)
+        return value
+
+    def _run_with_heartbeat(self, key, owner, fn):
+        """Suorittaa funktion ja jatkaa lukon voimassaoloa sen ajan, jotta odottajat eivät ota vaihetta itselleen"""
+        stop = threading.Event()
+        app = current_app._get_current_object()
+        interval = self.lease_seconds / 3
+
+        def renew():
+            with app.app_context():
+                while not stop.wait(interval):
+                    if not self._renew(key, owner):
+                        break
+
+        heartbeat = threading.Thread(target=renew, name=f"single-flight-{key}", daemon=True)
+        heartbeat.start()
+        try:
+            return fn()
+        finally:
+            stop.set()
+            heartbeat.join()
+
+    def _renew(self, key, owner):
+        """
+        Jatkaa oman käynnissä olevan lukon voimassaoloa
+
+        Returns:
+            bool: False, jos lukko ei ole enää tämän suorittajan hallussa
+        """
+        table = self._table
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                renewed = conn.execute(
+                    update(table)
+                    .where(table.c.key == key)
+                    .where(table.c.owner == owner)
+                    .where(table.c.status == STATUS_RUNNING)
+                    .values(expires_at=now + timedelta(seconds=self.lease_seconds), updated_at=now)
+                ).rowcount
+        except Exception as e:
+            # Yritetään uudelleen seuraavalla kierroksella
+            logger.warning(f"Vaiheen {key} lukon jatkaminen epäonnistui: {e}")
+            return True
+
+        if not renewed:
+            logger.warning(f"Vaiheen {key} lukko siirtyi toiselle suorittajalle")
+        return bool(renewed)
+
+    def _finish(self, key, owner, status, payload=None):
+        """Merkitsee oman lukon valmiiksi tai epäonnistuneeksi ja siivoaa vanhentuneet lukot"""
+        table = self._table
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.result_ttl) if status == STATUS_DONE else now
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    update(table)
+                    .where(table.c.key == key)
+                    .where(table.c.owner == owner)
+                    .values(status=status, result=payload, expires_at=expires_at, updated_at=now)
+                )
+                conn.execute(delete(table).where(table.c.expires_at < now - timedelta(seconds=self.lease_seconds)))
+        except Exception as e:
+            logger.warning(f"Vaiheen {key} lukon päivitys epäonnistui: {e}")
+
+
+# Luodaan singleton-instanssi
+single_flight = SingleFlight()
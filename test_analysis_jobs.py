@@ -0,0 +1,149 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from models import db, User, AnalysisJob
+from analysis_jobs import AnalysisJobQueue
+from analysis_pipeline import PipelineError
+from testutils import DatabaseTestCase
+
+
+class TestAnalysisJobQueue(DatabaseTestCase):
+
+    app_config = {'ANALYSIS_JOB_WORKERS': 0}
+
+    def setUp(self):
+        super().setUp()
+
+        user = User(email='testi@example.com', first_name='Testi', last_name='Käyttäjä',
+                    street_address='Testikatu 1', postal_code='00100', city='Helsinki',
+                    state='Uusimaa', country='Suomi',
+                    password='salasana')
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        self.queue = AnalysisJobQueue()
+        self.queue.init_app(self.app)
+
+    def test_enqueue_and_claim(self):
+        job = self.queue.enqueue(self.user_id, 'https://www.etuovi.com/kohde/12345')
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.source, 'etuovi')
+
+        # Työ voidaan varata vain kerran
+        self.assertEqual(self.queue._claim_next_job(), job.id)
+        self.assertIsNone(self.queue._claim_next_job())
+
+        job = AnalysisJob.query.get(job.id)
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.attempts, 1)
+
+    @patch('analysis_jobs.analysis_pipeline.charge_analysis')
+    @patch('analysis_jobs.analysis_pipeline.run_analysis_pipeline')
+    def test_execute_success(self, mock_run, mock_charge):
+        def fake_pipeline(url, user_id, progress=None, on_partial=None):
+            progress('fetch')
+            progress('analysis')
+            return {'analysis': 'Analyysi', 'source': 'oikotie'}
+        mock_run.side_effect = fake_pipeline
+
+        job = self.queue.enqueue(self.user_id, 'https://asunnot.oikotie.fi/myytavat-asunnot/helsinki/123')
+        self.queue._execute(self.queue._claim_next_job())
+
+        job = AnalysisJob.query.get(job.id)
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(json.loads(job.result_data)['analysis'], 'Analyysi')
+        self.assertIsNotNone(job.finished_at)
+        mock_charge.assert_called_once_with(self.user_id)
+
+    @patch('analysis_jobs.analysis_pipeline.charge_analysis')
+    @patch('analysis_jobs.analysis_pipeline.run_analysis_pipeline')
+    def test_partial_analysis_is_stored_while_streaming(self, mock_run, mock_charge):
+        stored = []
+
+        def fake_pipeline(url, user_id, progress=None, on_partial=None):
+            on_partial("```markdown\n### Sijainti")
+            # Toinen pala tulee tallennusvälin sisällä, joten sitä ei tallenneta
+            on_partial("```markdown\n### Sijainti\nRauhallinen")
+            stored.append(AnalysisJob.query.get(job.id).partial_analysis)
+            return {'analysis': '### Sijainti\nRauhallinen', 'source': 'etuovi'}
+        mock_run.side_effect = fake_pipeline
+
+        job = self.queue.enqueue(self.user_id, 'https://www.etuovi.com/kohde/12345')
+        self.queue._execute(self.queue._claim_next_job())
+
+        # Osittainen teksti sanitoidaan ja poistetaan, kun työ valmistuu
+        self.assertEqual(stored, ['### Sijainti'])
+        self.assertIsNone(AnalysisJob.query.get(job.id).partial_analysis)
+
+    def test_follow_yields_text_deltas(self):
+        job = self.queue.enqueue(self.user_id, 'https://www.etuovi.com/kohde/12345')
+        self.queue.stream_poll_interval = 0
+        events = self.queue.follow(job.id, user_id=self.user_id)
+
+        def update(**values):
+            AnalysisJob.query.filter_by(id=job.id).update(values)
+            db.session.commit()
+
+        self.assertEqual(next(events), {'type': 'status', 'status': 'queued', 'stage': None})
+        update(status='running', stage='analysis', partial_analysis='### Sijainti')
+        self.assertEqual(next(events), {'type': 'status', 'status': 'running', 'stage': 'analysis'})
+        self.assertEqual(next(events), {'type': 'delta', 'text': '### Sijainti'})
+        update(partial_analysis='### Sijainti\nRauhallinen')
+        self.assertEqual(next(events), {'type': 'delta', 'text': '\nRauhallinen'})
+
+        # Uusintayrityksessä teksti alkaa alusta
+        update(partial_analysis='### Alue')
+        self.assertEqual(next(events), {'type': 'reset', 'text': '### Alue'})
+
+        self.queue._finish(job.id, status='done', result_data=json.dumps({'analysis': 'Valmis'}))
+        self.assertEqual(next(events), {'type': 'status', 'status': 'done', 'stage': 'analysis'})
+        self.assertEqual(next(events), {'type': 'done', 'analysis_id': None, 'analysis': 'Valmis'})
+
+    def test_follow_resumes_from_offset_after_timeout(self):
+        job = self.queue.enqueue(self.user_id, 'https://www.etuovi.com/kohde/12345')
+        AnalysisJob.query.filter_by(id=job.id).update({'status': 'running', 'partial_analysis': '### Sijainti'})
+        db.session.commit()
+
+        # Yhteys suljetaan heti, ja timeout kertoo asiakkaan saaman tekstin pituuden
+        self.queue.stream_timeout = 0
+        events = list(self.queue.follow(job.id, user_id=self.user_id))
+        self.assertEqual(events[-1], {'type': 'timeout', 'offset': len('### Sijainti')})
+
+        AnalysisJob.query.filter_by(id=job.id).update({'partial_analysis': '### Sijainti\nRauhallinen'})
+        db.session.commit()
+        events = list(self.queue.follow(job.id, user_id=self.user_id, offset=len('### Sijainti')))
+        self.assertIn({'type': 'delta', 'text': '\nRauhallinen'}, events)
+
+    def test_concurrent_streams_are_capped(self):
+        self.queue.max_streams = 1
+        release = self.queue.acquire_stream()
+
+        self.assertIsNotNone(release)
+        self.assertIsNone(self.queue.acquire_stream())
+        # Vapautus on kertaluonteinen, joten kaksoiskutsu ei kasvata paikkojen määrää
+        release()
+        release()
+        second = self.queue.acquire_stream()
+        self.assertIsNotNone(second)
+        self.assertIsNone(self.queue.acquire_stream())
+        second()
+
+    @patch('analysis_jobs.analysis_pipeline.charge_analysis')
+    @patch('analysis_jobs.analysis_pipeline.run_analysis_pipeline')
+    def test_execute_failure_is_not_charged(self, mock_run, mock_charge):
+        mock_run.side_effect = PipelineError('Ilmoituksen hakemisessa tapahtui virhe.', 'fetch')
+
+        job = self.queue.enqueue(self.user_id, 'https://www.etuovi.com/kohde/12345')
+        self.queue._execute(self.queue._claim_next_job())
+
+        job = AnalysisJob.query.get(job.id)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.stage, 'fetch')
+        self.assertEqual(job.error_message, 'Ilmoituksen hakemisessa tapahtui virhe.')
+        mock_charge.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
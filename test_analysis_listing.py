@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+
+from models import db, User, Analysis, Kohde
+from analysis_listing import list_analyses_page
+from testutils import DatabaseTestCase
+
+
+class TestAnalysisListing(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        user = User(email='testi@example.com', first_name='Testi', last_name='Käyttäjä',
+                    street_address='Testikatu 1', postal_code='00100', city='Helsinki',
+                    state='Uusimaa', country='Suomi', password='salasana')
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+
+        # Osalla analyyseistä on sama luontiaika, jolloin järjestys ratkeaa ID:n mukaan
+        base = datetime(2025, 5, 1, 12, 0)
+        for i in range(7):
+            analysis = Analysis(filename=f'analyysi_{i}.txt', title=f'Analyysi {i}', content='x' * 1000,
+                                user_id=self.user_id, created_at=base + timedelta(minutes=i // 2))
+            db.session.add(analysis)
+            db.session.flush()
+            db.session.add(Kohde(osoite=f'Testikatu {i}', analysis_id=analysis.id, user_id=self.user_id, risk_level=4.5))
+        db.session.commit()
+        db.session.expunge_all()
+
+    def test_keyset_pages_cover_all_analyses_once(self):
+        expected = [a.id for a in Analysis.query.order_by(Analysis.created_at.desc(), Analysis.id.desc())]
+        db.session.expunge_all()
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = list_analyses_page(self.user_id, before=cursor, page_size=3)
+            seen.extend(a.id for a in page)
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, expected)
+
+    def test_page_loads_kohde_without_content_in_one_query(self):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            page, _ = list_analyses_page(self.user_id, page_size=5)
+            risk_levels = [float(a.kohde.risk_level) for a in page]
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        # Kohde ja riskitaso tulevat samasta kyselystä, eikä sisältöä ladata
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(risk_levels, [4.5] * 5)
+        self.assertTrue(all('content' in inspect(a).unloaded for a in page))
+
+    def test_search_matches_address(self):
+        page, cursor = list_analyses_page(self.user_id, search='Testikatu 3')
+        self.assertEqual([a.title for a in page], ['Analyysi 3'])
+        self.assertIsNone(cursor)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import threading
+import unittest
+from unittest.mock import patch, ANY
+
+import analysis_pipeline
+from llm_gateway import LLMCallCancelled
+
+
+class TestExtractAndAnalyze(unittest.TestCase):
+
+    def test_guess_property_type(self):
+        self.assertEqual(analysis_pipeline.guess_property_type("Talotyyppi: Omakotitalo\nHuoneita: 5"), 'omakotitalo')
+        self.assertEqual(analysis_pipeline.guess_property_type("Rakennuksen tyyppi Kerrostalo"), 'kerrostalo')
+        self.assertIsNone(analysis_pipeline.guess_property_type("Kaunis koti meren rannalla"))
+
+    @patch('analysis_pipeline.save_extracted_property')
+    @patch('analysis_pipeline.api_call.generate_analysis')
+    @patch('analysis_pipeline.info_extract.get_property_data')
+    def test_speculative_analysis_is_used_when_type_matches(self, mock_kat, mock_generate, mock_save):
+        mock_kat.return_value = '{"tyyppi": "kerrostalo"}'
+        mock_save.return_value = ({'tyyppi': 'kerrostalo'}, 1, 'kerrostalo')
+        mock_generate.return_value = ('Analyysi', True)
+
+        result = analysis_pipeline.extract_and_analyze("Talotyyppi: Kerrostalo", user_id=1)
+
+        # Analyysi tehdään vain kerran, koska ennakoitu tyyppi valitsi saman promptin
+        self.assertEqual(result, ({'tyyppi': 'kerrostalo'}, 1, 'kerrostalo', 'Analyysi', True, None))
+        mock_generate.assert_called_once_with("Talotyyppi: Kerrostalo", 'kerrostalo', use_cache=False,
+                                              on_partial=None, cancel=ANY)
+
+    @patch('analysis_pipeline.save_extracted_property')
+    @patch('analysis_pipeline.api_call.generate_analysis')
+    @patch('analysis_pipeline.info_extract.get_property_data')
+    def test_analysis_is_rerun_when_type_differs(self, mock_kat, mock_generate, mock_save):
+        mock_kat.return_value = '{"tyyppi": "omakotitalo"}'
+        mock_save.return_value = ({'tyyppi': 'omakotitalo'}, 2, 'omakotitalo')
+        mock_generate.side_effect = lambda markdown, tyyppi, use_cache=False, on_partial=None, cancel=None: (f"Analyysi ({tyyppi})", True)
+
+        result = analysis_pipeline.extract_and_analyze("Kaunis koti meren rannalla", user_id=1)
+
+        # Ennakoiva analyysi tehtiin kerrostalon promptilla, joten se hylätään
+        self.assertEqual(result[3], "Analyysi (omakotitalo)")
+        self.assertEqual(mock_generate.call_args_list[-1].args, ("Kaunis koti meren rannalla", 'omakotitalo'))
+
+    @patch('analysis_pipeline.save_extracted_property')
+    @patch('analysis_pipeline.api_call.generate_analysis')
+    @patch('analysis_pipeline.info_extract.get_property_data')
+    def test_rejected_speculative_analysis_stops_writing(self, mock_kat, mock_generate, mock_save):
+        streaming = threading.Event()
+        finished = threading.Event()
+        writes = []
+
+        def generate(markdown, tyyppi, use_cache=False, on_partial=None, cancel=None):
+            if tyyppi == 'kerrostalo':
+                # Ennakoiva analyysi striimaa, kunnes se perutaan, ja yrittää vielä kirjoittaa
+                on_partial('ennakoiva')
+                streaming.set()
+                cancel.wait(5)
+                on_partial('ennakoiva myöhässä')
+                finished.set()
+                raise LLMCallCancelled()
+            on_partial('oikea')
+            return 'Analyysi', True
+
+        mock_kat.side_effect = lambda markdown: streaming.wait(5) and '{"tyyppi": "omakotitalo"}'
+        mock_save.return_value = ({'tyyppi': 'omakotitalo'}, 2, 'omakotitalo')
+        mock_generate.side_effect = generate
+
+        result = analysis_pipeline.extract_and_analyze("Talotyyppi: Kerrostalo", user_id=1, on_partial=writes.append)
+        finished.wait(5)
+
+        self.assertEqual(result[3], 'Analyysi')
+        self.assertEqual(writes, ['ennakoiva', 'oikea'])
+
+
+if __name__ == '__main__':
+    unittest.main()
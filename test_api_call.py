@@ -0,0 +1,49 @@
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import api_call
+
+RISK_DATA = {
+    "kokonaisriskitaso": 4,
+    "riskimittari": [{"osa_alue": "Sijainti ja alue", "riski_taso": 4, "osuus_prosenttia": 100, "kuvaus": "Rauhallinen"}]
+}
+
+
+class TestCombinedAnalysis(unittest.TestCase):
+
+    @patch('api_call.llm_gateway')
+    def test_streamed_analysis_text_is_decoded_from_json(self, mock_gateway):
+        raw = json.dumps({"analyysi": "### Sijainti\n\"Hyvä\" alue – äö", "riskianalyysi": RISK_DATA}, ensure_ascii=False)
+        # Pilkotaan vastaus pieniksi paloiksi, jotta escape-jaksot jakautuvat palojen väliin
+        mock_gateway.stream.return_value = [
+            SimpleNamespace(type='response.output_text.delta', delta=raw[i:i + 3]) for i in range(0, len(raw), 3)
+        ]
+        partials = []
+
+        analysis, success, risk_data = api_call.generate_combined_analysis("Ilmoitus", on_partial=partials.append)
+
+        self.assertTrue(success)
+        self.assertEqual(analysis, '### Sijainti\n"Hyvä" alue – äö')
+        self.assertEqual(risk_data, RISK_DATA)
+        self.assertEqual(partials[-1], '### Sijainti\n"Hyvä" alue – äö')
+        self.assertTrue(all(analysis.startswith(partial) for partial in partials))
+        self.assertEqual(mock_gateway.stream.call_count, 1)
+
+    @patch('api_call.generate_analysis')
+    @patch('api_call.llm_gateway')
+    def test_unusable_response_falls_back_to_separate_analysis(self, mock_gateway, mock_generate):
+        # Katkennut vastaus ei ole validia JSONia, eikä yhdistettyä kutsua yritetä uudelleen
+        mock_gateway.create.return_value = MagicMock(output_text='{"analyysi": "Kesken')
+        mock_generate.return_value = ('Analyysi', True)
+
+        result = api_call.generate_combined_analysis("Ilmoitus", 'kerrostalo')
+
+        self.assertEqual(result, ('Analyysi', True, None))
+        self.assertEqual(mock_gateway.create.call_count, 1)
+        mock_generate.assert_called_once_with("Ilmoitus", 'kerrostalo', use_cache=False, on_partial=None, cancel=None)
+
+
+if __name__ == '__main__':
+    unittest.main()
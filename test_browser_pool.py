@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from browser_pool import BrowserPool
+
+
+def make_driver():
+    driver = MagicMock()
+    driver.execute_script.return_value = 1
+    driver.window_handles = ['main']
+    return driver
+
+
+class TestBrowserPool(unittest.TestCase):
+
+    @patch('etuovi_downloader.setup_driver')
+    def test_driver_is_reused(self, mock_setup):
+        mock_setup.side_effect = lambda headless=True: make_driver()
+        pool = BrowserPool(max_size=1, max_uses=5)
+
+        with pool.checkout('/tmp/a') as first:
+            pass
+        with pool.checkout('/tmp/b') as second:
+            pass
+
+        # Toinen lainaus saa saman lämpimän selaimen, lataushakemisto vaihtuu
+        self.assertIs(first, second)
+        self.assertEqual(mock_setup.call_count, 1)
+        second.execute_cdp_cmd.assert_called_with(
+            'Browser.setDownloadBehavior',
+            {'behavior': 'allow', 'downloadPath': '/tmp/b', 'eventsEnabled': False}
+        )
+
+    @patch('etuovi_downloader.setup_driver')
+    def test_driver_is_recycled_after_max_uses(self, mock_setup):
+        mock_setup.side_effect = lambda headless=True: make_driver()
+        pool = BrowserPool(max_size=1, max_uses=1)
+
+        with pool.checkout('/tmp/a') as first:
+            pass
+        with pool.checkout('/tmp/a') as second:
+            pass
+
+        self.assertIsNot(first, second)
+        first.quit.assert_called_once()
+
+    @patch('etuovi_downloader.setup_driver')
+    def test_crashed_driver_is_not_returned_to_pool(self, mock_setup):
+        crashed = make_driver()
+        mock_setup.side_effect = [crashed, make_driver()]
+        pool = BrowserPool(max_size=1)
+
+        with self.assertRaises(RuntimeError):
+            with pool.checkout('/tmp/a'):
+                crashed.execute_script.side_effect = Exception("chrome not reachable")
+                raise RuntimeError("lataus epäonnistui")
+
+        crashed.quit.assert_called_once()
+        self.assertEqual(pool.stats()['idle'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+
+from sqlalchemy import event
+
+from models import db, User, Subscription
+from entitlements import EntitlementCache, entitlement_cache
+from quota import QuotaService
+from testutils import DatabaseTestCase
+
+
+class TestEntitlementCache(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        user = User(email='testi@example.com', first_name='Testi', last_name='Käyttäjä',
+                    street_address='Testikatu 1', postal_code='00100', city='Helsinki',
+                    state='Uusimaa', country='Suomi', password='salasana')
+        user.analyses_left = 3
+        db.session.add(user)
+        db.session.commit()
+        self.user_id = user.id
+        db.session.remove()
+
+        # Muutosseuranta poistaa merkinnät singleton-instanssista
+        self.cache = entitlement_cache
+        self.cache.ttl = 60
+        self.cache.clear()
+
+    def tearDown(self):
+        self.cache.ttl = 0
+        self.cache.clear()
+        super().tearDown()
+
+    def count_queries(self, fn):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            # Oma sovelluskonteksti, jotta g ei jää talteen pyyntöjen välillä
+            with self.app.app_context(), self.app.test_request_context():
+                result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+            db.session.remove()
+        return len(statements), result
+
+    def load_entitlement(self):
+        user = self.cache.load_user(self.user_id)
+        return QuotaService().entitlement(user), user.email
+
+    def test_user_and_entitlement_in_one_query(self):
+        queries, result = self.count_queries(self.load_entitlement)
+        self.assertEqual(queries, 1)
+        self.assertEqual(result, ('credits', 'testi@example.com'))
+
+        # Toinen pyyntö saa käyttäjän prosessin välimuistista ilman kyselyä
+        queries, result = self.count_queries(self.load_entitlement)
+        self.assertEqual(queries, 0)
+        self.assertEqual(result, ('credits', 'testi@example.com'))
+
+    def test_cached_user_changes_are_saved(self):
+        self.count_queries(lambda: self.cache.load_user(self.user_id))
+
+        with self.app.app_context(), self.app.test_request_context():
+            user = self.cache.load_user(self.user_id)
+            user.add_analyses(2)
+        db.session.remove()
+
+        self.assertEqual(db.session.get(User, self.user_id).analyses_left, 5)
+
+    def test_new_subscription_invalidates_cache(self):
+        self.count_queries(self.load_entitlement)
+
+        db.session.add(Subscription(user_id=self.user_id, subscription_type='monthly', status='active'))
+        db.session.commit()
+        db.session.remove()
+
+        queries, result = self.count_queries(self.load_entitlement)
+        self.assertEqual(queries, 1)
+        self.assertEqual(result[0], 'subscription')
+
+    def test_disabled_cache_queries_every_request(self):
+        cache = EntitlementCache(ttl=0)
+        for _ in range(2):
+            queries, user = self.count_queries(lambda: cache.load_user(self.user_id))
+            self.assertEqual(queries, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
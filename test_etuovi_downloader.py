@@ -0,0 +1,125 @@
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from PyPDF2 import PdfWriter
+
+import etuovi_downloader
+
+
+def write_pdf(path):
+    writer = PdfWriter()
+    writer.add_blank_page(width=200, height=200)
+    with open(path, 'wb') as f:
+        writer.write(f)
+
+
+class TestDownloadWaits(unittest.TestCase):
+
+    def setUp(self):
+        self.download_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.download_dir, ignore_errors=True)
+
+    def test_wait_returns_valid_pdf(self):
+        path = os.path.join(self.download_dir, 'esite.pdf')
+        write_pdf(path)
+
+        document = etuovi_downloader._wait_for_download(self.download_dir, timeout=1)
+        self.assertEqual(document.name, path)
+        self.assertTrue(document.is_valid())
+
+    def test_pdf_to_text_from_bytes(self):
+        path = os.path.join(self.download_dir, 'esite.pdf')
+        write_pdf(path)
+        with open(path, 'rb') as f:
+            pdf_bytes = f.read()
+
+        # Tekstin poiminta ja validointi toimivat suoraan tavuista
+        self.assertTrue(etuovi_downloader.is_valid_pdf(pdf_bytes))
+        self.assertIn("--- Page 1 ---", etuovi_downloader.pdf_to_text(pdf_bytes))
+
+    def test_incomplete_download_is_ignored(self):
+        # Chrome kirjoittaa keskeneräisen latauksen .crdownload-tiedostoon
+        open(os.path.join(self.download_dir, 'esite.pdf.crdownload'), 'wb').close()
+
+        self.assertIsNone(etuovi_downloader._wait_for_download(self.download_dir, timeout=0.3, poll_interval=0.1))
+
+    def test_button_search_scrolls_until_button_appears(self):
+        button = MagicMock()
+        button.get_attribute.return_value = '<span>Tulosta PDF</span>'
+        button.text = 'TULOSTA PDF'
+        driver = MagicMock()
+        driver.find_elements.side_effect = lambda by, value: [button] if driver.execute_script.call_count else []
+
+        # Ensimmäisellä tarkistuksella painiketta ei ole, joten sivua skrollataan
+        self.assertFalse(etuovi_downloader._pdf_button_or_scroll(driver))
+        driver.execute_script.assert_called_once_with("window.scrollBy(0, 300);")
+        self.assertIs(etuovi_downloader._pdf_button_or_scroll(driver), button)
+
+
+
+BROCHURE_LINKS = re.compile(r'/(?:tulosta|esite)/', re.IGNORECASE)
+
+
+class TestHttpFastPath(unittest.TestCase):
+
+    @patch('etuovi_downloader.PDF_LINK_PATTERN', BROCHURE_LINKS)
+    def test_only_links_to_this_listing_brochure_are_candidates(self):
+        html = (
+            '<a href="/energiatodistus/todistus.pdf">Energiatodistus</a>'
+            '<a href="https://mainos.example.com/esite/kampanja.pdf">Mainos</a>'
+            '<a href="/esite/w677781.pdf">Toinen kohde</a>'
+            '<a href="/tulosta/w67778">Tulosta</a>'
+            '<a href="https://www.etuovi.com/esite/W67778.pdf">Esite</a>'
+        )
+
+        candidates = etuovi_downloader.resolve_printable_pdf_url('https://www.etuovi.com/kohde/w67778', html)
+
+        self.assertEqual(candidates, [
+            'https://www.etuovi.com/tulosta/w67778',
+            'https://www.etuovi.com/esite/W67778.pdf'
+        ])
+
+    @patch('etuovi_downloader.PDF_LINK_PATTERN', BROCHURE_LINKS)
+    @patch('etuovi_downloader.PdfDocument.is_valid', return_value=True)
+    @patch('etuovi_downloader.requests.Session')
+    def test_html_response_is_skipped_until_pdf_found(self, mock_session_cls, mock_valid):
+        listing = MagicMock(status_code=200, text='<a href="/liite/w1.pdf">x</a><a href="/tulosta/w1">y</a>'
+                                                  '<a href="/esite/w1.pdf">z</a>')
+        not_pdf = MagicMock(status_code=200, content=b'<html>Kirjaudu</html>')
+        pdf = MagicMock(status_code=200, content=b'%PDF-1.4 ...')
+        session = mock_session_cls.return_value.__enter__.return_value
+        session.get.side_effect = [listing, not_pdf, pdf]
+
+        document = etuovi_downloader.fetch_pdf_http('https://www.etuovi.com/kohde/w1')
+
+        # HTML-vastaus ohitetaan ja PDF palautetaan ilman selainta, muuta liitettä ei haeta
+        self.assertEqual(document.data, b'%PDF-1.4 ...')
+        self.assertEqual(session.get.call_args_list[0].kwargs['timeout'], etuovi_downloader.PAGE_PROBE_TIMEOUT)
+        self.assertEqual([c.args[0] for c in session.get.call_args_list[1:]],
+                         ['https://www.etuovi.com/tulosta/w1', 'https://www.etuovi.com/esite/w1.pdf'])
+
+    @patch('etuovi_downloader.PDF_LINK_PATTERN', None)
+    @patch('etuovi_downloader.requests.Session')
+    def test_no_request_without_template_or_link_pattern(self, mock_session_cls):
+        self.assertIsNone(etuovi_downloader.fetch_pdf_http('https://www.etuovi.com/kohde/w1'))
+        mock_session_cls.assert_not_called()
+
+    @patch('etuovi_downloader.PDF_LINK_PATTERN', None)
+    @patch('etuovi_downloader.PDF_URL_TEMPLATE', 'https://www.etuovi.com/tulosta/{listing_id}.pdf')
+    @patch('etuovi_downloader.requests.Session')
+    def test_template_is_tried_without_fetching_listing_page(self, mock_session_cls):
+        session = mock_session_cls.return_value.__enter__.return_value
+        session.get.return_value = MagicMock(status_code=404, content=b'')
+
+        self.assertIsNone(etuovi_downloader.fetch_pdf_http('https://www.etuovi.com/kohde/w1'))
+        self.assertEqual([c.args[0] for c in session.get.call_args_list], ['https://www.etuovi.com/tulosta/w1.pdf'])
+
+
+if __name__ == '__main__':
+    unittest.main()
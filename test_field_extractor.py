@@ -0,0 +1,45 @@
+import re
+import unittest
+
+from field_extractor import Field, FieldExtractor
+
+
+class TestFieldExtractor(unittest.TestCase):
+
+    def setUp(self):
+        self.fields = [
+            Field("kerros", r"Kerros\s+([^\n]+)"),
+            Field("kerrosala", r"Kerrosala\s+([0-9,\.]+)\s*m²"),
+            Field("sauna", r"Sauna\s+([^\n]+)"),
+            Field("saunan_varusteet", r"Saunan varusteet\s+([^\n]+)"),
+            Field("sähkönkulutus", r"Sähkön.*kulutus.*?([0-9\s]+)\s*kWh", re.IGNORECASE),
+            Field("puhelin", r"(?:Puh\.?|Puhelin)\s*[:\-]?\s+([0-9\s]+)", triggers=("Puh",)),
+        ]
+        self.extractor = FieldExtractor(self.fields)
+
+    def test_matches_per_field_search(self):
+        text = (
+            "Kerrosala 120 m²\nSaunan varusteet kiuas\nKerros 2/3\n"
+            "SÄHKÖN KOKONAISKULUTUS 12000 kWh\nSauna oma\nPuhelin 040 123\n"
+        )
+
+        result = self.extractor.extract(text)
+
+        # Tuloksen pitää vastata kenttäkohtaisia re.search-kutsuja
+        for field in self.fields:
+            expected = field.regex.search(text)
+            self.assertEqual(result[field.name].group(1), expected.group(1), field.name)
+
+    def test_missing_fields_are_none(self):
+        result = self.extractor.extract("Ei tunnettuja kenttiä")
+
+        self.assertEqual(list(result), [field.name for field in self.fields])
+        self.assertTrue(all(value is None for value in result.values()))
+
+    def test_field_without_literal_prefix_requires_triggers(self):
+        with self.assertRaises(ValueError):
+            Field("osoite", r"([A-Z][a-z]+\s\d+)")
+
+
+if __name__ == '__main__':
+    unittest.main()
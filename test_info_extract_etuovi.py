@@ -0,0 +1,135 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PyPDF2 import PdfWriter
+
+import info_extract_etuovi
+from models import Kohde
+from testutils import DatabaseTestCase
+
+
+class TestProcessAllPdfs(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for city, name in [("Espoo", "b.pdf"), ("Espoo", "a.pdf"), ("Turku", "c.pdf"), ("Turku", "rikki.pdf")]:
+            os.makedirs(os.path.join(self.folder, city), exist_ok=True)
+            path = os.path.join(self.folder, city, name)
+            if name == "rikki.pdf":
+                with open(path, "wb") as f:
+                    f.write(b"ei pdf")
+                continue
+            writer = PdfWriter()
+            writer.add_blank_page(width=200, height=200)
+            with open(path, "wb") as f:
+                writer.write(f)
+        self.output = os.path.join(self.folder, "tulos.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    @patch('info_extract_etuovi.save_property_data_batch', side_effect=lambda batch, *args: [1] * len(batch))
+    def test_parallel_results_match_sequential_order(self, mock_save):
+        expected = [task[0] for task in info_extract_etuovi._find_pdf_files(self.folder) if not task[0].endswith("rikki.pdf")]
+
+        count = info_extract_etuovi.process_all_pdfs(self.folder, self.output, workers=2)
+
+        # Viallinen tiedosto ohitetaan, muut tallennetaan tiedostojärjestyksessä
+        listings = info_extract_etuovi.read_jsonl(self.output)
+        self.assertEqual(count, 3)
+        self.assertEqual(
+            [os.path.join(self.folder, item["tiedostonimi"]) for item in listings],
+            expected
+        )
+        self.assertEqual(mock_save.call_count, 1)
+
+    @patch('info_extract_etuovi.save_property_data_batch', side_effect=lambda batch, *args: list(range(len(batch))))
+    def test_interrupted_run_resumes_from_checkpoint(self, mock_save):
+        # Edellinen ajo ehti tallentaa yhden erän ja jätti viimeisen rivin kesken
+        with open(self.output, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"tiedostonimi": os.path.join("Espoo", "a.pdf"), "kohde_id": 7}) + "\n")
+            f.write('{"tiedostonimi": "Espoo/b')
+
+        with patch('info_extract_etuovi.extract_listing_data', wraps=info_extract_etuovi.extract_listing_data) as mock_extract:
+            count = info_extract_etuovi.process_all_pdfs(self.folder, self.output, workers=1, batch_size=1)
+
+        # Valmista tiedostoa ei jäsennetä uudelleen, ja jokainen kohde tallennetaan omana eränään
+        parsed = [os.path.relpath(call.args[0], self.folder) for call in mock_extract.call_args_list]
+        self.assertNotIn(os.path.join("Espoo", "a.pdf"), parsed)
+        self.assertEqual(count, 3)
+        self.assertEqual(mock_save.call_count, 2)
+        self.assertEqual(
+            sorted(item["tiedostonimi"] for item in info_extract_etuovi.read_jsonl(self.output)),
+            [os.path.join("Espoo", "a.pdf"), os.path.join("Espoo", "b.pdf"), os.path.join("Turku", "c.pdf")]
+        )
+
+    def test_legacy_json_array_is_converted(self):
+        with open(self.output, "w", encoding="utf-8") as f:
+            json.dump([{"tiedostonimi": "vanha.pdf"}], f, indent=2)
+
+        with info_extract_etuovi.JsonlWriter(self.output) as writer:
+            writer.write([{"tiedostonimi": "uusi.pdf"}])
+
+        with open(self.output, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        self.assertEqual([json.loads(line)["tiedostonimi"] for line in lines], ["vanha.pdf", "uusi.pdf"])
+
+
+class TestResumeAfterCrash(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.folder, "Espoo"))
+        for name in ("a.pdf", "b.pdf", "c.pdf"):
+            writer = PdfWriter()
+            writer.add_blank_page(width=200, height=200)
+            with open(os.path.join(self.folder, "Espoo", name), "wb") as f:
+                writer.write(f)
+        self.output = os.path.join(self.folder, "tulos.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        super().tearDown()
+
+    def test_batch_committed_before_checkpoint_is_not_saved_twice(self):
+        real_write = info_extract_etuovi.JsonlWriter.write
+
+        def crash_mid_write(writer, records):
+            # Kohteet on jo tallennettu tietokantaan, mutta tiedostoon ehtii vain puolikas rivi
+            writer._file.write('{"tiedostonimi": "Espoo/')
+            writer._file.flush()
+            raise OSError("prosessi kaatui")
+
+        with patch.object(info_extract_etuovi.JsonlWriter, 'write', crash_mid_write):
+            info_extract_etuovi.process_all_pdfs(self.folder, self.output, batch_size=2)
+        self.assertEqual(Kohde.query.count(), 2)
+        self.assertTrue(os.path.exists(info_extract_etuovi.pending_path(self.output)))
+
+        with patch.object(info_extract_etuovi.JsonlWriter, 'write', real_write):
+            count = info_extract_etuovi.process_all_pdfs(self.folder, self.output, batch_size=2)
+
+        # Jatkettu ajo käyttää jo tallennetut kohteet eikä luo niitä uudelleen
+        listings = info_extract_etuovi.read_jsonl(self.output)
+        saved = {kohde.tiedostonimi: kohde.id for kohde in Kohde.query.all()}
+        self.assertEqual(count, 3)
+        self.assertEqual(len(saved), 3)
+        self.assertEqual(Kohde.query.count(), 3)
+        self.assertEqual({item["tiedostonimi"]: item["kohde_id"] for item in listings}, saved)
+        self.assertFalse(os.path.exists(info_extract_etuovi.pending_path(self.output)))
+
+    def test_previous_import_of_same_files_is_not_reused(self):
+        info_extract_etuovi.process_all_pdfs(self.folder, self.output)
+        os.remove(self.output)
+
+        # Uusi tuonti samoista tiedostoista ilman keskeneräistä erää luo uudet kohteet
+        info_extract_etuovi.process_all_pdfs(self.folder, self.output)
+        self.assertEqual(Kohde.query.count(), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
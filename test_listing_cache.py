@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime, timedelta
+
+from models import db, ListingContentCache
+from listing_cache import ListingCache, listing_key
+from testutils import DatabaseTestCase
+
+
+class TestListingKey(unittest.TestCase):
+
+    def test_listing_key(self):
+        self.assertEqual(listing_key('https://asunnot.oikotie.fi/myytavat-asunnot/helsinki/22948375'), ('oikotie', '22948375'))
+        self.assertEqual(listing_key('https://asunnot.oikotie.fi/nayttoesite/22948375/'), ('oikotie', '22948375'))
+        self.assertEqual(listing_key('https://www.etuovi.com/kohde/W12345?haku=1'), ('etuovi', 'w12345'))
+        self.assertIsNone(listing_key('https://example.com/kohde/1'))
+
+
+class TestListingCache(DatabaseTestCase):
+
+    def test_hit_and_miss(self):
+        cache = ListingCache(ttl=60, max_bytes=1000)
+        key = ('oikotie', '1')
+
+        self.assertIsNone(cache.get(key))
+        cache.set(key, 'ilmoitus')
+        self.assertEqual(cache.get(key), 'ilmoitus')
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_entry_is_shared_between_processes(self):
+        # Toisen workerin välimuisti näkee saman taulun
+        ListingCache(ttl=60, max_bytes=1000).set(('etuovi', 'a'), 'ilmoitus')
+        self.assertEqual(ListingCache(ttl=60, max_bytes=1000).get(('etuovi', 'a')), 'ilmoitus')
+
+    def test_expired_entry_is_removed(self):
+        cache = ListingCache(ttl=60, max_bytes=1000)
+        cache.set(('etuovi', 'a'), 'ilmoitus')
+        entry = db.session.get(ListingContentCache, ('etuovi', 'a'))
+        entry.created_at = datetime.utcnow() - timedelta(seconds=61)
+        db.session.commit()
+
+        # TTL:n jälkeen merkintää ei enää palauteta
+        self.assertIsNone(cache.get(('etuovi', 'a')))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ListingCache(ttl=60, max_bytes=25)
+        cache.set(('oikotie', '1'), 'a' * 10)
+        cache.set(('oikotie', '2'), 'b' * 10)
+        cache.get(('oikotie', '1'))
+
+        # Kolmas merkintä ylittää kokorajan, joten vähiten käytetty (2) poistetaan
+        cache.set(('oikotie', '3'), 'c' * 10)
+        self.assertIsNone(cache.get(('oikotie', '2')))
+        self.assertEqual(cache.get(('oikotie', '1')), 'a' * 10)
+        self.assertEqual(cache.stats()['bytes'], 20)
+
+    def test_cache_is_skipped_without_app_context(self):
+        self.ctx.pop()
+        try:
+            cache = ListingCache(ttl=60, max_bytes=1000)
+            cache.set(('oikotie', '1'), 'ilmoitus')
+            self.assertIsNone(cache.get(('oikotie', '1')))
+        finally:
+            self.ctx.push()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from models import db, User, Subscription, LLMResultCache
+from entitlements import entitlement_cache
+from llm_cache import LLMCache, make_cache_key
+from testutils import DatabaseTestCase
+
+
+class TestLLMCache(DatabaseTestCase):
+
+    app_config = {'LLM_CACHE_MAX_AGE': 3600}
+
+    def setUp(self):
+        super().setUp()
+
+        self.cache = LLMCache()
+        self.cache.init_app(self.app)
+
+    def add_user(self, email, is_admin=False, subscription=False):
+        user = User(email=email, first_name='Testi', last_name='Käyttäjä',
+                    street_address='Testikatu 1', postal_code='00100', city='Helsinki',
+                    state='Uusimaa', country='Suomi', password='salasana')
+        user.is_admin = is_admin
+        db.session.add(user)
+        db.session.commit()
+        if subscription:
+            db.session.add(Subscription(user_id=user.id, subscription_type='monthly', status='active'))
+            db.session.commit()
+        return user.id
+
+    def test_key_depends_on_model_prompt_and_input(self):
+        key = make_cache_key('gpt-4o', 'prompti', 'ilmoitus')
+
+        self.assertEqual(key, make_cache_key('gpt-4o', 'prompti', 'ilmoitus'))
+        self.assertNotEqual(key, make_cache_key('gpt-4o-mini', 'prompti', 'ilmoitus'))
+        self.assertNotEqual(key, make_cache_key('gpt-4o', 'uusi prompti', 'ilmoitus'))
+        self.assertNotEqual(key, make_cache_key('gpt-4o', 'prompti', 'toinen ilmoitus'))
+        # Osien raja kuuluu avaimeen, joten osien yhdistäminen ei tuota samaa avainta
+        self.assertNotEqual(make_cache_key('a', 'bc', ''), make_cache_key('ab', 'c', ''))
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get('gpt-4o', 'prompti', 'ilmoitus'))
+        self.cache.set('gpt-4o', 'prompti', 'ilmoitus', 'analyysi', prompt_name='analysis')
+
+        self.assertEqual(self.cache.get('gpt-4o', 'prompti', 'ilmoitus'), 'analyysi')
+        self.assertIsNone(self.cache.get('gpt-4o', 'muutettu prompti', 'ilmoitus'))
+
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 2, 'hit_rate': 0.333})
+        entry = db.session.get(LLMResultCache, make_cache_key('gpt-4o', 'prompti', 'ilmoitus'))
+        db.session.refresh(entry)
+        self.assertEqual(entry.hit_count, 1)
+        self.assertIsNotNone(entry.last_hit_at)
+
+    def test_entry_older_than_max_age_is_not_returned(self):
+        self.cache.set('gpt-4o', 'prompti', 'ilmoitus', 'analyysi')
+        entry = db.session.get(LLMResultCache, make_cache_key('gpt-4o', 'prompti', 'ilmoitus'))
+        entry.created_at = datetime.utcnow() - timedelta(seconds=3601)
+        db.session.commit()
+
+        self.assertIsNone(self.cache.get('gpt-4o', 'prompti', 'ilmoitus'))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+        # Uusi tallennus korvaa vanhentuneen merkinnän
+        self.cache.set('gpt-4o', 'prompti', 'ilmoitus', 'uusi analyysi')
+        self.assertEqual(self.cache.get('gpt-4o', 'prompti', 'ilmoitus'), 'uusi analyysi')
+
+    def test_opt_out_tiers(self):
+        self.app.config['LLM_CACHE_OPT_OUT_TIERS'] = 'subscription, admin'
+        self.cache.init_app(self.app)
+        one_time = self.add_user('kerta@example.com')
+        subscriber = self.add_user('tilaaja@example.com', subscription=True)
+        admin = self.add_user('admin@example.com', is_admin=True)
+
+        self.assertTrue(self.cache.allowed_for_user(one_time))
+        self.assertFalse(self.cache.allowed_for_user(subscriber))
+        self.assertFalse(self.cache.allowed_for_user(admin))
+
+    def test_opt_out_check_reuses_user_loaded_for_request(self):
+        self.app.config['LLM_CACHE_OPT_OUT_TIERS'] = 'subscription'
+        self.cache.init_app(self.app)
+        subscriber = self.add_user('tilaaja@example.com', subscription=True)
+        db.session.expunge_all()
+
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        with self.app.test_request_context():
+            # Flask-Login pitää kirjautuneen käyttäjän tallessa pyynnön ajan
+            current_user = entitlement_cache.load_user(subscriber)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                self.assertFalse(self.cache.allowed_for_user(subscriber))
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+
+        self.assertEqual(statements, [])
+        self.assertEqual(current_user.id, subscriber)
+
+    def test_disabled_cache_is_not_used(self):
+        self.app.config['LLM_CACHE_ENABLED'] = False
+        self.cache.init_app(self.app)
+        self.cache.set('gpt-4o', 'prompti', 'ilmoitus', 'analyysi')
+
+        self.assertIsNone(self.cache.get('gpt-4o', 'prompti', 'ilmoitus'))
+        self.assertFalse(self.cache.allowed_for_user(None))
+        self.assertEqual(LLMResultCache.query.count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
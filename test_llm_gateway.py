@@ -0,0 +1,115 @@
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import httpx
+import openai
+
+from llm_gateway import LLMGateway, LLMCallCancelled, LLMGatewayTimeout, TokenBucket, estimate_tokens
+
+
+def make_error(error_class, status_code, headers=None):
+    request = httpx.Request('POST', 'https://api.openai.com/v1/responses')
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return error_class('virhe', response=response, body=None)
+
+
+class TestLLMGateway(unittest.TestCase):
+
+    def setUp(self):
+        self.gateway = LLMGateway()
+        self.gateway._client = MagicMock()
+        self.create = self.gateway._client.responses.create
+
+    @patch('llm_gateway.time.sleep')
+    def test_rate_limit_honors_retry_after(self, mock_sleep):
+        response = MagicMock(output_text='ok')
+        response.usage.input_tokens = 10
+        response.usage.output_tokens = 5
+        self.create.side_effect = [make_error(openai.RateLimitError, 429, {'retry-after': '7'}), response]
+
+        result = self.gateway.create(model='gpt-4.1', input='teksti', max_output_tokens=100)
+
+        # Odotetaan palvelimen pyytämä aika ennen uutta yritystä
+        self.assertIs(result, response)
+        self.assertEqual(self.create.call_count, 2)
+        self.assertGreaterEqual(mock_sleep.call_args.args[0], 7)
+        self.assertLess(mock_sleep.call_args.args[0], 8)
+        stats = self.gateway.stats()['gpt-4.1']
+        self.assertEqual((stats['calls'], stats['errors'], stats['output_tokens']), (2, 1, 5))
+
+    @patch('llm_gateway.time.sleep')
+    def test_authentication_error_is_not_retried(self, mock_sleep):
+        self.create.side_effect = make_error(openai.AuthenticationError, 401)
+
+        with self.assertRaises(openai.AuthenticationError):
+            self.gateway.create(model='gpt-4.1', input='teksti')
+        self.assertEqual(self.create.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    def test_cancelled_stream_is_closed_and_slot_released(self):
+        events = MagicMock()
+        events.__iter__.return_value = iter([MagicMock(type='response.output_text.delta', delta='a')] * 3)
+        self.create.return_value = events
+        cancel = threading.Event()
+
+        received = []
+        with self.assertRaises(LLMCallCancelled):
+            for event in self.gateway.stream(cancel=cancel, model='gpt-4.1', input='teksti'):
+                received.append(event)
+                cancel.set()
+
+        # Striimi suljetaan ensimmäisen tapahtuman jälkeen ja paikka vapautuu
+        self.assertEqual(len(received), 1)
+        events.close.assert_called_once()
+        self.assertTrue(self.gateway._global_slots.acquire(blocking=False))
+        self.gateway._global_slots.release()
+
+    def test_cancelled_call_is_not_sent(self):
+        cancel = threading.Event()
+        cancel.set()
+
+        with self.assertRaises(LLMCallCancelled):
+            self.gateway.create(cancel=cancel, model='gpt-4.1', input='teksti')
+        self.create.assert_not_called()
+
+    def test_queue_timeout_returns_rate_limit_tokens(self):
+        self.gateway.queue_timeout = 0.05
+        self.gateway._global_slots = threading.BoundedSemaphore(1)
+        self.gateway._global_slots.acquire()
+        requests_before = self.gateway._request_bucket.tokens
+        tokens_before = self.gateway._token_bucket.tokens
+
+        with self.assertRaises(LLMGatewayTimeout):
+            self.gateway.create(model='gpt-4.1', input='a' * 4000, max_output_tokens=1000)
+
+        # Lähettämättä jäänyt kutsu ei kuluta minuuttikohtaisia rajoja
+        self.create.assert_not_called()
+        self.assertGreaterEqual(self.gateway._request_bucket.tokens, requests_before)
+        self.assertGreaterEqual(self.gateway._token_bucket.tokens, tokens_before)
+
+    def test_token_estimate(self):
+        request_args = {
+            'input': [{'role': 'system', 'content': [{'type': 'input_text', 'text': 'a' * 400}]}],
+            'max_output_tokens': 50
+        }
+        self.assertEqual(estimate_tokens(request_args), 150)
+
+    def test_token_bucket_waits_for_refill(self):
+        clock = [0.0]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        with patch('llm_gateway.time.monotonic', side_effect=lambda: clock[0]), \
+                patch('llm_gateway.time.sleep', side_effect=sleep):
+            bucket = TokenBucket(rate_per_minute=60, capacity=2)
+            bucket.acquire(2)
+            # Tyhjä rajoitin täyttyy yhden tokenin sekunnissa, joten kutsu jää odottamaan
+            waited = bucket.acquire(1)
+
+        self.assertAlmostEqual(waited, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
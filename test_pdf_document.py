@@ -0,0 +1,39 @@
+import unittest
+from io import BytesIO
+from unittest.mock import patch
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from pdf_document import PdfDocument
+
+
+def make_pdf_bytes(pages=2):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    buffer = BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+class TestPdfDocument(unittest.TestCase):
+
+    def test_document_is_parsed_once(self):
+        document = PdfDocument(make_pdf_bytes())
+
+        with patch('pdf_document.PdfReader', wraps=PdfReader) as mock_reader:
+            # Validointi, tekstin poiminta ja uudelleenavaus käyttävät samaa jäsennystä
+            self.assertTrue(document.is_valid())
+            self.assertEqual(document.page_texts(), ['', ''])
+            self.assertIs(PdfDocument.open(document), document)
+            document.text()
+
+        self.assertEqual(mock_reader.call_count, 1)
+
+    def test_invalid_content(self):
+        self.assertFalse(PdfDocument(b'<html>Ei PDF</html>').is_valid())
+        self.assertFalse(PdfDocument(b'%PDF-1.4 rikki').is_valid())
+
+
+if __name__ == '__main__':
+    unittest.main()
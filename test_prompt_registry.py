@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from prompt_registry import PromptRegistry, build_input
+
+
+class TestPromptRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('prompt_analyysi_kt.txt', 'Kerrostalon prompt\r\n')
+        self.write('prompt_analyysi_okt.txt', 'Omakotitalon prompt')
+        self.registry = PromptRegistry(self.directory, reload_interval=0)
+        self.registry.preload()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def write(self, name, text, mtime=None):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write(text)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def test_prompt_is_selected_by_type(self):
+        self.assertEqual(self.registry.analysis_prompt('Omakotitalo').text, 'Omakotitalon prompt\n')
+        self.assertEqual(self.registry.analysis_prompt('rivitalo').text, 'Kerrostalon prompt\n')
+        # Riskipromptitiedostoja ei ole, joten käytetään sisäänrakennettua oletusta
+        self.assertEqual(self.registry.risk_prompt('kerrostalo').name, 'oletus')
+
+    def test_changed_file_is_reloaded(self):
+        before = self.registry.analysis_prompt('kerrostalo')
+        self.write('prompt_analyysi_kt.txt', 'Uusi prompt', mtime=before.mtime + 10)
+
+        after = self.registry.analysis_prompt('kerrostalo')
+        self.assertEqual(after.text, 'Uusi prompt\n')
+        self.assertNotEqual(after.version, before.version)
+
+    def test_static_prompt_is_stable_prefix(self):
+        prompt = self.registry.analysis_prompt('kerrostalo')
+        first = build_input(prompt, 'Ilmoitus A')
+        second = build_input(prompt, 'Ilmoitus B')
+
+        # Pyynnöt eroavat vasta promptin jälkeen
+        self.assertEqual(first[0], second[0])
+        self.assertEqual(first[0]['content'][0]['text'], prompt.text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import os
+import uuid
+import random
+import unittest
+import importlib.util
+from datetime import datetime, timedelta
+
+import sqlalchemy as sa
+from sqlalchemy import event, insert, text
+
+from models import db, User, Analysis, RiskAnalysis, Kohde, Subscription, AnalysisJob
+from analysis_jobs import AnalysisJobQueue
+from analysis_listing import list_analyses_page
+from analysis_pipeline import find_recent_analysis, ensure_risk_analysis
+from entitlements import EntitlementCache
+from subscription_service import subscription_service
+from verification import validate_token
+from testutils import create_test_app
+
+# Synteettisen aineiston koko
+USERS = 2000
+ANALYSES_PER_USER = 10
+
+# PostgreSQL-testit ajetaan vain, jos tähän annetaan erillinen testikanta, jonka taulut saa poistaa
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL')
+
+
+def load_index_migration():
+    """Lataa hakemistojen migraation, jotta PostgreSQL-testi luo hakemistot samoin kuin migraatio"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations', 'versions', 'add_hot_query_indexes.py')
+    spec = importlib.util.spec_from_file_location('add_hot_query_indexes', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class QueryPlanTests:
+    """
+    Varmistaa kyselysuunnitelmasta, että usein suoritettavat haut käyttävät hakemistoa
+    eivätkä käy koko taulua läpi. Tarkistettavat kyselyt ovat ne, jotka sovelluksen omat
+    funktiot suorittavat, joten kyselyn muodostuksen muutos näkyy testissä.
+    """
+
+    database_url = 'sqlite://'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_test_app(SQLALCHEMY_DATABASE_URI=cls.database_url)
+        cls.ctx = cls.app.app_context()
+        cls.ctx.push()
+        db.drop_all()
+        db.create_all()
+        cls.create_indexes()
+        cls.seed()
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.drop_all()
+        cls.ctx.pop()
+
+    @classmethod
+    def create_indexes(cls):
+        """Mallien hakemistot luodaan create_all-funktiolla"""
+
+    @classmethod
+    def seed(cls):
+        rng = random.Random(1)
+        now = datetime.utcnow()
+        users, analyses, kohteet, risks, subscriptions, jobs = [], [], [], [], [], []
+
+        for user_id in range(1, USERS + 1):
+            users.append({
+                'id': user_id, 'email': f'kayttaja{user_id}@example.com', 'first_name': 'Testi',
+                'last_name': 'Käyttäjä', 'street_address': 'Testikatu 1', 'postal_code': '00100',
+                'city': 'Helsinki', 'state': 'Uusimaa', 'country': 'Suomi', 'analyses_left': 0,
+                'verification_token': f'token-{user_id}' if user_id % 10 == 0 else None
+            })
+            subscriptions.append({
+                'user_id': user_id, 'subscription_type': rng.choice(['monthly', 'one_time']),
+                'status': rng.choice(['active', 'cancelled', 'expired']),
+                'cancel_at_period_end': rng.random() < 0.2, 'is_trial': False,
+                'next_billing_date': now + timedelta(days=rng.randint(-30, 60))
+            })
+            for n in range(ANALYSES_PER_USER):
+                analysis_id = len(analyses) + 1
+                analyses.append({
+                    'id': analysis_id, 'filename': f'analyysi_{analysis_id}.txt', 'user_id': user_id,
+                    'property_url': f'https://asunnot.oikotie.fi/myytavat-asunnot/helsinki/{analysis_id}',
+                    'created_at': now - timedelta(minutes=analysis_id)
+                })
+                kohteet.append({'osoite': f'Testikatu {analysis_id}', 'analysis_id': analysis_id, 'user_id': user_id})
+                risks.append({'analysis_id': analysis_id, 'user_id': user_id, 'risk_data': '{}'})
+                jobs.append({
+                    'id': str(uuid.UUID(int=analysis_id)), 'user_id': user_id, 'property_url': f'https://www.etuovi.com/kohde/w{analysis_id}',
+                    'status': 'queued' if analysis_id % 500 == 0 else 'done', 'attempts': 0,
+                    'created_at': now - timedelta(minutes=analysis_id)
+                })
+
+        for model, rows in ((User, users), (Analysis, analyses), (Kohde, kohteet),
+                            (RiskAnalysis, risks), (Subscription, subscriptions), (AnalysisJob, jobs)):
+            db.session.execute(insert(model.__table__), rows)
+        db.session.commit()
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+
+    def explain(self, statement, parameters):
+        """Palauttaa kyselysuunnitelman yhtenä merkkijonona"""
+        rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        return ' | '.join(str(row[-1]) for row in rows)
+
+    def executed_plans(self, fn):
+        """Suorittaa funktion ja palauttaa sen tekemien SELECT-kyselyjen suunnitelmat"""
+        statements = []
+        listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            with self.app.test_request_context():
+                fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        selects = [(s, p) for s, p in statements if s.lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects, 'Funktio ei tehnyt yhtään kyselyä')
+        plans = [self.explain(s, p) for s, p in selects]
+        db.session.rollback()
+        return plans
+
+    def assert_uses_index(self, fn, index_name):
+        plans = self.executed_plans(fn)
+        self.assertTrue(any(index_name in plan for plan in plans),
+                        f'Kyselyt eivät käytä hakemistoa {index_name}: {plans}')
+
+    def test_recent_analysis_by_url_and_user(self):
+        self.assert_uses_index(lambda: find_recent_analysis('https://asunnot.oikotie.fi/myytavat-asunnot/helsinki/5', 1),
+                               'ix_analyses_user_id_property_url')
+
+    def test_analysis_list_pages(self):
+        page, cursor = list_analyses_page(1, page_size=5)
+        self.assertIsNotNone(cursor)
+
+        # Ensimmäinen ja avainjoukolla haettu seuraava sivu sekä niiden kohteet
+        for before in (None, cursor):
+            self.assert_uses_index(lambda: list_analyses_page(1, before=before, page_size=5),
+                                   'ix_analyses_user_id_created_at')
+            self.assert_uses_index(lambda: list_analyses_page(1, before=before, page_size=5),
+                                   'ix_kohteet_analysis_id')
+
+    def test_risk_analysis_of_analysis(self):
+        self.assert_uses_index(lambda: ensure_risk_analysis(db.session.get(Analysis, 5), 1),
+                               'ix_risk_analyses_analysis_id_user_id')
+
+    def test_login_loads_active_subscription(self):
+        self.assert_uses_index(lambda: EntitlementCache().load_user(1), 'ix_subscriptions_active_user_id_type')
+
+    def test_subscriptions_due_for_renewal(self):
+        self.assert_uses_index(lambda: subscription_service.get_subscriptions_due_for_renewal(days_before=3),
+                               'ix_subscriptions_renewal_next_billing_date')
+
+    def test_user_by_verification_token(self):
+        self.assert_uses_index(lambda: validate_token('token-10'), 'ix_users_verification_token')
+
+    def test_claim_next_job(self):
+        self.assert_uses_index(lambda: AnalysisJobQueue()._claim_next_job(), 'ix_analysis_jobs_status_created_at')
+
+
+class TestSqliteQueryPlans(QueryPlanTests, unittest.TestCase):
+    pass
+
+
+@unittest.skipUnless(POSTGRES_URL, 'TEST_POSTGRES_URL puuttuu')
+class TestPostgresQueryPlans(QueryPlanTests, unittest.TestCase):
+    """
+    Tarkistaa migraation osittaiset hakemistot PostgreSQL:ssä. Hakemistot luodaan
+    migraation määrittelyistä, ja täysi taulun läpikäynti estetään, jotta pienessä
+    testiaineistossa suunnitelma kertoo, voiko kysely käyttää hakemistoa.
+    """
+
+    database_url = POSTGRES_URL
+
+    @classmethod
+    def create_indexes(cls):
+        migration = load_index_migration()
+        with db.engine.begin() as conn:
+            for name, table, columns, where in migration.INDEXES:
+                conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+                condition = text(where) if where else None
+                sa.Index(name, *[db.metadata.tables[table].c[column] for column in columns],
+                         postgresql_where=condition).create(conn)
+
+    def explain(self, statement, parameters):
+        connection = db.session.connection()
+        connection.exec_driver_sql('SET enable_seqscan = off')
+        rows = connection.exec_driver_sql(f'EXPLAIN {statement}', parameters)
+        return ' | '.join(row[0] for row in rows)
+
+
+if __name__ == '__main__':
+    unittest.main()
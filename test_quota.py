@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from models import db, User, Subscription
+from quota import QuotaService
+from analysis_jobs import AnalysisJobQueue
+from analysis_pipeline import PipelineError
+from testutils import DatabaseTestCase
+
+
+class TestQuotaService(DatabaseTestCase):
+
+    app_config = {'ANALYSIS_JOB_WORKERS': 0}
+
+    def setUp(self):
+        super().setUp()
+
+        self.user = User(email='testi@example.com', first_name='Testi', last_name='Käyttäjä',
+                         street_address='Testikatu 1', postal_code='00100', city='Helsinki',
+                         state='Uusimaa', country='Suomi', password='salasana')
+        self.user.analyses_left = 1
+        db.session.add(self.user)
+        db.session.commit()
+
+        self.quota = QuotaService()
+
+    def analyses_left(self):
+        return db.session.query(User.analyses_left).filter_by(id=self.user.id).scalar()
+
+    def test_last_analysis_can_be_reserved_only_once(self):
+        with self.app.test_request_context():
+            self.assertEqual(self.quota.entitlement(self.user), 'credits')
+            # Toinen pyyntö käyttää viimeisen analyysin tarkistuksen ja varauksen välissä
+            self.assertEqual(QuotaService().reserve(self.user), 'credits')
+            self.assertIsNone(self.quota.reserve(self.user))
+
+        self.assertEqual(self.analyses_left(), 0)
+
+    def test_refund_returns_reserved_analysis(self):
+        with self.app.test_request_context():
+            reservation = self.quota.reserve(self.user)
+        self.assertTrue(self.quota.refund(self.user.id, reservation))
+        self.assertEqual(self.analyses_left(), 1)
+
+    def test_subscription_is_not_charged(self):
+        db.session.add(Subscription(user_id=self.user.id, subscription_type='monthly', status='active'))
+        db.session.commit()
+
+        with self.app.test_request_context():
+            self.assertEqual(self.quota.reserve(self.user), 'subscription')
+        self.assertFalse(self.quota.refund(self.user.id, 'subscription'))
+        self.assertEqual(self.analyses_left(), 1)
+
+    def test_entitlement_is_resolved_once_per_request(self):
+        self.user.analyses_left  # Ladataan käyttäjän tiedot ennen laskentaa
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            with self.app.test_request_context():
+                self.quota.entitlement(self.user)
+                self.quota.entitlement(self.user)
+                self.quota.reserve(self.user)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        # Yksi tilaushaku ja yksi ehdollinen päivitys
+        self.assertEqual(len(statements), 2)
+        self.assertIn('RETURNING', statements[1])
+
+    @patch('analysis_jobs.analysis_pipeline.charge_analysis')
+    @patch('analysis_jobs.analysis_pipeline.run_analysis_pipeline')
+    def test_failed_job_refunds_reservation(self, mock_run, mock_charge):
+        mock_run.side_effect = PipelineError('Ilmoituksen hakemisessa tapahtui virhe.', 'fetch')
+        queue = AnalysisJobQueue()
+        queue.init_app(self.app)
+
+        with self.app.test_request_context():
+            reservation = self.quota.reserve(self.user)
+        self.assertEqual(self.analyses_left(), 0)
+
+        queue.enqueue(self.user.id, 'https://www.etuovi.com/kohde/12345', options={'quota': reservation})
+        queue._execute(queue._claim_next_job())
+
+        self.assertEqual(self.analyses_left(), 1)
+        mock_charge.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
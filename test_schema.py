@@ -0,0 +1,60 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+
+import sqlalchemy
+from sqlalchemy import text
+
+from models import db
+from schema import ensure_schema
+from testutils import DatabaseTestCase
+
+
+class TestEnsureSchema(DatabaseTestCase):
+
+    # Taulut luodaan testeissä ensure_schema-funktiolla
+    create_tables = False
+
+    def columns(self, table):
+        return [c['name'] for c in sqlalchemy.inspect(db.engine).get_columns(table)]
+
+    def test_empty_database_gets_all_tables(self):
+        ensure_schema(self.app)
+
+        tables = sqlalchemy.inspect(db.engine).get_table_names()
+        self.assertIn('kohteet', tables)
+        self.assertIn('analysis_jobs', tables)
+
+    def test_old_tables_get_missing_columns(self):
+        # Vanhan version taulut ilman myöhemmin lisättyjä sarakkeita
+        with db.engine.begin() as conn:
+            conn.execute(text("CREATE TABLE kohteet (id INTEGER PRIMARY KEY, osoite VARCHAR(255) NOT NULL, "
+                              "analysis_id INTEGER)"))
+            conn.execute(text("CREATE TABLE analysis_jobs (id VARCHAR(36) PRIMARY KEY, user_id INTEGER NOT NULL, "
+                              "property_url VARCHAR(500) NOT NULL, status VARCHAR(20) NOT NULL)"))
+
+        ensure_schema(self.app)
+
+        self.assertIn('risk_level', self.columns('kohteet'))
+        self.assertIn('tiedostonimi', self.columns('kohteet'))
+        self.assertIn('partial_analysis', self.columns('analysis_jobs'))
+        self.assertIn('users', sqlalchemy.inspect(db.engine).get_table_names())
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def test_heavy_libraries_load_on_first_use(self):
+        # Tarkistetaan uudessa prosessissa, koska muut testit lataavat kirjastot tähän prosessiin
+        code = ("import sys, json, api_call, llm_gateway, etuovi_downloader, email_service; "
+                "print(json.dumps([m for m in ('openai', 'selenium', 'sendgrid') if m in sys.modules]))")
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout.strip().splitlines()[-1]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
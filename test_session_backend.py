@@ -0,0 +1,98 @@
+import unittest
+from datetime import datetime, timedelta
+
+from flask import session
+from sqlalchemy import event
+
+from models import db, WebSession
+from session_backend import init_session, DatabaseSessionInterface
+from testutils import DatabaseTestCase
+
+
+class TestDatabaseSessions(DatabaseTestCase):
+
+    app_config = {
+        'SECRET_KEY': 'testiavain',
+        'SESSION_BACKEND': 'database',
+        'SESSION_USE_SIGNER': True,
+        'SESSION_COOKIE_NAME': 'kotiko_session'
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.assertEqual(init_session(self.app), 'database')
+
+        @self.app.route('/set/<value>')
+        def set_value(value):
+            session['value'] = value
+            return 'ok'
+
+        @self.app.route('/get')
+        def get_value():
+            return session.get('value', '')
+
+        @self.app.route('/clear')
+        def clear():
+            session.clear()
+            return 'ok'
+
+        self.client = self.app.test_client()
+
+    def count_writes(self, path):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get(path)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        writes = [s for s in statements if not s.lstrip().upper().startswith('SELECT')]
+        return response, writes
+
+    def test_session_persists_between_requests(self):
+        self.client.get('/set/arvo')
+        self.assertEqual(self.client.get('/get').get_data(as_text=True), 'arvo')
+        self.assertEqual(WebSession.query.count(), 1)
+
+    def test_unchanged_session_is_not_rewritten(self):
+        self.client.get('/set/arvo')
+
+        response, writes = self.count_writes('/get')
+
+        self.assertEqual(response.get_data(as_text=True), 'arvo')
+        self.assertEqual(writes, [])
+
+    def test_anonymous_request_stores_nothing(self):
+        response, writes = self.count_writes('/get')
+
+        self.assertEqual(writes, [])
+        self.assertNotIn('Set-Cookie', response.headers)
+
+    def test_expired_session_is_not_loaded(self):
+        self.client.get('/set/arvo')
+        WebSession.query.update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+        self.assertEqual(self.client.get('/get').get_data(as_text=True), '')
+
+    def test_cleared_session_is_deleted(self):
+        self.client.get('/set/arvo')
+        self.client.get('/clear')
+        self.assertEqual(WebSession.query.count(), 0)
+
+    def test_cleanup_removes_expired_in_batches(self):
+        now = datetime.utcnow()
+        db.session.add_all(
+            [WebSession(sid=f'vanha{i}', data='{}', expires_at=now - timedelta(minutes=1)) for i in range(25)] +
+            [WebSession(sid='voimassa', data='{}', expires_at=now + timedelta(days=1))]
+        )
+        db.session.commit()
+
+        interface = DatabaseSessionInterface(cleanup_batch_size=10)
+        self.assertEqual(interface.cleanup(max_batches=1), 10)
+        self.assertEqual(interface.cleanup(), 15)
+        self.assertEqual([s.sid for s in WebSession.query.all()], ['voimassa'])
+
+
+if __name__ == '__main__':
+    unittest.main()
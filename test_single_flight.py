@@ -0,0 +1,82 @@
+import json
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from models import db, SingleFlightLock
+from single_flight import SingleFlight
+from testutils import DatabaseTestCase
+
+
+class TestSingleFlight(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.flight = SingleFlight()
+        self.flight.init_app(self.app)
+
+    def add_lock(self, status, result=None):
+        db.session.add(SingleFlightLock(key='fetch:oikotie:1', owner='toinen', status=status, result=result,
+                                        expires_at=datetime.utcnow() + timedelta(seconds=60)))
+        db.session.commit()
+
+    def test_result_is_shared_with_later_callers(self):
+        fn = MagicMock(return_value=[True, 'teksti', 'oikotie'])
+
+        first = self.flight.do('fetch:oikotie:1', fn)
+        second = self.flight.do('fetch:oikotie:1', fn)
+
+        self.assertEqual(first, second)
+        fn.assert_called_once()
+
+    def test_follower_waits_for_running_leader(self):
+        self.add_lock('running')
+        fn = MagicMock()
+
+        def leader_finishes(seconds):
+            SingleFlightLock.query.filter_by(key='fetch:oikotie:1').update(
+                {'status': 'done', 'result': json.dumps([True, 'johtajan teksti', 'oikotie'])}
+            )
+            db.session.commit()
+
+        with patch('single_flight.time.sleep', side_effect=leader_finishes) as mock_sleep:
+            result = self.flight.do('fetch:oikotie:1', fn)
+
+        # Odottaja ei hae ilmoitusta itse vaan saa johtajan tuloksen
+        self.assertEqual(result, [True, 'johtajan teksti', 'oikotie'])
+        fn.assert_not_called()
+        mock_sleep.assert_called_once()
+
+    def test_failed_leader_is_taken_over(self):
+        self.add_lock('failed')
+        fn = MagicMock(return_value=[False, None, 'oikotie'])
+
+        result = self.flight.do('fetch:oikotie:1', fn, succeeded=lambda r: r[0])
+
+        # Epäonnistunutta tulosta ei jaeta, joten seuraava kutsuja yrittää uudelleen
+        self.assertEqual(result, [False, None, 'oikotie'])
+        self.flight.do('fetch:oikotie:1', fn, succeeded=lambda r: r[0])
+        self.assertEqual(fn.call_count, 2)
+
+    def test_lease_is_renewed_while_leader_runs(self):
+        self.flight.lease_seconds = 0.3
+        seen = []
+
+        def slow_fetch():
+            # Vaihe kestää moninkertaisesti lukon voimassaoloajan
+            time.sleep(1.0)
+            seen.append(self.flight._acquire('fetch:oikotie:1', 'toinen'))
+            return [True, 'teksti', 'oikotie']
+
+        result = self.flight.do('fetch:oikotie:1', slow_fetch)
+
+        # Toinen kutsuja näki lukon yhä käynnissä eikä ottanut vaihetta itselleen
+        self.assertEqual(seen, [('running', None)])
+        self.assertEqual(result, [True, 'teksti', 'oikotie'])
+        self.assertEqual(db.session.get(SingleFlightLock, 'fetch:oikotie:1').status, 'done')
+
+
+if __name__ == '__main__':
+    unittest.main()
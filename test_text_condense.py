@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+
+import oikotie_downloader
+from pdf_document import PdfDocument
+from text_condense import TextCondenser, TRUNCATION_MARKER, count_tokens, fix_encoding, clean_lines
+
+
+class TestTextCondense(unittest.TestCase):
+
+    def test_fix_encoding_single_pass(self):
+        broken = 'Velaton hinta 289 000 â‚¬, 54 mÂ², Ã¤Ã¶ Ã„Ã– Ã…Ã¥'
+        self.assertEqual(fix_encoding(broken), 'Velaton hinta 289 000 €, 54 m², äö ÄÖ Åå')
+        # Oikein dekoodattu teksti säilyy ennallaan
+        self.assertEqual(fix_encoding('Mäntytie 3 Å'), 'Mäntytie 3 Å')
+
+    def test_fix_encoding_keeps_letters_before_nbsp(self):
+        # Ä, ä ja Å ennen NBSP:tä tai merkkejä kuten ° ja ² eivät ole väärin dekoodattuja
+        self.assertEqual(fix_encoding('KYLLÄ\xa0ja kyllä\xa0\xa0x'), 'KYLLÄ ja kyllä  x')
+        self.assertEqual(fix_encoding('Pinta-ala 54 m², lämpö 21°, Åä»'), 'Pinta-ala 54 m², lämpö 21°, Åä»')
+        # Korjattavassa tekstissä väärin dekoodattu NBSP muuttuu välilyönniksi
+        self.assertEqual(fix_encoding('PÃ¤Ã¤\xa0kyllä\xa0x 54Â\xa0mÂ²'), 'Pää kyllä x 54 m²')
+
+    def test_keeps_values_that_look_like_page_numbers(self):
+        # PyPDF2 erottaa otsikon ja arvon usein omille riveilleen
+        self.assertEqual(clean_lines('Kerros\n2/4\nHuoneita\n3 (5)\nSivu 1/2'),
+                         ['Kerros', '2/4', 'Huoneita', '3 (5)'])
+
+    def test_repeated_lines_inside_page_are_kept(self):
+        text = (
+            "Asunto Oy Mäntytie 3\nYhtiölainaa jäljellä 12 000 €\nHoitovastike 245 €\n"
+            "Yhtiölainaa jäljellä 12 000 €\nParveke\nSauna\nTakka\n"
+            "--- Page 2 ---\nAsunto Oy Mäntytie 3\nVarasto\n"
+        )
+        self.assertEqual(clean_lines(text), [
+            'Asunto Oy Mäntytie 3', 'Yhtiölainaa jäljellä 12 000 €', 'Hoitovastike 245 €',
+            'Yhtiölainaa jäljellä 12 000 €', 'Parveke', 'Sauna', 'Takka', 'Varasto'
+        ])
+
+    def test_removes_page_markers_boilerplate_and_repeated_headers(self):
+        text = (
+            "--- Page 1 ---\n"
+            "Kiinteistömaailma Kallio, puh. 010 123\n"
+            "Hoitovastike 245 €\n"
+            "Kyllä\n"
+            "Sivu 1/2\n"
+            "--- Page 2 ---\n"
+            "Kiinteistömaailma Kallio,   puh. 010 123\n"
+            "Sauna\n"
+            "Kyllä\n"
+            "Pidätämme oikeuden muutoksiin.\n"
+            "https://www.etuovi.com/kohde/123\n"
+        )
+        condensed = TextCondenser().condense(text)
+
+        self.assertEqual(condensed.split('\n'), [
+            'Kiinteistömaailma Kallio, puh. 010 123', 'Hoitovastike 245 €', 'Kyllä', 'Sauna', 'Kyllä'
+        ])
+
+    def test_repeated_headers_are_removed_from_oikotie_pages(self):
+        # PyPDF2:n sivutekstit ilman sivumerkintöjä, kuten Oikotien esitteessä
+        document = PdfDocument(b'%PDF')
+        document._page_texts = [
+            f"Asunto Oy Mäntytie 3, Helsinki\nSivun {i} sisältö\nLisätietoa kohteesta {i}\n"
+            f"Oikotie Myyntiesite 12.5.2025\nKiinteistömaailma Kallio, puh. 010 123"
+            for i in range(1, 4)
+        ]
+
+        text = oikotie_downloader.extract_text_from_pdf(document)
+        lines = TextCondenser().condense(text).split('\n')
+
+        # Ylä- ja alatunnisteet säilyvät vain ensimmäiseltä sivulta
+        self.assertEqual(lines.count('Asunto Oy Mäntytie 3, Helsinki'), 1)
+        self.assertEqual(lines.count('Oikotie Myyntiesite 12.5.2025'), 1)
+        self.assertEqual(lines.count('Kiinteistömaailma Kallio, puh. 010 123'), 1)
+        self.assertIn('Sivun 3 sisältö', lines)
+        self.assertNotIn('--- Page 2 ---', lines)
+
+    @patch('text_condense.tiktoken', None)
+    def test_token_budget_truncates_at_line_boundary(self):
+        text = '\n'.join(f'Rivi {i}: ' + 'x' * 30 for i in range(100))
+        condensed = TextCondenser(max_tokens=100).condense(text)
+
+        self.assertLessEqual(count_tokens(condensed), 100)
+        self.assertTrue(condensed.startswith('Rivi 0: '))
+        self.assertEqual(condensed.split('\n')[-1], TRUNCATION_MARKER)
+        # Nolla poistaa rajan käytöstä
+        self.assertNotIn(TRUNCATION_MARKER, TextCondenser(max_tokens=0).condense(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from flask import Flask
+
+from models import db
+from llm_gateway import llm_gateway
+import worker_lifecycle
+from testutils import create_test_app
+
+
+class TestResetAfterFork(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_test_app()
+
+    def test_inherited_resources_are_forgotten(self):
+        with self.app.app_context():
+            pool = db.engine.pool
+        llm_gateway._client = object()
+
+        worker_lifecycle.reset_after_fork(self.app)
+
+        with self.app.app_context():
+            self.assertIsNot(db.engine.pool, pool)
+        self.assertIsNone(llm_gateway._client)
+
+
+@patch('worker_lifecycle.subscription_scheduler')
+@patch('worker_lifecycle.analysis_job_queue')
+class TestStartBackgroundServices(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    @patch.dict(os.environ, {'RUN_SUBSCRIPTION_SCHEDULER': 'true'})
+    def test_scheduler_runs_only_in_designated_process(self, queue, scheduler):
+        worker_lifecycle.start_background_services(self.app, run_scheduler=False)
+        queue.start.assert_called_once()
+        scheduler.start.assert_not_called()
+
+        worker_lifecycle.start_background_services(self.app, run_scheduler=True)
+        scheduler.start.assert_called_once()
+
+    @patch.dict(os.environ, {'RUN_SUBSCRIPTION_SCHEDULER': 'false', 'FLASK_ENV': 'development'})
+    def test_scheduler_disabled_outside_production(self, queue, scheduler):
+        worker_lifecycle.start_background_services(self.app)
+        scheduler.start.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+"""
+Testien yhteiset apuvälineet: Flask-sovellus muistinvaraisella SQLite-tietokannalla.
+"""
+
+import unittest
+
+from flask import Flask
+
+from models import db
+
+
+def create_test_app(**config):
+    """
+    Luo testisovelluksen, jonka tietokanta on muistinvarainen SQLite
+
+    Args:
+        **config: Sovelluksen lisäasetukset
+
+    Returns:
+        Flask: Sovellus, johon tietokanta on liitetty
+    """
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config.update(config)
+    db.init_app(app)
+    return app
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Testiluokka, jonka jokainen testi saa oman tyhjän tietokannan ja sovelluskontekstin.
+    Aliluokka voi antaa sovelluksen lisäasetukset app_config-attribuutissa.
+    """
+
+    app_config = {}
+    create_tables = True
+
+    def setUp(self):
+        self.app = create_test_app(**self.app_config)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        if self.create_tables:
+            db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
@@ -0,0 +1,254 @@
+"""
+Ilmoitustekstin siivous ja tiivistys ennen LLM-kutsuja.
+
+PDF:stä poimittu teksti sisältää sivumerkintöjä, joka sivulla toistuvia ylä- ja
+alatunnisteita, välitysliikkeen vakiotekstejä sekä väärin dekoodattuja merkkejä
+(esim. "Ã¤" -> "ä"). Tiivistys poistaa nämä ja rajaa tekstin tokenibudjettiin,
+jolloin mallikutsut ovat nopeampia ja halvempia.
+
+Tokenit lasketaan tiktoken-kirjastolla, jos se on asennettu, muuten arviona
+merkit / 4 kuten LLM-yhdyskäytävässä.
+"""
+
+import re
+import logging
+import unicodedata
+
+try:
+    import tiktoken
+except ImportError:  # Valinnainen riippuvuus
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Merkit, joiden cp1252-koodi on UTF-8:n jatkotavu (0x80-0xBF)
+_CONTINUATION = re.escape(bytes(range(0x80, 0xC0)).decode('cp1252', errors='ignore'))
+
+# UTF-8-merkki, joka on dekoodattu virheellisesti cp1252:na. Korjataan vain jaksot, joiden
+# aloitusmerkki on Â, Ã (Latin-1-merkit kuten ä, ö, ², °) tai â (esim. €, –, ”). Oikein
+# dekoodatun suomenkielisen tekstin kirjaimet (ä, Ä, å, Å) eivät ole aloitusmerkkejä.
+MOJIBAKE_PATTERN = re.compile(f'[ÂÃ][{_CONTINUATION}]|â[{_CONTINUATION}]{{2}}')
+
+# Korjausta yritetään vain, jos tekstissä on jokin näistä
+MOJIBAKE_MARKERS = ('Ã', 'Â', 'â€')
+
+# Erikoisvälilyönnit tavallisiksi, tavutusviivat pois
+_CHAR_TABLE = str.maketrans({'\u00a0': ' ', '\u202f': ' ', '\u2009': ' ', '\u00ad': None, '\f': '\n'})
+
+# Sivumerkinnät, esim. "--- Page 2 ---" ja "Sivu 2/5"
+PAGE_LINE_PATTERN = re.compile(
+    r'^(?:-{3}\s*page\s+\d+\s*-{3}|sivu\s*\d+\s*(?:/|\(|of|sivusta)\s*\d+\)?)$',
+    re.IGNORECASE
+)
+
+# Välitysliikkeiden ja ilmoitusportaalien vakiorivit, joista ei ole hyötyä analyysille
+BOILERPLATE_PATTERNS = [
+    r'^https?://\S+$',
+    r'^(?:www\.)?(?:etuovi\.com|(?:asunnot\.)?oikotie\.fi)\S*$',
+    r'^tulostettu\b',
+    r'^(?:©|\(c\))',
+    r'kaikki oikeudet pidätetään',
+    r'pidätämme oikeuden (?:muutoksiin|hinnanmuutoksiin)',
+    r'(?:esitteen|ilmoituksen|kohteen) tiedot (?:on|ovat) (?:saatu|tarkistettu|perustuvat)',
+    r'välittäjä ei vastaa',
+    r'emme vastaa (?:mahdollisista )?(?:virheistä|painovirheistä)',
+]
+BOILERPLATE_PATTERN = re.compile('|'.join(f'(?:{p})' for p in BOILERPLATE_PATTERNS), re.IGNORECASE)
+
+# Tätä lyhyempiä rivejä ei poisteta toistona (esim. "Kyllä" tai "Ei" taulukoissa)
+MIN_REPEATED_LINE_LENGTH = 15
+
+# Kuinka monta riviä sivun alusta ja lopusta tulkitaan ylä- ja alatunnisteiksi
+EDGE_LINES = 3
+
+# Merkki katkaistun tekstin loppuun
+TRUNCATION_MARKER = '[...]'
+
+_encoding = None
+
+
+def _fix_match(match):
+    """Dekoodaa yhden väärin tulkitun merkin uudelleen; epäkelpo jakso jätetään ennalleen"""
+    try:
+        return match.group().encode('cp1252').decode('utf-8')
+    except UnicodeError:
+        return match.group()
+
+
+def fix_encoding(text):
+    """
+    Korjaa väärin dekoodatut merkit yhdellä läpikäynnillä ja yhtenäistää välilyönnit
+
+    Args:
+        text (str): Korjattava teksti
+
+    Returns:
+        str: Korjattu teksti
+    """
+    if any(marker in text for marker in MOJIBAKE_MARKERS):
+        # Väärin dekoodattu NBSP ("Â" + NBSP) on pelkkä välilyönti
+        text = text.replace('Â\u00a0', ' ')
+    # Välilyönnit yhtenäistetään ennen korjausta, jotta NBSP ei liity edeltävään merkkiin
+    text = text.translate(_CHAR_TABLE)
+    if any(marker in text for marker in MOJIBAKE_MARKERS):
+        text = MOJIBAKE_PATTERN.sub(_fix_match, text)
+    return unicodedata.normalize('NFC', text)
+
+
+def count_tokens(text):
+    """
+    Laskee tekstin tokenit gpt-4.1-mallien koodauksella tai arvioi ne merkkimäärästä
+
+    Args:
+        text (str): Teksti
+
+    Returns:
+        int: Tokenien määrä
+    """
+    global _encoding
+    if tiktoken is None:
+        return len(text) // 4
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding('o200k_base')
+    return len(_encoding.encode(text))
+
+
+def _split_pages(lines):
+    """Jakaa normalisoidut rivit sivuiksi sivumerkintöjen kohdalta"""
+    pages = [[]]
+    for line in lines:
+        if PAGE_LINE_PATTERN.match(line):
+            if pages[-1]:
+                pages.append([])
+            continue
+        pages[-1].append(line)
+    return pages
+
+
+def _repeated_edge_lines(pages):
+    """
+    Palauttaa rivit, jotka toistuvat usean sivun alussa tai lopussa (ylä- ja alatunnisteet)
+
+    Args:
+        pages (list): Sivujen rivit
+
+    Returns:
+        set: Toistuvien rivien casefold-avaimet
+    """
+    counts = {}
+    for page in pages:
+        content = [line for line in page if line]
+        edges = {line.casefold() for line in content[:EDGE_LINES] + content[-EDGE_LINES:]
+                 if len(line) >= MIN_REPEATED_LINE_LENGTH}
+        for key in edges:
+            counts[key] = counts.get(key, 0) + 1
+    return {key for key, count in counts.items() if count >= 2}
+
+
+def clean_lines(text):
+    """
+    Poistaa sivumerkinnät, vakiotekstit, sivujen ylä- ja alatunnisteet sekä ylimääräiset välilyönnit
+
+    Args:
+        text (str): PDF:stä poimittu teksti
+
+    Returns:
+        list: Säilytetyt rivit; kappalevälit tyhjinä riveinä
+    """
+    pages = _split_pages(' '.join(raw_line.split()) for raw_line in text.split('\n'))
+    repeated = _repeated_edge_lines(pages)
+
+    lines = []
+    seen = set()
+    for page in pages:
+        content = [i for i, line in enumerate(page) if line]
+        edge_indexes = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+        for i, line in enumerate(page):
+            if not line:
+                if lines and lines[-1]:
+                    lines.append('')
+                continue
+            if BOILERPLATE_PATTERN.search(line):
+                continue
+            # Sivujen reunoilla toistuvat tunnisteet säilytetään vain ensimmäisen kerran
+            key = line.casefold()
+            if i in edge_indexes and key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            lines.append(line)
+
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def truncate_lines(lines, max_tokens):
+    """
+    Rajaa rivit tokenibudjettiin rivin rajalta
+
+    Args:
+        lines (list): Rivit
+        max_tokens (int): Enimmäismäärä tokeneita
+
+    Returns:
+        list: Budjettiin mahtuvat rivit, katkaistaessa lopussa TRUNCATION_MARKER
+    """
+    budget = max_tokens - count_tokens(TRUNCATION_MARKER) - 1
+    kept = []
+    used = 0
+    for line in lines:
+        # Rivinvaihto lasketaan mukaan yhtenä tokenina
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            kept.append(TRUNCATION_MARKER)
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+class TextCondenser:
+    """
+    Ilmoitustekstin tiivistäjä, jonka asetukset luetaan sovelluksen konfiguraatiosta
+    """
+
+    def __init__(self, enabled=True, max_tokens=6000):
+        self.enabled = enabled
+        self.max_tokens = max_tokens
+
+    def init_app(self, app):
+        """Lukee asetukset sovelluksen konfiguraatiosta"""
+        self.enabled = app.config.get('TEXT_CONDENSE_ENABLED', self.enabled)
+        self.max_tokens = int(app.config.get('TEXT_CONDENSE_MAX_TOKENS', self.max_tokens))
+
+    def condense(self, text, max_tokens=None):
+        """
+        Siivoaa ilmoitustekstin ja rajaa sen tokenibudjettiin
+
+        Args:
+            text (str): PDF:stä poimittu teksti
+            max_tokens (int, optional): Tokenibudjetti; oletuksena asetettu budjetti, 0 = ei rajaa
+
+        Returns:
+            str: Tiivistetty teksti
+        """
+        if not text:
+            return text
+        text = fix_encoding(text)
+        if not self.enabled:
+            return text
+
+        max_tokens = self.max_tokens if max_tokens is None else max_tokens
+        lines = clean_lines(text)
+        if max_tokens and count_tokens('\n'.join(lines)) > max_tokens:
+            lines = truncate_lines(lines, max_tokens)
+            logger.warning(f"Ilmoitusteksti katkaistiin {max_tokens} tokenin budjettiin")
+
+        condensed = '\n'.join(lines)
+        logger.info(f"Ilmoitusteksti tiivistetty: {count_tokens(text)} -> {count_tokens(condensed)} tokenia")
+        return condensed
+
+
+# Luodaan singleton-instanssi
+text_condenser = TextCondenser()
@@ -0,0 +1,82 @@
+"""
+Taustapalvelujen käynnistys ja prosessin haarautumisen (fork) jälkeinen siivous.
+
+BACKGROUND_SERVICES valitsee, missä taustasäikeet (analyysijono ja tilausten
+ajastin) käynnistetään:
+
+- 'import' (oletus): app.py käynnistää ne latautuessaan, kuten flask run -käytössä.
+- 'worker': gunicorn.conf.py:n hookit käynnistävät ne vasta workerissa. Näin
+  säikeitä ei synny gunicornin emoprosessiin, kun sovellus esiladataan
+  (PRELOAD_APP=true), eikä tilausten ajastin käynnisty jokaisessa workerissa.
+
+Esiladattaessa raskaat moduulit, kehotteet ja asetukset ladataan kerran emoprosessissa
+ja workerit jakavat ne copy-on-write-muistina. Emoprosessilta periytyneitä tietokanta-
+ja HTTP-yhteyksiä ei kuitenkaan saa käyttää lapsiprosessissa, joten ne unohdetaan
+reset_after_fork-funktiolla heti haarautumisen jälkeen.
+"""
+
+import os
+import logging
+
+from models import db
+from analysis_jobs import analysis_job_queue
+from browser_pool import browser_pool
+from llm_gateway import llm_gateway
+from subscription_scheduler import subscription_scheduler
+
+logger = logging.getLogger(__name__)
+
+SERVICES_ON_IMPORT = 'import'
+SERVICES_IN_WORKER = 'worker'
+
+
+def scheduler_enabled():
+    """Kertoo, ajetaanko tilausten ajastinta tässä ympäristössä"""
+    return os.environ.get('FLASK_ENV') == 'production' or os.environ.get('RUN_SUBSCRIPTION_SCHEDULER') == 'true'
+
+
+def start_background_services(app, run_scheduler=True):
+    """
+    Käynnistää analyysijonon taustasäikeet ja tarvittaessa tilausten ajastimen
+
+    Args:
+        app (Flask): Sovellus
+        run_scheduler (bool): Saako tämä prosessi ajaa tilausten ajastinta
+    """
+    # ANALYSIS_JOB_WORKERS=0 poistaa säikeet käytöstä tässä prosessissa
+    if not app.config.get('TESTING'):
+        analysis_job_queue.start()
+
+    if run_scheduler and scheduler_enabled():
+        logger.info("Starting subscription scheduler...")
+        with app.app_context():
+            subscription_scheduler.start()
+        logger.info("Subscription scheduler started")
+
+
+def dispose_engines(app, close=True):
+    """
+    Hylkää sovelluksen tietokantamoottorien yhteyspoolit
+
+    Args:
+        app (Flask): Sovellus
+        close (bool): Suljetaanko yhteydet. Lapsiprosessissa käytetään False-arvoa,
+            jotta emoprosessin yhteyksiä ei katkaista.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def reset_after_fork(app):
+    """
+    Unohtaa emoprosessilta periytyneet yhteydet ja resurssit. Kutsutaan
+    lapsiprosessissa heti haarautumisen jälkeen ennen ensimmäistä pyyntöä.
+
+    Args:
+        app (Flask): Esiladattu sovellus
+    """
+    dispose_engines(app, close=False)
+    llm_gateway.reset_after_fork()
+    browser_pool.reset_after_fork()
+    logger.info(f"Worker {os.getpid()}: emoprosessin yhteydet hylätty")